@@ -26,4 +26,18 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from neon_mq_connector.connector import MQConnector
+from typing import TYPE_CHECKING
+
+from neon_mq_connector.utils.import_utils import lazy_exports
+
+if TYPE_CHECKING:
+    from neon_mq_connector.connector import MQConnector
+
+__all__ = ['MQConnector']
+
+# Heavy dependencies are only imported when first used
+_lazy_imports = {
+    'MQConnector': 'neon_mq_connector.connector',
+}
+
+__getattr__, __dir__ = lazy_exports(__name__, _lazy_imports)
@@ -0,0 +1,79 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from neon_mq_connector.benchmarks.fault_proxy import FaultProxy
+    from neon_mq_connector.benchmarks.harness import BenchmarkRunner, \
+        Scenario, scenario_matrix
+    from neon_mq_connector.benchmarks.histogram import LatencyHistogram
+    from neon_mq_connector.benchmarks.load import LoadGenerator, \
+        LoadProfile, PayloadTemplate, run_load
+    from neon_mq_connector.benchmarks.regression import compare_results, \
+        run_benchmarks
+    from neon_mq_connector.benchmarks.recovery import measure_recovery, \
+        run_recovery
+    from neon_mq_connector.benchmarks.soak import check_trends, run_soak
+
+__all__ = ['BenchmarkRunner', 'Scenario', 'scenario_matrix',
+           'LatencyHistogram', 'LoadGenerator', 'LoadProfile',
+           'PayloadTemplate', 'run_load', 'compare_results',
+           'run_benchmarks', 'check_trends', 'run_soak', 'FaultProxy',
+           'measure_recovery', 'run_recovery']
+
+_lazy_imports = {
+    'BenchmarkRunner': 'neon_mq_connector.benchmarks.harness',
+    'Scenario': 'neon_mq_connector.benchmarks.harness',
+    'scenario_matrix': 'neon_mq_connector.benchmarks.harness',
+    'LatencyHistogram': 'neon_mq_connector.benchmarks.histogram',
+    'LoadGenerator': 'neon_mq_connector.benchmarks.load',
+    'LoadProfile': 'neon_mq_connector.benchmarks.load',
+    'PayloadTemplate': 'neon_mq_connector.benchmarks.load',
+    'run_load': 'neon_mq_connector.benchmarks.load',
+    'compare_results': 'neon_mq_connector.benchmarks.regression',
+    'run_benchmarks': 'neon_mq_connector.benchmarks.regression',
+    'check_trends': 'neon_mq_connector.benchmarks.soak',
+    'run_soak': 'neon_mq_connector.benchmarks.soak',
+    'FaultProxy': 'neon_mq_connector.benchmarks.fault_proxy',
+    'measure_recovery': 'neon_mq_connector.benchmarks.recovery',
+    'run_recovery': 'neon_mq_connector.benchmarks.recovery',
+}
+
+
+def __getattr__(name: str):
+    if name not in _lazy_imports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_lazy_imports[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
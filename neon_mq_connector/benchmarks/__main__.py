@@ -0,0 +1,156 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+import sys
+
+from argparse import ArgumentParser
+from typing import List, Optional
+
+from neon_mq_connector.benchmarks.harness import CONSUMER_CLASSES, \
+    BenchmarkRunner, render_markdown, scenario_matrix, write_report
+from neon_mq_connector.benchmarks.regression import DEFAULT_ALPHA, \
+    DEFAULT_TRIALS, compare_results, load_baseline, render_comparison, \
+    run_benchmarks, save_baseline
+
+
+def _parse_bool(value: str) -> bool:
+    return value.lower() in ('true', 'yes', '1')
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(prog="python -m neon_mq_connector.benchmarks",
+                            description="Benchmark MQ Connector consumers")
+    parser.add_argument("--broker", choices=("rabbitmq", "memory"),
+                        default="rabbitmq",
+                        help="benchmark RabbitMQ or the in-process broker")
+    parser.add_argument("--config", help="path to an MQ config JSON file "
+                                         "(defaults to the global config)")
+    parser.add_argument("--service", default="mq_handler",
+                        help="service user in the config to connect as")
+    parser.add_argument("--vhost", default="/",
+                        help="vhost to create benchmark queues in")
+    parser.add_argument("--consumer", nargs='+', choices=CONSUMER_CLASSES,
+                        default=list(CONSUMER_CLASSES))
+    parser.add_argument("--payload-size", nargs='+', type=int, default=[64])
+    parser.add_argument("--handler-ms", nargs='+', type=float, default=[0])
+    parser.add_argument("--prefetch", nargs='+', type=int, default=[50])
+    parser.add_argument("--auto-ack", nargs='+', type=_parse_bool,
+                        default=[True])
+    parser.add_argument("--consumers", nargs='+', type=int, default=[1])
+    parser.add_argument("--messages", type=int, default=1000,
+                        help="messages to publish per scenario")
+    parser.add_argument("--requests", type=int, default=0,
+                        help="send_mq_request round trips to measure")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--json", help="path to write the JSON report to")
+    parser.add_argument("--markdown",
+                        help="path to write the Markdown report to")
+    regression = parser.add_argument_group(
+        "regression gate", "compare the regression benchmark suite on the "
+                           "in-process broker to a saved baseline")
+    regression.add_argument("--baseline",
+                            help="path to the baseline JSON to compare to")
+    regression.add_argument("--update-baseline", action="store_true",
+                            help="save the results as the new baseline")
+    regression.add_argument("--benchmark", nargs='+',
+                            help="regression benchmarks to run (default all)")
+    regression.add_argument("--trials", type=int, default=DEFAULT_TRIALS,
+                            help="measurements of each benchmark")
+    regression.add_argument("--alpha", type=float, default=DEFAULT_ALPHA,
+                            help="significance level of regressions")
+    regression.add_argument("--tolerance", nargs='+', default=[],
+                            metavar="NAME=FRACTION",
+                            help="override tolerances of the baseline")
+    return parser
+
+
+def run_regression(args) -> int:
+    """
+    Run the regression benchmark suite and compare it to, or save it as, the
+    baseline at `args.baseline`
+    :returns: exit code, 1 if any benchmark regressed
+    """
+    from os.path import isfile
+    baseline = load_baseline(args.baseline) if isfile(args.baseline) \
+        else None
+    if not baseline and not args.update_baseline:
+        raise FileNotFoundError(f"No baseline at {args.baseline}; run with "
+                                f"--update-baseline to create one")
+    results = run_benchmarks(args.benchmark, args.trials)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        save_baseline(args.baseline, results, baseline)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    tolerances = {name: float(value) for name, value in
+                  (item.split('=', 1) for item in args.tolerance)}
+    comparisons = compare_results(baseline, results, args.alpha, tolerances)
+    table = render_comparison(comparisons)
+    if args.markdown:
+        with open(args.markdown, 'w') as f:
+            f.write(table + '\n')
+    print(table)
+    return 1 if any(comparison.failed for comparison in comparisons) else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = get_parser().parse_args(argv)
+    if args.baseline:
+        return run_regression(args)
+    transport = None
+    if args.broker == "memory":
+        from neon_mq_connector.utils.memory_transport_utils import \
+            MemoryTransport
+        transport = MemoryTransport()
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+    elif transport:
+        config = {"server": "localhost",
+                  "users": {args.service: {"user": "benchmark",
+                                           "password": "benchmark"}}}
+    else:
+        from neon_mq_connector.connector import MQConnector
+        config = MQConnector.init_config()
+    scenarios = scenario_matrix(args.consumer, args.payload_size,
+                                [ms / 1000 for ms in args.handler_ms],
+                                args.prefetch, args.auto_ack, args.consumers,
+                                args.messages)
+    runner = BenchmarkRunner(config, args.service, args.vhost, args.timeout,
+                             transport)
+    report = runner.run(scenarios, args.requests, args.payload_size[0])
+    write_report(report, args.json, args.markdown)
+    print(render_markdown(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
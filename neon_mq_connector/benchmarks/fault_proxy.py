@@ -0,0 +1,360 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import random
+import select
+import socket
+import struct
+import time
+
+from queue import Queue
+from threading import Event, Lock, Thread, Timer
+from typing import List, Optional, Tuple
+
+from ovos_utils.log import LOG
+
+from neon_mq_connector.utils.thread_utils import RepeatingTimer
+
+"""
+TCP proxy that injects network faults between a client and a broker, for
+measuring how consumers and publishers recover from them. Point the
+connector at `FaultProxy.address` instead of the broker, then inject faults
+directly or on a schedule, i.e.:
+
+    with FaultProxy(("localhost", 5672)) as proxy:
+        config["port"] = proxy.port
+        proxy.schedule(10, proxy.restart, 5)  # broker down for 5s
+        proxy.schedule(30, proxy.set_latency, 0.5)
+"""
+
+
+def _reset(sock: socket.socket):
+    """
+    Close a socket with a TCP RST instead of a FIN
+    """
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                        struct.pack('ii', 1, 0))
+    except OSError:
+        pass
+    sock.close()
+
+
+class _ProxyConnection:
+    """
+    One client connection and its connection to the target. Each direction
+    is read by one thread and written by another, so latency delays data
+    without limiting throughput.
+    """
+
+    def __init__(self, proxy: 'FaultProxy', client: socket.socket,
+                 upstream: Optional[socket.socket]):
+        self.proxy = proxy
+        self.client = client
+        # None if accepted while blackholed
+        self.upstream = upstream
+        self.blackholed = upstream is None
+        self.closed = False
+        self._lock = Lock()
+        self._threads = list()
+
+    def start(self):
+        pairs = [(self.client, self.upstream), (self.upstream, self.client)] \
+            if self.upstream else [(self.client, None)]
+        for src, dst in pairs:
+            pending = Queue()
+            self._threads.append(Thread(target=self._read,
+                                        args=(src, pending), daemon=True,
+                                        name="fault_proxy_read"))
+            self._threads.append(Thread(target=self._write,
+                                        args=(dst, pending), daemon=True,
+                                        name="fault_proxy_write"))
+        for thread in self._threads:
+            thread.start()
+
+    def _read(self, src: socket.socket, pending: Queue):
+        try:
+            while not self.closed:
+                if not self.proxy.flowing.wait(0.1):
+                    # Stalled; the sender is throttled by TCP flow control
+                    continue
+                if not select.select([src], [], [], 0.1)[0]:
+                    continue
+                data = src.recv(65536)
+                if not data:
+                    break
+                if self.blackholed:
+                    continue
+                latency = self.proxy.latency
+                if self.proxy.jitter:
+                    latency += random.uniform(0, self.proxy.jitter)
+                pending.put((time.monotonic() + latency, data))
+        except (OSError, ValueError):
+            # Socket closed by another thread
+            pass
+        pending.put(None)
+
+    def _write(self, dst: Optional[socket.socket], pending: Queue):
+        try:
+            while True:
+                item = pending.get()
+                if item is None or self.closed:
+                    break
+                due, data = item
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                while not self.proxy.flowing.wait(0.1):
+                    if self.closed:
+                        return
+                if self.blackholed:
+                    continue
+                dst.sendall(data)
+        except OSError:
+            pass
+        self.close()
+
+    def close(self, reset: bool = False):
+        """
+        Close both sides of the connection
+        :param reset: if True, reset the client connection instead of closing
+            it cleanly
+        """
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+        if reset:
+            _reset(self.client)
+        else:
+            self.client.close()
+        if self.upstream:
+            self.upstream.close()
+        self.proxy._remove(self)
+
+
+class FaultProxy:
+    """
+    Forwards TCP connections to `target`, optionally injecting latency,
+    stalls, blackholes, resets and refused connections
+    """
+
+    def __init__(self, target: Tuple[str, int], host: str = "127.0.0.1",
+                 port: int = 0, connect_timeout: float = 5):
+        """
+        :param target: (host, port) to forward connections to
+        :param host: address to listen on
+        :param port: port to listen on; 0 picks a free port
+        :param connect_timeout: max seconds to connect to `target`
+        """
+        self.target = target
+        self.connect_timeout = connect_timeout
+        self.latency = 0.0
+        self.jitter = 0.0
+        # Cleared while traffic is stalled
+        self.flowing = Event()
+        self.flowing.set()
+        self.blackholing = False
+        self.refusing = False
+        self.accepted = 0
+        self._connections: List[_ProxyConnection] = list()
+        self._lock = Lock()
+        self._timers: List[Timer] = list()
+        self._stopping = Event()
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((host, port))
+        self._listener.listen(64)
+        self._thread = Thread(target=self._accept, daemon=True,
+                              name="fault_proxy")
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """
+        (host, port) clients should connect to
+        """
+        return self._listener.getsockname()[:2]
+
+    @property
+    def port(self) -> int:
+        return self.address[1]
+
+    @property
+    def connections(self) -> int:
+        """
+        Number of open client connections
+        """
+        with self._lock:
+            return len(self._connections)
+
+    def start(self) -> 'FaultProxy':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Cancel scheduled faults and close the listener and all connections
+        """
+        self._stopping.set()
+        for timer in self._timers:
+            timer.cancel()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._listener.close()
+        self.flowing.set()
+        for connection in self._get_connections():
+            connection.close()
+
+    def __enter__(self) -> 'FaultProxy':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _get_connections(self) -> List[_ProxyConnection]:
+        with self._lock:
+            return list(self._connections)
+
+    def _remove(self, connection: _ProxyConnection):
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+
+    def _accept(self):
+        while not self._stopping.is_set():
+            if not select.select([self._listener], [], [], 0.1)[0]:
+                continue
+            try:
+                client, _ = self._listener.accept()
+            except OSError:
+                continue
+            self.accepted += 1
+            if self.refusing:
+                _reset(client)
+                continue
+            upstream = None
+            if not self.blackholing:
+                try:
+                    upstream = socket.create_connection(
+                        self.target, self.connect_timeout)
+                    upstream.settimeout(None)
+                except OSError as e:
+                    LOG.debug(f"Failed to connect to {self.target}: {e}")
+                    _reset(client)
+                    continue
+            connection = _ProxyConnection(self, client, upstream)
+            with self._lock:
+                self._connections.append(connection)
+            connection.start()
+
+    def set_latency(self, latency: float, jitter: float = 0.0):
+        """
+        Delay data in each direction
+        :param latency: seconds to delay each chunk of data
+        :param jitter: max random seconds added to `latency`
+        """
+        self.latency = latency
+        self.jitter = jitter
+
+    def stall(self):
+        """
+        Stop forwarding data until `heal` is called. Data is held, not
+        dropped, as if packets were being retransmitted.
+        """
+        self.flowing.clear()
+
+    def blackhole(self):
+        """
+        Silently drop all data of open and new connections, leaving them
+        half-open. Blackholed connections stay so after `heal`, as a real
+        half-open connection would; only new connections recover.
+        """
+        self.blackholing = True
+        for connection in self._get_connections():
+            connection.blackholed = True
+
+    def refuse(self):
+        """
+        Reset new connections until `heal` is called
+        """
+        self.refusing = True
+
+    def reset_connections(self):
+        """
+        Reset all open connections
+        """
+        for connection in self._get_connections():
+            connection.close(reset=True)
+
+    def restart(self, downtime: float = 0.0):
+        """
+        Simulate a broker restart: reset all connections and refuse new ones
+        for `downtime` seconds
+        """
+        self.refuse()
+        self.reset_connections()
+        if downtime:
+            self._stopping.wait(downtime)
+        self.refusing = False
+
+    def heal(self):
+        """
+        Stop injecting faults into new data and connections
+        """
+        self.latency = 0.0
+        self.jitter = 0.0
+        self.blackholing = False
+        self.refusing = False
+        self.flowing.set()
+
+    def schedule(self, delay: float, fault: callable, *args,
+                 interval: Optional[float] = None) -> Timer:
+        """
+        Inject a fault later, i.e. `proxy.schedule(5, proxy.restart, 2)`
+        :param delay: seconds until `fault` is called
+        :param fault: method of this proxy (or any callable) to call
+        :param args: arguments to call `fault` with
+        :param interval: if set, call `fault` again every `interval` seconds
+            after the first call
+        :returns: started timer, which may be cancelled
+        """
+        if interval:
+            def _repeat():
+                fault(*args)
+                repeat = RepeatingTimer(interval, fault, args)
+                repeat.daemon = True
+                self._timers.append(repeat)
+                if not self._stopping.is_set():
+                    repeat.start()
+            timer = Timer(delay, _repeat)
+        else:
+            timer = Timer(delay, fault, args)
+        timer.daemon = True
+        self._timers.append(timer)
+        timer.start()
+        return timer
@@ -0,0 +1,501 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import itertools
+import json
+import math
+import platform
+import time
+import uuid
+
+from datetime import datetime, timezone
+from threading import Event, Lock
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+from ovos_utils.log import LOG
+
+from neon_mq_connector.connector import MQConnector
+from neon_mq_connector.utils.cluster_utils import parse_endpoints
+from neon_mq_connector.utils.network_utils import b64_to_dict
+from neon_mq_connector.utils.transport_utils import PikaTransport, \
+    Transport, get_transport, set_transport
+
+"""
+Throughput and latency benchmarks for `MQConnector` consumers. Each
+`Scenario` publishes messages with `MQConnector.emit_mq_message` to a new
+queue consumed by `BlockingConsumerThread` or `SelectConsumerThread`
+instances and measures publish throughput, consume throughput and end-to-end
+latency, against RabbitMQ or the in-process broker of
+`memory_transport_utils`. Results are reported as JSON, which may be rendered as Markdown
+with `render_markdown` to compare runs and consumer classes, i.e.:
+
+    python -m neon_mq_connector.benchmarks --payload-size 64 4096
+        --json results.json --markdown results.md
+"""
+
+CONSUMER_CLASSES = ('blocking', 'select')
+
+
+class Scenario(NamedTuple):
+    """
+    Parameters of a single benchmark run
+    """
+    consumer: str = 'select'
+    payload_size: int = 64
+    handler_seconds: float = 0.0
+    prefetch: int = 50
+    auto_ack: bool = True
+    consumers: int = 1
+    messages: int = 1000
+
+    @property
+    def name(self) -> str:
+        return f"{self.consumer}-{self.payload_size}B-" \
+               f"{self.handler_seconds * 1000:g}ms-prefetch{self.prefetch}-" \
+               f"{'auto' if self.auto_ack else 'manual'}ack-" \
+               f"{self.consumers}consumers"
+
+
+def scenario_matrix(consumer_classes: Sequence[str] = CONSUMER_CLASSES,
+                    payload_sizes: Sequence[int] = (64,),
+                    handler_seconds: Sequence[float] = (0.0,),
+                    prefetch: Sequence[int] = (50,),
+                    auto_ack: Sequence[bool] = (True,),
+                    consumers: Sequence[int] = (1,),
+                    messages: int = 1000) -> List[Scenario]:
+    """
+    Get every combination of the specified benchmark parameters
+    :param consumer_classes: consumer classes to compare
+    :param payload_sizes: sizes in bytes of the data in each message
+    :param handler_seconds: seconds each message handler takes
+    :param prefetch: consumer prefetch counts
+    :param auto_ack: whether messages are acknowledged on delivery
+    :param consumers: numbers of consumers of the benchmark queue
+    :param messages: number of messages published in each scenario
+    :returns: list of scenarios with consumer classes varying fastest
+    """
+    for consumer in consumer_classes:
+        if consumer not in CONSUMER_CLASSES:
+            raise ValueError(f"Unknown consumer class: {consumer}")
+    return [Scenario(consumer, size, seconds, count, ack, num, messages)
+            for size, seconds, count, ack, num, consumer in
+            itertools.product(payload_sizes, handler_seconds, prefetch,
+                              auto_ack, consumers, consumer_classes)]
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """
+    Get a percentile of sorted values by the nearest-rank method
+    :param values: sorted values
+    :param pct: percentile in the range 0-100
+    :returns: value at `pct`, or 0 if there are no values
+    """
+    if not values:
+        return 0.0
+    # Tolerate float error, i.e. 99.9 / 100 * 1000 > 999
+    rank = math.ceil(pct / 100 * len(values) - 1e-9)
+    return values[min(len(values), max(1, rank)) - 1]
+
+
+class LatencyStats(NamedTuple):
+    """
+    Summary of latency samples in seconds
+    """
+    count: int = 0
+    mean: float = 0.0
+    p50: float = 0.0
+    p99: float = 0.0
+    p999: float = 0.0
+    max: float = 0.0
+
+    @classmethod
+    def from_samples(cls, samples: Iterable[float]) -> 'LatencyStats':
+        samples = sorted(samples)
+        if not samples:
+            return cls()
+        return cls(len(samples), sum(samples) / len(samples),
+                   percentile(samples, 50), percentile(samples, 99),
+                   percentile(samples, 99.9), samples[-1])
+
+
+class BenchmarkResult(NamedTuple):
+    """
+    Measurements of a benchmark `Scenario`
+    """
+    scenario: Scenario
+    published: int
+    received: int
+    publish_seconds: float
+    consume_seconds: float
+    latency: LatencyStats
+
+    @property
+    def publish_rate(self) -> float:
+        """
+        Messages published per second
+        """
+        return self.published / self.publish_seconds \
+            if self.publish_seconds else 0.0
+
+    @property
+    def consume_rate(self) -> float:
+        """
+        Messages received per second, from the start of publishing to the
+        last message received
+        """
+        return self.received / self.consume_seconds \
+            if self.consume_seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return {"name": self.scenario.name,
+                "scenario": self.scenario._asdict(),
+                "published": self.published,
+                "received": self.received,
+                "lost": self.published - self.received,
+                "publish_rate": self.publish_rate,
+                "consume_rate": self.consume_rate,
+                "latency": self.latency._asdict()}
+
+
+class RequestResult(NamedTuple):
+    """
+    Measurements of `send_mq_request` round trips
+    """
+    requests: int
+    payload_size: int
+    failed: int
+    seconds: float
+    latency: LatencyStats
+
+    def to_dict(self) -> dict:
+        return {"requests": self.requests,
+                "payload_size": self.payload_size,
+                "failed": self.failed,
+                "rate": self.requests / self.seconds if self.seconds else 0.0,
+                "latency": self.latency._asdict()}
+
+
+class _BenchmarkConnector(MQConnector):
+    """
+    Connector owning the consumers of a benchmark
+    """
+
+
+def register_responder(connector: MQConnector, vhost: str, queue: str,
+                       name: str = "benchmark_responder",
+                       restart_attempts: int = 0):
+    """
+    Register a consumer replying to `send_mq_request` requests sent to
+    `queue` with the `message_id` of each request
+    :param connector: connector to register the consumer with
+    :param vhost: vhost of `queue`
+    :param queue: queue to consume requests from
+    :param name: name of the consumer
+    :param restart_attempts: max restarts of the consumer if it stops
+        (if < 0, it is always restarted)
+    """
+    def _on_request(channel, _method, properties, body):
+        request = b64_to_dict(body)
+        connector.emit_mq_reply(channel,
+                                {"message_id": request['message_id']},
+                                routing_key=request['routing_key'],
+                                request_properties=properties)
+
+    connector.register_consumer(name, vhost, queue, _on_request,
+                                restart_attempts=restart_attempts)
+
+
+class BenchmarkRunner:
+    """
+    Runs benchmark scenarios against the MQ broker in `config`
+    """
+
+    def __init__(self, config: dict, service_name: str, vhost: str = '/',
+                 timeout: float = 120, transport: Optional[Transport] = None):
+        """
+        :param config: MQ config with credentials for `service_name`
+        :param service_name: name of the service user to connect as
+        :param vhost: vhost to create benchmark queues in
+        :param timeout: max seconds to wait for the messages of a scenario
+        :param transport: transport to connect with (defaults to the one set
+            with `transport_utils.set_transport`)
+        """
+        self.config = config
+        self.service_name = service_name
+        self.vhost = vhost
+        self.timeout = timeout
+        self.transport = transport or get_transport()
+
+    def _create_connector(self, consumer: str = 'select') -> MQConnector:
+        connector = _BenchmarkConnector(self.config, self.service_name)
+        connector.vhost = self.vhost
+        connector.async_consumers_enabled = consumer == 'select'
+        connector.transport = self.transport
+        return connector
+
+    def _wait_for_consumers(self, connector: MQConnector) -> bool:
+        timeout = time.monotonic() + self.timeout
+        while time.monotonic() < timeout:
+            if all(consumer.is_consuming
+                   for consumer in connector.consumers.values()):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def _delete_queue(self, connector: MQConnector, queue: str):
+        try:
+            with connector.create_mq_connection(self.vhost) as connection:
+                connection.channel().queue_delete(queue)
+        except Exception as e:
+            LOG.warning(f"Failed to delete benchmark queue {queue}: {e}")
+
+    def run_scenario(self, scenario: Scenario) -> BenchmarkResult:
+        """
+        Publish the messages of `scenario` and wait for them to be consumed
+        :param scenario: benchmark parameters
+        :returns: measurements of the scenario
+        """
+        queue = f"neon_mq_benchmark_{uuid.uuid4().hex[:8]}"
+        connector = self._create_connector(scenario.consumer)
+        latencies = list()
+        lock = Lock()
+        done = Event()
+        last_received = [0.0]
+
+        def _on_message(channel, method, _properties, body):
+            received = time.perf_counter()
+            data = b64_to_dict(body)
+            if scenario.handler_seconds:
+                time.sleep(scenario.handler_seconds)
+            if not scenario.auto_ack:
+                channel.basic_ack(delivery_tag=method.delivery_tag)
+            with lock:
+                latencies.append(received - data['sent'])
+                last_received[0] = time.perf_counter()
+                if len(latencies) >= scenario.messages:
+                    done.set()
+
+        for idx in range(scenario.consumers):
+            connector.register_consumer(
+                f"benchmark_{idx}", self.vhost, queue, _on_message,
+                auto_ack=scenario.auto_ack, prefetch_count=scenario.prefetch,
+                restart_attempts=0)
+        payload = 'x' * scenario.payload_size
+        # Messages must not expire while queued behind slow handlers
+        expiration = int(self.timeout * 1000)
+        published = 0
+        publish_seconds = 0.0
+        start = time.perf_counter()
+        try:
+            connector.run_consumers()
+            if not self._wait_for_consumers(connector):
+                raise TimeoutError(f"Consumers of {queue} not started")
+            with connector.create_mq_connection(self.vhost) as connection:
+                start = time.perf_counter()
+                for seq in range(scenario.messages):
+                    connector.emit_mq_message(
+                        connection, {"sent": time.perf_counter(), "seq": seq,
+                                     "data": payload},
+                        queue=queue, expiration=expiration)
+                    published += 1
+                publish_seconds = time.perf_counter() - start
+            if not done.wait(self.timeout):
+                LOG.warning(f"Timed out waiting for {scenario.name}")
+        finally:
+            connector.stop()
+            self._delete_queue(connector, queue)
+        with lock:
+            samples = list(latencies)
+            consume_seconds = last_received[0] - start if samples else 0.0
+        return BenchmarkResult(scenario, published, len(samples),
+                               publish_seconds, consume_seconds,
+                               LatencyStats.from_samples(samples))
+
+    def run_requests(self, requests: int = 100,
+                     payload_size: int = 64) -> RequestResult:
+        """
+        Measure round trips of `send_mq_request` to a responder consuming
+        from a new queue. Note that `send_mq_request` connects with the
+        `mq_handler` user of the global MQ config, using the transport of
+        this runner.
+        :param requests: number of sequential requests to send
+        :param payload_size: size in bytes of the data in each request
+        :returns: measurements of the requests
+        """
+        from neon_mq_connector.utils.client_utils import send_mq_request
+        queue = f"neon_mq_benchmark_{uuid.uuid4().hex[:8]}"
+        connector = self._create_connector()
+        register_responder(connector, self.vhost, queue)
+        payload = 'x' * payload_size
+        latencies = list()
+        failed = 0
+        start = time.perf_counter()
+        transport = set_transport(self.transport)
+        try:
+            connector.run_consumers()
+            if not self._wait_for_consumers(connector):
+                raise TimeoutError(f"Consumer of {queue} not started")
+            start = time.perf_counter()
+            for _ in range(requests):
+                sent = time.perf_counter()
+                response = send_mq_request(self.vhost, {"data": payload},
+                                           queue, timeout=self.timeout)
+                if response:
+                    latencies.append(time.perf_counter() - sent)
+                else:
+                    failed += 1
+        finally:
+            seconds = time.perf_counter() - start
+            set_transport(transport)
+            connector.stop()
+            self._delete_queue(connector, queue)
+        return RequestResult(requests, payload_size, failed, seconds,
+                             LatencyStats.from_samples(latencies))
+
+    def run(self, scenarios: Iterable[Scenario], requests: int = 0,
+            request_payload_size: int = 64) -> dict:
+        """
+        Run benchmark scenarios in order
+        :param scenarios: scenarios to run
+        :param requests: number of `send_mq_request` round trips to measure
+            (default none)
+        :param request_payload_size: size in bytes of the data in requests
+        :returns: JSON-serializable benchmark report
+        """
+        results = list()
+        for scenario in scenarios:
+            LOG.info(f"Running benchmark: {scenario.name}")
+            results.append(self.run_scenario(scenario).to_dict())
+        report = {"environment": get_environment(self.config,
+                                                 self.transport),
+                  "results": results}
+        if requests:
+            report["requests"] = self.run_requests(
+                requests, request_payload_size).to_dict()
+        return report
+
+
+def get_environment(config: Optional[dict] = None,
+                    transport: Optional[Transport] = None) -> Dict[str, str]:
+    """
+    Describe the environment benchmarks run in, so reports can be compared
+    :param config: MQ config of the broker benchmarked
+    :param transport: transport benchmarked (defaults to the one set with
+        `transport_utils.set_transport`)
+    """
+    transport = transport or get_transport()
+    try:
+        from importlib.metadata import version
+        library_version = version('neon_mq_connector')
+    except Exception:
+        library_version = 'unknown'
+    import pika
+    return {"time": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "pika": pika.__version__,
+            "neon_mq_connector": library_version,
+            "transport": transport.name,
+            "broker": ','.join(str(endpoint) for endpoint in
+                               parse_endpoints(config or {}))
+            if isinstance(transport, PikaTransport) else "in-process"}
+
+
+def write_report(report: dict, json_path: Optional[str] = None,
+                 markdown_path: Optional[str] = None):
+    """
+    Write a benchmark report to files
+    :param report: report returned by `BenchmarkRunner.run`
+    :param json_path: path to write the report as JSON to (optional)
+    :param markdown_path: path to write the report as Markdown to (optional)
+    """
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    if markdown_path:
+        with open(markdown_path, 'w') as f:
+            f.write(render_markdown(report))
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.2f}"
+
+
+def render_markdown(report: dict) -> str:
+    """
+    Render a benchmark report as Markdown tables, including a comparison of
+    consumer classes for scenarios that only differ by consumer class
+    :param report: report returned by `BenchmarkRunner.run` or loaded from
+        its JSON
+    :returns: Markdown string
+    """
+    env = report.get("environment", {})
+    lines = ["# MQ Connector Benchmarks", "",
+             ', '.join(f"{key}: {value}" for key, value in env.items()), "",
+             "| Scenario | Publish msg/s | Consume msg/s | p50 ms | p99 ms | "
+             "p99.9 ms | Lost |",
+             "|---|---:|---:|---:|---:|---:|---:|"]
+    groups: Dict[tuple, Dict[str, dict]] = dict()
+    for result in report.get("results", []):
+        latency = result["latency"]
+        lines.append(f"| {result['name']} | {result['publish_rate']:.0f} | "
+                     f"{result['consume_rate']:.0f} | {_ms(latency['p50'])} | "
+                     f"{_ms(latency['p99'])} | {_ms(latency['p999'])} | "
+                     f"{result['lost']} |")
+        scenario = dict(result["scenario"])
+        consumer = scenario.pop("consumer")
+        groups.setdefault(tuple(scenario.items()), {})[consumer] = result
+
+    compared = [group for group in groups.values() if len(group) > 1]
+    if compared:
+        classes = sorted({consumer for group in compared
+                          for consumer in group})
+        lines += ["", "## Consumer Classes", "",
+                  "| Scenario | " + ' | '.join(
+                      f"{c} msg/s | {c} p99 ms" for c in classes) + " |",
+                  "|---|" + "---:|---:|" * len(classes)]
+        for group in compared:
+            name = next(iter(group.values()))['name'].split('-', 1)[1]
+            cells = list()
+            for consumer in classes:
+                result = group.get(consumer)
+                cells += [f"{result['consume_rate']:.0f}",
+                          _ms(result['latency']['p99'])] if result else \
+                    ['-', '-']
+            lines.append(f"| {name} | {' | '.join(cells)} |")
+
+    requests = report.get("requests")
+    if requests:
+        latency = requests["latency"]
+        lines += ["", "## send_mq_request", "",
+                  "| Requests | Failed | req/s | p50 ms | p99 ms | p99.9 ms |",
+                  "|---:|---:|---:|---:|---:|---:|",
+                  f"| {requests['requests']} | {requests['failed']} | "
+                  f"{requests['rate']:.1f} | {_ms(latency['p50'])} | "
+                  f"{_ms(latency['p99'])} | {_ms(latency['p999'])} |"]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,209 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import math
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+"""
+Latency histogram in the style of HdrHistogram: values are counted in
+log-linear buckets, so recording is constant-time and memory is bounded
+while percentiles keep a fixed number of significant digits at any
+magnitude. Histograms recorded by different threads may be merged, and
+exported as JSON or in the HdrHistogram percentile distribution (`.hgrm`)
+format understood by its plotting tools.
+"""
+
+DEFAULT_PERCENTILES = (50, 90, 99, 99.9, 99.99, 100)
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies in seconds, recorded as integer multiples of
+    `unit`. Histograms are not thread-safe; record from one thread per
+    histogram and `merge` them.
+    """
+
+    def __init__(self, significant_digits: int = 3, unit: float = 1e-6):
+        """
+        :param significant_digits: decimal digits of precision of recorded
+            values, from 1 to 5
+        :param unit: resolution of recorded values in seconds
+        """
+        if not 1 <= significant_digits <= 5:
+            raise ValueError(f"significant_digits must be 1-5, "
+                             f"not {significant_digits}")
+        self.significant_digits = significant_digits
+        self.unit = unit
+        # Values with at most this many bits are counted exactly; larger
+        # values keep this many significant bits
+        self._sub_bucket_bits = math.ceil(math.log2(2 * 10 **
+                                                    significant_digits))
+        self._counts: Dict[int, int] = dict()
+        self.total_count = 0
+        self._total = 0
+        self._min: Optional[int] = None
+        self._max = 0
+
+    def _lowest_equivalent(self, value: int) -> int:
+        shift = max(0, value.bit_length() - self._sub_bucket_bits)
+        return (value >> shift) << shift
+
+    def _highest_equivalent(self, value: int) -> int:
+        shift = max(0, value.bit_length() - self._sub_bucket_bits)
+        return value + (1 << shift) - 1
+
+    def record(self, seconds: float, count: int = 1):
+        """
+        Record a latency
+        :param seconds: latency to record; negative values are recorded as 0
+        :param count: number of times to record it
+        """
+        value = max(0, round(seconds / self.unit))
+        bucket = self._lowest_equivalent(value)
+        self._counts[bucket] = self._counts.get(bucket, 0) + count
+        self.total_count += count
+        self._total += value * count
+        self._min = value if self._min is None else min(self._min, value)
+        self._max = max(self._max, value)
+
+    def merge(self, other: 'LatencyHistogram'):
+        """
+        Add the values recorded by another histogram with the same precision
+        """
+        if (other.significant_digits, other.unit) != \
+                (self.significant_digits, self.unit):
+            raise ValueError("Histograms must have the same precision")
+        for bucket, count in other._counts.items():
+            self._counts[bucket] = self._counts.get(bucket, 0) + count
+        self.total_count += other.total_count
+        self._total += other._total
+        if other._min is not None:
+            self._min = other._min if self._min is None else \
+                min(self._min, other._min)
+        self._max = max(self._max, other._max)
+
+    @property
+    def min(self) -> float:
+        return (self._min or 0) * self.unit
+
+    @property
+    def max(self) -> float:
+        return self._max * self.unit
+
+    @property
+    def mean(self) -> float:
+        return self._total / self.total_count * self.unit \
+            if self.total_count else 0.0
+
+    def buckets(self) -> List[Tuple[float, int]]:
+        """
+        Get recorded buckets in ascending order
+        :returns: list of (highest value in seconds, count)
+        """
+        return [(min(self._highest_equivalent(bucket), self._max) *
+                 self.unit, self._counts[bucket])
+                for bucket in sorted(self._counts)]
+
+    def value_at_percentile(self, pct: float) -> float:
+        """
+        Get the value that `pct` percent of recorded values are less than or
+        equivalent to
+        :param pct: percentile in the range 0-100
+        :returns: latency in seconds, or 0 if nothing was recorded
+        """
+        if not self.total_count:
+            return 0.0
+        # Tolerate float error, i.e. 99.9 / 100 * 1000 > 999
+        rank = max(1, math.ceil(pct / 100 * self.total_count - 1e-9))
+        seen = 0
+        for value, count in self.buckets():
+            seen += count
+            if seen >= rank:
+                return value
+        return self.max
+
+    def percentiles(self, percentiles: Iterable[float] = DEFAULT_PERCENTILES
+                    ) -> Dict[str, float]:
+        """
+        Get values at percentiles, keyed by percentile, i.e. `"99.9"`
+        """
+        return {f"{pct:g}": self.value_at_percentile(pct)
+                for pct in percentiles}
+
+    def to_dict(self) -> dict:
+        return {"count": self.total_count,
+                "min": self.min,
+                "mean": self.mean,
+                "max": self.max,
+                "percentiles": self.percentiles(),
+                "significant_digits": self.significant_digits,
+                "unit": self.unit,
+                "buckets": [list(bucket) for bucket in self.buckets()]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LatencyHistogram':
+        """
+        Load a histogram exported with `to_dict`. Values are restored to
+        bucket precision.
+        """
+        histogram = cls(data["significant_digits"], data["unit"])
+        for seconds, count in data["buckets"]:
+            histogram.record(seconds, count)
+        return histogram
+
+    def to_hgrm(self, value_scale: float = 1000) -> str:
+        """
+        Format as an HdrHistogram percentile distribution
+        :param value_scale: multiplier of values in seconds, i.e. 1000 to
+            output milliseconds
+        :returns: text in the `.hgrm` format
+        """
+        lines = [f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} "
+                 f"{'1/(1-Percentile)':>14}", ""]
+        seen = 0
+        for value, count in self.buckets():
+            seen += count
+            fraction = seen / self.total_count
+            line = f"{value * value_scale:12.3f} {fraction:14.12f} {seen:10d}"
+            if fraction < 1:
+                line += f" {1 / (1 - fraction):14.2f}"
+            lines.append(line)
+        variance = 0.0
+        if self.total_count:
+            mean = self.mean
+            variance = sum(count * (value - mean) ** 2
+                           for value, count in self.buckets()) / \
+                self.total_count
+        lines += [f"#[Mean    = {self.mean * value_scale:12.3f}, "
+                  f"StdDeviation   = {math.sqrt(variance) * value_scale:12.3f}]",
+                  f"#[Max     = {self.max * value_scale:12.3f}, "
+                  f"Total count    = {self.total_count:12d}]",
+                  f"#[Buckets = {len(self._counts):12d}, "
+                  f"SubBuckets     = {1 << self._sub_bucket_bits:12d}]"]
+        return '\n'.join(lines) + '\n'
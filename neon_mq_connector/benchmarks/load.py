@@ -0,0 +1,499 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import copy
+import json
+import random
+import threading
+import time
+import uuid
+
+from argparse import ArgumentParser
+from queue import Queue
+from string import Template
+from typing import Callable, Iterator, List, NamedTuple, Optional
+
+from ovos_utils.log import LOG
+
+from neon_mq_connector.benchmarks.harness import get_environment, \
+    register_responder
+from neon_mq_connector.benchmarks.histogram import LatencyHistogram
+from neon_mq_connector.connector import MQConnector
+from neon_mq_connector.utils.transport_utils import Transport, \
+    get_transport, set_transport
+
+"""
+Open-loop load generator for services reached through `MQConnector`.
+Messages are sent on a schedule that does not wait for responses (constant
+rate, Poisson or bursty arrivals) by a pool of worker threads, and latency is
+measured from the time each message was scheduled to be sent. A service that
+stalls therefore adds the time messages waited to be sent to their latency,
+correcting for coordinated omission; the time from actually sending to
+completion is reported separately as service time. Run with:
+
+    neon-mq-load --queue <target_queue> --rate 100 --duration 30
+        --arrival poisson --json load.json --hgrm load.hgrm
+"""
+
+ARRIVAL_PATTERNS = ('constant', 'poisson', 'bursty')
+LOAD_MODES = ('request', 'publish')
+DEFAULT_TEMPLATE = {"data": "${data}"}
+
+
+def arrival_offsets(pattern: str = 'constant', rate: float = 100.0,
+                    count: int = 0, duration: float = 0.0,
+                    burst_size: int = 10,
+                    seed: Optional[int] = None) -> Iterator[float]:
+    """
+    Generate the times at which to send messages
+    :param pattern: `constant` spacing, `poisson` (exponentially distributed
+        gaps) or `bursty` (`burst_size` messages at once, spaced so the mean
+        rate is `rate`)
+    :param rate: mean messages per second
+    :param count: number of messages to generate (0 for no limit)
+    :param duration: seconds to generate messages for (0 for no limit)
+    :param burst_size: number of messages per burst with `bursty` arrivals
+    :param seed: random seed for reproducible `poisson` arrivals
+    :returns: iterator of seconds from the start of the run
+    """
+    if pattern not in ARRIVAL_PATTERNS:
+        raise ValueError(f"Unknown arrival pattern: {pattern}")
+    if rate <= 0:
+        raise ValueError(f"rate must be positive, not {rate}")
+    if not count and not duration:
+        raise ValueError("count or duration is required")
+    rng = random.Random(seed)
+    offset = 0.0
+    seq = 0
+    while (not count or seq < count) and (not duration or offset < duration):
+        yield offset
+        seq += 1
+        if pattern == 'constant':
+            offset = seq / rate
+        elif pattern == 'poisson':
+            offset += rng.expovariate(rate)
+        elif seq % burst_size == 0:
+            offset = seq / rate
+
+
+class PayloadTemplate:
+    """
+    Renders the request data of each message from a JSON template. String
+    values may reference `${seq}` (message number), `${uuid}` (random hex
+    string), `${time}` (epoch seconds) and `${data}` (`payload_size`
+    characters of filler); a string consisting only of `${seq}` or `${time}`
+    is rendered as a number.
+    """
+
+    def __init__(self, template: Optional[dict] = None,
+                 payload_size: int = 64):
+        """
+        :param template: request data with placeholders (defaults to
+            `{"data": "${data}"}`)
+        :param payload_size: number of characters in `${data}`
+        """
+        self.template = copy.deepcopy(template or DEFAULT_TEMPLATE)
+        self.data = 'x' * payload_size
+
+    def _render(self, value, variables: dict):
+        if isinstance(value, dict):
+            return {key: self._render(val, variables)
+                    for key, val in value.items()}
+        if isinstance(value, list):
+            return [self._render(val, variables) for val in value]
+        if isinstance(value, str):
+            if value in ("${seq}", "${time}"):
+                return variables[value[2:-1]]
+            return Template(value).safe_substitute(variables)
+        return value
+
+    def render(self, seq: int) -> dict:
+        """
+        Render the request data of message number `seq`
+        """
+        return self._render(self.template, {"seq": seq,
+                                            "uuid": uuid.uuid4().hex,
+                                            "time": time.time(),
+                                            "data": self.data})
+
+
+class LoadProfile(NamedTuple):
+    """
+    Schedule of a load test
+    """
+    arrival: str = 'constant'
+    rate: float = 100.0
+    duration: float = 10.0
+    count: int = 0
+    burst_size: int = 10
+    concurrency: int = 8
+    seed: Optional[int] = None
+
+    def offsets(self) -> Iterator[float]:
+        return arrival_offsets(self.arrival, self.rate, self.count,
+                               self.duration, self.burst_size, self.seed)
+
+
+class LoadResult(NamedTuple):
+    """
+    Measurements of a load test
+    """
+    profile: LoadProfile
+    sent: int
+    succeeded: int
+    seconds: float
+    max_backlog: int
+    latency: LatencyHistogram
+    service_time: LatencyHistogram
+
+    @property
+    def failed(self) -> int:
+        return self.sent - self.succeeded
+
+    def to_dict(self) -> dict:
+        return {"profile": self.profile._asdict(),
+                "sent": self.sent,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "seconds": self.seconds,
+                "rate": self.sent / self.seconds if self.seconds else 0.0,
+                "max_backlog": self.max_backlog,
+                "latency": self.latency.to_dict(),
+                "service_time": self.service_time.to_dict()}
+
+
+class LoadGenerator:
+    """
+    Sends messages on the schedule of a `LoadProfile` from a pool of worker
+    threads. The schedule is kept regardless of how long sending takes;
+    messages that are due while all workers are busy wait in a backlog.
+    """
+
+    def __init__(self, send: Callable[[dict], bool], profile: LoadProfile,
+                 template: Optional[PayloadTemplate] = None):
+        """
+        :param send: sends one message with the given request data,
+            returning True if it succeeded. Called concurrently by
+            `profile.concurrency` threads
+        :param profile: schedule to send messages on
+        :param template: template of the request data of messages
+        """
+        if profile.concurrency < 1:
+            raise ValueError(f"concurrency must be positive, "
+                             f"not {profile.concurrency}")
+        self.send = send
+        self.profile = profile
+        self.template = template or PayloadTemplate()
+
+    def _work(self, backlog: Queue, latency: LatencyHistogram,
+              service_time: LatencyHistogram, succeeded: List[int]):
+        while True:
+            item = backlog.get()
+            if item is None:
+                return
+            seq, intended = item
+            data = self.template.render(seq)
+            sent = time.perf_counter()
+            try:
+                ok = self.send(data)
+            except Exception as e:
+                LOG.warning(f"Failed to send message {seq}: {e}")
+                ok = False
+            done = time.perf_counter()
+            latency.record(done - intended)
+            service_time.record(done - sent)
+            if ok:
+                succeeded[0] += 1
+
+    def run(self) -> LoadResult:
+        """
+        Send all scheduled messages and wait for them to complete
+        :returns: measurements of the run
+        """
+        backlog = Queue()
+        workers = list()
+        for idx in range(self.profile.concurrency):
+            args = (backlog, LatencyHistogram(), LatencyHistogram(), [0])
+            thread = threading.Thread(target=self._work, args=args,
+                                      name=f"load_worker_{idx}", daemon=True)
+            workers.append((thread, args))
+            thread.start()
+        sent = 0
+        max_backlog = 0
+        start = time.perf_counter()
+        for seq, offset in enumerate(self.profile.offsets()):
+            intended = start + offset
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            backlog.put((seq, intended))
+            sent += 1
+            max_backlog = max(max_backlog, backlog.qsize())
+        for _ in workers:
+            backlog.put(None)
+        latency = LatencyHistogram()
+        service_time = LatencyHistogram()
+        succeeded = 0
+        for thread, args in workers:
+            thread.join()
+            latency.merge(args[1])
+            service_time.merge(args[2])
+            succeeded += args[3][0]
+        return LoadResult(self.profile, sent, succeeded,
+                          time.perf_counter() - start, max_backlog, latency,
+                          service_time)
+
+
+class RequestSender:
+    """
+    Sends messages with `send_mq_request` and waits for each response. Note
+    that `send_mq_request` connects with the `mq_handler` user of the global
+    MQ config and the transport set with `transport_utils.set_transport`.
+    """
+
+    def __init__(self, vhost: str, queue: str, timeout: float = 30):
+        """
+        :param vhost: vhost of `queue`
+        :param queue: queue of the service to send requests to
+        :param timeout: seconds to wait for each response
+        """
+        self.vhost = vhost
+        self.queue = queue
+        self.timeout = timeout
+
+    def __call__(self, data: dict) -> bool:
+        from neon_mq_connector.utils.client_utils import send_mq_request
+        return bool(send_mq_request(self.vhost, data, self.queue,
+                                    timeout=self.timeout))
+
+    def close(self):
+        pass
+
+
+class PublishSender:
+    """
+    Publishes messages with `MQConnector.emit_mq_message` over one
+    connection per worker thread, without waiting for any response
+    """
+
+    def __init__(self, connector: MQConnector, vhost: str, queue: str,
+                 expiration: int = 1000):
+        """
+        :param connector: connector to create connections with
+        :param vhost: vhost of `queue`
+        :param queue: queue to publish to
+        :param expiration: message expiration in milliseconds
+        """
+        self.connector = connector
+        self.vhost = vhost
+        self.queue = queue
+        self.expiration = expiration
+        self._local = threading.local()
+        self._connections = list()
+        self._lock = threading.Lock()
+
+    def __call__(self, data: dict) -> bool:
+        connection = getattr(self._local, 'connection', None)
+        if not connection or not connection.is_open:
+            connection = self.connector.create_mq_connection(self.vhost)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        self.connector.emit_mq_message(connection, data, queue=self.queue,
+                                       expiration=self.expiration)
+        return True
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, list()
+        for connection in connections:
+            if connection.is_open:
+                connection.close()
+
+
+def run_load(config: dict, service_name: str, queue: str,
+             profile: LoadProfile, template: Optional[PayloadTemplate] = None,
+             mode: str = 'request', vhost: str = '/', timeout: float = 30,
+             echo: bool = False,
+             transport: Optional[Transport] = None) -> dict:
+    """
+    Run a load test against `queue`
+    :param config: MQ config with credentials for `service_name`
+    :param service_name: name of the service user to publish as
+    :param queue: queue of the service under test
+    :param profile: schedule to send messages on
+    :param template: template of the request data of messages
+    :param mode: `request` to wait for responses with `send_mq_request`, or
+        `publish` to only publish messages
+    :param vhost: vhost of `queue`
+    :param timeout: seconds to wait for each response or message expiration
+    :param echo: if True, consume `queue` with a responder in this process,
+        i.e. to test the connector itself against the in-memory broker
+    :param transport: transport to connect with (defaults to the one set
+        with `transport_utils.set_transport`)
+    :returns: JSON-serializable load test report
+    """
+    if mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load mode: {mode}")
+    transport = transport or get_transport()
+    connector = MQConnector(config, service_name)
+    connector.vhost = vhost
+    connector.transport = transport
+    if mode == 'request':
+        sender = RequestSender(vhost, queue, timeout)
+    else:
+        sender = PublishSender(connector, vhost, queue, int(timeout * 1000))
+    previous = set_transport(transport)
+    try:
+        if echo:
+            register_responder(connector, vhost, queue, "load_responder")
+            connector.run_consumers()
+            deadline = time.monotonic() + timeout
+            while not connector.consumers["load_responder"].is_consuming:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Responder of {queue} not started")
+                time.sleep(0.01)
+        result = LoadGenerator(sender, profile, template).run()
+    finally:
+        sender.close()
+        connector.stop()
+        set_transport(previous)
+    return {"environment": get_environment(config, transport),
+            "mode": mode,
+            "queue": queue,
+            "result": result.to_dict()}
+
+
+def render_summary(report: dict) -> str:
+    """
+    Render a load test report as a short text summary
+    :param report: report returned by `run_load`
+    """
+    result = report["result"]
+    profile = result["profile"]
+    lines = [f"{report['mode']} {report['queue']}: {profile['arrival']} "
+             f"arrivals at {profile['rate']:g}/s, concurrency "
+             f"{profile['concurrency']}",
+             f"sent {result['sent']} in {result['seconds']:.2f}s "
+             f"({result['rate']:.1f}/s), failed {result['failed']}, "
+             f"max backlog {result['max_backlog']}",
+             f"{'':>14}" + ''.join(f"{'p' + pct:>10}" for pct in
+                                   result["latency"]["percentiles"])]
+    for key in ("latency", "service_time"):
+        lines.append(f"{key + ' ms':>14}" + ''.join(
+            f"{value * 1000:10.2f}" for value in
+            result[key]["percentiles"].values()))
+    return '\n'.join(lines)
+
+
+def _load_template(value: Optional[str]) -> Optional[dict]:
+    if not value:
+        return None
+    if value.startswith('@'):
+        with open(value[1:]) as f:
+            return json.load(f)
+    return json.loads(value)
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(prog="neon-mq-load",
+                            description="Open-loop load generator for MQ "
+                                        "services")
+    parser.add_argument("--queue", required=True,
+                        help="queue of the service to load")
+    parser.add_argument("--mode", choices=LOAD_MODES, default="request",
+                        help="wait for responses, or only publish")
+    parser.add_argument("--broker", choices=("rabbitmq", "memory"),
+                        default="rabbitmq",
+                        help="load RabbitMQ or the in-process broker")
+    parser.add_argument("--config", help="path to an MQ config JSON file "
+                                         "(defaults to the global config)")
+    parser.add_argument("--service", default="mq_handler",
+                        help="service user in the config to publish as")
+    parser.add_argument("--vhost", default="/")
+    parser.add_argument("--arrival", choices=ARRIVAL_PATTERNS,
+                        default="constant")
+    parser.add_argument("--rate", type=float, default=100,
+                        help="mean messages per second")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds to send messages for")
+    parser.add_argument("--count", type=int, default=0,
+                        help="max messages to send (default no limit)")
+    parser.add_argument("--burst-size", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="number of messages in flight at most")
+    parser.add_argument("--seed", type=int,
+                        help="random seed for Poisson arrivals")
+    parser.add_argument("--template",
+                        help="request data JSON, or @path to a JSON file")
+    parser.add_argument("--payload-size", type=int, default=64,
+                        help="number of characters in ${data}")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--echo", action="store_true",
+                        help="respond to requests from this process")
+    parser.add_argument("--json", help="path to write the JSON report to")
+    parser.add_argument("--hgrm", help="path to write the latency "
+                                       "histogram to in HdrHistogram format")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = get_parser().parse_args(argv)
+    transport = None
+    if args.broker == "memory":
+        from neon_mq_connector.utils.memory_transport_utils import \
+            MemoryTransport
+        transport = MemoryTransport()
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+    elif transport:
+        config = {"server": "localhost",
+                  "users": {args.service: {"user": "load",
+                                           "password": "load"}}}
+    else:
+        config = MQConnector.init_config()
+    profile = LoadProfile(args.arrival, args.rate, args.duration, args.count,
+                          args.burst_size, args.concurrency, args.seed)
+    template = PayloadTemplate(_load_template(args.template),
+                               args.payload_size)
+    report = run_load(config, args.service, args.queue, profile, template,
+                      args.mode, args.vhost, args.timeout, args.echo,
+                      transport)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.hgrm:
+        with open(args.hgrm, 'w') as f:
+            f.write(LatencyHistogram.from_dict(
+                report["result"]["latency"]).to_hgrm())
+    print(render_summary(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+import sys
+import time
+import uuid
+
+from argparse import ArgumentParser
+from threading import Event, Thread
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from ovos_utils.log import LOG
+
+from neon_mq_connector.benchmarks.fault_proxy import FaultProxy
+from neon_mq_connector.benchmarks.harness import get_environment
+from neon_mq_connector.connector import MQConnector
+from neon_mq_connector.utils.cluster_utils import parse_endpoints
+from neon_mq_connector.utils.network_utils import b64_to_dict
+
+"""
+Time-to-recover of consumers and publishers from network faults injected by
+a `FaultProxy` between the connector and RabbitMQ. Probe messages are
+published continuously while a fault is injected; recovery is the time from
+the end of the fault until a probe published after it is delivered. For the
+`select` and `blocking` paths the consumer connects through the proxy; for
+`send_message` and `publish_sync` the publisher does. i.e.:
+
+    neon-mq-recovery --path select blocking send_message --fault restart
+        --fault-seconds 5 --json recovery.json
+
+Blackholed connections are only detected by AMQP heartbeats, so the
+`blackhole` fault needs a timeout longer than the broker heartbeat.
+"""
+
+RECOVERY_PATHS = ('select', 'blocking', 'send_message', 'publish_sync')
+FAULTS = ('reset', 'restart', 'stall', 'latency', 'blackhole')
+
+
+class RecoveryResult(NamedTuple):
+    path: str
+    fault: str
+    fault_seconds: float
+    # None if not recovered before the timeout
+    recovery_seconds: Optional[float]
+    probes_sent: int
+    probes_received: int
+    publish_errors: int
+
+    def to_dict(self) -> dict:
+        return self._asdict()
+
+
+def inject_fault(proxy: FaultProxy, fault: str, duration: float,
+                 latency: float = 1.0):
+    """
+    Inject a fault and return once it is over
+    :param proxy: proxy to inject the fault with
+    :param fault: one of `FAULTS`
+    :param duration: seconds the fault lasts; `reset` is instantaneous
+    :param latency: seconds of latency added by the `latency` fault
+    """
+    if fault == 'reset':
+        proxy.reset_connections()
+        return
+    if fault == 'restart':
+        proxy.restart(duration)
+        return
+    if fault == 'stall':
+        proxy.stall()
+    elif fault == 'latency':
+        proxy.set_latency(latency)
+    elif fault == 'blackhole':
+        proxy.blackhole()
+    else:
+        raise ValueError(f"Unknown fault: {fault}")
+    time.sleep(duration)
+    proxy.heal()
+
+
+def get_proxied_config(config: dict, proxy: FaultProxy) -> dict:
+    """
+    Get a copy of `config` connecting through `proxy`
+    """
+    host, port = proxy.address
+    config = {key: value for key, value in config.items()
+              if key != 'servers'}
+    config.update({"server": host, "port": port})
+    return config
+
+
+class _Prober:
+    """
+    Publishes numbered probes and records when each is published and
+    received
+    """
+
+    def __init__(self, publish: Callable[[dict], None],
+                 interval: float = 0.05):
+        self.publish = publish
+        self.interval = interval
+        self.published: Dict[int, float] = dict()
+        self.received: Dict[int, float] = dict()
+        self.errors = 0
+        self._stopping = Event()
+        self._thread = Thread(target=self._run, daemon=True,
+                              name="recovery_prober")
+
+    def on_message(self, _channel, _method, _properties, body):
+        probe = b64_to_dict(body).get("probe")
+        if probe is not None:
+            self.received.setdefault(probe, time.monotonic())
+
+    def _run(self):
+        probe = 0
+        while not self._stopping.is_set():
+            probe += 1
+            self.published[probe] = time.monotonic()
+            try:
+                self.publish({"probe": probe})
+            except Exception as e:
+                LOG.debug(f"Probe {probe} not published: {e}")
+                self.errors += 1
+            self._stopping.wait(self.interval)
+
+    def first_received_after(self, start: float) -> Optional[float]:
+        """
+        Get the time the first probe published after `start` was received
+        """
+        times = [self.received[probe] for probe, published in
+                 list(self.published.items())
+                 if published >= start and probe in self.received]
+        return min(times) if times else None
+
+    def wait_received_after(self, start: float,
+                            timeout: float) -> Optional[float]:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            received = self.first_received_after(start)
+            if received is not None:
+                return received
+            time.sleep(0.01)
+        return None
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+
+
+def _delete_probe_queue(connector: MQConnector, vhost: str, queue: str,
+                        exchange: Optional[str] = None):
+    try:
+        with connector.create_mq_connection(vhost) as connection:
+            channel = connection.channel()
+            channel.queue_delete(queue)
+            if exchange:
+                channel.exchange_delete(exchange)
+    except Exception as e:
+        LOG.warning(f"Failed to delete recovery probe queue {queue}: {e}")
+
+
+def measure_recovery(config: dict, service_name: str, path: str,
+                     fault: str, fault_seconds: float = 5,
+                     proxy: Optional[FaultProxy] = None, vhost: str = '/',
+                     timeout: float = 120, probe_interval: float = 0.05,
+                     latency: float = 1.0) -> RecoveryResult:
+    """
+    Measure how long one path takes to recover from a fault
+    :param config: MQ config with credentials for `service_name`
+    :param service_name: name of the service user to connect as
+    :param path: one of `RECOVERY_PATHS`
+    :param fault: one of `FAULTS`
+    :param fault_seconds: seconds the fault lasts
+    :param proxy: started proxy to the broker in `config`; if None, one is
+        started for this measurement
+    :param vhost: vhost to declare probe queues in
+    :param timeout: max seconds to wait for probes before and after the fault
+    :param probe_interval: seconds between probes, which limits the
+        resolution of the result
+    :param latency: seconds of latency added by the `latency` fault
+    :returns: RecoveryResult
+    """
+    if path not in RECOVERY_PATHS:
+        raise ValueError(f"Unknown path: {path}")
+    if fault not in FAULTS:
+        raise ValueError(f"Unknown fault: {fault}")
+    own_proxy = proxy is None
+    if own_proxy:
+        proxy = FaultProxy(tuple(parse_endpoints(config)[0])).start()
+    direct = MQConnector(config, service_name)
+    proxied = MQConnector(get_proxied_config(config, proxy), service_name)
+    if path in ('select', 'blocking'):
+        consumer, publisher = proxied, direct
+    else:
+        consumer, publisher = direct, proxied
+    consumer.async_consumers_enabled = path != 'blocking'
+    queue = f"recovery_{uuid.uuid4().hex}"
+
+    if path == 'publish_sync':
+        def _publish(data: dict):
+            publisher.publish_sync(data, vhost, exchange=queue)
+    else:
+        def _publish(data: dict):
+            publisher.send_message(data, vhost, queue=queue)
+
+    prober = _Prober(_publish, probe_interval)
+    if path == 'publish_sync':
+        consumer.register_subscriber("recovery_probe", vhost,
+                                     prober.on_message, exchange=queue,
+                                     restart_attempts=-1)
+    else:
+        consumer.register_consumer("recovery_probe", vhost, queue,
+                                   prober.on_message, restart_attempts=-1)
+    recovered = None
+    try:
+        consumer.run_consumers(names=("recovery_probe",))
+        start = time.monotonic()
+        prober.start()
+        if prober.wait_received_after(start, timeout) is None:
+            raise TimeoutError(f"No probes received on {path} before the "
+                               f"fault")
+        inject_fault(proxy, fault, fault_seconds, latency)
+        healed = time.monotonic()
+        received = prober.wait_received_after(healed, timeout)
+        if received is not None:
+            recovered = received - healed
+    finally:
+        prober.stop()
+        consumer.stop()
+        publisher.stop()
+        # Subscribers consume from a queue bound to the `queue` exchange
+        _delete_probe_queue(
+            direct, vhost,
+            consumer.consumer_properties["recovery_probe"]["properties"]
+            ["queue"], queue if path == 'publish_sync' else None)
+        if own_proxy:
+            proxy.stop()
+        else:
+            proxy.heal()
+    return RecoveryResult(path, fault, fault_seconds, recovered,
+                          len(prober.published), len(prober.received),
+                          prober.errors)
+
+
+def run_recovery(config: dict, service_name: str,
+                 paths: Sequence[str] = RECOVERY_PATHS,
+                 faults: Sequence[str] = FAULTS, fault_seconds: float = 5,
+                 vhost: str = '/', timeout: float = 120,
+                 latency: float = 1.0) -> dict:
+    """
+    Measure the recovery of each path from each fault
+    :param config: MQ config with credentials for `service_name`
+    :param service_name: name of the service user to connect as
+    :param paths: paths to measure (see `RECOVERY_PATHS`)
+    :param faults: faults to inject (see `FAULTS`)
+    :param fault_seconds: seconds each fault lasts
+    :param vhost: vhost to declare probe queues in
+    :param timeout: max seconds to wait for each path to recover
+    :param latency: seconds of latency added by the `latency` fault
+    :returns: JSON-serializable report
+    """
+    results: List[RecoveryResult] = list()
+    with FaultProxy(tuple(parse_endpoints(config)[0])) as proxy:
+        for fault in faults:
+            for path in paths:
+                LOG.info(f"Measuring recovery of {path} from {fault}")
+                results.append(measure_recovery(
+                    config, service_name, path, fault, fault_seconds, proxy,
+                    vhost, timeout, latency=latency))
+    return {"environment": get_environment(config),
+            "results": [result.to_dict() for result in results]}
+
+
+def render_summary(report: dict) -> str:
+    """
+    Render a recovery report as a Markdown table
+    :param report: report returned by `run_recovery`
+    """
+    lines = ["| Fault | Path | Fault (s) | Recovery (s) | Publish errors |",
+             "|---|---|---|---|---|"]
+    for result in report["results"]:
+        recovery = result["recovery_seconds"]
+        lines.append(f"| {result['fault']} | {result['path']} | "
+                     f"{result['fault_seconds']:g} | "
+                     f"{'timed out' if recovery is None else f'{recovery:.3f}'}"
+                     f" | {result['publish_errors']} |")
+    return '\n'.join(lines)
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(prog="neon-mq-recovery",
+                            description="Measure how long MQConnector "
+                                        "consumers and publishers take to "
+                                        "recover from network faults")
+    parser.add_argument("--config", help="path to an MQ config JSON file "
+                                         "(defaults to the global config)")
+    parser.add_argument("--service", default="mq_handler",
+                        help="service user in the config to connect as")
+    parser.add_argument("--vhost", default="/")
+    parser.add_argument("--path", nargs='+', choices=RECOVERY_PATHS,
+                        default=list(RECOVERY_PATHS))
+    parser.add_argument("--fault", nargs='+', choices=FAULTS,
+                        default=list(FAULTS))
+    parser.add_argument("--fault-seconds", type=float, default=5,
+                        help="seconds each fault lasts")
+    parser.add_argument("--latency", type=float, default=1.0,
+                        help="seconds of latency added by the latency fault")
+    parser.add_argument("--timeout", type=float, default=120,
+                        help="max seconds to wait for recovery")
+    parser.add_argument("--json", help="path to write the JSON report to")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = get_parser().parse_args(argv)
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+    else:
+        config = MQConnector.init_config()
+    report = run_recovery(config, args.service, args.path, args.fault,
+                          args.fault_seconds, args.vhost, args.timeout,
+                          args.latency)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(render_summary(report))
+    return 0 if all(result["recovery_seconds"] is not None
+                    for result in report["results"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
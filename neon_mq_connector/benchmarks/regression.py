@@ -0,0 +1,395 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+import math
+import statistics
+import time
+import uuid
+
+from functools import lru_cache
+from timeit import timeit
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, \
+    Sequence
+
+from pika import BasicProperties
+from ovos_utils.log import LOG
+
+from neon_mq_connector.benchmarks.harness import BenchmarkRunner, Scenario, \
+    get_environment
+from neon_mq_connector.connector import MQConnector
+from neon_mq_connector.utils.network_utils import b64_to_dict, dict_to_b64
+from neon_mq_connector.utils.transport_utils import Transport
+
+"""
+Benchmark regression gate. A fixed suite of benchmarks (message codec,
+callback wrappers, and publish and consume throughput on the in-process
+broker) is run for several interleaved trials and compared to a baseline
+saved by a previous run. A benchmark regresses when its median is worse than
+the baseline by more than its tolerance and a one-sided Mann-Whitney U test
+rejects that the difference is noise. Baselines are machine-specific; save
+one on the machine that runs the gate, i.e.:
+
+    python -m neon_mq_connector.benchmarks --baseline baseline.json
+        --update-baseline
+    python -m neon_mq_connector.benchmarks --baseline baseline.json
+"""
+
+DEFAULT_TRIALS = 5
+DEFAULT_ALPHA = 0.05
+# Messages per throughput trial
+THROUGHPUT_MESSAGES = 500
+
+_SAMPLE_REQUEST = {"msg_type": "recognizer_loop:utterance",
+                   "data": {"utterances": ["what time is it"] * 4,
+                            "lang": "en-us"},
+                   "context": {"session": {"session_id": "x" * 32},
+                               "mq": {"message_id": "y" * 32},
+                               "timing": {"transcribed": 1.0}},
+                   "message_id": "z" * 32,
+                   "routing_key": "response_queue"}
+
+
+class RegressionBenchmark(NamedTuple):
+    """
+    A benchmark measured once per trial
+    """
+    name: str
+    unit: str
+    higher_is_better: bool
+    tolerance: float
+    measure: Callable[['RegressionContext'], float]
+
+
+class RegressionContext:
+    """
+    Shared state of the benchmarks of a run
+    """
+
+    def __init__(self, transport: Transport):
+        """
+        :param transport: transport to measure throughput with
+        """
+        self.transport = transport
+        self.config = {"server": "localhost",
+                       "users": {"benchmark": {"user": "benchmark",
+                                               "password": "benchmark"}}}
+        self.runner = BenchmarkRunner(self.config, "benchmark",
+                                      transport=transport)
+
+
+def _per_op_us(func: Callable[[], object], number: int) -> float:
+    return timeit(func, number=number) / number * 1e6
+
+
+def _measure_encode(_: RegressionContext) -> float:
+    return _per_op_us(lambda: dict_to_b64(_SAMPLE_REQUEST), 2000)
+
+
+def _measure_decode(_: RegressionContext) -> float:
+    body = dict_to_b64(_SAMPLE_REQUEST)
+    return _per_op_us(lambda: b64_to_dict(body), 2000)
+
+
+def _measure_callback_wrapper(_: RegressionContext) -> float:
+    from neon_mq_connector.utils.rabbit_utils import create_mq_callback
+
+    @create_mq_callback(include_callback_props=('body',))
+    def _handler(body: dict):
+        return body
+
+    body = dict_to_b64(_SAMPLE_REQUEST)
+    properties = BasicProperties()
+    return _per_op_us(lambda: _handler(None, None, properties, body), 2000)
+
+
+def _measure_handle_message(_: RegressionContext) -> float:
+    from types import SimpleNamespace
+    from neon_mq_connector.utils.consumer_utils import handle_message
+    consumer = SimpleNamespace(queue="benchmark", auto_ack=True,
+                               callback_func=lambda *_: None)
+    properties = BasicProperties()
+    return _per_op_us(lambda: handle_message(consumer, None, None,
+                                             properties, b""), 5000)
+
+
+def _measure_publish(context: RegressionContext) -> float:
+    connector = MQConnector(context.config, "benchmark")
+    connector.transport = context.transport
+    queue = f"neon_mq_benchmark_{uuid.uuid4().hex[:8]}"
+    with connector.create_mq_connection('/') as connection:
+        start = time.perf_counter()
+        for _ in range(THROUGHPUT_MESSAGES):
+            connector.emit_mq_message(connection, _SAMPLE_REQUEST,
+                                      queue=queue, expiration=60000)
+        seconds = time.perf_counter() - start
+        connection.channel().queue_delete(queue)
+    return THROUGHPUT_MESSAGES / seconds
+
+
+def _consume_rate(consumer: str) -> Callable[[RegressionContext], float]:
+    def _measure(context: RegressionContext) -> float:
+        result = context.runner.run_scenario(
+            Scenario(consumer, messages=THROUGHPUT_MESSAGES))
+        if result.received != result.published:
+            raise RuntimeError(f"{consumer} consumer lost "
+                               f"{result.published - result.received} "
+                               f"messages")
+        return result.consume_rate
+    return _measure
+
+
+BENCHMARKS = (
+    RegressionBenchmark("codec_encode", "us", False, 0.15, _measure_encode),
+    RegressionBenchmark("codec_decode", "us", False, 0.15, _measure_decode),
+    RegressionBenchmark("callback_wrapper", "us", False, 0.15,
+                        _measure_callback_wrapper),
+    RegressionBenchmark("handle_message", "us", False, 0.2,
+                        _measure_handle_message),
+    RegressionBenchmark("publish_throughput", "msg/s", True, 0.25,
+                        _measure_publish),
+    RegressionBenchmark("blocking_consume_throughput", "msg/s", True, 0.25,
+                        _consume_rate('blocking')),
+    RegressionBenchmark("select_consume_throughput", "msg/s", True, 0.25,
+                        _consume_rate('select')),
+)
+
+
+def run_benchmarks(names: Optional[Iterable[str]] = None,
+                   trials: int = DEFAULT_TRIALS,
+                   transport: Optional[Transport] = None) -> dict:
+    """
+    Run regression benchmarks. Trials of different benchmarks are
+    interleaved so drift in machine load affects all of them alike.
+    :param names: names of benchmarks to run (default all)
+    :param trials: number of measurements of each benchmark
+    :param transport: transport to measure throughput with (defaults to a
+        new in-process broker)
+    :returns: JSON-serializable results, which may be saved as a baseline
+    """
+    if not transport:
+        from neon_mq_connector.utils.memory_transport_utils import \
+            MemoryTransport
+        transport = MemoryTransport()
+    benchmarks = [benchmark for benchmark in BENCHMARKS
+                  if names is None or benchmark.name in names]
+    unknown = set(names or ()) - {benchmark.name for benchmark in BENCHMARKS}
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {sorted(unknown)}")
+    context = RegressionContext(transport)
+    samples: Dict[str, List[float]] = {benchmark.name: list()
+                                       for benchmark in benchmarks}
+    # Warm up caches and lazy imports before measuring
+    for benchmark in benchmarks:
+        benchmark.measure(context)
+    for trial in range(trials):
+        LOG.info(f"Running benchmark trial {trial + 1}/{trials}")
+        for benchmark in benchmarks:
+            samples[benchmark.name].append(benchmark.measure(context))
+    return {"environment": get_environment(transport=transport),
+            "trials": trials,
+            "benchmarks": {benchmark.name: {
+                "unit": benchmark.unit,
+                "higher_is_better": benchmark.higher_is_better,
+                "tolerance": benchmark.tolerance,
+                "median": statistics.median(samples[benchmark.name]),
+                "samples": samples[benchmark.name]}
+                for benchmark in benchmarks}}
+
+
+@lru_cache(maxsize=None)
+def _u_counts(m: int, n: int) -> tuple:
+    """
+    Count the orderings of `m` baseline and `n` current values by the number
+    of (baseline, current) pairs where the current value is greater
+    """
+    if not m or not n:
+        return 1,
+    counts = [0] * (m * n + 1)
+    # The largest value is either a baseline value (adding no pairs) or a
+    # current value greater than all `m` baseline values
+    for u, count in enumerate(_u_counts(m - 1, n)):
+        counts[u] += count
+    for u, count in enumerate(_u_counts(m, n - 1)):
+        counts[u + m] += count
+    return tuple(counts)
+
+
+def mann_whitney_greater(baseline: Sequence[float],
+                         current: Sequence[float]) -> float:
+    """
+    One-sided Mann-Whitney U test that `current` values tend to be greater
+    than `baseline` values. Exact for small samples without ties; otherwise
+    uses the normal approximation with tie correction.
+    :returns: p-value of observing the samples if they do not differ
+    """
+    m, n = len(baseline), len(current)
+    if not m or not n:
+        return 1.0
+    combined = sorted([(value, 0) for value in baseline] +
+                      [(value, 1) for value in current])
+    ranks = dict()
+    ties = list()
+    idx = 0
+    while idx < len(combined):
+        end = idx
+        while end + 1 < len(combined) and \
+                combined[end + 1][0] == combined[idx][0]:
+            end += 1
+        ranks[combined[idx][0]] = (idx + end) / 2 + 1
+        ties.append(end - idx + 1)
+        idx = end + 1
+    u = sum(ranks[value] for value in current) - n * (n + 1) / 2
+    if len(ties) == m + n and m + n <= 40:
+        counts = _u_counts(m, n)
+        return sum(counts[math.ceil(u):]) / math.comb(m + n, m)
+    total = m + n
+    variance = m * n / 12 * ((total + 1) - sum(t ** 3 - t for t in ties) /
+                             (total * (total - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - m * n / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+class Comparison(NamedTuple):
+    """
+    Result of comparing a benchmark to its baseline
+    """
+    name: str
+    unit: str
+    baseline: Optional[float]
+    current: Optional[float]
+    change: Optional[float]
+    tolerance: Optional[float]
+    p_value: Optional[float]
+    status: str
+
+    @property
+    def failed(self) -> bool:
+        return self.status == 'regression'
+
+
+def compare_results(baseline: dict, current: dict,
+                    alpha: float = DEFAULT_ALPHA,
+                    tolerances: Optional[Dict[str, float]] = None
+                    ) -> List[Comparison]:
+    """
+    Compare benchmark results to a baseline
+    :param baseline: results returned by `run_benchmarks` for the baseline
+    :param current: results returned by `run_benchmarks` to check
+    :param alpha: significance level of the test for a difference
+    :param tolerances: fractions by which benchmarks may be worse than the
+        baseline, overriding the tolerances saved in the baseline
+    :returns: comparison of each benchmark in either result; `status` is
+        `regression`, `improvement`, `pass`, `new` or `missing`
+    """
+    tolerances = tolerances or dict()
+    comparisons = list()
+    base_results = baseline.get("benchmarks", {})
+    current_results = current.get("benchmarks", {})
+    for name in list(base_results) + [name for name in current_results
+                                      if name not in base_results]:
+        base = base_results.get(name)
+        result = current_results.get(name)
+        if not base or not result:
+            known = base or result
+            comparisons.append(Comparison(
+                name, known["unit"], base and base["median"],
+                result and result["median"], None, None, None,
+                'missing' if base else 'new'))
+            continue
+        if 1 / math.comb(len(base["samples"]) + len(result["samples"]),
+                         len(base["samples"])) >= alpha:
+            LOG.warning(f"Too few trials of {name} to detect a difference "
+                        f"at alpha={alpha}")
+        tolerance = tolerances.get(name, base["tolerance"])
+        change = (result["median"] - base["median"]) / base["median"]
+        # Compare so that greater values are worse
+        sign = -1 if base["higher_is_better"] else 1
+        p_worse = mann_whitney_greater(
+            [sign * value for value in base["samples"]],
+            [sign * value for value in result["samples"]])
+        p_better = mann_whitney_greater(
+            [-sign * value for value in base["samples"]],
+            [-sign * value for value in result["samples"]])
+        if sign * change > tolerance and p_worse < alpha:
+            status, p_value = 'regression', p_worse
+        elif -sign * change > tolerance and p_better < alpha:
+            status, p_value = 'improvement', p_better
+        else:
+            status, p_value = 'pass', min(p_worse, p_better)
+        comparisons.append(Comparison(name, base["unit"], base["median"],
+                                      result["median"], change, tolerance,
+                                      p_value, status))
+    return comparisons
+
+
+def _format(value: Optional[float], spec: str) -> str:
+    return '-' if value is None else format(value, spec)
+
+
+def render_comparison(comparisons: Sequence[Comparison]) -> str:
+    """
+    Render benchmark comparisons as a Markdown table
+    """
+    lines = ["| Benchmark | Unit | Baseline | Current | Change | Tolerance | "
+             "p | Result |",
+             "|---|---|---:|---:|---:|---:|---:|---|"]
+    for comparison in comparisons:
+        lines.append(
+            f"| {comparison.name} | {comparison.unit} | "
+            f"{_format(comparison.baseline, '.2f')} | "
+            f"{_format(comparison.current, '.2f')} | "
+            f"{_format(comparison.change, '+.1%')} | "
+            f"{_format(comparison.tolerance, '.0%')} | "
+            f"{_format(comparison.p_value, '.3f')} | "
+            f"{'FAIL' if comparison.failed else 'ok'} "
+            f"({comparison.status}) |")
+    failed = sum(comparison.failed for comparison in comparisons)
+    lines += ["", f"{failed} regression(s)" if failed else "PASS"]
+    return '\n'.join(lines)
+
+
+def load_baseline(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, results: dict, baseline: Optional[dict] = None):
+    """
+    Save benchmark results as a baseline, keeping the tolerances of the
+    previous `baseline` so they may be tuned in the committed file
+    """
+    for name, result in results["benchmarks"].items():
+        previous = (baseline or {}).get("benchmarks", {}).get(name)
+        if previous:
+            result["tolerance"] = previous["tolerance"]
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
@@ -0,0 +1,443 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import gc
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from ovos_utils.log import LOG
+
+from neon_mq_connector.benchmarks.harness import get_environment, \
+    register_responder
+from neon_mq_connector.connector import MQConnector
+from neon_mq_connector.utils.client_utils import send_mq_request
+from neon_mq_connector.utils.consumer_utils import call_threadsafe
+from neon_mq_connector.utils.transport_utils import Transport, \
+    get_transport, set_transport
+
+"""
+Soak test of `MQConnector` for resource leaks. The connector is driven
+through cycles of registering, starting, restarting and stopping consumers
+(alternating select and blocking consumers), forced disconnects and bursts of
+`send_mq_request` while RSS, traced Python memory, open file descriptors and
+threads are sampled. After a warm-up, the growth of each sample over the run
+is estimated with a least-squares fit and the test fails if it exceeds a
+tolerance. Run for hours with:
+
+    neon-mq-soak --duration 14400 --sample-interval 60 --json soak.json
+"""
+
+# Allowed growth over a run; memory as a fraction of its value after warm-up,
+# file descriptors and threads as counts
+DEFAULT_TOLERANCES = {"rss_bytes": 0.1,
+                      "traced_bytes": 0.1,
+                      "open_fds": 4,
+                      "threads": 2}
+MEMORY_METRICS = ("rss_bytes", "traced_bytes")
+
+
+class SoakSample(NamedTuple):
+    elapsed: float
+    cycles: int
+    rss_bytes: int
+    traced_bytes: int
+    open_fds: int
+    threads: int
+
+
+class Trend(NamedTuple):
+    metric: str
+    start: float
+    growth: float
+    allowed: float
+
+    @property
+    def failed(self) -> bool:
+        return self.growth > self.allowed
+
+    def to_dict(self) -> dict:
+        return {**self._asdict(), "failed": self.failed}
+
+
+def get_rss() -> int:
+    """
+    Get the resident set size of this process in bytes. Where `/proc` is not
+    available, the peak RSS is returned instead.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def count_open_fds() -> int:
+    """
+    Get the number of open file descriptors of this process, or -1 if they
+    cannot be listed
+    """
+    for path in ('/proc/self/fd', '/dev/fd'):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return -1
+
+
+def take_sample(elapsed: float, cycles: int) -> SoakSample:
+    """
+    Sample the resources used by this process, after collecting garbage so
+    unreachable reference cycles are not counted
+    :param elapsed: seconds since the soak test started
+    :param cycles: number of cycles run so far
+    """
+    gc.collect()
+    traced = tracemalloc.get_traced_memory()[0] if \
+        tracemalloc.is_tracing() else 0
+    return SoakSample(elapsed, cycles, get_rss(), traced, count_open_fds(),
+                      threading.active_count())
+
+
+def fit_slope(xs: List[float], ys: List[float]) -> float:
+    """
+    Get the least-squares slope of `ys` over `xs`
+    """
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if not var_x:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+
+
+def check_trends(samples: List[SoakSample],
+                 tolerances: Optional[Dict[str, float]] = None,
+                 warmup: int = 0) -> List[Trend]:
+    """
+    Estimate the growth of each sampled resource
+    :param samples: samples in the order they were taken
+    :param tolerances: allowed growth per metric (see `DEFAULT_TOLERANCES`)
+    :param warmup: number of leading samples to ignore
+    :returns: trend of each metric; none if fewer than 3 samples remain
+    """
+    tolerances = {**DEFAULT_TOLERANCES, **(tolerances or {})}
+    samples = samples[warmup:]
+    if len(samples) < 3:
+        return []
+    xs = [sample.elapsed for sample in samples]
+    trends = list()
+    for metric, tolerance in tolerances.items():
+        ys = [getattr(sample, metric) for sample in samples]
+        if min(ys) < 0:
+            continue
+        slope = fit_slope(xs, ys)
+        start = sum(ys) / len(ys) - slope * (sum(xs) / len(xs) - xs[0])
+        allowed = tolerance * start if metric in MEMORY_METRICS else \
+            tolerance
+        trends.append(Trend(metric, start, slope * (xs[-1] - xs[0]),
+                            allowed))
+    return trends
+
+
+def force_disconnect(connector: MQConnector):
+    """
+    Drop the connections of the consumers of `connector`. With the in-memory
+    broker, all of its connections are closed as if it was restarted;
+    otherwise each consumer closes its connection.
+    """
+    broker = getattr(connector.transport, 'broker', None)
+    if broker is not None:
+        broker.close_connections()
+        return
+    for consumer in list(connector.consumers.values()):
+        channel = getattr(consumer, 'channel', None)
+        if channel is None or not channel.connection.is_open:
+            continue
+        call_threadsafe(channel, channel.connection.close,
+                        lambda e: LOG.debug(f"Failed to disconnect: {e}"))
+
+
+def _wait_for(check: Callable[[], bool], timeout: float, error: str):
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            raise TimeoutError(error)
+        time.sleep(0.01)
+
+
+def _wait_consuming(connector: MQConnector, name: str, timeout: float):
+    _wait_for(lambda: connector.consumers[name].is_consuming, timeout,
+              f"Consumer {name} not started")
+
+
+class SoakCycle:
+    """
+    One cycle of the soak workload
+    """
+
+    def __init__(self, connector: MQConnector, vhost: str,
+                 responder_queue: str, burst_size: int = 10,
+                 timeout: float = 30):
+        """
+        :param connector: connector to drive
+        :param vhost: vhost to declare soak queues in
+        :param responder_queue: queue of the responder requests are sent to
+        :param burst_size: number of concurrent requests per cycle
+        :param timeout: max seconds to wait for consumers and responses
+        """
+        self.connector = connector
+        self.vhost = vhost
+        self.responder_queue = responder_queue
+        self.burst_size = burst_size
+        self.timeout = timeout
+        self.errors = 0
+
+    @staticmethod
+    def _on_error(consumer, error: Exception):
+        # Blocking consumers stop when disconnected
+        LOG.debug(f"{consumer.name} stopped: {error!r}")
+
+    def _request(self, index: int) -> bool:
+        response = send_mq_request(self.vhost, {"data": index},
+                                   self.responder_queue,
+                                   timeout=self.timeout)
+        return bool(response)
+
+    def run(self, index: int):
+        """
+        Run cycle `index`
+        """
+        connector = self.connector
+        name = f"soak_consumer_{index % 2}"
+        connector.async_consumers_enabled = index % 2 == 0
+        connector.register_consumer(name, self.vhost, f"soak_q_{index % 2}",
+                                    lambda *_: None, restart_attempts=0,
+                                    on_error=self._on_error)
+        connector.run_consumers(names=(name,))
+        _wait_consuming(connector, name, self.timeout)
+        connector.restart_consumer(name)
+        _wait_consuming(connector, name, self.timeout)
+        # Select consumers reconnect in place; others are restarted
+        responder = connector.consumers["soak_responder"]
+        reconnects = getattr(responder, 'num_reconnects', 0)
+        force_disconnect(connector)
+        _wait_for(lambda: connector.consumers["soak_responder"] is not
+                  responder or responder.num_reconnects > reconnects,
+                  self.timeout, "Responder not disconnected")
+        _wait_consuming(connector, "soak_responder", self.timeout)
+        with ThreadPoolExecutor(self.burst_size,
+                                thread_name_prefix="soak_request") as pool:
+            self.errors += list(pool.map(self._request,
+                                         range(self.burst_size))).count(False)
+        connector.stop_consumers(names=(name,))
+        connector.consumers.pop(name, None)
+
+
+def run_soak(config: dict, service_name: str, duration: float,
+             sample_interval: float = 60, warmup: int = 2,
+             burst_size: int = 10, vhost: str = '/', timeout: float = 30,
+             tolerances: Optional[Dict[str, float]] = None,
+             top_allocations: int = 10,
+             transport: Optional[Transport] = None,
+             on_sample: Optional[Callable[[SoakSample], None]] = None) -> \
+        dict:
+    """
+    Run a soak test
+    :param config: MQ config with credentials for `service_name`
+    :param service_name: name of the service user to connect as
+    :param duration: seconds to run cycles for
+    :param sample_interval: seconds between samples
+    :param warmup: number of samples taken before trends are measured
+    :param burst_size: number of concurrent requests per cycle
+    :param vhost: vhost to declare soak queues in
+    :param timeout: max seconds to wait for consumers and responses
+    :param tolerances: allowed growth per metric (see `DEFAULT_TOLERANCES`)
+    :param top_allocations: number of allocation sites that grew the most
+        since warm-up to report
+    :param transport: transport to connect with (defaults to the one set
+        with `transport_utils.set_transport`)
+    :param on_sample: optional function called with each sample
+    :returns: JSON-serializable soak test report
+    """
+    transport = transport or get_transport()
+    connector = MQConnector(config, service_name)
+    connector.vhost = vhost
+    connector.transport = transport
+    previous = set_transport(transport)
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    samples: List[SoakSample] = list()
+    baseline = None
+    cycle = SoakCycle(connector, vhost, "soak_responder_q", burst_size,
+                      timeout)
+    cycles = 0
+    try:
+        register_responder(connector, vhost, "soak_responder_q",
+                           "soak_responder", restart_attempts=-1)
+        connector.run_consumers(names=("soak_responder",))
+        _wait_consuming(connector, "soak_responder", timeout)
+        start = time.monotonic()
+        next_sample = start
+        while True:
+            now = time.monotonic()
+            if now >= next_sample:
+                sample = take_sample(now - start, cycles)
+                samples.append(sample)
+                if len(samples) == warmup + 1:
+                    gc.collect()
+                    baseline = tracemalloc.take_snapshot()
+                if on_sample:
+                    on_sample(sample)
+                next_sample += sample_interval
+            if now - start >= duration:
+                break
+            cycle.run(cycles)
+            cycles += 1
+        grown = list()
+        if baseline:
+            gc.collect()
+            stats = tracemalloc.take_snapshot().compare_to(baseline,
+                                                           'lineno')
+            grown = [str(stat) for stat in stats[:top_allocations]
+                     if stat.size_diff > 0]
+    finally:
+        connector.stop()
+        set_transport(previous)
+        if started_tracing:
+            tracemalloc.stop()
+    trends = check_trends(samples, tolerances, warmup)
+    return {"environment": get_environment(config, transport),
+            "duration": duration,
+            "cycles": cycles,
+            "request_errors": cycle.errors,
+            "passed": not any(trend.failed for trend in trends),
+            "trends": [trend.to_dict() for trend in trends],
+            "top_allocations": grown,
+            "samples": [sample._asdict() for sample in samples]}
+
+
+def render_summary(report: dict) -> str:
+    """
+    Render a soak test report as a short text summary
+    :param report: report returned by `run_soak`
+    """
+    lines = [f"{report['cycles']} cycles in {report['duration']:g}s, "
+             f"{report['request_errors']} failed requests: "
+             f"{'PASSED' if report['passed'] else 'FAILED'}"]
+    for trend in report["trends"]:
+        lines.append(f"{trend['metric']:>14}: start {trend['start']:.0f}, "
+                     f"growth {trend['growth']:+.0f} (allowed "
+                     f"{trend['allowed']:.0f})"
+                     f"{' FAILED' if trend['failed'] else ''}")
+    if report["top_allocations"]:
+        lines.append("Top allocation growth since warm-up:")
+        lines.extend(f"  {line}" for line in report["top_allocations"])
+    return '\n'.join(lines)
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(prog="neon-mq-soak",
+                            description="Soak test MQConnector for thread, "
+                                        "socket and memory leaks")
+    parser.add_argument("--broker", choices=("rabbitmq", "memory"),
+                        default="rabbitmq",
+                        help="soak RabbitMQ or the in-process broker")
+    parser.add_argument("--config", help="path to an MQ config JSON file "
+                                         "(defaults to the global config)")
+    parser.add_argument("--service", default="mq_handler",
+                        help="service user in the config to connect as")
+    parser.add_argument("--vhost", default="/")
+    parser.add_argument("--duration", type=float, default=3600,
+                        help="seconds to run for")
+    parser.add_argument("--sample-interval", type=float, default=60,
+                        help="seconds between resource samples")
+    parser.add_argument("--warmup", type=int, default=2,
+                        help="number of samples to ignore in trends")
+    parser.add_argument("--burst-size", type=int, default=10,
+                        help="number of concurrent requests per cycle")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--tolerance", action="append", default=[],
+                        metavar="METRIC=VALUE",
+                        help="allowed growth of a metric (fraction for "
+                             "memory, count for open_fds and threads)")
+    parser.add_argument("--json", help="path to write the JSON report to")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = get_parser().parse_args(argv)
+    transport = None
+    if args.broker == "memory":
+        from neon_mq_connector.utils.memory_transport_utils import \
+            MemoryTransport
+        transport = MemoryTransport()
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+    elif transport:
+        config = {"server": "localhost",
+                  "users": {args.service: {"user": "soak",
+                                           "password": "soak"}}}
+    else:
+        config = MQConnector.init_config()
+    tolerances = dict()
+    for tolerance in args.tolerance:
+        metric, value = tolerance.split('=', 1)
+        if metric not in DEFAULT_TOLERANCES:
+            raise ValueError(f"Unknown metric: {metric}")
+        tolerances[metric] = float(value)
+
+    def _print_sample(sample: SoakSample):
+        print(f"{sample.elapsed:8.0f}s {sample.cycles:6d} cycles "
+              f"rss={sample.rss_bytes} traced={sample.traced_bytes} "
+              f"fds={sample.open_fds} threads={sample.threads}", flush=True)
+
+    report = run_soak(config, args.service, args.duration,
+                      args.sample_interval, args.warmup, args.burst_size,
+                      args.vhost, args.timeout, tolerances,
+                      transport=transport, on_sample=_print_sample)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(render_summary(report))
+    return 0 if report["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
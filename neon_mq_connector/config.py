@@ -26,12 +26,28 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import copy
+import inspect
 import os
 import json
-from typing import Optional
+import time
+import weakref
+
+from threading import Lock
+from typing import Optional, Callable, Dict, List, Tuple
 from ovos_utils.log import LOG
-from ovos_config.config import Configuration as _Config
-from ovos_config.locations import get_xdg_config_save_path
+
+# Seconds between checks for changed configuration files
+CONFIG_CHECK_INTERVAL = 5
+
+
+def _get_legacy_config_paths() -> Tuple[str, ...]:
+    from ovos_config.locations import get_xdg_config_save_path
+    return (
+        os.path.expanduser(os.environ.get('NEON_MQ_CONFIG_PATH', "")),
+        os.path.join(get_xdg_config_save_path("neon"), "mq_config.json"),
+        os.path.expanduser("~/.local/share/neon/credentials.json")
+    )
 
 
 def load_neon_mq_config():
@@ -41,11 +57,9 @@ def load_neon_mq_config():
     {NEON_CONFIG_PATH}/mq_config.json
     ~/.local/share/neon/credentials.json
     """
-    valid_config_paths = (
-        os.path.expanduser(os.environ.get('NEON_MQ_CONFIG_PATH', "")),
-        os.path.join(get_xdg_config_save_path("neon"), "mq_config.json"),
-        os.path.expanduser("~/.local/share/neon/credentials.json")
-    )
+    # ovos_config is slow to import, so only load it when needed
+    from ovos_config.config import Configuration as _Config
+    valid_config_paths = _get_legacy_config_paths()
     config = None
     for conf in valid_config_paths:
         if conf and os.path.isfile(conf):
@@ -58,6 +72,240 @@ def load_neon_mq_config():
     return config.get("MQ", config)
 
 
+class _FrozenDict(dict):
+    """
+    Read-only dict. Copies are regular, mutable dicts.
+    """
+
+    def _immutable(self, *_, **__):
+        raise TypeError("MQ config snapshot is read-only. Copy it to modify")
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return {key: copy.deepcopy(value, memo) for key, value in self.items()}
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return _FrozenDict((key, _freeze(val)) for key, val in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(val) for val in value)
+    return value
+
+
+class MQConfigSnapshot:
+    """
+    Read-only MQ configuration with connection parameters computed once per
+    service and vhost.
+    """
+
+    def __init__(self, config: Optional[dict],
+                 sources: Optional[Dict[str, Optional[int]]] = None):
+        """
+        :param config: MQ configuration
+        :param sources: configuration file paths mapped to their
+            modification times (None if missing) when `config` was loaded
+        """
+        self.config = _freeze(config or dict())
+        self.sources = dict(sources or {})
+        self._lock = Lock()
+        self._connection_params = dict()
+        self._endpoints = None
+
+    def get_service_config(self, service_name: str) -> dict:
+        """
+        Get the configuration of a service in `users`
+        :param service_name: name of the service
+        :returns: read-only service configuration (empty if not configured)
+        """
+        return self.config.get('users', {}).get(service_name) or _FrozenDict()
+
+    def get_connection_fields(self, service_name: str) -> tuple:
+        """
+        Get the configuration values connections of a service depend on
+        :param service_name: name of the service
+        :returns: tuple of server, port, username and password
+        """
+        service_config = self.get_service_config(service_name)
+        return (self.config.get('server', 'localhost'),
+                int(self.config.get('port', '5672')),
+                service_config.get('user', 'guest'),
+                service_config.get('password', 'guest'))
+
+    def get_connection_params(self, service_name: str, vhost: str):
+        """
+        Get connection parameters for a service. Parameters are cached, so
+        they must not be modified.
+        :param service_name: name of the service to get credentials for
+        :param vhost: virtual_host to connect to
+        :returns: pika.ConnectionParameters
+        """
+        key = (service_name, vhost)
+        with self._lock:
+            if key not in self._connection_params:
+                import pika
+                server, port, user, password = \
+                    self.get_connection_fields(service_name)
+                self._connection_params[key] = pika.ConnectionParameters(
+                    host=server, port=port, virtual_host=vhost,
+                    credentials=pika.PlainCredentials(user, password))
+            return self._connection_params[key]
+
+    def get_endpoints(self) -> tuple:
+        """
+        Get the configured broker endpoints
+        :returns: tuple of `cluster_utils.Endpoint` in configured order
+        """
+        if self._endpoints is None:
+            from neon_mq_connector.utils.cluster_utils import parse_endpoints
+            self._endpoints = parse_endpoints(self.config)
+        return self._endpoints
+
+    def get_cluster_connection_params(self, service_name: str,
+                                      vhost: str) -> dict:
+        """
+        Get connection parameters for a service for every configured endpoint.
+        Parameters are cached, so they must not be modified.
+        :param service_name: name of the service to get credentials for
+        :param vhost: virtual_host to connect to
+        :returns: dict of `cluster_utils.Endpoint` to pika.ConnectionParameters
+        """
+        key = (service_name, vhost, 'cluster')
+        with self._lock:
+            if key not in self._connection_params:
+                import pika
+                _, _, user, password = \
+                    self.get_connection_fields(service_name)
+                credentials = pika.PlainCredentials(user, password)
+                self._connection_params[key] = {
+                    endpoint: pika.ConnectionParameters(
+                        host=endpoint.host, port=endpoint.port,
+                        virtual_host=vhost, credentials=credentials)
+                    for endpoint in self.get_endpoints()}
+            return self._connection_params[key]
+
+    def is_stale(self) -> bool:
+        """
+        Check if any configuration file changed since this snapshot was loaded
+        """
+        return _get_source_mtimes(self.sources) != self.sources
+
+
+def _get_source_mtimes(paths) -> Dict[str, Optional[int]]:
+    mtimes = dict()
+    for path in paths:
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            mtimes[path] = None
+    return mtimes
+
+
+def _get_config_sources() -> List[str]:
+    from ovos_config.locations import get_config_locations
+    paths = [path for path in _get_legacy_config_paths() if path]
+    paths.extend(os.path.expanduser(path) for path in get_config_locations())
+    return paths
+
+
+_snapshot: Optional[MQConfigSnapshot] = None
+_snapshot_lock = Lock()
+_last_check = 0.0
+_listeners: List[weakref.ref] = list()
+
+
+def get_mq_config_snapshot() -> MQConfigSnapshot:
+    """
+    Get the process-wide MQ configuration snapshot, loading it on first use.
+    Configuration files are checked for changes at most every
+    `CONFIG_CHECK_INTERVAL` seconds.
+    :returns: current MQConfigSnapshot
+    """
+    snapshot = _snapshot
+    if snapshot is None or \
+            time.monotonic() - _last_check > CONFIG_CHECK_INTERVAL:
+        snapshot = reload_mq_config()
+    return snapshot
+
+
+def reload_mq_config(force: bool = False) -> MQConfigSnapshot:
+    """
+    Load a new process-wide MQ configuration snapshot if configuration files
+    changed. Listeners are notified if the configuration changed.
+    :param force: if True, reload even if no files changed
+    :returns: current MQConfigSnapshot
+    """
+    global _snapshot, _last_check
+    with _snapshot_lock:
+        _last_check = time.monotonic()
+        old = _snapshot
+        if old is not None and not force and not old.is_stale():
+            return old
+        # Read mtimes first, so changes made while loading trigger a reload
+        sources = _get_source_mtimes(_get_config_sources())
+        new = MQConfigSnapshot(load_neon_mq_config(), sources)
+        _snapshot = new
+    if old is not None and new.config != old.config:
+        LOG.info("MQ configuration changed")
+        _notify_listeners(old, new)
+    return new
+
+
+def add_config_listener(callback: Callable[[MQConfigSnapshot,
+                                            MQConfigSnapshot], None]):
+    """
+    Register a callback for changes of the process-wide MQ configuration.
+    Only a weak reference to `callback` is kept.
+    :param callback: called with the old and new MQConfigSnapshot
+    """
+    ref = weakref.WeakMethod(callback) if inspect.ismethod(callback) \
+        else weakref.ref(callback)
+    with _snapshot_lock:
+        _listeners[:] = [ref for ref in _listeners if ref() is not None]
+        _listeners.append(ref)
+
+
+def _notify_listeners(old: MQConfigSnapshot, new: MQConfigSnapshot):
+    with _snapshot_lock:
+        _listeners[:] = [ref for ref in _listeners if ref() is not None]
+        callbacks = [ref() for ref in _listeners]
+    for callback in callbacks:
+        if callback is None:
+            continue
+        try:
+            callback(old, new)
+        except Exception as e:
+            LOG.exception(f"Config listener {callback} failed: {e}")
+
+
+_watcher = None
+
+
+def start_config_watcher(interval: float = CONFIG_CHECK_INTERVAL):
+    """
+    Start a daemon thread checking configuration files for changes, so that
+    listeners are notified without waiting for the next access. Does nothing
+    if the watcher is already running.
+    :param interval: seconds between checks
+    """
+    global _watcher
+    from neon_mq_connector.utils.thread_utils import RepeatingTimer
+    with _snapshot_lock:
+        if _watcher and _watcher.is_alive():
+            return
+        _watcher = RepeatingTimer(interval, reload_mq_config)
+        _watcher.daemon = True
+        _watcher.start()
+
+
 class Configuration:
     def __init__(self, file_path: Optional[str] = None):
         LOG.warning("This class is deprecated. "
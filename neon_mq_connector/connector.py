@@ -35,17 +35,39 @@ import pika
 import pika.exceptions
 
 from abc import ABC
-from typing import Optional, Dict, Any, Union, Type
+from threading import Event
+from typing import Optional, Dict, Any, Union, Type, Iterable, Callable, \
+    List
 
 from pika.exchange_type import ExchangeType
 from ovos_utils.log import LOG
 
-from neon_mq_connector.config import load_neon_mq_config
+from neon_mq_connector.config import MQConfigSnapshot, \
+    add_config_listener, get_mq_config_snapshot, start_config_watcher
 from neon_mq_connector.consumers import BlockingConsumerThread, SelectConsumerThread
 
-from neon_mq_connector.utils.connection_utils import wait_for_mq_startup, retry
+from neon_mq_connector.utils import consumer_utils
+from neon_mq_connector.utils.accounting_utils import enable_consumer_stats, \
+    get_consumer_stats
+from neon_mq_connector.utils.cluster_utils import Endpoint, \
+    EndpointSelector, get_endpoint_selector
+from neon_mq_connector.utils.connection_utils import retry
+from neon_mq_connector.utils.loop_lag_utils import enable_loop_lag_monitor
+from neon_mq_connector.utils.metrics_utils import ACK_SECONDS, \
+    CONNECTION_OPENS, CONSUMER_RESTARTS, MESSAGES_PUBLISHED, \
+    start_metrics_server
 from neon_mq_connector.utils.network_utils import dict_to_b64
-from neon_mq_connector.utils.thread_utils import RepeatingTimer
+from neon_mq_connector.utils.supervisor_utils import ConsumerSupervisor
+from neon_mq_connector.utils.stream_utils import make_stream_headers, \
+    run_stream_producer
+from neon_mq_connector.utils.sync_utils import get_shared_publisher, \
+    get_sync_aggregator
+from neon_mq_connector.utils.thread_utils import RepeatingTimer, \
+    JitteredRepeatingTimer
+from neon_mq_connector.utils.tracing_utils import start_publish_span
+from neon_mq_connector.utils.transport_utils import Transport, \
+    get_transport, is_blocking_connection
+from neon_mq_connector.utils.watchdog_utils import enable_watchdog
 
 # DO NOT REMOVE ME: Defined for backward compatibility
 ConsumerThread = BlockingConsumerThread
@@ -56,6 +78,21 @@ SUPPORTED_THREADED_CONSUMERS = (BlockingConsumerThread,
                                 SelectConsumerThread,)
 
 
+def _broker_target(connector: 'MQConnector', *_, **__) -> str:
+    """
+    Get the circuit breaker target for connections made by `connector`
+    """
+    return ','.join(str(endpoint) for endpoint in
+                    connector.config_snapshot.get_endpoints())
+
+
+def _expiration(expiration: Optional[int]) -> Optional[str]:
+    """
+    Get the message expiration property for `expiration` millis
+    """
+    return None if expiration is None else str(expiration)
+
+
 class MQConnector(ABC):
     """
     Abstract class implementing interface for attaching services to MQ server
@@ -70,7 +107,7 @@ class MQConnector(ABC):
     @staticmethod
     def init_config(config: Optional[dict] = None) -> dict:
         """ Initialize config from source data """
-        config = config or load_neon_mq_config() or dict()
+        config = config or get_mq_config_snapshot().config or dict()
         config = config.get('MQ') or config
         return config
 
@@ -106,18 +143,25 @@ class MQConnector(ABC):
         self.consumers: Dict[str, ConsumerThreadInstance] = dict()
         self.consumer_properties = dict()
         self._vhost = None
+        self._explicit_snapshot = None
+        self._global_config = None
         self._sync_thread = None
         self._observer_thread = None
         self._consumers_started = False
+        self._transport = None
+        self.supervisor = ConsumerSupervisor(self._restart_stopped_consumer)
 
         # Define properties and initialize them
         self.sync_period = 0
+        self.sync_aggregate = False
         self.observe_period = 0
+        self.control_consumer = False
         self.vhost_prefix = ""
         self.default_testing_prefix = 'test'
         self.testing_envs = set()
         self.testing_prefix_envs = None
         self.__init_configurable_properties()
+        add_config_listener(self._on_config_reload)
 
     @property
     def started(self):
@@ -126,13 +170,37 @@ class MQConnector(ABC):
     @property
     def config(self):
         if not self._config:
-            self._config = self.init_config()
+            # Default configuration follows reloads of the global snapshot.
+            # A mutable copy is returned, so it may be changed in place like
+            # an explicit config
+            snapshot = get_mq_config_snapshot()
+            if not self._global_config or \
+                    self._global_config[0] is not snapshot:
+                self._global_config = (snapshot,
+                                       copy.deepcopy(snapshot.config))
+            return self._global_config[1]
         return self._config
 
     @config.setter
     def config(self, new_config: dict):
         self._config = self.init_config(config=new_config)
 
+    @property
+    def config_snapshot(self) -> MQConfigSnapshot:
+        """
+        Returns a read-only snapshot of the current config. The snapshot and
+        the connection parameters cached in it are reused until `config` is
+        reassigned, changed in place or, for the default config, reloaded.
+        """
+        config = self.config
+        if not self._config and config == self._global_config[0].config:
+            return self._global_config[0]
+        cached = self._explicit_snapshot
+        if not cached or cached[0] is not config or cached[1] != config:
+            cached = (config, copy.deepcopy(config), MQConfigSnapshot(config))
+            self._explicit_snapshot = cached
+        return cached[2]
+
     @property
     def service_config(self) -> dict:
         """ Returns current service config """
@@ -148,7 +216,9 @@ class MQConnector(ABC):
         """
         return {
             'sync_period': 10,  # in seconds
+            'sync_aggregate': False,  # combine syncs of this process
             'observe_period': 20,  # in seconds
+            'control_consumer': False,  # consume diagnostic commands
             'vhost_prefix': '',  # Could be used for scalability purposes
             'default_testing_prefix': 'test',
             'testing_envs': (f'{self.service_name.upper()}_TESTING',
@@ -257,6 +327,12 @@ class MQConnector(ABC):
         Gets connection parameters to be used to create an mq connection
         :param vhost: virtual_host to connect to
         """
+        if not kwargs:
+            if not self.service_config:
+                raise Exception(f'Configuration is not set for '
+                                f'{self.service_name}')
+            return self.config_snapshot.get_connection_params(
+                self.service_name, vhost)
         connection_params = pika.ConnectionParameters(
             host=self.config.get('server', 'localhost'),
             port=int(self.config.get('port', '5672')),
@@ -264,6 +340,68 @@ class MQConnector(ABC):
             credentials=self.mq_credentials, **kwargs)
         return connection_params
 
+    @property
+    def transport(self) -> Transport:
+        """
+        Transport used to connect to the broker. Defaults to the one set with
+        `transport_utils.set_transport`; consumers registered after it is set
+        use it as well.
+        """
+        return self._transport or get_transport()
+
+    @transport.setter
+    def transport(self, transport: Optional[Transport]):
+        self._transport = transport
+
+    @property
+    def endpoint_selector(self) -> EndpointSelector:
+        """
+        Selector of the broker endpoints to connect to, shared by all
+        connectors using the same cluster config
+        """
+        return get_endpoint_selector(self.config_snapshot.config)
+
+    def get_cluster_connection_params(
+            self, vhost: str, queue: Optional[str] = None,
+            strategy: Optional[str] = None,
+            **kwargs) -> List[pika.ConnectionParameters]:
+        """
+        Gets connection parameters for every broker endpoint, in the order
+        they should be tried
+        :param vhost: virtual_host to connect to
+        :param queue: queue the connection is for (optional)
+        :param strategy: endpoint selection strategy (defaults to the
+            configured `endpoint_strategy`)
+        """
+        params = self._get_endpoint_params(vhost, **kwargs)
+        return [params[endpoint] for endpoint in
+                self.endpoint_selector.order(queue, strategy)]
+
+    def _get_endpoint_params(self, vhost: str, **kwargs) -> \
+            Dict[Endpoint, pika.ConnectionParameters]:
+        if not kwargs:
+            if not self.service_config:
+                raise Exception(f'Configuration is not set for '
+                                f'{self.service_name}')
+            return self.config_snapshot.get_cluster_connection_params(
+                self.service_name, vhost)
+        return {endpoint: pika.ConnectionParameters(
+            host=endpoint.host, port=endpoint.port, virtual_host=vhost,
+            credentials=self.mq_credentials, **kwargs)
+            for endpoint in self.config_snapshot.get_endpoints()}
+
+    def _get_consumer_connection_params(self, vhost: str, queue: str) -> \
+            Union[pika.ConnectionParameters, List[pika.ConnectionParameters]]:
+        """
+        Gets connection parameters for a consumer of `queue`, which fails
+        over between them in order if there are multiple broker endpoints
+        """
+        if len(self.config_snapshot.get_endpoints()) == 1:
+            return self.get_connection_params(vhost)
+        strategy = self.config.get('consumer_endpoint_strategy') or \
+            'queue_leader'
+        return self.get_cluster_connection_params(vhost, queue, strategy)
+
     @staticmethod
     def create_unique_id():
         """Method for generating unique id"""
@@ -278,7 +416,10 @@ class MQConnector(ABC):
                         queue: Optional[str] = '',
                         exchange_type: Union[str, ExchangeType] =
                         ExchangeType.direct,
-                        expiration: int = 1000) -> str:
+                        expiration: Optional[int] = 1000,
+                        reply_to: Optional[str] = None,
+                        headers: Optional[dict] = None,
+                        mandatory: bool = False) -> str:
         """
         Emits request to the neon api service on the MQ bus
         :param connection: pika connection object
@@ -288,9 +429,17 @@ class MQConnector(ABC):
         :param exchange_type: type of exchange to declare
             (defaults to direct)
         :param expiration: mq message expiration time in millis
-            (defaults to 1 second)
+            (defaults to 1 second); None for no expiration
+        :param reply_to: queue the response should be published to (optional).
+            If specified, `correlation_id` is set to the message id
+        :param headers: message headers to include (optional)
+        :param mandatory: if True, `queue` is not declared and the message
+            must be routable. With a BlockingConnection, delivery is confirmed
+            and `pika.exceptions.UnroutableError` is raised if the message was
+            returned; with a SelectConnection, returned messages are logged
 
         :raises ValueError: invalid request data provided
+        :raises UnroutableError: mandatory message could not be routed
         :returns message_id: id of the sent message
         """
         # Make a copy of request_data to prevent modifying the input object
@@ -301,41 +450,231 @@ class MQConnector(ABC):
         if not request_data:
             raise ValueError('No request data provided')
 
-        # Ensure `message_id` in data will match context in messagebus connector
-        if request_data.get('message_id') is None:
-            request_data['message_id'] = \
-                request_data.get("context", {}).get("mq", {}).get("message_id")\
-                or cls.create_unique_id()
+        cls._ensure_message_id(request_data)
+        headers, span = start_publish_span(queue or exchange, headers)
+        properties = pika.BasicProperties(expiration=_expiration(expiration),
+                                          headers=headers)
+        if reply_to:
+            properties.reply_to = reply_to
+            properties.correlation_id = request_data['message_id']
 
-        def _on_channel_open(new_channel):
+        def _on_channel_open(new_channel, close: bool = True):
             if exchange:
                 new_channel.exchange_declare(exchange=exchange,
                                              exchange_type=exchange_type,
                                              auto_delete=False)
-            if queue:
+            if queue and not mandatory:
                 declared_queue = new_channel.queue_declare(queue=queue,
                                                            auto_delete=False)
                 if exchange_type == ExchangeType.fanout.value:
                     new_channel.queue_bind(queue=declared_queue.method.queue,
                                            exchange=exchange)
-            new_channel.basic_publish(exchange=exchange or '',
-                                      routing_key=queue,
-                                      body=dict_to_b64(request_data),
-                                      properties=pika.BasicProperties(
-                                          expiration=str(expiration)))
-
-            new_channel.close()
-
-        if isinstance(connection, pika.BlockingConnection):
+            start = time.perf_counter()
+            try:
+                new_channel.basic_publish(exchange=exchange or '',
+                                          routing_key=queue,
+                                          body=dict_to_b64(request_data),
+                                          properties=properties,
+                                          mandatory=mandatory)
+            finally:
+                if close:
+                    new_channel.close()
+                if span:
+                    span.end()
+            if mandatory and is_blocking_connection(connection):
+                # Blocking publishes return once the broker confirmed them
+                ACK_SECONDS.observe(time.perf_counter() - start)
+            MESSAGES_PUBLISHED.inc(labels=(getattr(exchange_type, 'value',
+                                                   exchange_type),))
+
+        if is_blocking_connection(connection):
             LOG.debug(f"Using blocking connection for request: {request_data}")
-            _on_channel_open(connection.channel())
+            channel = connection.channel()
+            if mandatory:
+                channel.confirm_delivery()
+            _on_channel_open(channel)
         else:
             LOG.debug(f"Using select connection for queue: {queue}")
-            connection.channel(on_open_callback=_on_channel_open)
+
+            def _on_return(_channel, _method, _properties, _body):
+                LOG.warning(f"Message {request_data['message_id']} could not "
+                            f"be routed to queue: {queue}")
+
+            def _on_select_channel_open(new_channel):
+                if not mandatory:
+                    _on_channel_open(new_channel)
+                    return
+                # Keep the channel open long enough to receive a return
+                new_channel.add_on_return_callback(_on_return)
+                _on_channel_open(new_channel, close=False)
+                connection.ioloop.call_later(
+                    1, lambda: new_channel.is_open and new_channel.close())
+
+            connection.channel(on_open_callback=_on_select_channel_open)
 
         LOG.debug(f"sent message: {request_data['message_id']}")
         return request_data['message_id']
 
+    @classmethod
+    def emit_mq_reply(cls, channel, response: dict, routing_key: str,
+                      request_properties: Optional[
+                          pika.BasicProperties] = None,
+                      expiration: Optional[int] = 1000,
+                      headers: Optional[dict] = None,
+                      on_failure: Optional[
+                          Callable[[Exception], None]] = None) -> str:
+        """
+        Publishes a response on the channel the request was consumed from,
+        avoiding a new connection per reply. If called from a thread other
+        than the one consuming `channel`, the publish is scheduled on the
+        owning IO loop.
+        Note that the reply queue is not declared here; a failed declaration
+        would close the consumer channel. This is intended for replies to a
+        `reply_to` queue, which the requester is responsible for declaring.
+        :param channel: channel the request was received on
+        :param response: dictionary with the response data
+        :param routing_key: name of the queue to reply to
+        :param request_properties: properties of the request being answered;
+            `correlation_id` is copied to the response if present
+        :param expiration: mq message expiration time in millis
+            (defaults to 1 second); None for no expiration
+        :param headers: message headers to include (optional)
+        :param on_failure: optional function called with the exception if
+            publishing fails. Required to handle failures of a publish
+            scheduled from another thread, which are otherwise only logged
+
+        :raises TypeError: invalid response data provided
+        :returns message_id: id of the sent message
+        """
+        if not isinstance(response, dict):
+            raise TypeError(f"Expected dict and got {type(response)}")
+        response = dict(response)
+        cls._ensure_message_id(response)
+        headers, span = start_publish_span(routing_key, headers)
+        properties = pika.BasicProperties(
+            expiration=_expiration(expiration), headers=headers,
+            correlation_id=getattr(request_properties, 'correlation_id',
+                                   None) or response['message_id'])
+        body = dict_to_b64(response)
+
+        def _publish():
+            try:
+                channel.basic_publish(exchange='', routing_key=routing_key,
+                                      body=body, properties=properties)
+            finally:
+                if span:
+                    span.end()
+            MESSAGES_PUBLISHED.inc(labels=('reply',))
+
+        consumer_utils.call_threadsafe(channel, _publish, on_failure)
+        LOG.debug(f"sent reply: {response['message_id']}")
+        return response['message_id']
+
+    @classmethod
+    def emit_mq_stream(cls,
+                       connection: Union[pika.BlockingConnection,
+                                         pika.SelectConnection],
+                       chunks: Iterable[dict],
+                       queue: str,
+                       message_id: Optional[str] = None,
+                       stream_id: Optional[str] = None,
+                       expiration: Optional[int] = None,
+                       reply_to: Optional[str] = None,
+                       headers: Optional[dict] = None) -> str:
+        """
+        Emits a stream of messages to a queue on a single channel. Each chunk
+        is published as soon as it is produced with headers identifying the
+        stream and its sequence number, followed by an end marker message, so
+        the receiver can reassemble it with `stream_utils.StreamReassembler`.
+        With a `SelectConnection`, chunks are produced in a background thread
+        (see `stream_utils.run_stream_producer`) and published on the IO loop.
+        :param connection: pika connection object
+        :param chunks: iterable of dicts to publish in order
+        :param queue: name of the queue to publish in
+        :param message_id: id of the request this stream responds to. It is
+            set as the `message_id` context and `correlation_id` of every
+            message in the stream (defaults to a new unique id)
+        :param stream_id: unique id of the stream (optional)
+        :param expiration: mq message expiration time in millis
+            (defaults to none, so chunks are held until read)
+        :param reply_to: queue responses should be published to (optional)
+        :param headers: additional message headers to include (optional)
+
+        :raises StreamProducerBusy: too many streams are queued to be
+            produced with a `SelectConnection`
+        :returns stream_id: id of the emitted stream
+        """
+        stream_id = stream_id or cls.create_unique_id()
+        message_id = message_id or cls.create_unique_id()
+        headers, span = start_publish_span(queue, headers)
+
+        def _encode(seq: int, data: dict, end: bool = False):
+            data = dict(data)
+            data.setdefault("context", {}).setdefault("mq", {}).setdefault(
+                "message_id", message_id)
+            cls._ensure_message_id(data)
+            return dict_to_b64(data), pika.BasicProperties(
+                expiration=_expiration(expiration), reply_to=reply_to,
+                correlation_id=message_id,
+                headers={**(headers or {}),
+                         **make_stream_headers(stream_id, seq, end)})
+
+        def _produce(publish: Callable[[bytes, pika.BasicProperties], None]):
+            seq = -1
+            for seq, chunk in enumerate(chunks):
+                publish(*_encode(seq, chunk))
+            publish(*_encode(seq + 1, {}, end=True))
+            MESSAGES_PUBLISHED.inc(seq + 2, labels=('stream',))
+            if span:
+                span.end()
+
+        if is_blocking_connection(connection):
+            channel = connection.channel()
+            channel.queue_declare(queue=queue, auto_delete=False)
+            _produce(lambda body, props: channel.basic_publish(
+                exchange='', routing_key=queue, body=body, properties=props))
+            channel.close()
+        else:
+            channel_opened = Event()
+            channels = []
+
+            def _on_channel_open(new_channel):
+                new_channel.queue_declare(queue=queue, auto_delete=False)
+                channels.append(new_channel)
+                channel_opened.set()
+
+            def _publish(body: bytes, props: pika.BasicProperties):
+                connection.ioloop.add_callback_threadsafe(
+                    lambda: channels[0].basic_publish(
+                        exchange='', routing_key=queue, body=body,
+                        properties=props))
+
+            def _produce_select():
+                if not channel_opened.wait(30):
+                    LOG.error(f"Timed out opening channel for {stream_id}")
+                    return
+                try:
+                    _produce(_publish)
+                finally:
+                    connection.ioloop.add_callback_threadsafe(
+                        channels[0].close)
+
+            # Raises before a channel is opened if too many streams are queued
+            run_stream_producer(_produce_select)
+            connection.channel(on_open_callback=_on_channel_open)
+        LOG.debug(f"sent stream: {stream_id}")
+        return stream_id
+
+    @classmethod
+    def _ensure_message_id(cls, request_data: dict):
+        """
+        Ensure `message_id` in data will match context in messagebus connector
+        """
+        if request_data.get('message_id') is None:
+            request_data['message_id'] = \
+                request_data.get("context", {}).get("mq", {}).get("message_id")\
+                or cls.create_unique_id()
+
     @classmethod
     def publish_message(cls,
                         connection: pika.BlockingConnection,
@@ -365,7 +704,8 @@ class MQConnector(ABC):
                      exchange: Optional[str] = '',
                      queue: Optional[str] = '',
                      exchange_type: ExchangeType = ExchangeType.direct,
-                     expiration: int = 1000) -> str:
+                     expiration: Optional[int] = 1000,
+                     headers: Optional[dict] = None) -> str:
         """
         Wrapper method for creation the MQ connection and immediate propagation
         of requested message with that
@@ -378,7 +718,9 @@ class MQConnector(ABC):
             connection creation (optional)
         :param exchange_type: type of exchange to use
             (defaults to ExchangeType.direct)
-        :param expiration: posted data expiration (in millis)
+        :param expiration: posted data expiration (in millis); None for no
+            expiration
+        :param headers: message headers to include (optional)
 
         :returns message_id: id of the propagated message
         """
@@ -404,11 +746,13 @@ class MQConnector(ABC):
                                               request_data=request_data,
                                               exchange=exchange,
                                               exchange_type=exchange_type,
-                                              expiration=expiration)
+                                              expiration=expiration,
+                                              headers=headers)
         LOG.debug(f'Message propagated, id={msg_id}')
         return msg_id
 
-    @retry(use_self=True, num_retries=__run_retries__)
+    @retry(use_self=True, num_retries=__run_retries__,
+           circuit_breaker_target=_broker_target)
     def create_mq_connection(self, vhost: str = '/', **kwargs):
         """
             Creates MQ Connection on the specified virtual host
@@ -419,8 +763,14 @@ class MQConnector(ABC):
         """
         if not self.config:
             raise Exception('Configuration is not set')
-        return pika.BlockingConnection(
-            parameters=self.get_connection_params(vhost, **kwargs))
+        CONNECTION_OPENS.inc(labels=('publisher',))
+        if len(self.config_snapshot.get_endpoints()) == 1:
+            return self.transport.blocking_connection(
+                self.get_connection_params(vhost, **kwargs))
+        params = self._get_endpoint_params(vhost, **kwargs)
+        return self.endpoint_selector.connect(
+            lambda endpoint: self.transport.blocking_connection(
+                params[endpoint]))
 
     def register_consumer(self, name: str, vhost: str, queue: str,
                           callback: callable,
@@ -430,7 +780,8 @@ class MQConnector(ABC):
                           exchange_reset: bool = False,
                           queue_exclusive: bool = False,
                           skip_on_existing: bool = False,
-                          restart_attempts: int = __max_consumer_restarts__):
+                          restart_attempts: int = __max_consumer_restarts__,
+                          prefetch_count: int = 50):
         """
         Registers a consumer for the specified queue.
         The callback function will handle items in the queue.
@@ -451,8 +802,11 @@ class MQConnector(ABC):
         :param skip_on_existing: to skip if consumer already exists
         :param restart_attempts: max instance restart attempts
             (if < 0 - will restart infinitely times)
+        :param prefetch_count: max number of unacknowledged messages
+            delivered to the consumer
         """
         error_handler = on_error or self.default_error_handler
+        self.supervisor.remove(name)
         consumer = self.consumers.get(name, None)
         if consumer:
             # Gracefully terminating
@@ -464,7 +818,8 @@ class MQConnector(ABC):
         self.consumer_properties[name]['properties'] = \
             dict(
                 name=name,
-                connection_params=self.get_connection_params(vhost),
+                connection_params=self._get_consumer_connection_params(
+                    vhost, queue),
                 queue=queue,
                 queue_reset=queue_reset,
                 callback_func=callback,
@@ -474,7 +829,11 @@ class MQConnector(ABC):
                 error_func=error_handler,
                 auto_ack=auto_ack,
                 queue_exclusive=queue_exclusive,
+                on_exit=self._on_consumer_exit,
+                prefetch_count=prefetch_count,
+                transport=self._transport,
             )
+        self.consumer_properties[name]['vhost'] = vhost
         self.consumer_properties[name]['restart_attempts'] = int(restart_attempts)
         self.consumer_properties[name]['started'] = False
 
@@ -487,7 +846,32 @@ class MQConnector(ABC):
                       f'[name={name},queue={queue},vhost={vhost},'
                       f'async={self.async_consumers_enabled}]')
 
-        self.consumers[name] = self.consumer_thread_cls(**self.consumer_properties[name]['properties'])
+        self.consumers[name] = self._create_consumer(name)
+
+    def _create_consumer(self, name: str) -> ConsumerThreadInstance:
+        """
+        Create a consumer thread from its registered properties
+        :param name: name of the registered consumer
+        :returns: new consumer thread, accounted as owned by this connector
+        """
+        consumer = self.consumer_thread_cls(
+            **self.consumer_properties[name]['properties'])
+        consumer.stats_owner = self.service_id
+        return consumer
+
+    def register_control_consumer(self):
+        """
+        Registers a consumer of diagnostic commands (i.e. profiling) on the
+        `<service_name>_control` queue of this connector's vhost. Commands
+        are authorized by the permissions of users on the vhost. See
+        `control_utils` for supported commands.
+        """
+        from neon_mq_connector.utils.control_utils import CONTROL_CONSUMER, \
+            ControlHandler, get_control_queue
+        self.register_consumer(CONTROL_CONSUMER, self.vhost,
+                               get_control_queue(self.service_name),
+                               ControlHandler(self).on_message,
+                               skip_on_existing=True, prefetch_count=1)
 
     @property
     def consumer_thread_cls(self) -> Type[ConsumerThreadInstance]:
@@ -498,6 +882,22 @@ class MQConnector(ABC):
     def check_health(self) -> bool:
         """
         Health check to determine if each consumer is in a healthy state.
+        Consumers report when they stop, so this does not check each one.
+        """
+        if not self._consumers_started:
+            LOG.info("Waiting for consumer start")
+            return False
+        if not self.supervisor.is_healthy:
+            LOG.error(f"Consumers not running: "
+                      f"{self.supervisor.unhealthy_consumers}")
+            return False
+        return True
+
+    def check_consumers(self) -> bool:
+        """
+        Check the state of each consumer thread. This is slower than
+        `check_health`, but also detects consumers that stopped without
+        reporting it.
         """
         if not self._consumers_started:
             LOG.info("Waiting for consumer start")
@@ -543,14 +943,37 @@ class MQConnector(ABC):
             self.consumers.pop(name, None)
             # TODO: Register a new subscriber?
         else:
-            self.consumers[name] = self.consumer_thread_cls(**consumer_data['properties'])
+            self.consumers[name] = self._create_consumer(name)
             self.run_consumers(names=(name,))
+            CONSUMER_RESTARTS.inc(labels=(name,))
             self.consumer_properties[name].setdefault('num_restarted', 0)
             self.consumer_properties[name]['num_restarted'] += 1
         if err_msg:
             self.consumer_properties[name]['dead'] = True
             LOG.error(f'Cannot restart consumer "{name}" - {err_msg}')
 
+    def _on_consumer_exit(self, thread: ConsumerThreadInstance,
+                          error: Optional[Exception]):
+        """
+        Called by consumer threads that stop unexpectedly
+        """
+        name = thread.name
+        if self.consumers.get(name) is not thread or \
+                not self.consumer_properties.get(name, {}).get('started'):
+            return
+        self.supervisor.notify_stopped(name, error)
+
+    def _restart_stopped_consumer(self, name: str) -> bool:
+        """
+        Restart a consumer on behalf of the supervisor
+        :returns: True if the consumer was restarted
+        """
+        if not self.consumer_properties.get(name, {}).get('started'):
+            # Stopped since the restart was scheduled
+            return False
+        self.restart_consumer(name)
+        return not self.consumer_properties[name].get('dead')
+
     def register_subscriber(self, name: str, vhost: str,
                             callback: callable,
                             on_error: Optional[callable] = None,
@@ -588,6 +1011,28 @@ class MQConnector(ABC):
                                       skip_on_existing=skip_on_existing,
                                       restart_attempts=restart_attempts)
 
+    def _on_config_reload(self, old: MQConfigSnapshot, new: MQConfigSnapshot):
+        """
+        Rebuild consumer connections if the global config changed fields
+        they depend on. Connectors with an explicit config are not affected.
+        """
+        if self._config or (old.get_connection_fields(self.service_name) ==
+                            new.get_connection_fields(self.service_name) and
+                            old.get_endpoints() == new.get_endpoints()):
+            return
+        LOG.info(f"Connection config changed for {self.service_name}")
+        for name, props in self.consumer_properties.items():
+            properties = props.get('properties')
+            if not properties:
+                continue
+            vhost = props.get('vhost') or \
+                properties['connection_params'].virtual_host
+            properties['connection_params'] = \
+                self._get_consumer_connection_params(vhost,
+                                                     properties.get('queue'))
+            if props.get('started'):
+                self.restart_consumer(name)
+
     @staticmethod
     def default_error_handler(thread: ConsumerThreadInstance,
                               exception: Exception):
@@ -597,6 +1042,19 @@ class MQConnector(ABC):
             # This is a fatal error; raise it so this object can be re-created
             raise exception
 
+    def consumer_stats(self) -> Dict[str, dict]:
+        """
+        Get cumulative accounting of this connector's consumers, i.e. to
+        find consumers whose handlers use the most CPU. Consumers are only
+        accounted while `accounting_utils` accounting or metrics are enabled.
+
+        :returns: dict of consumer name to stats with `messages`, `errors`,
+            `bytes`, `handler_cpu_seconds`, `handler_wall_seconds`,
+            `io_cpu_seconds` (CPU time of the consumer thread in pika),
+            `cpu_seconds` and `handler_cpu_fraction`
+        """
+        return get_consumer_stats(list(self.consumers), self.service_id)
+
     def run_consumers(self, names: Optional[tuple] = None, daemon=True):
         """
         Runs consumer threads based on the name if present
@@ -624,6 +1082,7 @@ class MQConnector(ABC):
         if not names:
             names = list(self.consumers)
         for name in names:
+            self.supervisor.remove(name)
             try:
                 if isinstance(self.consumers.get(name),
                               SUPPORTED_THREADED_CONSUMERS) and \
@@ -632,6 +1091,9 @@ class MQConnector(ABC):
                     if self.consumers[name].is_alive():
                         LOG.error(f"Failed to join consumer thread: {name} "
                                   f"after {self.__consumer_join_timeout__}s")
+                if name in self.consumer_properties:
+                    # Also for stopped threads, so a restart scheduled before
+                    # this is not run
                     self.consumer_properties[name]['started'] = False
             except Exception as e:
                 raise ChildProcessError(e)
@@ -653,14 +1115,54 @@ class MQConnector(ABC):
         vhost = vhost or self.vhost
         queue = f'{queue or self.service_name}_sync'
         exchange = exchange or ''
-        request_data = request_data or {'service_id': self.service_id,
-                                        'time': int(time.time())}
+        request_data = request_data or self._get_sync_data()
+        LOG.debug(f'Emitting sync message to (vhost="{vhost}",'
+                  f' exchange="{exchange}", queue="{queue}")')
+        self.publish_sync(request_data, vhost=vhost, exchange=exchange)
 
-        with self.create_mq_connection(vhost=vhost) as mq_connection:
-            LOG.debug(f'Emitting sync message to (vhost="{vhost}",'
-                      f' exchange="{exchange}", queue="{queue}")')
-            self.publish_message(mq_connection, exchange=exchange,
-                                 request_data=request_data)
+    def _get_sync_data(self) -> dict:
+        return {'service_id': self.service_id, 'time': int(time.time())}
+
+    def publish_sync(self, request_data: dict, vhost: Optional[str] = None,
+                     exchange: str = '') -> str:
+        """
+        Publish a sync message using the connection shared by all connectors
+        in this process with the same broker, vhost and user
+        :param request_data: data to publish
+        :param vhost: mq virtual host (defaults to self.vhost)
+        :param exchange: mq exchange (defaults to base one)
+        :returns message_id: id of the sent message
+        """
+        vhost = vhost or self.vhost
+        params = self.get_cluster_connection_params(vhost)
+
+        transport = self.transport
+
+        def _create_connection():
+            CONNECTION_OPENS.inc(labels=('sync',))
+            return transport.blocking_connection(params)
+
+        publisher = get_shared_publisher(
+            (transport, _broker_target(self), vhost,
+             self.mq_credentials.username), _create_connection)
+        return publisher.publish(
+            lambda connection: self.publish_message(
+                connection, exchange=exchange, request_data=request_data))
+
+    def _on_sync_timer(self):
+        """
+        Send a sync message, or add it to the process-level aggregated sync
+        if `sync_aggregate` is enabled
+        """
+        if self.sync_aggregate:
+            self._sync_aggregator.report(self, self._get_sync_data())
+        else:
+            self.sync()
+
+    @property
+    def _sync_aggregator(self):
+        return get_sync_aggregator((_broker_target(self), self.vhost),
+                                   self.sync_period)
 
     @retry(callback_on_exceeded='stop', use_self=True,
            num_retries=__run_retries__)
@@ -671,22 +1173,35 @@ class MQConnector(ABC):
 
         :param run_consumers: to run this instance consumers (defaults to True)
         :param run_sync: to run synchronization thread (defaults to True)
-        :param run_observer: to run consumers state observation
-            (defaults to True for Blocking Consumers, else False)
+        :param run_observer: to run periodic consumers state observation
+            (defaults to False). Consumers that stop report it to
+            `self.supervisor`, so this is only needed as a fallback
         """
         if run_observer is None:
-            # Observer thread is default on for Blocking Consumer only
-            run_observer = self.consumer_thread_cls == BlockingConsumerThread
-
-        host = self.config.get('server', 'localhost')
-        port = int(self.config.get('port', '5672'))
-        if not wait_for_mq_startup(host, port, kwargs.get('mq_timeout', 120),
-                                   connection_params=self.get_connection_params(
-                                       self.vhost)):
-            raise ConnectionError(f"Failed to connect to MQ at {host}:{port}")
+            run_observer = False
+
+        params = self._get_endpoint_params(self.vhost)
+        if not self.transport.wait_for_startup(self.endpoint_selector.order(),
+                                               kwargs.get('mq_timeout', 120),
+                                               params.get):
+            raise ConnectionError(f"Failed to connect to MQ at "
+                                  f"{_broker_target(self)}")
+        if not self._config:
+            start_config_watcher()
+        metrics_port = (self.config.get('metrics') or {}).get('port')
+        if metrics_port is not None:
+            start_metrics_server(int(metrics_port))
+        if self.config.get('slow_callbacks'):
+            enable_watchdog(**self.config['slow_callbacks'])
+        if self.config.get('consumer_stats'):
+            enable_consumer_stats()
+        if self.config.get('ioloop_lag'):
+            enable_loop_lag_monitor(**self.config['ioloop_lag'])
         kwargs.setdefault('consumer_names', ())
         kwargs.setdefault('daemonize_consumers', False)
         self.pre_run(**kwargs)
+        if self.control_consumer:
+            self.register_control_consumer()
         if run_consumers:
             self.run_consumers(names=kwargs['consumer_names'],
                                daemon=kwargs['daemonize_consumers'])
@@ -702,7 +1217,8 @@ class MQConnector(ABC):
         """Creates new synchronization thread if none is present"""
         if not (isinstance(self._sync_thread, RepeatingTimer) and
                 self._sync_thread.is_alive()):
-            self._sync_thread = RepeatingTimer(self.sync_period, self.sync)
+            self._sync_thread = JitteredRepeatingTimer(self.sync_period,
+                                                       self._on_sync_timer)
             self._sync_thread.daemon = True
         return self._sync_thread
 
@@ -711,6 +1227,8 @@ class MQConnector(ABC):
         if self._sync_thread:
             self._sync_thread.cancel()
             self._sync_thread = None
+        if self.sync_aggregate:
+            self._sync_aggregator.remove(self)
 
     def observe_consumers(self):
         """
@@ -745,6 +1263,7 @@ class MQConnector(ABC):
 
     def stop(self):
         """Generic method for graceful instance stopping"""
+        self.supervisor.stop()
         self.stop_consumers()
         self.stop_sync_thread()
         self.stop_observer_thread()
@@ -26,11 +26,24 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+from typing import TYPE_CHECKING
+
+from neon_mq_connector.utils.import_utils import lazy_exports
+
+if TYPE_CHECKING:
+    from neon_mq_connector.consumers.select_consumer import \
+        SelectConsumerThread
+    from neon_mq_connector.consumers.blocking_consumer import \
+        BlockingConsumerThread
 
 __all__ = [
     'BlockingConsumerThread',
     'SelectConsumerThread',
 ]
 
-from neon_mq_connector.consumers.select_consumer import SelectConsumerThread
-from neon_mq_connector.consumers.blocking_consumer import BlockingConsumerThread
+_lazy_imports = {
+    'BlockingConsumerThread': 'neon_mq_connector.consumers.blocking_consumer',
+    'SelectConsumerThread': 'neon_mq_connector.consumers.select_consumer',
+}
+
+__getattr__, __dir__ = lazy_exports(__name__, _lazy_imports)
@@ -28,13 +28,16 @@
 
 
 import threading
-from typing import Optional, Callable
+from typing import Optional, Callable, Sequence, Union
 
 import pika.exceptions
 from ovos_utils import LOG
 from pika.exchange_type import ExchangeType
 
 from neon_mq_connector.utils import consumer_utils
+from neon_mq_connector.utils.metrics_utils import CONNECTION_OPENS
+from neon_mq_connector.utils.transport_utils import Transport, \
+    get_transport
 
 
 class BlockingConsumerThread(threading.Thread):
@@ -43,7 +46,9 @@ class BlockingConsumerThread(threading.Thread):
     """
 
     # retry to handle connection failures in case MQ server is still starting
-    def __init__(self, connection_params: pika.ConnectionParameters,
+    def __init__(self, connection_params: Union[
+                     pika.ConnectionParameters,
+                     Sequence[pika.ConnectionParameters]],
                  queue: str,
                  callback_func: callable,
                  error_func: Callable[
@@ -54,11 +59,17 @@ class BlockingConsumerThread(threading.Thread):
                  queue_exclusive: bool = False,
                  exchange: Optional[str] = None,
                  exchange_reset: bool = False,
-                 exchange_type: str = ExchangeType.direct, *args, **kwargs):
+                 exchange_type: str = ExchangeType.direct,
+                 on_exit: Optional[Callable[
+                     ['BlockingConsumerThread', Optional[Exception]],
+                     None]] = None,
+                 prefetch_count: int = 50,
+                 transport: Optional[Transport] = None, *args, **kwargs):
         """
         Rabbit MQ Consumer class that aims at providing unified configurable
         interface for consumer threads
-        :param connection_params: pika connection parameters
+        :param connection_params: pika connection parameters, or a sequence
+            of them to fail over between in order
         :param queue: Desired consuming queue
         :param callback_func: logic on message receiving
         :param error_func: handler for consumer thread errors
@@ -72,6 +83,12 @@ class BlockingConsumerThread(threading.Thread):
             (defaults to direct)
             follow: https://www.rabbitmq.com/tutorials/amqp-concepts.html
             to learn more about different exchanges
+        :param on_exit: optional function called with this thread and the
+            exception that caused it if the consumer stops unexpectedly
+        :param prefetch_count: max number of unacknowledged messages
+            delivered to this consumer
+        :param transport: transport to connect with (defaults to the one set
+            with `transport_utils.set_transport`)
         """
         threading.Thread.__init__(self, *args, **kwargs)
         self._consumer_started = threading.Event()  # annotates that ConsumerThread is running
@@ -80,7 +97,10 @@ class BlockingConsumerThread(threading.Thread):
 
         self.callback_func = callback_func
         self.error_func = error_func
+        self.on_exit = on_exit
         self.auto_ack = auto_ack
+        self.prefetch_count = prefetch_count
+        self._transport = transport
 
         self.exchange = exchange or ''
         self.exchange_type = exchange_type or ExchangeType.direct
@@ -94,6 +114,13 @@ class BlockingConsumerThread(threading.Thread):
         self.connection = None
         self.channel = None
 
+    @property
+    def transport(self) -> Transport:
+        """
+        Transport this consumer connects with
+        """
+        return self._transport or get_transport()
+
     @property
     def is_consumer_alive(self) -> bool:
         return self._is_consumer_alive
@@ -110,24 +137,36 @@ class BlockingConsumerThread(threading.Thread):
                 self._create_connection()
                 self._consumer_started.set()
                 self.channel.start_consuming()
+                if self._is_consumer_alive:
+                    # Consuming stopped without `join` being called. If the
+                    # channel was closed by a callback, this is not an error
+                    closed_by_client = self.channel.is_closed
+                    self._close_connection()
+                    if not closed_by_client:
+                        self._notify_exit()
             except (pika.exceptions.ChannelClosed,
                     pika.exceptions.ConnectionClosed) as e:
                 LOG.info(f"Closed {e.reply_code}: {e.reply_text}")
                 if self._is_consumer_alive:
                     self._close_connection()
+                    self._notify_exit(e)
                     self.error_func(self, e)
             except pika.exceptions.StreamLostError as e:
                 if self._is_consumer_alive:
+                    self._notify_exit(e)
                     self.error_func(self, e)
             except Exception as e:
                 if self._is_consumer_alive:
                     self._close_connection()
+                    self._notify_exit(e)
                 self.error_func(self, e)
 
     def _create_connection(self):
-        self.connection = pika.BlockingConnection(self.connection_params)
+        self.connection = self.transport.blocking_connection(
+            self.connection_params)
+        CONNECTION_OPENS.inc(labels=('consumer',))
         self.channel = self.connection.channel()
-        self.channel.basic_qos(prefetch_count=50)
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
         if self.queue_reset:
             self.channel.queue_delete(queue=self.queue)
         declared_queue = self.channel.queue_declare(queue=self.queue,
@@ -141,14 +180,27 @@ class BlockingConsumerThread(threading.Thread):
                                           auto_delete=False)
             self.channel.queue_bind(queue=declared_queue.method.queue,
                                     exchange=self.exchange)
-        self.channel.basic_consume(on_message_callback=self.callback_func,
+        self.channel.basic_consume(on_message_callback=self.on_message,
                                    queue=self.queue,
                                    auto_ack=self.auto_ack)
 
+    def on_message(self, channel, method, properties, body):
+        consumer_utils.handle_message(self, channel, method, properties, body)
+
+    def _notify_exit(self, error: Optional[Exception] = None):
+        """Report that this consumer stopped unexpectedly"""
+        if not self.on_exit:
+            return
+        try:
+            self.on_exit(self, error)
+        except Exception as e:
+            LOG.error(f"Failed to notify exit of {self.name}: {e}")
+
     def join(self, timeout: Optional[float] = None) -> None:
         """Terminating consumer channel"""
         if self._is_consumer_alive:
             self._close_connection()
+        if self.is_alive() and threading.current_thread() is not self:
             threading.Thread.join(self, timeout=timeout)
 
     def _close_connection(self):
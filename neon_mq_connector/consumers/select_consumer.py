@@ -26,26 +26,57 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import random
 import threading
 import pika.exceptions
 
-from asyncio import Event, get_event_loop, set_event_loop, new_event_loop
-from typing import Optional, Callable
+from asyncio import get_event_loop, set_event_loop, new_event_loop
+from enum import Enum
+from typing import Optional, Callable, Sequence, Union
 from ovos_utils import LOG
+from pika.adapters.select_connection import IOLoop
 from pika.channel import Channel
 from pika.exchange_type import ExchangeType
 from pika.frame import Method
 
 from neon_mq_connector.utils import consumer_utils
+from neon_mq_connector.utils.cluster_utils import Endpoint, endpoint_health
+from neon_mq_connector.utils.loop_lag_utils import LoopLagProbe, lag_monitor
+from neon_mq_connector.utils.metrics_utils import CONNECTION_OPENS, \
+    CONSUMER_RECONNECTS
+from neon_mq_connector.utils.transport_utils import Transport, get_transport
+
+
+class ConsumerState(str, Enum):
+    """
+    Lifecycle states of a `SelectConsumerThread`
+    """
+    IDLE = "idle"
+    CONNECTING = "connecting"
+    DECLARING = "declaring"
+    CONSUMING = "consuming"
+    RECONNECT_WAIT = "reconnect_wait"
+    CLOSING = "closing"
+    STOPPED = "stopped"
 
 
 class SelectConsumerThread(threading.Thread):
     """
-    Consumer thread implementation based on pika.SelectConnection
+    Consumer thread implementation based on pika.SelectConnection.
+
+    The consumer is a state machine driven by a single IO loop run for the
+    lifetime of the thread. Lost connections are replaced in place after a
+    jittered exponential backoff, reusing the same IO loop.
     """
 
+    # Seconds to wait before the first reconnect attempt, doubling with each
+    # consecutive failed attempt up to `reconnect_max_delay`
+    reconnect_base_delay = 1.0
+    reconnect_max_delay = 60.0
+
     def __init__(self,
-                 connection_params: pika.ConnectionParameters,
+                 connection_params: Union[pika.ConnectionParameters,
+                                          Sequence[pika.ConnectionParameters]],
                  queue: str,
                  callback_func: callable,
                  error_func: Callable[
@@ -57,11 +88,17 @@ class SelectConsumerThread(threading.Thread):
                  exchange: Optional[str] = None,
                  exchange_reset: bool = False,
                  exchange_type: str = ExchangeType.direct,
+                 on_exit: Optional[Callable[
+                     ['SelectConsumerThread', Optional[Exception]],
+                     None]] = None,
+                 prefetch_count: int = 50,
+                 transport: Optional[Transport] = None,
                  *args, **kwargs):
         """
         Rabbit MQ Consumer class that aims at providing unified configurable
         interface for consumer threads
-        :param connection_params: pika connection parameters
+        :param connection_params: pika connection parameters, or a sequence
+            of them to fail over between in order
         :param queue: Desired consuming queue
         :param callback_func: logic on message receiving
         :param error_func: handler for consumer thread errors
@@ -75,6 +112,12 @@ class SelectConsumerThread(threading.Thread):
             (defaults to direct)
             follow: https://www.rabbitmq.com/tutorials/amqp-concepts.html
             to learn more about different exchanges
+        :param on_exit: optional function called with this thread and the
+            exception that caused it if the consumer stops unexpectedly
+        :param prefetch_count: max number of unacknowledged messages
+            delivered to this consumer
+        :param transport: transport to connect with (defaults to the one set
+            with `transport_utils.set_transport`)
         """
         threading.Thread.__init__(self, *args, **kwargs)
 
@@ -85,67 +128,187 @@ class SelectConsumerThread(threading.Thread):
         except RuntimeError as e:
             LOG.info(f"Creating a new event loop: e={e}")
             self._loop = new_event_loop()
-            set_event_loop(self._loop)
-            self._loop.run_forever()
             self.__stop_loop_on_exit = True
 
-        self._consumer_started = Event()  # annotates that ConsumerThread is running
+        self._state = ConsumerState.IDLE
+        self._state_lock = threading.Lock()
+        self._consumer_started = threading.Event()  # annotates that ConsumerThread is running
         self._channel_closed = threading.Event()
         self._is_consumer_alive = True  # annotates that ConsumerThread is alive and shall be recreated
         self._stopping = False
+        self._topology_declared = False
+        self._ioloop: Optional[IOLoop] = None
+        self._reconnect_timer = None
+        self._lag_probe: Optional[LoopLagProbe] = None
         self.callback_func = callback_func
         self.error_func = error_func
+        self.on_exit = on_exit
         self.exchange = exchange or ''
         self.exchange_type = exchange_type or ExchangeType.direct
         self.queue = queue or ''
         self.channel = None
         self.queue_exclusive = queue_exclusive
         self.auto_ack = auto_ack
+        self.prefetch_count = prefetch_count
+        self._transport = transport
 
         self.connection_params = connection_params
+        self._endpoint_params = list(connection_params) if \
+            isinstance(connection_params, (list, tuple)) else \
+            [connection_params]
+        self._endpoint_index = 0
         self.queue_reset = queue_reset
         self.exchange_reset = exchange_reset
 
         self.connection: Optional[pika.SelectConnection] = None
         self.connection_failed_attempts = 0
         self.max_connection_failed_attempts = 3
+        self.num_reconnects = 0
+
+    @property
+    def state(self) -> ConsumerState:
+        """
+        Current lifecycle state of this consumer
+        """
+        return self._state
+
+    def _set_state(self, state: ConsumerState):
+        with self._state_lock:
+            LOG.debug(f"{self.name}: {self._state.value} -> {state.value}")
+            self._state = state
+        if state == ConsumerState.CONSUMING:
+            self._consumer_started.set()
+        else:
+            self._consumer_started.clear()
+
+    @property
+    def transport(self) -> Transport:
+        """
+        Transport this consumer connects with
+        """
+        return self._transport or get_transport()
+
+    @property
+    def current_params(self) -> pika.ConnectionParameters:
+        """
+        Connection parameters of the endpoint currently connected to or tried
+        """
+        return self._endpoint_params[self._endpoint_index %
+                                     len(self._endpoint_params)]
+
+    def _record_endpoint_result(self, success: bool):
+        params = self.current_params
+        endpoint = Endpoint(params.host, params.port)
+        if success:
+            endpoint_health.record_success(endpoint)
+        else:
+            endpoint_health.record_failure(endpoint)
+
+    def _next_endpoint(self) -> bool:
+        """
+        Move on to the next endpoint
+        :returns: True if not all endpoints were tried since the last one
+            connected to or tried first
+        """
+        self._endpoint_index += 1
+        return self._endpoint_index % len(self._endpoint_params) != 0
 
     def create_connection(self) -> pika.SelectConnection:
-        return pika.SelectConnection(parameters=self.connection_params,
-                                     on_open_callback=self.on_connected,
-                                     on_open_error_callback=self.on_connection_fail,
-                                     on_close_callback=self.on_close)
+        return self.transport.select_connection(
+            parameters=self.current_params,
+            on_open_callback=self.on_connected,
+            on_open_error_callback=self.on_connection_fail,
+            on_close_callback=self.on_close,
+            custom_ioloop=self._ioloop)
+
+    def _connect(self):
+        """Open a new connection on the IO loop of this thread"""
+        self._reconnect_timer = None
+        if self._stopping:
+            self._ioloop.stop()
+            return
+        self._set_state(ConsumerState.CONNECTING)
+        self._channel_closed.clear()
+        self.channel = None
+        try:
+            self.connection = self.create_connection()
+        except Exception as e:
+            self.on_connection_fail(None, e)
 
     def on_connected(self, _):
         """Called when we are fully connected to RabbitMQ"""
+        self.connection_failed_attempts = 0
+        CONNECTION_OPENS.inc(labels=('consumer',))
+        # Fail over through all endpoints if this one is lost
+        self._endpoint_params = self._endpoint_params[self._endpoint_index:] + \
+            self._endpoint_params[:self._endpoint_index]
+        self._endpoint_index = 0
+        self._record_endpoint_result(True)
         self.connection.channel(on_open_callback=self.on_channel_open)
 
-    def on_connection_fail(self, *_, **__):
+    def on_connection_fail(self, _connection, error=None, *_, **__):
         """ Called when connection to RabbitMQ fails"""
+        if self._stopping:
+            self._ioloop.stop()
+            return
+        self._record_endpoint_result(False)
+        if self._next_endpoint():
+            LOG.warning(f"Failed to connect ({error}); trying "
+                        f"{self.current_params.host}:"
+                        f"{self.current_params.port}")
+            self._schedule_reconnect(0)
+            return
         self.connection_failed_attempts += 1
-        if self.connection_failed_attempts > self.max_connection_failed_attempts:
+        if self.connection_failed_attempts > \
+                self.max_connection_failed_attempts:
             LOG.error(f'Failed establish MQ connection after '
                       f'{self.connection_failed_attempts} attempts')
-            self.error_func(self, ConnectionError("Connection not established"))
-            self._close_connection(mark_consumer_as_dead=True)
+            error = ConnectionError("Connection not established")
+            self._is_consumer_alive = False
+            self._stopping = True
+            self._ioloop.stop()
+            self.error_func(self, error)
+            self._notify_exit(error)
         else:
-            self.reconnect()
+            LOG.warning(f"Failed to connect ({error}); reconnecting")
+            self._schedule_reconnect()
 
     def on_channel_open(self, new_channel: Channel):
         """Called when our channel has opened"""
         new_channel.add_on_close_callback(self.on_channel_close)
         self.channel = new_channel
+        self._set_state(ConsumerState.DECLARING)
+        if not self._topology_declared:
+            self._declare_topology()
+        elif self.queue_exclusive or not self.queue:
+            # Exclusive and server-named queues are deleted with the
+            # connection, so they are always declared again
+            self.declare_queue()
+        else:
+            # Only declare topology again if the broker lost it
+            self.channel.queue_declare(queue=self.queue, passive=True,
+                                       callback=self.set_qos)
+
+    def _declare_topology(self):
         if self.queue_reset:
             self.channel.queue_delete(queue=self.queue,
                                       if_unused=True,
                                       callback=self.declare_queue)
         else:
             self.declare_queue()
-        self._consumer_started.set()
 
-    def on_channel_close(self, *_, **__):
-        LOG.debug(f"Channel closed.")
+    def on_channel_close(self, _channel, reason=None, *_, **__):
+        LOG.debug(f"Channel closed: {reason}")
         self._channel_closed.set()
+        if self._stopping or self._state != ConsumerState.DECLARING or \
+                not isinstance(reason, pika.exceptions.ChannelClosedByBroker) \
+                or reason.reply_code != 404:
+            return
+        # Passive declaration failed; declare topology on a new channel
+        LOG.info(f"Queue {self.queue} not found; declaring it again")
+        self._topology_declared = False
+        if self.connection and self.connection.is_open:
+            self.connection.channel(on_open_callback=self.on_channel_open)
 
     def declare_queue(self, _unused_frame: Optional[Method] = None):
         return self.channel.queue_declare(queue=self.queue,
@@ -161,7 +324,7 @@ class SelectConsumerThread(threading.Thread):
             self.set_qos()
 
     def setup_exchange(self):
-        if self.exchange_reset:
+        if self.exchange_reset and not self._topology_declared:
             self.channel.exchange_delete(exchange=self.exchange, callback=self.declare_exchange)
         else:
             self.declare_exchange()
@@ -183,36 +346,72 @@ class SelectConsumerThread(threading.Thread):
             LOG.error(f"Error binding queue '{self.queue}' to exchange '{self.exchange}': {e}")
 
     def set_qos(self, _unused_frame: Optional[Method] = None):
-        self.channel.basic_qos(prefetch_count=50, callback=self.start_consuming)
+        self._topology_declared = True
+        self.channel.basic_qos(prefetch_count=self.prefetch_count,
+                               callback=self.start_consuming)
 
     def start_consuming(self, _unused_frame: Optional[Method] = None):
         self.channel.basic_consume(queue=self.queue,
                                    on_message_callback=self.on_message,
                                    auto_ack=self.auto_ack)
+        self._set_state(ConsumerState.CONSUMING)
 
     def on_message(self, channel, method, properties, body):
         try:
-            self.callback_func(channel, method, properties, body)
+            consumer_utils.handle_message(self, channel, method, properties,
+                                          body)
         except Exception as e:
             self.error_func(self, e)
 
     def on_close(self, _, e):
         self._consumer_started.clear()
-        if isinstance(e, pika.exceptions.ConnectionClosed):
+        if isinstance(e, pika.exceptions.ConnectionClosedByClient):
             LOG.info(f"Connection closed normally: {e}")
         elif isinstance(e, pika.exceptions.StreamLostError):
             LOG.warning("MQ connection lost; "
                         "RabbitMQ is likely temporarily unavailable.")
         else:
             LOG.error(f"MQ connection closed due to exception: {e}")
-        if not self._stopping:
-            if hasattr(e, "reply_code") and e.reply_code == 320:
-                LOG.info(f"Server shutdown. Try to reconnect after 60s (t={self.name})")
-                self.reconnect(60)
-            else:
-                # Connection was lost or closed by the server. Try to re-connect
-                LOG.info(f"Trying to reconnect after server connection loss")
-                self.reconnect()
+        if self._stopping:
+            self._ioloop.stop()
+        elif len(self._endpoint_params) > 1:
+            # Fail over to the next endpoint immediately
+            self._record_endpoint_result(False)
+            self._next_endpoint()
+            self._schedule_reconnect(0)
+        else:
+            # Connection was lost or closed by the server. Try to re-connect
+            self._schedule_reconnect()
+
+    def get_reconnect_delay(self) -> float:
+        """
+        Get seconds to wait before the next reconnect attempt
+        """
+        delay = min(self.reconnect_max_delay,
+                    self.reconnect_base_delay *
+                    2 ** self.connection_failed_attempts)
+        return random.uniform(delay / 2, delay)
+
+    def _schedule_reconnect(self, delay: Optional[float] = None):
+        self._set_state(ConsumerState.RECONNECT_WAIT)
+        self.num_reconnects += 1
+        CONSUMER_RECONNECTS.inc(labels=(self.queue,))
+        if delay is None:
+            delay = self.get_reconnect_delay()
+        LOG.info(f"Reconnecting in {delay:.3f}s (t={self.name})")
+        self._reconnect_timer = self._ioloop.call_later(delay, self._connect)
+
+    def _get_heartbeat(self) -> Optional[float]:
+        params = getattr(self.connection, 'params', None)
+        return getattr(params, 'heartbeat', None)
+
+    @property
+    def loop_lag(self) -> Optional[dict]:
+        """
+        Lag of the IO loop of this consumer if it is monitored by
+        `loop_lag_utils`
+        """
+        return self._lag_probe.get_stats() if self._lag_probe else None
 
     @property
     def is_consumer_alive(self) -> bool:
@@ -224,68 +423,80 @@ class SelectConsumerThread(threading.Thread):
 
     def run(self):
         """
-        Starting connection io loop
+        Run the IO loop of this consumer until it is stopped
         """
         # Ensure there is an event loop in this thread
         set_event_loop(self._loop)
-        if not self.is_consuming:
-            try:
-                LOG.debug(f"Starting Consumer: {self.name}")
-                self.connection: pika.SelectConnection = self.create_connection()
-                self.connection.ioloop.start()
-            except pika.exceptions.StreamLostError as e:
-                # This connection is dead.
-                self._close_connection()
+        if self._state != ConsumerState.IDLE:
+            LOG.warning("Consumer already running!")
+            return
+        LOG.debug(f"Starting Consumer: {self.name}")
+        self._ioloop = IOLoop()
+        try:
+            self._lag_probe = lag_monitor.add_probe(self.name, self._ioloop,
+                                                    self._get_heartbeat)
+            self._connect()
+            self._ioloop.start()
+        except Exception as e:
+            LOG.error(f"Failed to run io loop on consumer thread "
+                      f"{self.name!r}: {e}")
+            if not self._stopping:
+                self._is_consumer_alive = False
+                self._notify_exit(e)
                 self.error_func(self, e)
-            except (pika.exceptions.ChannelClosed,
-                    pika.exceptions.ConnectionClosed) as e:
-                LOG.info(f"Closed {e.reply_code}: {e.reply_text}")
-                if not self._stopping:
-                    # Connection was unexpectedly closed
-                    self._close_connection()
-                    self.error_func(self, e)
+        finally:
+            self._set_state(ConsumerState.STOPPED)
+            self._channel_closed.set()
+            lag_monitor.remove_probe(self._lag_probe)
+            try:
+                self._ioloop.close()
             except Exception as e:
-                LOG.error(f"Failed to start io loop on consumer thread {self.name!r}: {e}")
-                self._close_connection()
-                self.error_func(self, e)
-        else:
-            LOG.warning("Consumer already running!")
+                LOG.debug(f"Failed to close io loop: {e}")
+
+    def _shutdown(self):
+        """Close the connection and stop the IO loop; called on the IO loop"""
+        self._set_state(ConsumerState.CLOSING)
+        if self._reconnect_timer is not None:
+            self._ioloop.remove_timeout(self._reconnect_timer)
+            self._reconnect_timer = None
+        if self.connection and not (self.connection.is_closed or
+                                    self.connection.is_closing):
+            # `on_close` stops the IO loop once the connection is closed
+            self.connection.close()
+        elif not (self.connection and self.connection.is_closing):
+            self._ioloop.stop()
 
     def _close_connection(self, mark_consumer_as_dead: bool = True):
-        try:
-            self._stopping = True
-            if self.connection and not (self.connection.is_closed or self.connection.is_closing):
-                self.connection.close()
-                LOG.info(f"Waiting for channel close")
-                if not self._channel_closed.wait(15):
-                    raise TimeoutError(f"Timeout waiting for channel close. "
-                                       f"is_closed={self.channel.is_closed}")
-                LOG.debug(f"Channel closed")
-
-                # Wait for the connection to close
-                waiter = threading.Event()
-                while not self.connection.is_closed:
-                    waiter.wait(1)
-                LOG.debug(f"Connection closed")  # Logged in `on_channel_close`
-
-            if self.connection:
-                self.connection.ioloop.stop()
-            # self.connection = None
-        except Exception as e:
-            LOG.error(f"Failed to close connection for Consumer {self.name!r}: {e}")
-        self._is_consuming = False
-        self._consumer_started.clear()
+        """
+        Stop this consumer, closing its connection
+        :param mark_consumer_as_dead: if True, the consumer should not be
+            restarted
+        """
+        self._stopping = True
         if mark_consumer_as_dead:
             self._is_consumer_alive = False
-        else:
-            self._stopping = False
+        if self._ioloop is None or self._state == ConsumerState.STOPPED:
+            self._consumer_started.clear()
+            return
+        try:
+            self._ioloop.add_callback_threadsafe(self._shutdown)
+        except Exception as e:
+            LOG.error(f"Failed to close connection for Consumer "
+                      f"{self.name!r}: {e}")
+        if threading.current_thread() is not self and \
+                not self._channel_closed.wait(15):
+            LOG.error(f"Timeout waiting for channel close (t={self.name})")
         LOG.debug(f"Connection Closed stopping={self._stopping} "
                   f"(t={self.name})")
 
-    def reconnect(self, wait_interval: int = 5):
-        self._close_connection(mark_consumer_as_dead=False)
-        threading.Event().wait(wait_interval)
-        self.run()
+    def _notify_exit(self, error: Optional[Exception] = None):
+        """Report that this consumer stopped unexpectedly"""
+        if not self.on_exit:
+            return
+        try:
+            self.on_exit(self, error)
+        except Exception as e:
+            LOG.error(f"Failed to notify exit of {self.name}: {e}")
 
     def join(self, timeout: Optional[float] = None) -> None:
         """Terminating consumer channel"""
@@ -294,6 +505,7 @@ class SelectConsumerThread(threading.Thread):
         try:
             if self.__stop_loop_on_exit:
                 self._loop.stop()
+                self._loop.close()
         except Exception as e:
             LOG.error(f"failed to stop ioloop: {e}")
         LOG.info(f"Stopped consumer. Waiting up to {timeout}s for thread to terminate.")
@@ -26,7 +26,22 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from neon_mq_connector.utils.thread_utils import RepeatingTimer
-from neon_mq_connector.utils.connection_utils import retry, wait_for_mq_startup
+from typing import TYPE_CHECKING
+
+from neon_mq_connector.utils.import_utils import lazy_exports
+
+if TYPE_CHECKING:
+    from neon_mq_connector.utils.thread_utils import RepeatingTimer
+    from neon_mq_connector.utils.connection_utils import retry, \
+        wait_for_mq_startup
 
 # TODO: Deprecate wrapped imports
+__all__ = ['RepeatingTimer', 'retry', 'wait_for_mq_startup']
+
+_lazy_imports = {
+    'RepeatingTimer': 'neon_mq_connector.utils.thread_utils',
+    'retry': 'neon_mq_connector.utils.connection_utils',
+    'wait_for_mq_startup': 'neon_mq_connector.utils.connection_utils',
+}
+
+__getattr__, __dir__ = lazy_exports(__name__, _lazy_imports)
@@ -0,0 +1,178 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import threading
+
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+from neon_mq_connector.utils.metrics_utils import CONSUMER_BYTES, \
+    CONSUMER_CPU_SECONDS, CONSUMER_HANDLER_SECONDS, CONSUMER_MESSAGES
+
+"""
+Per-consumer accounting of the time spent handling messages. For each
+consumer, the CPU (`time.thread_time`) and wall time spent in
+callbacks, messages handled, bytes of message bodies and the CPU time the
+consumer thread spent outside of callbacks (in pika, reading and writing the
+connection) are accumulated. Consumers are accounted by owner (the
+`service_id` of the connector that created them) and name, so connectors in
+one process may use the same consumer names. Stats of a restarted consumer
+are added to those of the thread it replaced.
+
+Accounting is disabled unless enabled with `enable_consumer_stats`, the
+`consumer_stats` MQ config option or `NEON_MQ_CONSUMER_STATS=1`. Consumers
+are also accounted while metrics, tracing or the callback watchdog are
+enabled.
+"""
+
+
+class ConsumerStats:
+    """
+    Cumulative accounting of one consumer
+    """
+    __slots__ = ('messages', 'errors', 'bytes', 'handler_cpu',
+                 'handler_wall', 'io_cpu')
+
+    def __init__(self):
+        self.messages = 0
+        self.errors = 0
+        self.bytes = 0
+        self.handler_cpu = 0.0
+        self.handler_wall = 0.0
+        self.io_cpu = 0.0
+
+    def to_dict(self) -> dict:
+        """
+        Get these stats as a dict of cumulative values
+        """
+        cpu = self.handler_cpu + self.io_cpu
+        return {"messages": self.messages,
+                "errors": self.errors,
+                "bytes": self.bytes,
+                "handler_cpu_seconds": self.handler_cpu,
+                "handler_wall_seconds": self.handler_wall,
+                "io_cpu_seconds": self.io_cpu,
+                "cpu_seconds": cpu,
+                "handler_cpu_fraction": self.handler_cpu / cpu if cpu
+                else 0.0}
+
+
+class ConsumerAccounting:
+    """
+    Accounting of consumers by owner and name
+    """
+
+    def __init__(self, enabled: bool = False):
+        """
+        :param enabled: if True, consumers are accounted even when metrics
+            are disabled
+        """
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[Hashable, str], ConsumerStats] = dict()
+        # `time.thread_time` when the last callback in a thread returned
+        self._thread = threading.local()
+
+    def record(self, name: str, cpu_start: float, cpu_end: float,
+               wall: float, size: int, error: bool = False,
+               owner: Hashable = None):
+        """
+        Account a message handled in the calling consumer thread
+        :param name: name of the consumer
+        :param cpu_start: `time.thread_time` when the callback was called
+        :param cpu_end: `time.thread_time` when the callback returned
+        :param wall: seconds the callback ran for
+        :param size: length of the message body
+        :param error: True if the callback raised an exception
+        :param owner: identifier of the connector that owns the consumer
+        """
+        # CPU time of this thread since its last callback (or since it
+        # started) was spent connecting and waiting for messages
+        io_cpu = max(cpu_start - getattr(self._thread, 'last_cpu', 0.0), 0.0)
+        handler_cpu = cpu_end - cpu_start
+        self._thread.last_cpu = cpu_end
+        key = (owner, name)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = ConsumerStats()
+            stats.messages += 1
+            stats.errors += bool(error)
+            stats.bytes += size
+            stats.handler_cpu += handler_cpu
+            stats.handler_wall += wall
+            stats.io_cpu += io_cpu
+        labels = (name,)
+        CONSUMER_MESSAGES.inc(labels=labels)
+        CONSUMER_BYTES.inc(size, labels)
+        CONSUMER_HANDLER_SECONDS.inc(wall, labels)
+        CONSUMER_CPU_SECONDS.inc(handler_cpu, (name, 'handler'))
+        CONSUMER_CPU_SECONDS.inc(io_cpu, (name, 'io'))
+
+    def get_stats(self, names: Optional[Iterable[str]] = None,
+                  owner: Hashable = None) -> Dict[str, dict]:
+        """
+        Get the stats of consumers
+        :param names: names of consumers to include (default all accounted
+            for `owner`)
+        :param owner: identifier of the connector that owns the consumers
+        :returns: dict of consumer name to `ConsumerStats.to_dict`
+        """
+        with self._lock:
+            if names is None:
+                names = [name for key, name in self._stats if key == owner]
+            return {name: (self._stats.get((owner, name)) or ConsumerStats())
+                    .to_dict() for name in names}
+
+    def reset(self):
+        """
+        Clear all stats
+        """
+        with self._lock:
+            self._stats.clear()
+
+
+accounting = ConsumerAccounting(
+    enabled=os.environ.get('NEON_MQ_CONSUMER_STATS', '').lower() in
+    ('1', 'true', 'yes'))
+
+
+def enable_consumer_stats(enabled: bool = True):
+    """
+    Enable or disable consumer accounting
+    :param enabled: if True, account consumers even when metrics are disabled
+    """
+    accounting.enabled = enabled
+
+
+def get_consumer_stats(names: Optional[Iterable[str]] = None,
+                       owner: Hashable = None) -> Dict[str, dict]:
+    """
+    Get the stats of consumers; see `ConsumerAccounting.get_stats`
+    """
+    return accounting.get_stats(names, owner)
@@ -26,18 +26,32 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import copy
+import time
 import uuid
 
-from threading import Event
+from threading import Event, Lock
+from typing import Dict, Optional, Tuple
+from pika.adapters.blocking_connection import BlockingConnection
 from pika.channel import Channel
 from pika.spec import Basic, BasicProperties
-from pika.exceptions import ProbableAccessDeniedError, StreamLostError
+from pika.exceptions import ChannelClosedByBroker, ProbableAccessDeniedError, \
+    StreamLostError, UnroutableError
+from neon_mq_connector.config import MQConfigSnapshot, \
+    get_mq_config_snapshot
 from neon_mq_connector.connector import MQConnector
-from ovos_config.config import Configuration
 from ovos_utils.log import LOG
 
 from neon_mq_connector.utils.connection_utils import SuppressPikaLogging
+from neon_mq_connector.utils.consumer_utils import call_threadsafe
+from neon_mq_connector.utils.deadline_utils import make_deadline_headers
+from neon_mq_connector.utils.latency_utils import get_adaptive_timeout, \
+    get_hedge_delay, get_timing_config, hedge_budget, latency_tracker
+from neon_mq_connector.utils.metrics_utils import REQUESTS, \
+    REQUEST_SECONDS, REQUESTS_IN_FLIGHT
 from neon_mq_connector.utils.network_utils import b64_to_dict
+from neon_mq_connector.utils.stream_utils import StreamReassembler, \
+    get_stream_info
 
 _default_mq_config = {
     "server": "mq.neonaiservices.com",
@@ -51,6 +65,80 @@ _default_mq_config = {
 }
 
 
+class ServiceUnavailableError(ConnectionError):
+    """
+    Raised when a request cannot be delivered because the target queue does
+    not exist or has no consumers.
+    """
+
+
+class QueueConsumerCache:
+    """
+    Caches the number of consumers of queues, as reported by a passive
+    `queue_declare`, for `ttl` seconds. Entries should be invalidated when
+    routing is known to have changed, i.e. when a message to the queue was
+    returned or a request to it timed out.
+    """
+
+    def __init__(self, ttl: float = 5):
+        """
+        :param ttl: seconds to cache the consumer count of a queue
+        """
+        self.ttl = ttl
+        self._lock = Lock()
+        self._counts: Dict[Tuple[str, str], Tuple[float, Optional[int]]] = {}
+
+    def get_consumer_count(self, connection: BlockingConnection, vhost: str,
+                           queue: str) -> Optional[int]:
+        """
+        Get the number of consumers of a queue
+        :param connection: connection to `vhost` used to query the broker
+        :param vhost: vhost of the queue
+        :param queue: name of the queue
+        :returns: number of consumers, or None if the queue does not exist
+        """
+        key = (vhost, queue)
+        with self._lock:
+            cached = self._counts.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        count = self._query_consumer_count(connection, queue)
+        with self._lock:
+            self._counts[key] = (time.monotonic() + self.ttl, count)
+        return count
+
+    def invalidate(self, vhost: Optional[str] = None,
+                   queue: Optional[str] = None):
+        """
+        Remove cached consumer counts
+        :param vhost: vhost to invalidate (default all)
+        :param queue: queue to invalidate (default all in `vhost`)
+        """
+        with self._lock:
+            for key in list(self._counts):
+                if vhost in (None, key[0]) and queue in (None, key[1]):
+                    self._counts.pop(key)
+
+    @staticmethod
+    def _query_consumer_count(connection: BlockingConnection,
+                              queue: str) -> Optional[int]:
+        # A failed passive declaration closes the channel, so use a new one
+        channel = connection.channel()
+        try:
+            declared = channel.queue_declare(queue=queue, passive=True)
+            return declared.method.consumer_count
+        except ChannelClosedByBroker as e:
+            if e.reply_code == 404:
+                return None
+            raise
+        finally:
+            if channel.is_open:
+                channel.close()
+
+
+_consumer_cache = QueueConsumerCache()
+
+
 class NeonMQHandler(MQConnector):
     """
     This class is intended for use with `send_mq_request` for simple,
@@ -60,12 +148,25 @@ class NeonMQHandler(MQConnector):
 
     async_consumers_enabled = False
 
-    def __init__(self, config: dict, service_name: str, vhost: str):
-        super().__init__(config, service_name)
+    def __init__(self, config: Optional[dict], service_name: str, vhost: str,
+                 snapshot: Optional[MQConfigSnapshot] = None):
+        """
+        :param config: MQ configuration (ignored if `snapshot` is specified)
+        :param service_name: name of the service user to connect as
+        :param vhost: vhost to connect to
+        :param snapshot: MQ config snapshot to use, so that connection
+            parameters cached in it are reused
+        """
+        self._snapshot = snapshot
+        super().__init__(snapshot.config if snapshot else config,
+                         service_name)
         self.vhost = vhost
-        import pika
-        self.connection = pika.BlockingConnection(
-            parameters=self.get_connection_params(vhost))
+        self.connection = self.transport.blocking_connection(
+            self.get_cluster_connection_params(vhost))
+
+    @property
+    def config_snapshot(self) -> MQConfigSnapshot:
+        return self._snapshot or super().config_snapshot
 
     def shutdown(self):
         MQConnector.stop(self)
@@ -75,9 +176,100 @@ class NeonMQHandler(MQConnector):
             raise RuntimeError(f"Connection is still open: {self.connection}")
 
 
+# Global MQ config snapshot and the snapshot derived from it with default
+# `mq_handler` credentials, if these are not configured
+_fallback_snapshot: Optional[Tuple[MQConfigSnapshot, MQConfigSnapshot]] = None
+
+
+def _get_mq_config_snapshot() -> MQConfigSnapshot:
+    """
+    Get the MQ config snapshot for `NeonMQHandler` requests
+    """
+    global _fallback_snapshot
+    snapshot = get_mq_config_snapshot()
+    if snapshot.get_service_config('mq_handler'):
+        return snapshot
+    fallback = _fallback_snapshot
+    if not fallback or fallback[0] is not snapshot:
+        LOG.warning("mq_handler not configured, using default credentials")
+        config = copy.deepcopy(snapshot.config if snapshot.config.get('users')
+                               else _default_mq_config)
+        config['users']['mq_handler'] = \
+            _default_mq_config['users']['mq_handler']
+        fallback = (snapshot, MQConfigSnapshot(config))
+        _fallback_snapshot = fallback
+    return fallback[1]
+
+
+# MQ config snapshot `_timing` was read from
+_timing_snapshot = None
+_timing = dict()
+
+
+def _get_request_timing() -> dict:
+    """
+    Get the `request_timing` MQ config. The hedge budget ratio is updated
+    when the config changes.
+    """
+    global _timing_snapshot, _timing
+    snapshot = get_mq_config_snapshot()
+    if snapshot is not _timing_snapshot:
+        _timing = get_timing_config(snapshot.config)
+        hedge_budget.ratio = _timing['hedge_budget']
+        _timing_snapshot = snapshot
+    return _timing
+
+
+def _check_consumers(connection: BlockingConnection, vhost: str,
+                     target_queue: str):
+    """
+    Raise ServiceUnavailableError if `target_queue` has no consumers
+    """
+    count = _consumer_cache.get_consumer_count(connection, vhost,
+                                               target_queue)
+    if count is None:
+        raise ServiceUnavailableError(f"Queue {target_queue} does not exist "
+                                      f"in {vhost}")
+    if count == 0:
+        raise ServiceUnavailableError(f"Queue {target_queue} in {vhost} has "
+                                      f"no consumers")
+
+
+def _declare_response_queue(handler: NeonMQHandler, response_queue: str):
+    """
+    Declare `response_queue` before a request is sent, so replies published
+    before the response consumer has started are queued rather than dropped
+    """
+    channel = handler.connection.channel()
+    try:
+        channel.queue_declare(queue=response_queue, auto_delete=False)
+    finally:
+        channel.close()
+
+
+def _emit_request(handler: NeonMQHandler, vhost: str, target_queue: str,
+                  request_data: dict, **kwargs) -> str:
+    """
+    Emit a request that must be routable to `target_queue`
+    :raises ServiceUnavailableError: the request could not be routed
+    """
+    try:
+        return handler.emit_mq_message(connection=handler.connection,
+                                       queue=target_queue,
+                                       request_data=request_data,
+                                       exchange='', mandatory=True, **kwargs)
+    except UnroutableError:
+        _consumer_cache.invalidate(vhost, target_queue)
+        raise ServiceUnavailableError(f"Request to {target_queue} in {vhost} "
+                                      f"could not be routed")
+
+
 def send_mq_request(vhost: str, request_data: dict, target_queue: str,
                     response_queue: str = None, timeout: int = 30,
-                    expect_response: bool = True) -> dict:
+                    expect_response: bool = True,
+                    check_consumers: bool = False,
+                    adaptive_timeout: bool = False,
+                    hedge: bool = False) -> dict:
     """
     Sends a request to the MQ server and returns the response.
     :param vhost: vhost to target
@@ -85,16 +277,32 @@ def send_mq_request(vhost: str, request_data: dict, target_queue: str,
     :param target_queue: queue to post request to
     :param response_queue: optional queue to monitor for a response.
         Generally should be blank
-    :param timeout: time in seconds to wait for a response before timing out
+    :param timeout: time in seconds to wait for a response before timing out.
+        This deadline is included in the request headers so services may drop
+        the request once it has passed
     :param expect_response: boolean indicating whether a response is expected
+    :param check_consumers: if True, check that `target_queue` has consumers
+        before sending the request. Consumer counts are cached briefly
+    :param adaptive_timeout: if True, wait a multiple of the observed latency
+        of `target_queue`, up to `timeout`
+    :param hedge: if True, send a duplicate request if no response is received
+        within a high percentile of the observed latency of `target_queue`.
+        The first response is returned. Only use for idempotent requests
+    :raises ServiceUnavailableError: `target_queue` does not exist or has no
+        consumers
     :return: response to request
+
+    Adaptive timeout and hedging percentiles are configured in the
+    `request_timing` section of the MQ config
+    (see `latency_utils.DEFAULT_TIMING_CONFIG`).
     """
     response_queue = response_queue or uuid.uuid4().hex
 
     response_event = Event()
     message_id = None
+    in_flight = False
     response_data = dict()
-    config = dict()
+    snapshot = None
 
     def on_error(thread, error):
         """
@@ -105,7 +313,7 @@ def send_mq_request(vhost: str, request_data: dict, target_queue: str,
         LOG.error(f"{thread} raised {error}")
 
     def handle_mq_response(channel: Channel, method: Basic.Deliver,
-                           _: BasicProperties, body: bytes):
+                           properties: BasicProperties, body: bytes):
         """
         Method that handles Neon API output.
         In case received output message with the desired id, event stops
@@ -122,7 +330,11 @@ def send_mq_request(vhost: str, request_data: dict, target_queue: str,
         # TODO: One of these specs should be deprecated
         if api_output_msg_id != api_output.get('message_id'):
             LOG.debug(f"Handling message_id from response context")
-        if api_output_msg_id == message_id:
+        if response_event.is_set():
+            # Response to a hedged request was already handled
+            return
+        if message_id and \
+                message_id in (api_output_msg_id, properties.correlation_id):
             LOG.debug(f'MQ output: {api_output}')
             channel.basic_ack(delivery_tag=method.delivery_tag)
             channel.queue_delete(response_queue)
@@ -135,43 +347,221 @@ def send_mq_request(vhost: str, request_data: dict, target_queue: str,
 
     neon_api_mq_handler = None
     try:
-        config = Configuration().get('MQ') or _default_mq_config
-        if not config['users'].get('mq_handler'):
-            LOG.warning("mq_handler not configured, using default credentials")
-            config['users']['mq_handler'] = \
-                _default_mq_config['users']['mq_handler']
-        neon_api_mq_handler = NeonMQHandler(config=config,
+        snapshot = _get_mq_config_snapshot()
+        neon_api_mq_handler = NeonMQHandler(config=None,
                                             service_name='mq_handler',
-                                            vhost=vhost)
+                                            vhost=vhost, snapshot=snapshot)
         if not neon_api_mq_handler.connection.is_open:
             raise ConnectionError("MQ Connection not established.")
+        if check_consumers:
+            _check_consumers(neon_api_mq_handler.connection, vhost,
+                             target_queue)
 
         if expect_response:
+            _declare_response_queue(neon_api_mq_handler, response_queue)
             neon_api_mq_handler.register_consumer(
                 'neon_output_handler', neon_api_mq_handler.vhost,
                 response_queue, handle_mq_response, on_error, auto_ack=False)
             neon_api_mq_handler.run_consumers()
             request_data['routing_key'] = response_queue
 
-        message_id = neon_api_mq_handler.emit_mq_message(
-            connection=neon_api_mq_handler.connection, queue=target_queue,
-            request_data=request_data, exchange='')
+        timing = _get_request_timing()
+        if adaptive_timeout:
+            timeout = get_adaptive_timeout(
+                target_queue, timeout, timing['timeout_percentile'],
+                timing['timeout_multiplier'], timing['min_timeout'])
+        headers = make_deadline_headers(timeout) if expect_response else None
+        sent_time = time.monotonic()
+        REQUESTS_IN_FLIGHT.inc()
+        in_flight = True
+        message_id = _emit_request(
+            neon_api_mq_handler, vhost, target_queue, request_data,
+            reply_to=response_queue if expect_response else None,
+            headers=headers)
         LOG.debug(f'Sent request with keys: {request_data.keys()}')
 
         if expect_response:
-            response_event.wait(timeout)
+            hedge_budget.record_request()
+            hedge_delay = get_hedge_delay(target_queue,
+                                          timing['hedge_percentile']) \
+                if hedge else None
+            if hedge_delay is not None and hedge_delay < timeout and \
+                    not response_event.wait(hedge_delay) and \
+                    hedge_budget.try_acquire():
+                LOG.debug(f"Sending hedged request for {message_id}")
+                _emit_request(neon_api_mq_handler, vhost, target_queue,
+                              {**request_data, 'message_id': message_id},
+                              reply_to=response_queue, headers=headers)
+            response_event.wait(max(0.0, timeout -
+                                    (time.monotonic() - sent_time)))
+            # Timeouts are recorded so adaptive timeouts can grow
+            latency = time.monotonic() - sent_time
+            latency_tracker.record(target_queue, latency)
+            if response_event.is_set():
+                REQUEST_SECONDS.observe(latency, (target_queue,))
+            REQUESTS.inc(labels=(target_queue, 'ok' if response_event.is_set()
+                                 else 'timeout'))
             if not response_event.is_set():
                 LOG.error(f"Timeout waiting for response to: {message_id} on "
                           f"{response_queue}")
+                # Consumers of the target queue may have changed
+                _consumer_cache.invalidate(vhost, target_queue)
             with SuppressPikaLogging():
                 neon_api_mq_handler.stop_consumers()
     except ProbableAccessDeniedError:
-        raise ValueError(f"{vhost} is not a valid endpoint for "
-                         f"{config.get('users').get('mq_handler').get('user')}")
+        user = snapshot.get_connection_fields('mq_handler')[2]
+        raise ValueError(f"{vhost} is not a valid endpoint for {user}")
+    except ServiceUnavailableError:
+        REQUESTS.inc(labels=(target_queue, 'unavailable'))
+        raise
     except Exception as ex:
         LOG.exception(f'Exception occurred while resolving Neon API: {ex}')
     finally:
+        if in_flight:
+            REQUESTS_IN_FLIGHT.dec()
         # Ensure this object is always cleaned up
         if neon_api_mq_handler:
             neon_api_mq_handler.shutdown()
     return response_data
+
+
+class MQResponseStream:
+    """
+    Response to a request handled as a stream, returned by
+    `send_mq_stream_request`. Chunks are yielded in order as they are
+    received, by iterating synchronously or with `async for`. Each chunk is
+    acknowledged as it is read, so at most the consumer prefetch count of
+    chunks is buffered. The MQ connection is closed when the stream ends,
+    fails, or `close` is called.
+    """
+
+    def __init__(self, handler: NeonMQHandler, reassembler: StreamReassembler,
+                 response_queue: str):
+        self._handler = handler
+        self._reassembler = reassembler
+        self._response_queue = response_queue
+        self._closed = False
+        self._lock = Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> dict:
+        try:
+            return self._reassembler.next_chunk()
+        except BaseException:
+            self.close()
+            raise
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        try:
+            return await self._reassembler.__anext__()
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """
+        Stop receiving this stream and clean up the MQ connection
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._reassembler.close()
+        try:
+            with SuppressPikaLogging():
+                self._handler.stop_consumers()
+                channel = self._handler.connection.channel()
+                channel.queue_delete(self._response_queue)
+        except Exception as e:
+            LOG.debug(f"Failed to clean up {self._response_queue}: {e}")
+        self._handler.shutdown()
+
+
+def send_mq_stream_request(vhost: str, request_data: dict, target_queue: str,
+                           timeout: int = 30,
+                           max_buffered: int = 64) -> MQResponseStream:
+    """
+    Sends a request to the MQ server and returns an iterator over the response
+    chunks. The first chunk may be read while later ones are still being
+    produced. A service responding with a single message is returned as a
+    stream of one chunk.
+    :param vhost: vhost to target
+    :param request_data: data to post to target_queue
+    :param target_queue: queue to post request to
+    :param timeout: time in seconds to wait for each chunk before timing out.
+        This is also the request deadline included in the request headers
+    :param max_buffered: max number of chunks to buffer out of order
+    :raises ServiceUnavailableError: the request could not be routed to
+        `target_queue`
+    :return: MQResponseStream yielding response chunks
+    """
+    response_queue = uuid.uuid4().hex
+    reassembler = StreamReassembler(max_buffered=max_buffered, timeout=timeout)
+    snapshot = _get_mq_config_snapshot()
+    request_data = dict(request_data)
+    NeonMQHandler._ensure_message_id(request_data)
+    message_id = request_data['message_id']
+    request_data['routing_key'] = response_queue
+
+    def on_error(thread, error):
+        if isinstance(error, StreamLostError):
+            return
+        LOG.error(f"{thread} raised {error}")
+        reassembler.close(error)
+
+    def handle_stream_chunk(channel: Channel, method: Basic.Deliver,
+                            properties: BasicProperties, body: bytes):
+        def _ack():
+            call_threadsafe(channel, lambda: channel.basic_ack(
+                delivery_tag=method.delivery_tag))
+
+        api_output = b64_to_dict(body)
+        api_output_msg_id = \
+            api_output.get('context',
+                           api_output).get('mq', api_output).get('message_id')
+        if message_id not in (api_output_msg_id, properties.correlation_id):
+            LOG.debug(f"Ignoring {api_output_msg_id} waiting for {message_id}")
+            _ack()
+            return
+        stream_info = get_stream_info(properties)
+        if stream_info is None:
+            # Service responded with a single message
+            reassembler.add_chunk(0, api_output, on_consumed=_ack)
+            reassembler.add_chunk(1, None, end=True)
+            return
+        _, seq, end = stream_info
+        if end and api_output.get('stream_error'):
+            api_output = RuntimeError(api_output['stream_error'])
+        reassembler.add_chunk(seq, api_output, end, on_consumed=_ack)
+
+    try:
+        handler = NeonMQHandler(config=None, service_name='mq_handler',
+                                vhost=vhost, snapshot=snapshot)
+    except ProbableAccessDeniedError:
+        user = snapshot.get_connection_fields('mq_handler')[2]
+        raise ValueError(f"{vhost} is not a valid endpoint for {user}")
+    stream = MQResponseStream(handler, reassembler, response_queue)
+    try:
+        _declare_response_queue(handler, response_queue)
+        handler.register_consumer('neon_stream_handler', handler.vhost,
+                                  response_queue, handle_stream_chunk,
+                                  on_error, auto_ack=False)
+        handler.run_consumers()
+        _emit_request(handler, vhost, target_queue, request_data,
+                      reply_to=response_queue,
+                      headers=make_deadline_headers(timeout))
+    except Exception:
+        stream.close()
+        raise
+    return stream
@@ -0,0 +1,317 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import hashlib
+import itertools
+import math
+import random
+import time
+
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, \
+    Optional, Tuple
+from weakref import WeakSet
+from ovos_utils.log import LOG
+
+"""
+Helpers for connecting to a cluster of MQ brokers. Endpoints are configured
+as a list of `servers` in the MQ config, i.e.:
+{
+  "servers": ["mq-0.example.com", "mq-1.example.com:5673",
+              {"host": "mq-2.example.com", "port": 5672}],
+  "endpoint_strategy": "least_connections",
+  "consumer_endpoint_strategy": "queue_leader",
+  "queue_leaders": {"neon_api_input": "mq-1.example.com:5673"}
+}
+If `servers` is not configured, the single `server` and `port` are used.
+"""
+
+STRATEGIES = ('random', 'round_robin', 'least_connections', 'queue_leader')
+
+
+class Endpoint(NamedTuple):
+    host: str
+    port: int
+
+    def __str__(self):
+        return f"{self.host}:{self.port}"
+
+
+def _parse_endpoint(value: Any, default_port: int) -> Endpoint:
+    if isinstance(value, dict):
+        return Endpoint(value.get('host') or value.get('server', 'localhost'),
+                        int(value.get('port', default_port)))
+    if isinstance(value, (list, tuple)):
+        return Endpoint(value[0], int(value[1]))
+    value = str(value)
+    if ':' not in value:
+        return Endpoint(value, default_port)
+    host, port = value.rsplit(':', 1)
+    return Endpoint(host, int(port))
+
+
+def parse_endpoints(config: dict) -> Tuple[Endpoint, ...]:
+    """
+    Get the broker endpoints from an MQ config
+    :param config: MQ configuration
+    :returns: tuple of configured endpoints in configured order
+    """
+    default_port = int(config.get('port', '5672'))
+    servers = config.get('servers')
+    if not servers:
+        return Endpoint(config.get('server', 'localhost'), default_port),
+    endpoints = []
+    for server in servers:
+        endpoint = _parse_endpoint(server, default_port)
+        if endpoint not in endpoints:
+            endpoints.append(endpoint)
+    return tuple(endpoints)
+
+
+class EndpointHealth:
+    """
+    Health scores of broker endpoints shared by all connections in the
+    process. Failures are weighted by age so an endpoint recovers its score
+    `half_life` seconds after it starts accepting connections again.
+    """
+
+    def __init__(self, half_life: float = 30):
+        """
+        :param half_life: seconds after which the weight of a failure halves
+        """
+        self.half_life = half_life
+        self._lock = Lock()
+        # Endpoint to decayed failure count and time it was last updated
+        self._failures: Dict[Endpoint, Tuple[float, float]] = dict()
+
+    def _get_failures(self, endpoint: Endpoint, now: float) -> float:
+        failures, updated = self._failures.get(endpoint, (0.0, now))
+        return failures * math.pow(0.5, (now - updated) / self.half_life)
+
+    def record_success(self, endpoint: Endpoint):
+        """
+        Record a successful connection to `endpoint`
+        """
+        with self._lock:
+            self._failures.pop(endpoint, None)
+
+    def record_failure(self, endpoint: Endpoint):
+        """
+        Record a failed connection to `endpoint`
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._failures[endpoint] = \
+                (self._get_failures(endpoint, now) + 1, now)
+
+    def get_score(self, endpoint: Endpoint) -> float:
+        """
+        Get the health score of `endpoint`
+        :returns: 1.0 for an endpoint without recent failures, approaching 0
+            as failures accumulate
+        """
+        with self._lock:
+            return 1 / (1 + self._get_failures(endpoint, time.monotonic()))
+
+    def reset(self):
+        with self._lock:
+            self._failures.clear()
+
+
+endpoint_health = EndpointHealth()
+
+
+class EndpointSelector:
+    """
+    Orders the endpoints of a cluster to connect to. Endpoints are ordered by
+    `strategy` and then those with a health score below `min_score` are moved
+    to the end, so connections fail over to healthy nodes first.
+    """
+
+    def __init__(self, endpoints: Iterable[Endpoint],
+                 strategy: str = 'random',
+                 queue_leaders: Optional[Dict[str, str]] = None,
+                 health: EndpointHealth = endpoint_health,
+                 min_score: float = 0.9):
+        """
+        :param endpoints: endpoints of the cluster
+        :param strategy: default strategy, one of `STRATEGIES`
+        :param queue_leaders: queue names mapped to the endpoint ("host:port")
+            hosting their leader, used by the `queue_leader` strategy
+        :param health: endpoint health scores to consider
+        :param min_score: health score below which endpoints are tried last
+        """
+        self.endpoints = tuple(endpoints)
+        if not self.endpoints:
+            raise ValueError("No endpoints specified")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Invalid strategy: {strategy}")
+        self.strategy = strategy
+        self.health = health
+        self.min_score = min_score
+        self.queue_leaders = {
+            queue: _parse_endpoint(endpoint, self.endpoints[0].port)
+            for queue, endpoint in (queue_leaders or {}).items()}
+        self._round_robin = itertools.count()
+        self._connections: Dict[Endpoint, WeakSet] = {
+            endpoint: WeakSet() for endpoint in self.endpoints}
+
+    def track_connection(self, endpoint: Endpoint, connection: Any):
+        """
+        Count `connection` towards the connections open to `endpoint` until
+        it is closed or garbage collected
+        """
+        try:
+            self._connections[endpoint].add(connection)
+        except (KeyError, TypeError) as e:
+            LOG.debug(f"Not tracking connection to {endpoint}: {e}")
+
+    def get_connection_count(self, endpoint: Endpoint) -> int:
+        """
+        Get the number of tracked connections open to `endpoint`
+        """
+        return sum(1 for connection in list(self._connections.get(endpoint,
+                                                                  ()))
+                   if getattr(connection, 'is_open', False))
+
+    def _leader_order(self, queue: str) -> List[Endpoint]:
+        # Rendezvous hashing places each queue on one node consistently,
+        # so consumers of a queue all connect to the node that declared it
+        def _weight(endpoint: Endpoint) -> bytes:
+            return hashlib.md5(f"{queue}|{endpoint}".encode()).digest()
+        order = sorted(self.endpoints, key=_weight, reverse=True)
+        leader = self.queue_leaders.get(queue)
+        if leader in order:
+            order.remove(leader)
+            order.insert(0, leader)
+        return order
+
+    def order(self, queue: Optional[str] = None,
+              strategy: Optional[str] = None) -> List[Endpoint]:
+        """
+        Get the endpoints in the order they should be tried
+        :param queue: queue the connection is for, used by the
+            `queue_leader` strategy
+        :param strategy: strategy to use instead of the default one
+        :returns: list of all endpoints
+        """
+        strategy = strategy or self.strategy
+        endpoints = list(self.endpoints)
+        if len(endpoints) == 1:
+            return endpoints
+        if strategy == 'queue_leader' and queue:
+            endpoints = self._leader_order(queue)
+        elif strategy == 'least_connections':
+            random.shuffle(endpoints)
+            endpoints.sort(key=self.get_connection_count)
+        elif strategy == 'random':
+            random.shuffle(endpoints)
+        else:
+            offset = next(self._round_robin) % len(endpoints)
+            endpoints = endpoints[offset:] + endpoints[:offset]
+        # Stable sort keeps the strategy order within each group
+        endpoints.sort(key=lambda e:
+                       self.health.get_score(e) < self.min_score)
+        return endpoints
+
+    def connect(self, create_connection: Callable[[Endpoint], Any],
+                queue: Optional[str] = None,
+                strategy: Optional[str] = None) -> Any:
+        """
+        Connect to the first endpoint that accepts a connection
+        :param create_connection: function returning a new connection to the
+            specified endpoint
+        :param queue: queue the connection is for
+        :param strategy: strategy to use instead of the default one
+        :returns: connection returned by `create_connection`
+        :raises: exception raised by the last endpoint tried
+        """
+        error = None
+        for endpoint in self.order(queue, strategy):
+            try:
+                connection = create_connection(endpoint)
+            except Exception as e:
+                LOG.warning(f"Failed to connect to {endpoint}: {e}")
+                self.health.record_failure(endpoint)
+                error = e
+                continue
+            self.health.record_success(endpoint)
+            self.track_connection(endpoint, connection)
+            return connection
+        raise error
+
+
+_selectors: Dict[tuple, EndpointSelector] = dict()
+_selectors_lock = Lock()
+
+
+def get_endpoint_selector(config: dict) -> EndpointSelector:
+    """
+    Get the endpoint selector shared by all connectors in this process using
+    the same cluster config
+    :param config: MQ configuration
+    :returns: EndpointSelector for the configured endpoints
+    """
+    endpoints = parse_endpoints(config)
+    strategy = config.get('endpoint_strategy') or 'random'
+    queue_leaders = config.get('queue_leaders') or {}
+    key = (endpoints, strategy, tuple(sorted(queue_leaders.items())))
+    with _selectors_lock:
+        if key not in _selectors:
+            _selectors[key] = EndpointSelector(endpoints, strategy,
+                                               queue_leaders)
+        return _selectors[key]
+
+
+def wait_for_cluster_startup(endpoints: Iterable[Endpoint], timeout: float,
+                             get_params: Optional[Callable] = None,
+                             probe_timeout: float = 5) -> Optional[Endpoint]:
+    """
+    Wait up to `timeout` seconds for any endpoint of a cluster to come online
+    :param endpoints: endpoints in the order they should be checked
+    :param timeout: max seconds to wait
+    :param get_params: optional function returning the connection parameters
+        to check an endpoint with
+    :param probe_timeout: max seconds to wait for each endpoint per attempt
+    :returns: first endpoint found to be ready, else None
+    """
+    from neon_mq_connector.utils.connection_utils import wait_for_mq_startup
+    endpoints = list(endpoints)
+    if len(endpoints) == 1:
+        probe_timeout = timeout
+    deadline = time.monotonic() + timeout
+    while True:
+        for endpoint in endpoints:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            params = get_params(endpoint) if get_params else None
+            if wait_for_mq_startup(endpoint.host, endpoint.port,
+                                   min(remaining, probe_timeout), params):
+                return endpoint
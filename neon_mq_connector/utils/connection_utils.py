@@ -25,12 +25,14 @@
 # LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import functools
 import inspect
 import logging
+import random
 import time
 
-from threading import Event
-from typing import Union, Callable, Optional
+from threading import Lock
+from typing import Union, Callable, Optional, Dict
 from ovos_utils.log import LOG
 from pika.adapters.blocking_connection import BlockingConnection
 from pika.connection import ConnectionParameters
@@ -58,12 +60,141 @@ def get_timeout(backoff_factor: float, number_of_retries: int) -> float:
     return backoff_factor * (2 ** (number_of_retries - 1))
 
 
+class CircuitOpenError(ConnectionError):
+    """
+    Raised when a call is rejected because the circuit breaker for its target
+    is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Tracks failures of calls to a target. After `failure_threshold`
+    consecutive failures the circuit opens and calls are rejected for
+    `reset_timeout` seconds. Then, a single trial call is allowed; the
+    circuit closes if it succeeds, else it opens again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        """
+        :param failure_threshold: consecutive failures that open the circuit
+        :param reset_timeout: seconds to reject calls after the circuit opens
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def is_open(self) -> bool:
+        """
+        True if calls are currently rejected
+        """
+        with self._lock:
+            return self._opened_at is not None and \
+                (self._trial_running or
+                 time.monotonic() < self._opened_at + self.reset_timeout)
+
+    def allow(self) -> bool:
+        """
+        Check if a call may be made, reserving the trial call of a circuit
+        that is ready to close
+        :returns: True if the call may be made
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_running or \
+                    time.monotonic() < self._opened_at + self.reset_timeout:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        """
+        Record a successful call, closing the circuit
+        """
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        """
+        Record a failed call, opening the circuit if the failure threshold
+        is reached or the trial call failed
+        """
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or \
+                    self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class RetryBudget:
+    """
+    Limits retries to a fraction of all calls made by this process. Each call
+    adds `ratio` tokens, up to `max_tokens`, and each retry spends one token.
+    The budget starts full so that a burst of retries is allowed at startup.
+    """
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 20):
+        """
+        :param ratio: max number of retries per call made
+        :param max_tokens: max number of retries allowed in a burst
+        """
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(max_tokens)
+        self._lock = Lock()
+
+    def record_call(self):
+        """
+        Record a call made, earning budget for retries
+        """
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        """
+        Spend budget for a retry
+        :returns: True if the retry may be made
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+retry_budget = RetryBudget()
+_circuit_breakers: Dict[str, CircuitBreaker] = dict()
+_circuit_breakers_lock = Lock()
+
+
+def get_circuit_breaker(target: str) -> CircuitBreaker:
+    """
+    Get the circuit breaker shared by all calls to a target
+    :param target: name of the target, i.e. "host:port"
+    :returns: CircuitBreaker for `target`
+    """
+    with _circuit_breakers_lock:
+        if target not in _circuit_breakers:
+            _circuit_breakers[target] = CircuitBreaker()
+        return _circuit_breakers[target]
+
+
 def retry(callback_on_exceeded: Union[str, Callable] = None,
           callback_on_attempt_failure: Union[str, Callable] = None,
           num_retries: int = 3, backoff_factor: float = 5,
           use_self: bool = False,
           callback_on_attempt_failure_args: list = None,
-          callback_on_exceeded_args: list = None):
+          callback_on_exceeded_args: list = None,
+          jitter: bool = True,
+          circuit_breaker_target: Callable[..., str] = None):
     """
         Decorator for generic retrying function execution
 
@@ -75,87 +206,206 @@ def retry(callback_on_exceeded: Union[str, Callable] = None,
         :param callback_on_attempt_failure: function to call when a single
             attempt fails
         :param callback_on_attempt_failure_args: args for
-            callback_on_attempt_failure
+            callback_on_attempt_failure. 'e' and 'self' are replaced with the
+            raised exception and the instance
         :param backoff_factor: value of backoff factor for setting delay between
             function execution retry, refer to "get_timeout()" for details
+        :param jitter: if True, wait a random time up to the backoff timeout
+            so that retries of many processes are not synchronized
+        :param circuit_breaker_target: optional function called with the
+            function args, returning the name of the target of the call. Calls
+            to a target whose circuit breaker is open are not attempted, and
+            fail like calls that ran out of retries
+
+        Retries are also limited by the per-process `retry_budget`; when it is
+        exhausted, failing calls are not retried.
     """
-    # TODO: given function shows non-thread-safe behaviour for Consumer Thread,
-    #       need to fix this before using
-    if not callback_on_attempt_failure_args:
-        callback_on_attempt_failure_args = []
-    if not callback_on_exceeded_args:
-        callback_on_exceeded_args = []
+    failure_args = list(callback_on_attempt_failure_args or [])
+    exceeded_args = list(callback_on_exceeded_args or [])
 
     def decorator(function):
-        def wrapper(*args, **kwargs):
-            signature = inspect.signature(function).parameters
-            self = args[0] if 'self' in signature else None
-            if self:
-                args = args[1:]
+        has_self = 'self' in inspect.signature(function).parameters
+        name = function.__qualname__ if use_self else function.__name__
+
+        def _resolve_args(cb_args: list, self, e) -> list:
+            return [e if arg == 'e' else self if arg == 'self' else arg
+                    for arg in cb_args]
+
+        def _on_exceeded(self, reason: str, error: Optional[Exception]):
+            LOG.error(f'Failed to execute {name}: {reason}')
             with_self = use_self and self
-            num_attempts = 1
-            error_body = f"{function.__name__}(args={args}, kwargs={kwargs})"
-            if with_self:
-                error_body = f'{self.__class__.__name__}.{error_body}'
-            while num_attempts <= num_retries:
-                if num_attempts > 1:
-                    LOG.debug(f'Retrying {error_body} execution. '
-                              f'Attempt #{num_attempts}')
-                try:
-                    if with_self:
-                        return_value = function(self, *args, **kwargs)
-                    else:
-                        return_value = function(*args, **kwargs)
-                    if num_attempts > 1:
-                        call_frame = inspect.currentframe().f_back.f_back
-                        info = inspect.getframeinfo(call_frame)
-                        LOG.info(
-                            f"{error_body} succeeded on try #{num_attempts}\n"
-                            f"{info.filename}:{info.function}:{info.lineno}")
-                    return return_value
-                except Exception as e:
-                    for i in range(len(callback_on_attempt_failure_args)):
-                        if callback_on_attempt_failure_args[i] == 'e':
-                            callback_on_attempt_failure_args[i] = e
-                        elif callback_on_attempt_failure_args[i] == 'self':
-                            callback_on_attempt_failure_args[i] = self
-                    try:
-                        if callback_on_attempt_failure:
-                            if with_self and \
-                                    isinstance(callback_on_attempt_failure,
-                                               str):
-                                getattr(self, callback_on_attempt_failure)(
-                                    *callback_on_attempt_failure_args)
-
-                            elif isinstance(callback_on_attempt_failure,
-                                            Callable):
-                                callback_on_attempt_failure(
-                                    *callback_on_attempt_failure_args)
-                    except Exception as ex:
-                        LOG.error(f'Failed to execute '
-                                  f'callback_on_attempt_failure function '
-                                  f'{callback_on_attempt_failure.__name__}('
-                                  f'{callback_on_attempt_failure_args}) - {ex}')
-                    sleep_timeout = get_timeout(backoff_factor=backoff_factor,
-                                                number_of_retries=num_attempts)
-                    LOG.warning(f'{error_body}: {e}.')
-                    LOG.debug(f'Timeout for {sleep_timeout} secs')
-                    num_attempts += 1
-                    time.sleep(sleep_timeout)
-            LOG.error(f'Failed to execute after {num_retries} attempts')
             if callback_on_exceeded:
+                cb_args = _resolve_args(exceeded_args, self, error)
                 if with_self and isinstance(callback_on_exceeded, str):
-                    return getattr(self, callback_on_exceeded)(
-                        *callback_on_exceeded_args)
+                    return getattr(self, callback_on_exceeded)(*cb_args)
                 elif isinstance(callback_on_exceeded, Callable):
-                    return callback_on_exceeded(*callback_on_exceeded_args)
+                    return callback_on_exceeded(*cb_args)
+            elif isinstance(error, CircuitOpenError):
+                raise error
             else:
-                raise RuntimeError(f"Ran out of retries for {function}")
+                raise RuntimeError(f"Ran out of retries for {function}") \
+                    from error
+
+        def _on_attempt_failure(self, e: Exception):
+            if not callback_on_attempt_failure:
+                return
+            cb_args = _resolve_args(failure_args, self, e)
+            try:
+                if use_self and self and \
+                        isinstance(callback_on_attempt_failure, str):
+                    getattr(self, callback_on_attempt_failure)(*cb_args)
+                elif isinstance(callback_on_attempt_failure, Callable):
+                    callback_on_attempt_failure(*cb_args)
+            except Exception as ex:
+                LOG.error(f'Failed to execute callback_on_attempt_failure '
+                          f'{callback_on_attempt_failure}({cb_args}) - {ex}')
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            self = args[0] if has_self and args else None
+            breaker = get_circuit_breaker(circuit_breaker_target(
+                *args, **kwargs)) if circuit_breaker_target else None
+            retry_budget.record_call()
+            error = None
+            for attempt in range(1, num_retries + 1):
+                if breaker and not breaker.allow():
+                    error = CircuitOpenError(f"Circuit open for {name}")
+                    return _on_exceeded(self, "circuit breaker is open",
+                                        error)
+                try:
+                    return_value = function(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                    if breaker:
+                        breaker.record_failure()
+                    _on_attempt_failure(self, e)
+                    LOG.warning(f'{name} attempt #{attempt} failed: {e}')
+                    if attempt == num_retries:
+                        break
+                    if not retry_budget.try_acquire():
+                        return _on_exceeded(self, "retry budget exhausted",
+                                            error)
+                    sleep_timeout = get_timeout(backoff_factor, attempt)
+                    if jitter:
+                        sleep_timeout = random.uniform(0, sleep_timeout)
+                    LOG.debug(f'Retrying {name} in {sleep_timeout} secs')
+                    time.sleep(sleep_timeout)
+                else:
+                    if breaker:
+                        breaker.record_success()
+                    if attempt > 1:
+                        LOG.info(f"{name} succeeded on try #{attempt}")
+                    return return_value
+            return _on_exceeded(self, f"{num_retries} attempts failed", error)
 
         return wrapper
     return decorator
 
 
+class BrokerReadinessProbe:
+    """
+    Waits for an MQ broker to accept connections. A probe is shared by all
+    callers in the process waiting for the same broker (see
+    `get_readiness_probe`), so only one of them probes at a time and the
+    others reuse its result.
+    """
+
+    def __init__(self, addr: str, port: int, ready_ttl: float = 10,
+                 initial_backoff: float = 0.1, max_backoff: float = 5):
+        """
+        :param addr: URL or IP address of the broker
+        :param port: MQ port of the broker
+        :param ready_ttl: seconds a successful probe is reused for
+        :param initial_backoff: seconds to wait after the first failed probe
+        :param max_backoff: max seconds to wait between probes
+        """
+        self.addr = addr
+        self.port = port
+        self.ready_ttl = ready_ttl
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self._lock = Lock()
+        self._ready_time: Optional[float] = None
+
+    @property
+    def is_ready(self) -> bool:
+        """
+        True if the broker was ready within the last `ready_ttl` seconds
+        """
+        ready_time = self._ready_time
+        return ready_time is not None and \
+            time.monotonic() - ready_time < self.ready_ttl
+
+    def wait_ready(self, timeout: float,
+                   connection_params: Optional[ConnectionParameters] = None
+                   ) -> bool:
+        """
+        Wait up to `timeout` seconds for the broker to come online
+        :param timeout: max seconds to wait
+        :param connection_params: if specified, the broker is ready once an
+            AMQP connection with these parameters succeeds; otherwise, once
+            its port accepts TCP connections
+        :returns: True if the broker is ready, False if `timeout` elapsed
+        """
+        if self.is_ready:
+            return True
+        deadline = time.monotonic() + timeout
+        if not self._lock.acquire(timeout=timeout):
+            return False
+        try:
+            # Another caller may have probed while this one was waiting
+            if self.is_ready:
+                return True
+            if self._probe(deadline, connection_params):
+                self._ready_time = time.monotonic()
+                return True
+            return False
+        finally:
+            self._lock.release()
+
+    def _probe(self, deadline: float,
+               connection_params: Optional[ConnectionParameters]) -> bool:
+        backoff = self.initial_backoff
+        port_open = False
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                LOG.warning(f"Timed out waiting for MQ at "
+                            f"{self.addr}:{self.port} (port_open={port_open})")
+                return False
+            port_open = check_port_is_open(self.addr, self.port,
+                                           min(remaining, 5))
+            if port_open and (not connection_params or
+                              check_rmq_is_available(connection_params)):
+                LOG.info(f"MQ Server at {self.addr}:{self.port} is ready")
+                return True
+            LOG.debug(f"MQ at {self.addr}:{self.port} not ready "
+                      f"(port_open={port_open})")
+            time.sleep(min(random.uniform(0, backoff),
+                           max(0.0, deadline - time.monotonic())))
+            backoff = min(self.max_backoff, backoff * 2)
+
+
+_readiness_probes: Dict[tuple, BrokerReadinessProbe] = dict()
+_readiness_probes_lock = Lock()
+
+
+def get_readiness_probe(addr: str, port: int,
+                        vhost: Optional[str] = None) -> BrokerReadinessProbe:
+    """
+    Get the readiness probe shared by all callers in this process
+    :param addr: URL or IP address of the broker
+    :param port: MQ port of the broker
+    :param vhost: vhost that readiness is checked for, if any
+    :returns: BrokerReadinessProbe for the broker
+    """
+    key = (addr, port, vhost)
+    with _readiness_probes_lock:
+        if key not in _readiness_probes:
+            _readiness_probes[key] = BrokerReadinessProbe(addr, port)
+        return _readiness_probes[key]
+
+
 def wait_for_mq_startup(addr: str, port: int, timeout: int = 60,
                         connection_params: Optional[ConnectionParameters] = None
                         ) -> bool:
@@ -165,28 +415,13 @@ def wait_for_mq_startup(addr: str, port: int, timeout: int = 60,
     :param addr: URL or IP address to monitor
     :param port: MQ port to query
     :param timeout: Max seconds to wait for connection to come online
+    :param connection_params: if specified, wait for an AMQP connection with
+        these parameters to succeed
     """
-    stop_time = time.time() + timeout
     LOG.debug(f"Waiting for MQ server at {addr}:{port} to come online")
-    while not check_port_is_open(addr, port):
-        if time.time() > stop_time:
-            LOG.warning(f"Timed out waiting for port to open after {timeout}s")
-            return False
-    LOG.info("Waiting for RMQ broker to load")
-    if connection_params:
-        waiter = Event()
-        rmq_ready = True
-        while not check_rmq_is_available(connection_params):
-            rmq_ready = False
-            if time.time() > stop_time:
-                LOG.warning(f"Timed out waiting for RMQ after {timeout}s")
-                return False
-            waiter.wait(5)
-        if not rmq_ready:
-            LOG.info("MQ just started. Wait some time for queues, etc. to load")
-            waiter.wait(15)
-    LOG.info("MQ Server Started")
-    return True
+    vhost = connection_params.virtual_host if connection_params else None
+    return get_readiness_probe(addr, port, vhost).wait_ready(
+        timeout, connection_params)
 
 
 def check_rmq_is_available(
@@ -27,8 +27,20 @@
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
+import threading
+import time
+
+from typing import Callable, Optional
 from ovos_utils.log import LOG
 
+from neon_mq_connector.utils.accounting_utils import accounting
+from neon_mq_connector.utils.deadline_utils import get_deadline, \
+    is_expired, record_expired, request_deadline
+from neon_mq_connector.utils.metrics_utils import metrics, \
+    HANDLER_ERRORS, HANDLER_SECONDS, MESSAGES_CONSUMED, MESSAGES_IN_FLIGHT
+from neon_mq_connector.utils.tracing_utils import consume_span, get_tracer
+from neon_mq_connector.utils.watchdog_utils import watchdog
+
 
 def default_error_handler(*args):
     """
@@ -38,3 +50,116 @@ def default_error_handler(*args):
     """
     LOG.warning("Error handler not defined")
     raise Exception(*args)
+
+
+def call_threadsafe(channel, func: Callable[[], None],
+                    on_error: Optional[Callable[[Exception], None]] = None):
+    """
+    Calls `func` on the thread that owns `channel`. If the calling thread is
+    the consumer thread of `channel`, `func` is called immediately; otherwise
+    it is scheduled on the connection IO loop of `channel`.
+    :param channel: `pika.channel.Channel` or `BlockingChannel` to act on
+    :param func: function to call with no arguments
+    :param on_error: optional function called with any exception raised by
+        `func` or raised scheduling it. If not specified, exceptions are
+        raised to the caller if `func` is called immediately, else logged
+    """
+    def _call():
+        try:
+            func()
+        except Exception as e:
+            if on_error:
+                on_error(e)
+            else:
+                LOG.error(f"Failed to call {func} on {channel}: {e}")
+
+    if getattr(threading.current_thread(), 'channel', None) is channel:
+        if on_error:
+            _call()
+        else:
+            func()
+        return
+
+    try:
+        connection = channel.connection
+        if hasattr(connection, 'add_callback_threadsafe'):
+            # pika.BlockingConnection
+            connection.add_callback_threadsafe(_call)
+        else:
+            # pika.SelectConnection
+            connection.ioloop.add_callback_threadsafe(_call)
+    except Exception as e:
+        if not on_error:
+            raise
+        on_error(e)
+
+
+def drop_expired_message(consumer, channel, method, properties) -> bool:
+    """
+    Drops a received message if its deadline has passed, acknowledging it if
+    the consumer does not auto-ack.
+    :param consumer: consumer thread that received the message
+    :param channel: channel the message was received on
+    :param method: delivery method of the message
+    :param properties: properties of the message
+    :returns: True if the message was dropped and should not be handled
+    """
+    if not is_expired(properties):
+        return False
+    record_expired("queue", consumer.queue)
+    LOG.debug(f"Dropping expired message on {consumer.queue}")
+    if not consumer.auto_ack:
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+    return True
+
+
+def handle_message(consumer, channel, method, properties, body):
+    """
+    Passes a received message to the callback of a consumer within the
+    message deadline, unless it expired. Exceptions raised by the callback
+    are raised to the caller. If the callback is interrupted by the
+    `watchdog_utils` hard timeout, the message is nacked unless the consumer
+    auto-acks. Handled messages are accounted per consumer name by
+    `accounting_utils` when enabled.
+    :param consumer: consumer thread that received the message
+    :param channel: channel the message was received on
+    :param method: delivery method of the message
+    :param properties: properties of the message
+    :param body: body of the message
+    """
+    if not metrics.enabled and get_tracer() is None and \
+            not watchdog.enabled and not accounting.enabled:
+        if not drop_expired_message(consumer, channel, method, properties):
+            with request_deadline(get_deadline(properties)):
+                consumer.callback_func(channel, method, properties, body)
+        return
+    labels = (consumer.queue,)
+    MESSAGES_CONSUMED.inc(labels=labels)
+    if drop_expired_message(consumer, channel, method, properties):
+        return
+    MESSAGES_IN_FLIGHT.inc(labels=labels)
+    watch = watchdog.watch(consumer.queue,
+                           getattr(consumer.callback_func, '__name__', None),
+                           getattr(properties, 'correlation_id', None))
+    error = False
+    cpu_start = time.thread_time()
+    start = time.perf_counter()
+    try:
+        with watch, consume_span(consumer.queue, properties), \
+                request_deadline(get_deadline(properties)):
+            consumer.callback_func(channel, method, properties, body)
+    except Exception:
+        error = True
+        HANDLER_ERRORS.inc(labels=labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        accounting.record(getattr(consumer, 'name', consumer.queue),
+                          cpu_start, time.thread_time(), elapsed,
+                          len(body or b''), error,
+                          getattr(consumer, 'stats_owner', None))
+        HANDLER_SECONDS.observe(elapsed, labels)
+        MESSAGES_IN_FLIGHT.dec(labels=labels)
+    if getattr(watch, 'timed_out', False) and not consumer.auto_ack:
+        channel.basic_nack(delivery_tag=method.delivery_tag,
+                           requeue=watchdog.requeue)
@@ -0,0 +1,301 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional
+from ovos_utils.log import LOG
+
+from neon_mq_connector.utils.accounting_utils import accounting
+from neon_mq_connector.utils.consumer_utils import call_threadsafe
+from neon_mq_connector.utils.metrics_utils import metrics
+from neon_mq_connector.utils.network_utils import b64_to_dict
+
+"""
+Control commands for diagnosing a running `MQConnector`. When enabled, a
+connector consumes the reserved `<service_name>_control` queue in its vhost,
+so only users permitted to publish to that vhost may send commands. Requests
+are dicts with a `command` of:
+
+ - `profile`: profile consumer threads for `seconds` with the `sampling`
+   profiler (collapsed stacks) or `cprofile` (pstats text)
+ - `stacks`: dump the stacks of all threads
+ - `metrics`: dump metrics in Prometheus text format
+
+Responses are published to the `routing_key` of the request (or its
+`reply_to` property), as for `send_mq_request`. Nothing runs between
+commands besides the idle control consumer.
+"""
+
+CONTROL_CONSUMER = 'neon_control'
+MAX_PROFILE_SECONDS = 300
+# cProfile hooks are per-thread before Python 3.12, which uses the
+# interpreter-wide `sys.monitoring` so one profiler sees every thread
+_PER_THREAD_PROFILERS = sys.version_info < (3, 12)
+
+
+def get_control_queue(service_name: str) -> str:
+    """
+    Get the name of the control queue of a service
+    """
+    return f"{service_name}_control"
+
+
+def dump_thread_stacks() -> str:
+    """
+    Format the current stack of every thread
+    """
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    sections = list()
+    for ident, frame in sys._current_frames().items():
+        sections.append(f"Thread {names.get(ident, 'unknown')} ({ident}):\n"
+                        + ''.join(traceback.format_stack(frame)))
+    return '\n'.join(sections)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def sample_stacks(threads: Optional[Iterable[threading.Thread]],
+                  seconds: float, interval: float = 0.005) -> Counter:
+    """
+    Sample the stacks of threads at a regular interval
+    :param threads: threads to sample (default all other threads)
+    :param seconds: duration to sample for
+    :param interval: seconds between samples
+    :returns: number of samples of each stack, keyed by collapsed stack
+        (`thread;outer;...;inner`)
+    """
+    own = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threads} \
+        if threads is not None else None
+    counts = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if names is None:
+            current = {thread.ident: thread.name
+                       for thread in threading.enumerate()}
+        else:
+            current = names
+        for ident, frame in sys._current_frames().items():
+            if ident == own or ident not in current:
+                continue
+            stack = list()
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            counts[';'.join([current[ident]] + stack[::-1])] += 1
+        time.sleep(interval)
+    return counts
+
+
+def format_collapsed(counts: Counter, limit: int = 0) -> str:
+    """
+    Format stack samples in the collapsed format read by flame graph tools
+    :param counts: samples returned by `sample_stacks`
+    :param limit: max number of stacks to include, most sampled first
+        (0 for all)
+    """
+    return '\n'.join(f"{stack} {count}" for stack, count in
+                     counts.most_common(limit or None))
+
+
+def profile_threads(consumers: Iterable, seconds: float,
+                    sort: str = 'cumulative', limit: int = 50) -> str:
+    """
+    Profile consumer threads with cProfile. Profilers are enabled and
+    disabled on each consumer thread through its connection.
+    :param consumers: started consumer threads to profile
+    :param seconds: duration to profile for
+    :param sort: `pstats` sort key
+    :param limit: max number of functions to include
+    :returns: `pstats` text output
+    """
+    if not _PER_THREAD_PROFILERS:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        time.sleep(seconds)
+        profiler.disable()
+        profilers = [profiler]
+    else:
+        profilers = list()
+        for consumer in consumers:
+            channel = getattr(consumer, 'channel', None)
+            if channel is None:
+                continue
+            profiler = cProfile.Profile()
+            try:
+                call_threadsafe(channel, profiler.enable)
+            except Exception as e:
+                LOG.warning(f"Failed to profile {consumer.name}: {e}")
+                continue
+            profilers.append((channel, profiler))
+        time.sleep(seconds)
+        stopped = list()
+        for channel, profiler in profilers:
+            done = threading.Event()
+
+            def _disable(profiler=profiler, done=done):
+                profiler.disable()
+                done.set()
+            try:
+                call_threadsafe(channel, _disable)
+            except Exception as e:
+                LOG.warning(f"Failed to stop profiling {channel}: {e}")
+                continue
+            if done.wait(5):
+                stopped.append(profiler)
+        profilers = stopped
+    if not profilers:
+        return "No consumer threads profiled"
+    output = io.StringIO()
+    stats = pstats.Stats(profilers[0], stream=output)
+    for profiler in profilers[1:]:
+        stats.add(profiler)
+    stats.sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+class ControlHandler:
+    """
+    Handles commands received on the control queue of a connector. Commands
+    that take time run in their own thread so the control consumer keeps
+    serving its connection; one profile runs at a time.
+    """
+
+    def __init__(self, connector):
+        """
+        :param connector: `MQConnector` to diagnose
+        """
+        self.connector = connector
+        self._profile_lock = threading.Lock()
+
+    def _get_consumers(self) -> List[threading.Thread]:
+        return [consumer for name, consumer in
+                list(self.connector.consumers.items())
+                if name != CONTROL_CONSUMER and consumer.is_alive()]
+
+    def profile(self, request: dict) -> dict:
+        seconds = min(float(request.get('seconds', 10)), MAX_PROFILE_SECONDS)
+        profiler = request.get('profiler', 'sampling')
+        limit = int(request.get('limit', 50))
+        if not self._profile_lock.acquire(blocking=False):
+            return {"error": "A profile is already running"}
+        try:
+            if profiler == 'cprofile':
+                return {"format": "pstats",
+                        "output": profile_threads(
+                            self._get_consumers(), seconds,
+                            request.get('sort', 'cumulative'), limit)}
+            if profiler == 'sampling':
+                threads = None if request.get('all_threads') else \
+                    self._get_consumers()
+                counts = sample_stacks(threads, seconds,
+                                       float(request.get('interval', 0.005)))
+                return {"format": "collapsed",
+                        "samples": sum(counts.values()),
+                        "output": format_collapsed(counts, limit)}
+            return {"error": f"Unknown profiler: {profiler}"}
+        finally:
+            self._profile_lock.release()
+
+    def stacks(self, _: dict) -> dict:
+        return {"format": "text", "output": dump_thread_stacks()}
+
+    def metrics(self, _: dict) -> dict:
+        return {"format": "prometheus", "enabled": metrics.enabled,
+                "output": metrics.render()}
+
+    def consumer_stats(self, _: dict) -> dict:
+        return {"format": "json", "enabled": accounting.enabled,
+                "output": self.connector.consumer_stats()}
+
+    @property
+    def commands(self) -> Dict[str, Callable[[dict], dict]]:
+        return {"profile": self.profile,
+                "stacks": self.stacks,
+                "metrics": self.metrics,
+                "consumer_stats": self.consumer_stats}
+
+    def handle_request(self, request: dict) -> dict:
+        """
+        Run a control command
+        :param request: dict with a `command` and its arguments
+        :returns: response to the command
+        """
+        command = request.get('command')
+        handler = self.commands.get(command)
+        if not handler:
+            response = {"error": f"Unknown command: {command}"}
+        else:
+            LOG.info(f"Running control command: {command}")
+            try:
+                response = handler(request)
+            except Exception as e:
+                LOG.exception(f"Control command {command} failed: {e}")
+                response = {"error": repr(e)}
+        return {"command": command,
+                "service_id": self.connector.service_id, **response}
+
+    def _reply(self, channel, properties, request: dict):
+        routing_key = request.get('routing_key') or \
+            getattr(properties, 'reply_to', None)
+        response = self.handle_request(request)
+        if not routing_key:
+            LOG.warning(f"No reply queue for control command "
+                        f"{request.get('command')}")
+            return
+        response['message_id'] = request.get('message_id')
+        self.connector.emit_mq_reply(channel, response, routing_key,
+                                     request_properties=properties,
+                                     expiration=30000)
+
+    def on_message(self, channel, method, properties, body):
+        """
+        Consumer callback of the control queue
+        """
+        try:
+            request = b64_to_dict(body)
+        except Exception as e:
+            LOG.error(f"Invalid control request: {e}")
+            return
+        # Reply from a worker thread; `emit_mq_reply` publishes on the
+        # consumer connection
+        threading.Thread(target=self._reply,
+                         args=(channel, properties, request),
+                         name="neon_control_command", daemon=True).start()
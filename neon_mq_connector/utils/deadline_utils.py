@@ -0,0 +1,133 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Optional, Dict, Tuple
+
+"""
+Helpers for propagating request deadlines through message headers. The
+deadline is an absolute UNIX timestamp (seconds), so services are expected to
+have reasonably synchronized clocks.
+"""
+
+DEADLINE_HEADER = "x-neon-deadline"
+
+_local = threading.local()
+_expired_lock = threading.Lock()
+_expired_counts: Dict[Tuple[str, str], int] = dict()
+
+
+def make_deadline_headers(timeout: float) -> dict:
+    """
+    Build message headers for a request that expires in `timeout` seconds
+    :param timeout: seconds until the request expires
+    :returns: dict of headers to include in published message properties
+    """
+    return {DEADLINE_HEADER: time.time() + timeout}
+
+
+def get_deadline(properties) -> Optional[float]:
+    """
+    Get the deadline of a received message
+    :param properties: `pika.BasicProperties` of the message
+    :returns: absolute deadline timestamp if specified, else None
+    """
+    headers = getattr(properties, 'headers', None)
+    if not isinstance(headers, dict):
+        return None
+    deadline = headers.get(DEADLINE_HEADER)
+    try:
+        return float(deadline) if deadline is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_expired(properties) -> bool:
+    """
+    Check if a received message has passed its deadline
+    :param properties: `pika.BasicProperties` of the message
+    :returns: True if the message deadline has passed
+    """
+    deadline = get_deadline(properties)
+    return deadline is not None and deadline <= time.time()
+
+
+def record_expired(kind: str, name: str):
+    """
+    Count a request that was dropped because its deadline passed
+    :param kind: "queue" if dropped by a consumer thread, or "handler" if
+        dropped by a `create_mq_callback` handler
+    :param name: name of the queue or handler that dropped the request
+    """
+    with _expired_lock:
+        key = (kind, name)
+        _expired_counts[key] = _expired_counts.get(key, 0) + 1
+
+
+def get_expired_counts() -> Dict[Tuple[str, str], int]:
+    """
+    Get the number of expired requests dropped, keyed by ("queue", name) for
+    requests dropped by consumer threads and ("handler", name) for requests
+    dropped by `create_mq_callback` handlers. Consumer threads drop expired
+    requests before calling handlers, so handler counts only include requests
+    that expired after being received or that were passed to the handler
+    outside of a consumer thread.
+    """
+    with _expired_lock:
+        return dict(_expired_counts)
+
+
+@contextmanager
+def request_deadline(deadline: Optional[float]):
+    """
+    Context manager setting the deadline of the request handled on the
+    current thread, read via `get_remaining_time`
+    :param deadline: absolute deadline timestamp, or None
+    """
+    previous = getattr(_local, 'deadline', None)
+    _local.deadline = deadline
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def get_remaining_time() -> Optional[float]:
+    """
+    Get the time remaining to handle the current request. Handlers may use
+    this to cut expensive work short.
+    :returns: seconds until the current request deadline (may be negative),
+        or None if the request has no deadline
+    """
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None:
+        return None
+    return deadline - time.time()
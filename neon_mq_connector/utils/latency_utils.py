@@ -0,0 +1,281 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+
+from typing import Dict, Iterable, List, Optional
+from ovos_utils.log import LOG
+
+"""
+Helpers for tracking request latency per target queue, used by
+`client_utils.send_mq_request` for adaptive timeouts and request hedging.
+"""
+
+DEFAULT_TIMING_CONFIG = {
+    # Adaptive timeout is `timeout_multiplier` times this latency percentile
+    "timeout_percentile": 0.99,
+    "timeout_multiplier": 3.0,
+    "min_timeout": 1.0,
+    # Hedged requests are sent after this latency percentile
+    "hedge_percentile": 0.95,
+    # Max number of hedged requests per request sent
+    "hedge_budget": 0.05,
+}
+
+
+def get_timing_config(config: dict) -> dict:
+    """
+    Get the `request_timing` section of an MQ config with defaults applied.
+    Invalid percentiles are replaced with their defaults.
+    :param config: MQ configuration
+    :returns: dict with the keys of `DEFAULT_TIMING_CONFIG`
+    """
+    timing = {**DEFAULT_TIMING_CONFIG, **(config.get('request_timing') or {})}
+    for key in ("timeout_percentile", "hedge_percentile"):
+        try:
+            valid = 0 < float(timing[key]) < 1
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            LOG.warning(f"Invalid request_timing {key}: {timing[key]!r}. "
+                        f"Using {DEFAULT_TIMING_CONFIG[key]}")
+            timing[key] = DEFAULT_TIMING_CONFIG[key]
+    return timing
+
+
+class P2Quantile:
+    """
+    Streaming estimator of a single quantile using the P-Square algorithm
+    (Jain and Chlamtac, 1985). Uses constant memory and time per observation.
+    """
+
+    def __init__(self, quantile: float):
+        """
+        :param quantile: quantile to estimate, between 0 and 1
+        """
+        if not 0 < quantile < 1:
+            raise ValueError(f"quantile must be between 0 and 1: {quantile}")
+        self.quantile = quantile
+        self.count = 0
+        self._heights: List[float] = []
+        self._positions = [0, 1, 2, 3, 4]
+        self._desired = [0, 2 * quantile, 4 * quantile, 2 + 2 * quantile, 4]
+        self._increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def add(self, value: float):
+        """
+        Add an observation
+        :param value: observed value
+        """
+        self.count += 1
+        q = self._heights
+        if self.count <= 5:
+            q.append(value)
+            q.sort()
+            return
+
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= value < q[i + 1])
+        n = self._positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        for i in range(1, 4):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or \
+                    (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q = self._heights
+        n = self._positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    @property
+    def value(self) -> Optional[float]:
+        """
+        Current estimate of the quantile, or None if nothing was observed
+        """
+        if not self._heights:
+            return None
+        if self.count <= 5:
+            idx = round(self.quantile * (len(self._heights) - 1))
+            return self._heights[idx]
+        return self._heights[2]
+
+
+class LatencyTracker:
+    """
+    Tracks streaming estimates of latency quantiles per target queue
+    """
+
+    def __init__(self, quantiles: Iterable[float] = (0.5, 0.9, 0.95, 0.99),
+                 min_samples: int = 20):
+        """
+        :param quantiles: quantiles to track for each queue. Other quantiles
+            are tracked from when they are first requested
+        :param min_samples: number of observations required before a queue's
+            quantiles are reported
+        """
+        self.quantiles = tuple(quantiles)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._estimators: Dict[str, Dict[float, P2Quantile]] = dict()
+
+    def record(self, queue: str, latency: float):
+        """
+        Record the latency of a request
+        :param queue: queue the request was sent to
+        :param latency: seconds from sending the request to the response
+        """
+        with self._lock:
+            estimators = self._estimators.setdefault(queue, dict())
+            if len(estimators) < len(self.quantiles):
+                for q in self.quantiles:
+                    if q not in estimators:
+                        estimators[q] = P2Quantile(q)
+            for estimator in estimators.values():
+                estimator.add(latency)
+
+    def get_quantile(self, queue: str, quantile: float) -> Optional[float]:
+        """
+        Get the estimated latency quantile for requests to a queue
+        :param queue: queue requests were sent to
+        :param quantile: quantile to get. If it is not tracked yet, it is
+            tracked from now on
+        :returns: latency in seconds, or None if fewer than `min_samples`
+            requests to `queue` were recorded while tracking `quantile`
+        :raises ValueError: `quantile` is not between 0 and 1
+        """
+        if quantile not in self.quantiles:
+            if not 0 < quantile < 1:
+                raise ValueError(f"quantile must be between 0 and 1: "
+                                 f"{quantile}")
+            with self._lock:
+                if quantile not in self.quantiles:
+                    self.quantiles += (quantile,)
+        with self._lock:
+            estimator = self._estimators.get(queue, {}).get(quantile)
+            if not estimator or estimator.count < self.min_samples:
+                return None
+            return estimator.value
+
+    def reset(self, queue: Optional[str] = None):
+        """
+        Discard recorded latencies
+        :param queue: queue to reset (default all)
+        """
+        with self._lock:
+            if queue is None:
+                self._estimators.clear()
+            else:
+                self._estimators.pop(queue, None)
+
+
+class HedgeBudget:
+    """
+    Limits hedged requests to a fraction of all requests sent. Each request
+    adds `ratio` tokens, up to `max_tokens`, and each hedged request spends
+    one token.
+    """
+
+    def __init__(self, ratio: float = 0.05, max_tokens: float = 5):
+        """
+        :param ratio: max number of hedged requests per request sent
+        :param max_tokens: max number of hedged requests allowed in a burst
+        """
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        """
+        Record a request sent, earning budget for hedged requests
+        """
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        """
+        Spend budget for a hedged request
+        :returns: True if a hedged request may be sent
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+latency_tracker = LatencyTracker()
+hedge_budget = HedgeBudget()
+
+
+def get_adaptive_timeout(queue: str, max_timeout: float,
+                         percentile: float = 0.99, multiplier: float = 3.0,
+                         min_timeout: float = 1.0) -> float:
+    """
+    Get a timeout for a request based on observed latency
+    :param queue: queue the request will be sent to
+    :param max_timeout: timeout to use if latency of `queue` is unknown, and
+        upper bound of the returned timeout
+    :param percentile: tracked latency percentile to base the timeout on
+    :param multiplier: multiple of the latency percentile to wait
+    :param min_timeout: lower bound of the returned timeout
+    :returns: timeout in seconds
+    """
+    latency = latency_tracker.get_quantile(queue, percentile)
+    if latency is None:
+        return max_timeout
+    return min(max_timeout, max(min_timeout, latency * multiplier))
+
+
+def get_hedge_delay(queue: str, percentile: float = 0.95) -> Optional[float]:
+    """
+    Get the delay after which a hedged request should be sent
+    :param queue: queue the request will be sent to
+    :param percentile: tracked latency percentile to wait for
+    :returns: delay in seconds, or None if latency of `queue` is unknown
+    """
+    return latency_tracker.get_quantile(queue, percentile)
@@ -0,0 +1,280 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import threading
+import time
+import traceback
+
+from typing import Callable, Dict, List, Optional
+from ovos_utils.log import LOG
+
+from neon_mq_connector.utils.metrics_utils import LOOP_LAG_SECONDS, \
+    LOOP_STALLS
+
+"""
+IO loop lag monitoring of select consumers. Each probed IO loop runs a
+periodic `call_later` timer and the delay between when the timer was due and
+when it ran is recorded as lag. A watcher thread checks for timers that are
+overdue by more than `warn_fraction` of the connection heartbeat timeout;
+while an IO loop is blocked, heartbeats are not sent and the broker closes
+the connection once the timeout passes, so the stack of the blocked thread is
+captured and logged (rate-limited per consumer) before that happens.
+
+Monitoring is disabled unless enabled with `enable_loop_lag_monitor`, the
+`ioloop_lag` section of the MQ config or `NEON_MQ_IOLOOP_LAG_INTERVAL`, and
+applies to consumers started while it is enabled.
+"""
+
+# RabbitMQ default heartbeat timeout, used when none was negotiated
+DEFAULT_HEARTBEAT = 60
+
+
+class LoopLagProbe:
+    """
+    Periodic timer measuring the lag of one IO loop
+    """
+
+    def __init__(self, monitor: 'LoopLagMonitor', name: str, ioloop,
+                 get_heartbeat: Optional[Callable[[], Optional[float]]]):
+        """
+        :param monitor: monitor this probe reports to
+        :param name: name of the consumer running the IO loop
+        :param ioloop: pika IO loop to probe
+        :param get_heartbeat: returns the negotiated heartbeat timeout in
+            seconds, if any
+        """
+        self.name = name
+        self._monitor = monitor
+        self._ioloop = ioloop
+        self._get_heartbeat = get_heartbeat
+        self._ident: Optional[int] = None
+        self._timer = None
+        self._stopped = False
+        self.expected: Optional[float] = None
+        self.stalled = False
+        self.count = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+
+    @property
+    def threshold(self) -> float:
+        """
+        Seconds of lag after which a stall is reported
+        """
+        heartbeat = self._get_heartbeat() if self._get_heartbeat else None
+        if not isinstance(heartbeat, (int, float)) or heartbeat <= 0:
+            heartbeat = DEFAULT_HEARTBEAT
+        return heartbeat * self._monitor.warn_fraction
+
+    @property
+    def ident(self) -> Optional[int]:
+        return self._ident
+
+    def start(self):
+        """
+        Start probing; must be called on the thread running the IO loop
+        """
+        self._ident = threading.get_ident()
+        self._schedule()
+
+    def stop(self):
+        """
+        Stop probing; must be called on the thread running the IO loop
+        """
+        self._stopped = True
+        self.expected = None
+        if self._timer is not None:
+            try:
+                self._ioloop.remove_timeout(self._timer)
+            except Exception as e:
+                LOG.debug(f"Failed to remove lag timer of {self.name}: {e}")
+            self._timer = None
+
+    def _schedule(self):
+        interval = self._monitor.interval
+        self.expected = time.monotonic() + interval
+        self._timer = self._ioloop.call_later(interval, self._tick)
+
+    def _tick(self):
+        lag = max(time.monotonic() - self.expected, 0.0)
+        self.count += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        self.last_lag = lag
+        LOOP_LAG_SECONDS.observe(lag, (self.name,))
+        if self.stalled:
+            self.stalled = False
+            LOG.warning(f"IO loop of {self.name} was blocked for "
+                        f"{lag:.2f}s")
+        if not self._stopped:
+            self._schedule()
+
+    def get_stats(self) -> dict:
+        """
+        Get the lag measured by this probe
+        """
+        return {"count": self.count,
+                "mean_lag": self.total_lag / self.count if self.count
+                else 0.0,
+                "max_lag": self.max_lag,
+                "last_lag": self.last_lag,
+                "threshold": self.threshold}
+
+
+class LoopLagMonitor:
+    """
+    Watches probed IO loops for stalls
+    """
+
+    def __init__(self):
+        self.interval: Optional[float] = None
+        self.warn_fraction = 0.25
+        self.log_interval = 60.0
+        self._lock = threading.Lock()
+        self._probes: List[LoopLagProbe] = list()
+        self._last_logged: Dict[str, float] = dict()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval is not None
+
+    def configure(self, interval: Optional[float] = None,
+                  warn_fraction: float = 0.25, log_interval: float = 60.0):
+        """
+        Set how IO loops are probed
+        :param interval: seconds between probes of each IO loop (None to
+            disable probing)
+        :param warn_fraction: fraction of the heartbeat timeout of lag after
+            which a stall is reported
+        :param log_interval: min seconds between stack logs per consumer
+        """
+        self.interval = interval
+        self.warn_fraction = warn_fraction
+        self.log_interval = log_interval
+
+    def add_probe(self, name: str, ioloop,
+                  get_heartbeat: Optional[Callable[[], Optional[float]]] =
+                  None) -> Optional[LoopLagProbe]:
+        """
+        Start probing an IO loop if monitoring is enabled; must be called on
+        the thread running the IO loop
+        :param name: name of the consumer running the IO loop
+        :param ioloop: pika IO loop to probe
+        :param get_heartbeat: returns the negotiated heartbeat timeout
+        :returns: started probe, or None if monitoring is disabled
+        """
+        if not self.enabled:
+            return None
+        probe = LoopLagProbe(self, name, ioloop, get_heartbeat)
+        probe.start()
+        with self._lock:
+            self._probes.append(probe)
+            if not self._thread:
+                self._thread = threading.Thread(target=self._watch,
+                                                name="neon_ioloop_lag",
+                                                daemon=True)
+                self._thread.start()
+        return probe
+
+    def remove_probe(self, probe: Optional[LoopLagProbe]):
+        """
+        Stop a probe returned by `add_probe`; must be called on the thread
+        running the IO loop
+        """
+        if probe is None:
+            return
+        probe.stop()
+        with self._lock:
+            if probe in self._probes:
+                self._probes.remove(probe)
+
+    def get_stats(self) -> Dict[str, dict]:
+        """
+        Get the lag measured by each probe
+        """
+        with self._lock:
+            probes = list(self._probes)
+        return {probe.name: probe.get_stats() for probe in probes}
+
+    def _watch(self):
+        while True:
+            with self._lock:
+                probes = list(self._probes)
+            thresholds = list()
+            now = time.monotonic()
+            for probe in probes:
+                threshold = probe.threshold
+                thresholds.append(threshold)
+                expected = probe.expected
+                if expected is None or probe.stalled or \
+                        now - expected <= threshold:
+                    continue
+                probe.stalled = True
+                self._report_stall(probe, now - expected)
+            time.sleep(min(1.0, max(0.01, min(thresholds) / 4))
+                       if thresholds else 1.0)
+
+    def _report_stall(self, probe: LoopLagProbe, lag: float):
+        LOOP_STALLS.inc(labels=(probe.name,))
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_logged.get(probe.name)
+            if last is not None and now - last < self.log_interval:
+                return
+            self._last_logged[probe.name] = now
+        frame = sys._current_frames().get(probe.ident)
+        stack = ''.join(traceback.format_stack(frame)) if frame else ''
+        LOG.warning(f"IO loop of {probe.name} blocked for {lag:.2f}s "
+                    f"(heartbeats are missed after "
+                    f"{probe.threshold / self.warn_fraction:.0f}s)\n{stack}")
+
+
+lag_monitor = LoopLagMonitor()
+
+
+def enable_loop_lag_monitor(interval: float = 1.0, warn_fraction: float = 0.25,
+                            log_interval: float = 60.0):
+    """
+    Enable IO loop lag monitoring; see `LoopLagMonitor.configure`
+    """
+    lag_monitor.configure(interval, warn_fraction, log_interval)
+
+
+def disable_loop_lag_monitor():
+    """
+    Disable IO loop lag monitoring of consumers started afterwards
+    """
+    lag_monitor.configure()
+
+
+if os.environ.get('NEON_MQ_IOLOOP_LAG_INTERVAL'):
+    enable_loop_lag_monitor(float(os.environ['NEON_MQ_IOLOOP_LAG_INTERVAL']))
@@ -0,0 +1,1106 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import itertools
+import threading
+import time
+import uuid
+
+from collections import deque
+from functools import lru_cache, partial
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, \
+    Tuple
+
+from pika import BasicProperties
+from pika.adapters.blocking_connection import ReturnedMessage
+from pika.adapters.select_connection import IOLoop
+from pika.exceptions import AMQPConnectionError, ChannelClosedByBroker, \
+    ChannelClosedByClient, ChannelWrongStateError, ConnectionClosedByBroker, \
+    ConnectionClosedByClient, ConnectionWrongStateError, UnroutableError
+from pika.exchange_type import ExchangeType
+from pika.frame import Method
+from pika.spec import Basic, Exchange, Queue
+
+from neon_mq_connector.utils.cluster_utils import Endpoint
+from neon_mq_connector.utils.transport_utils import ConnectionParams, \
+    Transport
+
+"""
+In-process stand-in for an AMQP 0-9-1 broker, for tests and benchmarks that
+should not depend on RabbitMQ. It supports direct, fanout and topic
+exchanges, exclusive, auto-delete and server-named queues, consumer prefetch,
+acks, nacks and rejects with requeueing, per-message and per-queue
+(`x-message-ttl`) TTL, and returns of unroutable mandatory messages.
+Durability, dead-lettering, transactions and authentication are not
+supported. Use it for every connection of a process with:
+
+    from neon_mq_connector.utils.transport_utils import set_transport
+    set_transport(MemoryTransport())
+
+Messages are not serialized, so one `BasicProperties` object is shared by
+every delivery of a published message and must not be modified.
+"""
+
+DEFAULT_EXCHANGES = {'': ExchangeType.direct.value,
+                     'amq.direct': ExchangeType.direct.value,
+                     'amq.fanout': ExchangeType.fanout.value,
+                     'amq.topic': ExchangeType.topic.value}
+SUPPORTED_EXCHANGE_TYPES = (ExchangeType.direct.value,
+                            ExchangeType.fanout.value,
+                            ExchangeType.topic.value)
+
+
+def topic_matches(binding_key: str, routing_key: str) -> bool:
+    """
+    Check if a topic exchange binding key matches a routing key, where `*`
+    matches exactly one word and `#` matches zero or more words
+    """
+    return _match_words(tuple(binding_key.split('.')),
+                        tuple(routing_key.split('.')))
+
+
+@lru_cache(maxsize=4096)
+def _match_words(pattern: Tuple[str, ...], words: Tuple[str, ...]) -> bool:
+    if not pattern:
+        return not words
+    head, rest = pattern[0], pattern[1:]
+    if head == '#':
+        return any(_match_words(rest, words[idx:])
+                   for idx in range(len(words) + 1))
+    return bool(words) and head in ('*', words[0]) and \
+        _match_words(rest, words[1:])
+
+
+class _Message:
+    __slots__ = ('exchange', 'routing_key', 'body', 'properties', 'expires',
+                 'redelivered')
+
+    def __init__(self, exchange: str, routing_key: str, body: bytes,
+                 properties: BasicProperties, expires: Optional[float]):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.expires = expires
+        self.redelivered = False
+
+
+class _Consumer:
+    __slots__ = ('tag', 'queue', 'channel', 'callback', 'auto_ack',
+                 'prefetch', 'unacked')
+
+    def __init__(self, tag: str, queue: '_Queue', channel: '_MemoryChannel',
+                 callback: Callable, auto_ack: bool, prefetch: int):
+        self.tag = tag
+        self.queue = queue
+        self.channel = channel
+        self.callback = callback
+        self.auto_ack = auto_ack
+        self.prefetch = prefetch
+        self.unacked = 0
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.auto_ack or not self.prefetch or \
+            self.unacked < self.prefetch
+
+
+class _Queue:
+    def __init__(self, name: str, owner: Optional['_MemoryConnection'],
+                 auto_delete: bool, arguments: Optional[dict]):
+        self.name = name
+        self.owner = owner
+        self.auto_delete = auto_delete
+        self.ttl = (arguments or {}).get('x-message-ttl')
+        self.messages: Deque[_Message] = deque()
+        self.consumers: List[_Consumer] = list()
+        self.deleted = False
+        self._next_consumer = 0
+
+    def next_consumer(self) -> Optional[_Consumer]:
+        """
+        Get the next consumer able to receive a message, round-robin
+        """
+        consumers = self.consumers
+        for _ in range(len(consumers)):
+            self._next_consumer = (self._next_consumer + 1) % len(consumers)
+            consumer = consumers[self._next_consumer]
+            if consumer.has_capacity:
+                return consumer
+        return None
+
+    def drop_expired(self, now: float):
+        messages = self.messages
+        while messages and messages[0].expires is not None and \
+                messages[0].expires < now:
+            messages.popleft()
+
+
+class _Exchange:
+    def __init__(self, name: str, exchange_type: str, auto_delete: bool):
+        self.name = name
+        self.type = exchange_type
+        self.auto_delete = auto_delete
+        self.bindings: Dict[str, Set[str]] = dict()
+
+    def route(self, routing_key: str) -> Iterable[str]:
+        """
+        Get the names of queues a message with `routing_key` is routed to
+        """
+        if self.type == ExchangeType.direct.value:
+            return self.bindings.get(routing_key, ())
+        queues = set()
+        for key, names in self.bindings.items():
+            if self.type == ExchangeType.fanout.value or \
+                    topic_matches(key, routing_key):
+                queues.update(names)
+        return queues
+
+    def unbind_queue(self, queue: str):
+        for key in list(self.bindings):
+            self.bindings[key].discard(queue)
+            if not self.bindings[key]:
+                del self.bindings[key]
+
+
+class _VirtualHost:
+    def __init__(self):
+        self.exchanges = {name: _Exchange(name, exchange_type, False)
+                          for name, exchange_type in DEFAULT_EXCHANGES.items()}
+        self.queues: Dict[str, _Queue] = dict()
+
+
+class MemoryBroker:
+    """
+    In-process broker shared by the connections of a `MemoryTransport`.
+    Connections call back into the broker from any thread; deliveries are
+    passed to the thread of the consuming connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._vhosts: Dict[str, _VirtualHost] = dict()
+        self._connections: Set['_MemoryConnection'] = set()
+        self.available = True
+
+    @property
+    def connections(self) -> List['_MemoryConnection']:
+        """
+        Currently open connections
+        """
+        with self._lock:
+            return list(self._connections)
+
+    def get_message_count(self, queue: str, vhost: str = '/') -> int:
+        """
+        Get the number of messages ready for delivery in a queue
+        :raises KeyError: if the queue does not exist
+        """
+        with self._lock:
+            declared = self._vhosts[vhost].queues[queue]
+            declared.drop_expired(time.monotonic())
+            return len(declared.messages)
+
+    def close_connections(self, reply_code: int = 320,
+                          reply_text: str = "CONNECTION_FORCED - "
+                                            "broker forced connection closure"):
+        """
+        Close all connections as if the broker was restarted
+        """
+        with self._lock:
+            for connection in list(self._connections):
+                self.close_connection(connection, ConnectionClosedByBroker(
+                    reply_code, reply_text))
+
+    def _get_vhost(self, name: str) -> _VirtualHost:
+        if name not in self._vhosts:
+            self._vhosts[name] = _VirtualHost()
+        return self._vhosts[name]
+
+    def _get_queue(self, channel: '_MemoryChannel', name: str) -> _Queue:
+        queue = self._get_vhost(channel.vhost).queues.get(name)
+        if queue is None:
+            raise ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{name}' "
+                                             f"in vhost '{channel.vhost}'")
+        if queue.owner not in (None, channel.connection):
+            raise ChannelClosedByBroker(
+                405, f"RESOURCE_LOCKED - cannot obtain exclusive access to "
+                     f"locked queue '{name}' in vhost '{channel.vhost}'")
+        return queue
+
+    def add_connection(self, connection: '_MemoryConnection'):
+        with self._lock:
+            if not self.available:
+                raise AMQPConnectionError("Broker is not available")
+            self._connections.add(connection)
+
+    def close_connection(self, connection: '_MemoryConnection',
+                         reason: Exception):
+        with self._lock:
+            if connection.is_closed:
+                return
+            for channel in list(connection.channels.values()):
+                self.close_channel(channel, reason)
+            for vhost in self._vhosts.values():
+                for queue in list(vhost.queues.values()):
+                    if queue.owner is connection:
+                        self._delete_queue(vhost, queue)
+            self._connections.discard(connection)
+            connection._set_closed(reason)
+
+    def close_channel(self, channel: '_MemoryChannel', reason: Exception):
+        with self._lock:
+            if channel.is_closed:
+                return
+            for consumer in list(channel.consumers.values()):
+                self._remove_consumer(consumer)
+            self._requeue(channel, list(channel.unacked))
+            channel._set_closed(reason)
+
+    def exchange_declare(self, channel: '_MemoryChannel', exchange: str,
+                         exchange_type: str, passive: bool,
+                         auto_delete: bool) -> Exchange.DeclareOk:
+        exchange_type = getattr(exchange_type, 'value', exchange_type)
+        with self._lock:
+            exchanges = self._get_vhost(channel.vhost).exchanges
+            declared = exchanges.get(exchange)
+            if declared is None:
+                if passive:
+                    raise ChannelClosedByBroker(
+                        404, f"NOT_FOUND - no exchange '{exchange}' in vhost "
+                             f"'{channel.vhost}'")
+                if exchange_type not in SUPPORTED_EXCHANGE_TYPES:
+                    raise ChannelClosedByBroker(
+                        503, f"COMMAND_INVALID - unknown exchange type "
+                             f"'{exchange_type}'")
+                exchanges[exchange] = _Exchange(exchange, exchange_type,
+                                                auto_delete)
+            elif not passive and declared.type != exchange_type:
+                raise ChannelClosedByBroker(
+                    406, f"PRECONDITION_FAILED - inequivalent arg 'type' for "
+                         f"exchange '{exchange}' in vhost '{channel.vhost}': "
+                         f"received '{exchange_type}' but current is "
+                         f"'{declared.type}'")
+        return Exchange.DeclareOk()
+
+    def exchange_delete(self, channel: '_MemoryChannel',
+                        exchange: str) -> Exchange.DeleteOk:
+        with self._lock:
+            if exchange not in DEFAULT_EXCHANGES:
+                self._get_vhost(channel.vhost).exchanges.pop(exchange, None)
+        return Exchange.DeleteOk()
+
+    def queue_declare(self, channel: '_MemoryChannel', queue: str,
+                      passive: bool, exclusive: bool, auto_delete: bool,
+                      arguments: Optional[dict]) -> Queue.DeclareOk:
+        with self._lock:
+            queues = self._get_vhost(channel.vhost).queues
+            if passive or queue in queues:
+                declared = self._get_queue(channel, queue)
+            else:
+                queue = queue or f"amq.gen-{uuid.uuid4().hex}"
+                declared = _Queue(queue, channel.connection if exclusive
+                                  else None, auto_delete, arguments)
+                queues[queue] = declared
+            declared.drop_expired(time.monotonic())
+            return Queue.DeclareOk(queue, len(declared.messages),
+                                   len(declared.consumers))
+
+    def queue_delete(self, channel: '_MemoryChannel', queue: str,
+                     if_unused: bool, if_empty: bool) -> Queue.DeleteOk:
+        with self._lock:
+            vhost = self._get_vhost(channel.vhost)
+            if queue not in vhost.queues:
+                return Queue.DeleteOk(0)
+            declared = self._get_queue(channel, queue)
+            if if_unused and declared.consumers:
+                raise ChannelClosedByBroker(
+                    406, f"PRECONDITION_FAILED - queue '{queue}' in vhost "
+                         f"'{channel.vhost}' in use")
+            if if_empty and declared.messages:
+                raise ChannelClosedByBroker(
+                    406, f"PRECONDITION_FAILED - queue '{queue}' in vhost "
+                         f"'{channel.vhost}' not empty")
+            return Queue.DeleteOk(self._delete_queue(vhost, declared))
+
+    def _delete_queue(self, vhost: _VirtualHost, queue: _Queue) -> int:
+        queue.deleted = True
+        vhost.queues.pop(queue.name, None)
+        for exchange in vhost.exchanges.values():
+            exchange.unbind_queue(queue.name)
+        for consumer in list(queue.consumers):
+            self._remove_consumer(consumer)
+            # The broker cancels consumers of deleted queues
+            consumer.channel._on_cancelled(consumer.tag)
+        count = len(queue.messages)
+        queue.messages.clear()
+        return count
+
+    def queue_purge(self, channel: '_MemoryChannel',
+                    queue: str) -> Queue.PurgeOk:
+        with self._lock:
+            declared = self._get_queue(channel, queue)
+            count = len(declared.messages)
+            declared.messages.clear()
+        return Queue.PurgeOk(count)
+
+    def queue_bind(self, channel: '_MemoryChannel', queue: str,
+                   exchange: str, routing_key: Optional[str],
+                   unbind: bool = False):
+        with self._lock:
+            self._get_queue(channel, queue)
+            declared = self._get_vhost(channel.vhost).exchanges.get(exchange)
+            if declared is None:
+                raise ChannelClosedByBroker(
+                    404, f"NOT_FOUND - no exchange '{exchange}' in vhost "
+                         f"'{channel.vhost}'")
+            if not exchange:
+                raise ChannelClosedByBroker(
+                    403, f"ACCESS_REFUSED - operation not permitted on the "
+                         f"default exchange")
+            key = queue if routing_key is None else routing_key
+            if unbind:
+                declared.bindings.get(key, set()).discard(queue)
+                return Queue.UnbindOk()
+            declared.bindings.setdefault(key, set()).add(queue)
+        return Queue.BindOk()
+
+    def basic_publish(self, channel: '_MemoryChannel', exchange: str,
+                      routing_key: str, body: bytes,
+                      properties: Optional[BasicProperties]) -> bool:
+        """
+        Route a message to queues
+        :returns: True if the message was routed to any queue
+        """
+        properties = properties or BasicProperties()
+        now = time.monotonic()
+        with self._lock:
+            vhost = self._get_vhost(channel.vhost)
+            declared = vhost.exchanges.get(exchange)
+            if declared is None:
+                raise ChannelClosedByBroker(
+                    404, f"NOT_FOUND - no exchange '{exchange}' in vhost "
+                         f"'{channel.vhost}'")
+            if exchange:
+                queues = [vhost.queues[name] for name in
+                          declared.route(routing_key) if name in vhost.queues]
+            else:
+                queue = vhost.queues.get(routing_key)
+                queues = [queue] if queue else []
+            for queue in queues:
+                ttl = queue.ttl
+                if properties.expiration is not None:
+                    ttl = int(properties.expiration) if ttl is None else \
+                        min(ttl, int(properties.expiration))
+                queue.messages.append(_Message(
+                    exchange, routing_key, body, properties,
+                    None if ttl is None else now + ttl / 1000))
+                if queue.consumers:
+                    self._dispatch(queue)
+        return bool(queues)
+
+    def basic_consume(self, channel: '_MemoryChannel', queue: str,
+                      callback: Callable, auto_ack: bool,
+                      consumer_tag: Optional[str]) -> Basic.ConsumeOk:
+        with self._lock:
+            declared = self._get_queue(channel, queue)
+            consumer_tag = consumer_tag or f"ctag{channel.channel_number}." \
+                                           f"{uuid.uuid4().hex}"
+            if consumer_tag in channel.consumers:
+                raise ChannelClosedByBroker(
+                    530, f"NOT_ALLOWED - attempt to reuse consumer tag "
+                         f"'{consumer_tag}'")
+            consumer = _Consumer(consumer_tag, declared, channel, callback,
+                                 auto_ack, channel.prefetch_count)
+            channel.consumers[consumer_tag] = consumer
+            declared.consumers.append(consumer)
+            self._dispatch(declared)
+        return Basic.ConsumeOk(consumer_tag)
+
+    def basic_cancel(self, channel: '_MemoryChannel',
+                     consumer_tag: str) -> Basic.CancelOk:
+        with self._lock:
+            consumer = channel.consumers.get(consumer_tag)
+            if consumer:
+                self._remove_consumer(consumer)
+        return Basic.CancelOk(consumer_tag)
+
+    def _remove_consumer(self, consumer: _Consumer):
+        consumer.channel.consumers.pop(consumer.tag, None)
+        queue = consumer.queue
+        if consumer in queue.consumers:
+            queue.consumers.remove(consumer)
+        if queue.auto_delete and not queue.consumers and not queue.deleted:
+            self._delete_queue(self._get_vhost(consumer.channel.vhost), queue)
+
+    def basic_get(self, channel: '_MemoryChannel', queue: str,
+                  auto_ack: bool) -> Tuple[Optional[Basic.GetOk],
+                                           Optional[BasicProperties],
+                                           Optional[bytes]]:
+        with self._lock:
+            declared = self._get_queue(channel, queue)
+            declared.drop_expired(time.monotonic())
+            if not declared.messages:
+                return None, None, None
+            message = declared.messages.popleft()
+            delivery_tag = channel._next_delivery_tag()
+            if not auto_ack:
+                channel.unacked[delivery_tag] = (declared, message, None)
+            return Basic.GetOk(delivery_tag, message.redelivered,
+                               message.exchange, message.routing_key,
+                               len(declared.messages)), \
+                message.properties, message.body
+
+    def basic_ack(self, channel: '_MemoryChannel', delivery_tag: int,
+                  multiple: bool):
+        with self._lock:
+            self._settle(channel, self._get_unacked_tags(
+                channel, delivery_tag, multiple))
+
+    def basic_nack(self, channel: '_MemoryChannel', delivery_tag: int,
+                   multiple: bool, requeue: bool):
+        with self._lock:
+            tags = self._get_unacked_tags(channel, delivery_tag, multiple)
+            if requeue:
+                self._requeue(channel, tags)
+            else:
+                self._settle(channel, tags)
+
+    @staticmethod
+    def _get_unacked_tags(channel: '_MemoryChannel', delivery_tag: int,
+                          multiple: bool) -> List[int]:
+        if multiple:
+            return [tag for tag in channel.unacked
+                    if not delivery_tag or tag <= delivery_tag]
+        if delivery_tag not in channel.unacked:
+            raise ChannelClosedByBroker(406, f"PRECONDITION_FAILED - unknown "
+                                             f"delivery tag {delivery_tag}")
+        return [delivery_tag]
+
+    def _settle(self, channel: '_MemoryChannel', tags: List[int]):
+        queues = dict()
+        for tag in tags:
+            queue, _, consumer = channel.unacked.pop(tag)
+            if consumer:
+                consumer.unacked -= 1
+                queues[id(queue)] = queue
+        for queue in queues.values():
+            if queue.consumers:
+                self._dispatch(queue)
+
+    def _requeue(self, channel: '_MemoryChannel', tags: List[int]):
+        queues = dict()
+        # Requeue in reverse so messages keep their order at the queue head
+        for tag in reversed(tags):
+            queue, message, consumer = channel.unacked.pop(tag)
+            if consumer:
+                consumer.unacked -= 1
+            if queue.deleted:
+                continue
+            message.redelivered = True
+            queue.messages.appendleft(message)
+            queues[id(queue)] = queue
+        for queue in queues.values():
+            self._dispatch(queue)
+
+    def _dispatch(self, queue: _Queue):
+        """
+        Deliver ready messages to consumers with capacity
+        """
+        messages = queue.messages
+        now = time.monotonic()
+        while messages:
+            consumer = queue.next_consumer()
+            if consumer is None:
+                return
+            message = messages.popleft()
+            if message.expires is not None and message.expires < now:
+                continue
+            consumer.channel._deliver(consumer, message)
+
+
+class _MemoryConnection:
+    is_blocking = False
+
+    def __init__(self, broker: MemoryBroker,
+                 parameters: Optional[ConnectionParams] = None):
+        if isinstance(parameters, (list, tuple)):
+            parameters = parameters[0]
+        self.params = parameters
+        self.vhost = parameters.virtual_host if parameters else '/'
+        self.broker = broker
+        self.channels: Dict[int, '_MemoryChannel'] = dict()
+        self._channel_numbers = itertools.count(1)
+        self._closed_reason: Optional[Exception] = None
+        self._events: Deque[Callable[[], None]] = deque()
+
+    @property
+    def is_open(self) -> bool:
+        return self._closed_reason is None
+
+    @property
+    def is_closed(self) -> bool:
+        return self._closed_reason is not None
+
+    @property
+    def is_closing(self) -> bool:
+        return False
+
+    def _new_channel(self, channel_cls, channel_number: Optional[int]):
+        self._check_open()
+        channel = channel_cls(self, channel_number or
+                              next(self._channel_numbers))
+        self.channels[channel.channel_number] = channel
+        return channel
+
+    def _check_open(self):
+        if isinstance(self._closed_reason, ConnectionClosedByBroker):
+            raise self._closed_reason
+        if self._closed_reason is not None:
+            raise ConnectionWrongStateError("Connection is closed.")
+
+    def _post(self, func: Callable[[], None]):
+        """
+        Call `func` on the thread of this connection
+        """
+        raise NotImplementedError()
+
+    def _set_closed(self, reason: Exception):
+        self._closed_reason = reason
+
+    def close(self, reply_code: int = 200, reply_text: str = "Normal shutdown"):
+        if self.is_closed:
+            raise ConnectionWrongStateError("Connection is already closed.")
+        self.broker.close_connection(self, ConnectionClosedByClient(
+            reply_code, reply_text))
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} vhost={self.vhost} " \
+               f"open={self.is_open}>"
+
+
+class MemoryBlockingConnection(_MemoryConnection):
+    """
+    In-memory equivalent of `pika.BlockingConnection`. Deliveries and
+    callbacks are processed by `process_data_events`, `sleep` and
+    `start_consuming` on the thread calling them.
+    """
+    is_blocking = True
+
+    def __init__(self, broker: MemoryBroker,
+                 parameters: Optional[ConnectionParams] = None):
+        _MemoryConnection.__init__(self, broker, parameters)
+        self._wakeup = threading.Event()
+        broker.add_connection(self)
+
+    def _post(self, func: Callable[[], None]):
+        self._events.append(func)
+        self._wakeup.set()
+
+    def _set_closed(self, reason: Exception):
+        _MemoryConnection._set_closed(self, reason)
+        self._wakeup.set()
+
+    def _process_events(self, timeout: Optional[float]):
+        """
+        Call posted events, first waiting up to `timeout` seconds for one if
+        there are none
+        :param timeout: max seconds to wait, or None to wait until an event is
+            posted or the connection is closed
+        """
+        events = self._events
+        if not events and timeout != 0:
+            self._wakeup.wait(timeout)
+        self._wakeup.clear()
+        for _ in range(len(events)):
+            if self.is_closed:
+                break
+            events.popleft()()
+
+    def process_data_events(self, time_limit: Optional[float] = 0):
+        self._check_open()
+        self._process_events(time_limit)
+
+    def sleep(self, duration: float):
+        deadline = time.monotonic() + duration
+        while True:
+            self._check_open()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self._process_events(remaining)
+
+    def add_callback_threadsafe(self, callback: Callable[[], None]):
+        self._check_open()
+        self._post(callback)
+
+    def channel(self, channel_number: Optional[int] = None
+                ) -> 'MemoryBlockingChannel':
+        return self._new_channel(MemoryBlockingChannel, channel_number)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        if self.is_open:
+            self.close()
+
+
+class MemorySelectConnection(_MemoryConnection):
+    """
+    In-memory equivalent of `pika.SelectConnection`, calling back on its IO
+    loop
+    """
+
+    # Max events to process per IO loop iteration so timers are not starved
+    max_batch = 1000
+
+    def __init__(self, broker: MemoryBroker,
+                 parameters: Optional[ConnectionParams] = None,
+                 on_open_callback: Optional[Callable] = None,
+                 on_open_error_callback: Optional[Callable] = None,
+                 on_close_callback: Optional[Callable] = None,
+                 custom_ioloop: Optional[IOLoop] = None):
+        _MemoryConnection.__init__(self, broker, parameters)
+        self.ioloop = custom_ioloop or IOLoop()
+        self._drain_scheduled = False
+        self._on_close_callback = on_close_callback
+        try:
+            broker.add_connection(self)
+        except AMQPConnectionError as e:
+            self._closed_reason = e
+            if on_open_error_callback:
+                self._post(partial(on_open_error_callback, self, e))
+            return
+        if on_open_callback:
+            self._post(partial(on_open_callback, self))
+
+    def _post(self, func: Callable[[], None]):
+        self._events.append(func)
+        if not self._drain_scheduled:
+            self._drain_scheduled = True
+            self.ioloop.add_callback_threadsafe(self._drain)
+
+    def _drain(self):
+        self._drain_scheduled = False
+        events = self._events
+        for _ in range(min(len(events), self.max_batch)):
+            events.popleft()()
+        if events and not self._drain_scheduled:
+            self._drain_scheduled = True
+            self.ioloop.add_callback_threadsafe(self._drain)
+
+    def _set_closed(self, reason: Exception):
+        _MemoryConnection._set_closed(self, reason)
+        if self._on_close_callback:
+            self._post(partial(self._on_close_callback, self, reason))
+
+    def channel(self, channel_number: Optional[int] = None,
+                on_open_callback: Optional[Callable] = None
+                ) -> 'MemorySelectChannel':
+        channel = self._new_channel(MemorySelectChannel, channel_number)
+        if on_open_callback:
+            self._post(partial(on_open_callback, channel))
+        return channel
+
+
+class _MemoryChannel:
+    def __init__(self, connection: _MemoryConnection, channel_number: int):
+        self.connection = connection
+        self.channel_number = channel_number
+        self.vhost = connection.vhost
+        self.broker = connection.broker
+        self.consumers: Dict[str, _Consumer] = dict()
+        # Delivery tag to (queue, message, consumer) in delivery order
+        self.unacked: Dict[int, tuple] = dict()
+        self.prefetch_count = 0
+        self._delivery_tags = itertools.count(1)
+        self._closed_reason: Optional[Exception] = None
+        self._close_callbacks: List[Callable] = list()
+        self._return_callbacks: List[Callable] = list()
+
+    @property
+    def is_open(self) -> bool:
+        return self._closed_reason is None
+
+    @property
+    def is_closed(self) -> bool:
+        return self._closed_reason is not None
+
+    @property
+    def is_closing(self) -> bool:
+        return False
+
+    @property
+    def consumer_tags(self) -> List[str]:
+        return list(self.consumers)
+
+    def add_on_close_callback(self, callback: Callable):
+        self._close_callbacks.append(callback)
+
+    def add_on_return_callback(self, callback: Callable):
+        self._return_callbacks.append(callback)
+
+    def _check_open(self):
+        self.connection._check_open()
+        if self._closed_reason is not None:
+            raise ChannelWrongStateError("Channel is closed.")
+
+    def _next_delivery_tag(self) -> int:
+        return next(self._delivery_tags)
+
+    def _set_closed(self, reason: Exception):
+        self._closed_reason = reason
+        self.connection.channels.pop(self.channel_number, None)
+        for callback in self._close_callbacks:
+            self.connection._post(partial(callback, self, reason))
+
+    def _deliver(self, consumer: _Consumer, message: _Message):
+        """
+        Pass a message to `consumer`; called with the broker lock held
+        """
+        delivery_tag = next(self._delivery_tags)
+        if not consumer.auto_ack:
+            consumer.unacked += 1
+            self.unacked[delivery_tag] = (consumer.queue, message, consumer)
+        self.connection._post(partial(
+            self._on_deliver, consumer, Basic.Deliver(
+                consumer.tag, delivery_tag, message.redelivered,
+                message.exchange, message.routing_key),
+            message.properties, message.body))
+
+    def _on_deliver(self, consumer: _Consumer, method: Basic.Deliver,
+                    properties: BasicProperties, body: bytes):
+        if self._closed_reason is None and consumer.tag in self.consumers:
+            consumer.callback(self, method, properties, body)
+
+    def _on_cancelled(self, consumer_tag: str):
+        """
+        Called when the broker cancelled a consumer of this channel
+        """
+
+    def _returned(self, exchange: str, routing_key: str, body: bytes,
+                  properties: Optional[BasicProperties]) -> ReturnedMessage:
+        returned = ReturnedMessage(
+            Basic.Return(312, "NO_ROUTE", exchange, routing_key),
+            properties or BasicProperties(), body)
+        for callback in self._return_callbacks:
+            self.connection._post(partial(callback, self, returned.method,
+                                          returned.properties, body))
+        return returned
+
+    def _call(self, func: Callable, *args):
+        """
+        Call a broker method for this channel, closing the channel if the
+        broker raises a channel error
+        """
+        self._check_open()
+        try:
+            return func(self, *args)
+        except ChannelClosedByBroker as e:
+            self.broker.close_channel(self, e)
+            raise
+
+    def _publish(self, exchange: str, routing_key: str, body: bytes,
+                 properties: Optional[BasicProperties],
+                 mandatory: bool) -> Optional[ReturnedMessage]:
+        if not self._call(self.broker.basic_publish, exchange or '',
+                          routing_key, body, properties) and mandatory:
+            return self._returned(exchange, routing_key, body, properties)
+        return None
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        self._call(self.broker.basic_ack, delivery_tag, multiple)
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False,
+                   requeue: bool = True):
+        self._call(self.broker.basic_nack, delivery_tag, multiple, requeue)
+
+    def basic_reject(self, delivery_tag: int = 0, requeue: bool = True):
+        self._call(self.broker.basic_nack, delivery_tag, False, requeue)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} number={self.channel_number} " \
+               f"open={self.is_open} conn={self.connection}>"
+
+
+class MemoryBlockingChannel(_MemoryChannel):
+    """
+    In-memory equivalent of `pika.adapters.blocking_connection.BlockingChannel`
+    """
+
+    def __init__(self, connection: MemoryBlockingConnection,
+                 channel_number: int):
+        _MemoryChannel.__init__(self, connection, channel_number)
+        self._confirm = False
+
+    def _method(self, method) -> Method:
+        return Method(self.channel_number, method)
+
+    def close(self, reply_code: int = 0, reply_text: str = "Normal shutdown"):
+        if self.is_closed:
+            raise ChannelWrongStateError("Channel is already closed.")
+        self.broker.close_channel(self, ChannelClosedByClient(reply_code,
+                                                              reply_text))
+
+    def confirm_delivery(self):
+        self._check_open()
+        self._confirm = True
+
+    def basic_qos(self, prefetch_size: int = 0, prefetch_count: int = 0,
+                  global_qos: bool = False):
+        self._check_open()
+        self.prefetch_count = prefetch_count
+
+    def exchange_declare(self, exchange: str,
+                         exchange_type: str = ExchangeType.direct,
+                         passive: bool = False, durable: bool = False,
+                         auto_delete: bool = False, internal: bool = False,
+                         arguments: Optional[dict] = None) -> Method:
+        return self._method(self._call(self.broker.exchange_declare, exchange,
+                                       exchange_type, passive, auto_delete))
+
+    def exchange_delete(self, exchange: Optional[str] = None,
+                        if_unused: bool = False) -> Method:
+        return self._method(self._call(self.broker.exchange_delete,
+                                       exchange))
+
+    def queue_declare(self, queue: str, passive: bool = False,
+                      durable: bool = False, exclusive: bool = False,
+                      auto_delete: bool = False,
+                      arguments: Optional[dict] = None) -> Method:
+        return self._method(self._call(self.broker.queue_declare, queue,
+                                       passive, exclusive, auto_delete,
+                                       arguments))
+
+    def queue_delete(self, queue: str, if_unused: bool = False,
+                     if_empty: bool = False) -> Method:
+        return self._method(self._call(self.broker.queue_delete, queue,
+                                       if_unused, if_empty))
+
+    def queue_purge(self, queue: str) -> Method:
+        return self._method(self._call(self.broker.queue_purge, queue))
+
+    def queue_bind(self, queue: str, exchange: str,
+                   routing_key: Optional[str] = None,
+                   arguments: Optional[dict] = None) -> Method:
+        return self._method(self._call(self.broker.queue_bind, queue,
+                                       exchange, routing_key))
+
+    def queue_unbind(self, queue: str, exchange: Optional[str] = None,
+                     routing_key: Optional[str] = None,
+                     arguments: Optional[dict] = None) -> Method:
+        return self._method(self._call(self.broker.queue_bind, queue,
+                                       exchange, routing_key, True))
+
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes,
+                      properties: Optional[BasicProperties] = None,
+                      mandatory: bool = False):
+        returned = self._publish(exchange, routing_key, body, properties,
+                                 mandatory)
+        if returned and self._confirm:
+            raise UnroutableError([returned])
+
+    def basic_consume(self, queue: str, on_message_callback: Callable,
+                      auto_ack: bool = False, exclusive: bool = False,
+                      consumer_tag: Optional[str] = None,
+                      arguments: Optional[dict] = None) -> str:
+        return self._call(self.broker.basic_consume, queue,
+                          on_message_callback, auto_ack,
+                          consumer_tag).consumer_tag
+
+    def basic_cancel(self, consumer_tag: str) -> list:
+        self._call(self.broker.basic_cancel, consumer_tag)
+        self._on_cancelled(consumer_tag)
+        return []
+
+    def basic_get(self, queue: str, auto_ack: bool = False):
+        return self._call(self.broker.basic_get, queue, auto_ack)
+
+    def start_consuming(self):
+        """
+        Process deliveries until all consumers of this channel are cancelled
+        or the channel or connection is closed
+        """
+        while self.consumers and self.is_open:
+            self.connection._process_events(None)
+        for reason in (self.connection._closed_reason, self._closed_reason):
+            if isinstance(reason, (ConnectionClosedByBroker,
+                                   ChannelClosedByBroker)):
+                raise reason
+
+    def stop_consuming(self, consumer_tag: Optional[str] = None):
+        for tag in [consumer_tag] if consumer_tag else self.consumer_tags:
+            self.basic_cancel(tag)
+
+    def _on_cancelled(self, consumer_tag: str):
+        # Wake `start_consuming` so it can return
+        self.connection._post(lambda: None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        if self.is_open:
+            self.close()
+
+
+class MemorySelectChannel(_MemoryChannel):
+    """
+    In-memory equivalent of `pika.channel.Channel`. Method callbacks are
+    called on the IO loop of the connection; a broker error closes the
+    channel and is passed to its close callbacks.
+    """
+
+    def _async(self, func: Callable, callback: Optional[Callable], *args):
+        try:
+            result = self._call(func, *args)
+        except ChannelClosedByBroker:
+            return None
+        if callback:
+            self.connection._post(partial(
+                callback, Method(self.channel_number, result)))
+        return result
+
+    def close(self, reply_code: int = 0, reply_text: str = "Normal shutdown"):
+        if self.is_closed:
+            raise ChannelWrongStateError("Channel is already closed.")
+        self.broker.close_channel(self, ChannelClosedByClient(reply_code,
+                                                              reply_text))
+
+    def basic_qos(self, prefetch_size: int = 0, prefetch_count: int = 0,
+                  global_qos: bool = False,
+                  callback: Optional[Callable] = None):
+        self._check_open()
+        self.prefetch_count = prefetch_count
+        if callback:
+            self.connection._post(partial(
+                callback, Method(self.channel_number, Basic.QosOk())))
+
+    def exchange_declare(self, exchange: str,
+                         exchange_type: str = ExchangeType.direct,
+                         passive: bool = False, durable: bool = False,
+                         auto_delete: bool = False, internal: bool = False,
+                         arguments: Optional[dict] = None,
+                         callback: Optional[Callable] = None):
+        self._async(self.broker.exchange_declare, callback, exchange,
+                    exchange_type, passive, auto_delete)
+
+    def exchange_delete(self, exchange: Optional[str] = None,
+                        if_unused: bool = False,
+                        callback: Optional[Callable] = None):
+        self._async(self.broker.exchange_delete, callback, exchange)
+
+    def queue_declare(self, queue: str, passive: bool = False,
+                      durable: bool = False, exclusive: bool = False,
+                      auto_delete: bool = False,
+                      arguments: Optional[dict] = None,
+                      callback: Optional[Callable] = None):
+        self._async(self.broker.queue_declare, callback, queue, passive,
+                    exclusive, auto_delete, arguments)
+
+    def queue_delete(self, queue: str, if_unused: bool = False,
+                     if_empty: bool = False,
+                     callback: Optional[Callable] = None):
+        self._async(self.broker.queue_delete, callback, queue, if_unused,
+                    if_empty)
+
+    def queue_purge(self, queue: str, callback: Optional[Callable] = None):
+        self._async(self.broker.queue_purge, callback, queue)
+
+    def queue_bind(self, queue: str, exchange: str,
+                   routing_key: Optional[str] = None,
+                   arguments: Optional[dict] = None,
+                   callback: Optional[Callable] = None):
+        self._async(self.broker.queue_bind, callback, queue, exchange,
+                    routing_key)
+
+    def queue_unbind(self, queue: str, exchange: Optional[str] = None,
+                     routing_key: Optional[str] = None,
+                     arguments: Optional[dict] = None,
+                     callback: Optional[Callable] = None):
+        self._async(self.broker.queue_bind, callback, queue, exchange,
+                    routing_key, True)
+
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes,
+                      properties: Optional[BasicProperties] = None,
+                      mandatory: bool = False):
+        self._publish(exchange, routing_key, body, properties, mandatory)
+
+    def basic_consume(self, queue: str, on_message_callback: Callable,
+                      auto_ack: bool = False, exclusive: bool = False,
+                      consumer_tag: Optional[str] = None,
+                      arguments: Optional[dict] = None,
+                      callback: Optional[Callable] = None) -> Optional[str]:
+        result = self._async(self.broker.basic_consume, callback, queue,
+                             on_message_callback, auto_ack, consumer_tag)
+        return result.consumer_tag if result else None
+
+    def basic_cancel(self, consumer_tag: str = '',
+                     callback: Optional[Callable] = None):
+        self._async(self.broker.basic_cancel, callback, consumer_tag)
+
+
+class MemoryTransport(Transport):
+    """
+    Connects to an in-process `MemoryBroker`
+    """
+    name = 'memory'
+
+    def __init__(self, broker: Optional[MemoryBroker] = None):
+        """
+        :param broker: broker to connect to (defaults to a new one)
+        """
+        self.broker = broker or MemoryBroker()
+
+    def blocking_connection(self, parameters: Optional[ConnectionParams] = None
+                            ) -> MemoryBlockingConnection:
+        return MemoryBlockingConnection(self.broker, parameters)
+
+    def select_connection(self, parameters: Optional[ConnectionParams] = None,
+                          on_open_callback: Optional[Callable] = None,
+                          on_open_error_callback: Optional[Callable] = None,
+                          on_close_callback: Optional[Callable] = None,
+                          custom_ioloop: Optional[IOLoop] = None
+                          ) -> MemorySelectConnection:
+        return MemorySelectConnection(self.broker, parameters,
+                                      on_open_callback,
+                                      on_open_error_callback,
+                                      on_close_callback, custom_ioloop)
+
+    def wait_for_startup(self, endpoints: Iterable[Endpoint],
+                         timeout: float,
+                         get_params: Optional[Callable] = None
+                         ) -> Optional[Endpoint]:
+        endpoints = list(endpoints)
+        deadline = time.monotonic() + timeout
+        while not self.broker.available:
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(0.01)
+        return endpoints[0] if endpoints else None
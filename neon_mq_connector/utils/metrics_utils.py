@@ -0,0 +1,390 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import bisect
+import math
+import os
+
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Sequence, Tuple
+from ovos_utils.log import LOG
+
+"""
+Lightweight metrics registry with Prometheus text exposition. Metrics are
+disabled by default, in which case updates return immediately; enable them
+with `NEON_MQ_METRICS=1`, `metrics.enabled = True` or `start_metrics_server`.
+"""
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str],
+                   extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"'
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return f"{{{','.join(pairs)}}}" if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')\
+        .replace('\n', '\\n')
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str,
+                 description: str, labelnames: Sequence[str] = ()):
+        self._registry = registry
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+        self._values: Dict[Tuple[str, ...], float] = dict()
+
+    def get(self, labels: Tuple[str, ...] = ()) -> float:
+        """
+        Get the current value for `labels`
+        """
+        return self._values.get(labels, 0)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} "
+                f"{_format_value(value)}" for labels, value in values]
+
+    def render(self) -> str:
+        """
+        Get this metric in Prometheus text format
+        """
+        return '\n'.join([f"# HELP {self.name} {self.description}",
+                          f"# TYPE {self.name} {self.type_name}",
+                          *self._samples()])
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count
+    """
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, labels: Tuple[str, ...] = ()):
+        """
+        Increment the count for `labels` by `amount`
+        """
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Counter):
+    """
+    Value that may go up and down
+    """
+    type_name = 'gauge'
+
+    def dec(self, amount: float = 1, labels: Tuple[str, ...] = ()):
+        """
+        Decrement the value for `labels` by `amount`
+        """
+        self.inc(-amount, labels)
+
+    def set(self, value: float, labels: Tuple[str, ...] = ()):
+        """
+        Set the value for `labels`
+        """
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values counted in fixed buckets
+    """
+    type_name = 'histogram'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str,
+                 description: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        _Metric.__init__(self, registry, name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Labels to per-bucket counts (the last one is +Inf), sum and count
+        self._histograms: Dict[Tuple[str, ...], list] = dict()
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()):
+        """
+        Record an observed value for `labels`
+        """
+        if not self._registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(labels)
+            if histogram is None:
+                histogram = self._histograms[labels] = \
+                    [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def get(self, labels: Tuple[str, ...] = ()) -> float:
+        """
+        Get the number of observations for `labels`
+        """
+        histogram = self._histograms.get(labels)
+        return histogram[2] if histogram else 0
+
+    def get_sum(self, labels: Tuple[str, ...] = ()) -> float:
+        """
+        Get the sum of observations for `labels`
+        """
+        histogram = self._histograms.get(labels)
+        return histogram[1] if histogram else 0.0
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            histograms = [(labels, list(counts), total, count) for
+                          labels, (counts, total, count) in
+                          self._histograms.items()]
+        samples = []
+        for labels, counts, total, count in histograms:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                samples.append(f"{self.name}_bucket"
+                               f"{_format_labels(self.labelnames, labels, le)}"
+                               f" {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            samples.append(f"{self.name}_sum{label_str} "
+                           f"{_format_value(total)}")
+            samples.append(f"{self.name}_count{label_str} {count}")
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Collection of named metrics. Metrics with the same name are shared, so
+    modules may declare the metrics they update at import.
+    """
+
+    def __init__(self, enabled: bool = False):
+        """
+        :param enabled: if False, metric updates are ignored
+        """
+        self.enabled = enabled
+        self._lock = Lock()
+        self._metrics: Dict[str, _Metric] = dict()
+
+    def _get_or_create(self, cls, name: str, description: str,
+                       labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, description,
+                                                   labelnames, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"{name} is already registered as a "
+                                 f"{metric.type_name}")
+            return metric
+
+    def counter(self, name: str, description: str,
+                labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, description, labelnames)
+
+    def gauge(self, name: str, description: str,
+              labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, description, labelnames)
+
+    def histogram(self, name: str, description: str,
+                  labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, description, labelnames,
+                                   buckets=buckets)
+
+    def get_metric(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def reset(self):
+        """
+        Clear the values of all metrics
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def render(self) -> str:
+        """
+        Get all metrics in Prometheus text exposition format
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return ''.join(f"{metric.render()}\n" for metric in metrics)
+
+
+metrics = MetricsRegistry(
+    enabled=os.environ.get('NEON_MQ_METRICS', '').lower() in
+    ('1', 'true', 'yes'))
+
+MESSAGES_PUBLISHED = metrics.counter(
+    'mq_messages_published_total', 'Messages published', ('exchange_type',))
+MESSAGES_CONSUMED = metrics.counter(
+    'mq_messages_consumed_total', 'Messages received by consumers',
+    ('queue',))
+MESSAGES_IN_FLIGHT = metrics.gauge(
+    'mq_messages_in_flight', 'Messages being handled by consumers',
+    ('queue',))
+HANDLER_SECONDS = metrics.histogram(
+    'mq_handler_seconds', 'Seconds consumers spent handling a message',
+    ('queue',))
+HANDLER_ERRORS = metrics.counter(
+    'mq_handler_errors_total', 'Messages that raised an exception in their '
+                               'handler', ('queue',))
+SLOW_CALLBACKS = metrics.counter(
+    'mq_slow_callbacks_total', 'Callbacks that exceeded the slow callback '
+                               'threshold', ('queue',))
+HANDLER_TIMEOUTS = metrics.counter(
+    'mq_handler_timeouts_total', 'Callbacks interrupted by their hard '
+                                 'timeout', ('queue',))
+CONSUMER_MESSAGES = metrics.counter(
+    'mq_consumer_messages_total', 'Messages handled by consumers',
+    ('consumer',))
+CONSUMER_BYTES = metrics.counter(
+    'mq_consumer_bytes_total', 'Bytes of message bodies handled by '
+                               'consumers', ('consumer',))
+CONSUMER_HANDLER_SECONDS = metrics.counter(
+    'mq_consumer_handler_seconds_total', 'Wall seconds consumers spent in '
+                                         'callbacks', ('consumer',))
+CONSUMER_CPU_SECONDS = metrics.counter(
+    'mq_consumer_cpu_seconds_total', 'CPU seconds of consumer threads in '
+                                     'callbacks (handler) or pika (io)',
+    ('consumer', 'activity'))
+DECODE_SECONDS = metrics.histogram(
+    'mq_decode_seconds', 'Seconds spent decoding and validating request '
+                         'bodies', ('handler',))
+ACK_SECONDS = metrics.histogram(
+    'mq_ack_seconds', 'Seconds waiting for the broker to confirm mandatory '
+                      'publishes')
+LOOP_LAG_SECONDS = metrics.histogram(
+    'mq_ioloop_lag_seconds', 'Seconds consumer IO loop timers ran late',
+    ('consumer',), buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0,
+                            2.5, 5.0, 10.0, 30.0, 60.0))
+LOOP_STALLS = metrics.counter(
+    'mq_ioloop_stalls_total', 'Consumer IO loops blocked for longer than '
+                              'the lag warning threshold', ('consumer',))
+CONNECTION_OPENS = metrics.counter(
+    'mq_connection_opens_total', 'Connections opened', ('kind',))
+CONSUMER_RECONNECTS = metrics.counter(
+    'mq_consumer_reconnects_total', 'Reconnects of consumers', ('queue',))
+CONSUMER_RESTARTS = metrics.counter(
+    'mq_consumer_restarts_total', 'Consumer threads restarted', ('consumer',))
+REQUESTS = metrics.counter(
+    'mq_requests_total', 'Requests sent with send_mq_request',
+    ('queue', 'outcome'))
+REQUEST_SECONDS = metrics.histogram(
+    'mq_request_seconds', 'Seconds until a response to send_mq_request was '
+                          'received', ('queue',))
+REQUESTS_IN_FLIGHT = metrics.gauge(
+    'mq_requests_in_flight', 'Requests waiting for a response')
+
+_server = None
+_server_lock = Lock()
+
+
+def start_metrics_server(port: int = 9090, addr: str = '0.0.0.0'):
+    """
+    Enable metrics and serve them in Prometheus text format at `/metrics`.
+    Only one server is started per process.
+    :param port: port to listen on (0 to pick a free one)
+    :param addr: address to listen on
+    :returns: http.server.ThreadingHTTPServer serving metrics
+    """
+    global _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    with _server_lock:
+        metrics.enabled = True
+        if _server is None:
+            _server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+            Thread(target=_server.serve_forever, daemon=True,
+                   name="metrics_server").start()
+            LOG.info(f"Serving metrics on port {_server.server_address[1]}")
+        return _server
+
+
+def stop_metrics_server():
+    """
+    Stop the metrics server started by `start_metrics_server`
+    """
+    global _server
+    with _server_lock:
+        if _server is not None:
+            _server.shutdown()
+            _server.server_close()
+            _server = None
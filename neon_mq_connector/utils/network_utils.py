@@ -58,14 +58,16 @@ def dict_to_b64(data: dict, charset: str = "utf-8") -> bytes:
     return base64.b64encode(json.dumps(str(data)).encode(charset))
 
 
-def check_port_is_open(addr: str, port: int) -> bool:
+def check_port_is_open(addr: str, port: int, timeout: float = 5) -> bool:
     """
     Checks if the specified port at addr is open
     :param addr: IP or URL to query
     :param port: port to check
+    :param timeout: max seconds to wait for a connection
     :returns: True if the port is reachable, else False
     """
-    test_connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    test_connection.settimeout(5)
-    status = test_connection.connect_ex((addr, port))
-    return status == 0
+    try:
+        with socket.create_connection((addr, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
@@ -26,16 +26,122 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import inspect
+import time
 
 from functools import wraps
-from typing import Optional, Type, Callable, Any, Tuple
+from typing import Optional, Type, Callable, Any, Tuple, Iterator
 
 import pika.channel
 
 from ovos_utils.log import LOG
 from pydantic import BaseModel, ValidationError
 
+from neon_mq_connector.utils.deadline_utils import get_deadline, \
+    is_expired, record_expired, request_deadline
+from neon_mq_connector.utils.metrics_utils import DECODE_SECONDS
 from neon_mq_connector.utils.network_utils import b64_to_dict
+from neon_mq_connector.utils.stream_utils import StreamProducerBusy, \
+    make_stream_headers, run_stream_producer
+from neon_mq_connector.utils.tracing_utils import trace_phase
+from neon_mq_connector.utils.watchdog_utils import watchdog
+
+
+def _reply_on_channel(channel, properties, response: dict,
+                      routing_key: str) -> bool:
+    """
+    Check if a response may be published on the consuming channel. This is
+    only done for replies to the `reply_to` queue of the request, which the
+    requester declares before sending the request; replies to other queues
+    use `send_message`, which declares the queue first.
+    """
+    return 'vhost' not in response and \
+        routing_key == getattr(properties, 'reply_to', None) and \
+        getattr(channel, 'is_open', False)
+
+
+def _send_reply(connector, channel, properties, response: dict,
+                routing_key: str, headers: Optional[dict] = None,
+                expiration: Optional[int] = 1000):
+    """
+    Publishes a response on the consuming channel, falling back to a new
+    connection if the response is not for the request `reply_to` queue or
+    the channel is not usable.
+    :param connector: MQConnector instance handling the request
+    :param channel: channel the request was received on
+    :param properties: properties of the request
+    :param response: response data to publish
+    :param routing_key: queue to publish the response to
+    :param headers: message headers to include (optional)
+    :param expiration: mq message expiration time in millis; if None, the
+        response does not expire
+    """
+    def _send_message(error: Optional[Exception] = None):
+        if error:
+            LOG.warning(f"Failed to reply on consumer channel: {error}")
+        connector.send_message(request_data=response,
+                               vhost=response.pop('vhost', connector.vhost),
+                               queue=routing_key, headers=headers,
+                               expiration=expiration)
+
+    if _reply_on_channel(channel, properties, response, routing_key):
+        try:
+            connector.emit_mq_reply(channel, response, routing_key,
+                                    request_properties=properties,
+                                    headers=headers, expiration=expiration,
+                                    on_failure=_send_message)
+            return
+        except Exception as e:
+            LOG.warning(f"Failed to reply on consumer channel: {e}")
+    _send_message()
+
+
+def _send_stream_reply(connector, channel, properties, chunks: Iterator,
+                       routing_key: str, message_id: str):
+    """
+    Publishes chunks yielded by a handler as a stream. Chunks are produced in
+    the shared stream producer pool so the consumer IO loop is free to send
+    each chunk as soon as it is yielded. Chunks do not expire, since a slow
+    reader relies on the queue to hold them. If too many streams are queued
+    (see `run_stream_producer`), the stream is ended with an error.
+    :param connector: MQConnector instance handling the request
+    :param channel: channel the request was received on
+    :param properties: properties of the request
+    :param chunks: generator yielding response chunks; non-dict chunks are
+        published as `{"data": chunk}`
+    :param routing_key: queue to publish the response to
+    :param message_id: id of the request being answered
+    """
+    stream_id = connector.create_unique_id()
+
+    def _publish(seq: int, data: dict, end: bool = False):
+        data.setdefault("context", {}).setdefault("mq", {}).setdefault(
+            "message_id", message_id)
+        _send_reply(connector, channel, properties, data, routing_key,
+                    headers=make_stream_headers(stream_id, seq, end),
+                    expiration=None)
+
+    def _stream():
+        seq = 0
+        end_data = {}
+        try:
+            with request_deadline(get_deadline(properties)):
+                for chunk in chunks:
+                    _publish(seq, chunk if isinstance(chunk, dict)
+                             else {"data": chunk})
+                    seq += 1
+        except Exception as e:
+            LOG.error(f"Streaming response to {routing_key} failed: {e}")
+            end_data = {"stream_error": repr(e)}
+        try:
+            _publish(seq, end_data, end=True)
+        except Exception as e:
+            LOG.error(f"Failed to end stream to {routing_key}: {e}")
+
+    try:
+        run_stream_producer(_stream)
+    except StreamProducerBusy as e:
+        LOG.error(f"Rejected stream to {routing_key}: {e}")
+        _publish(0, {"stream_error": repr(e)}, end=True)
 
 
 def create_mq_callback(
@@ -62,6 +168,15 @@ def create_mq_callback(
     if the decorated function does not accept `channel` and `method` kwargs that
     are required to acknowledge a message.
 
+    If the request specifies a `routing_key` (or `reply_to` property), a
+    returned dict is published as the response. A returned generator is
+    published as a stream of chunks (see `stream_utils`).
+
+    Requests received after their deadline (see `deadline_utils`) are dropped
+    before decoding. While handling a request, the remaining time may be read
+    with `deadline_utils.get_remaining_time`. Handlers are monitored by the
+    `watchdog_utils` callback watchdog when it is enabled.
+
     :param callback: callable to wrap into this decorator
     :param include_callback_props: tuple of `pika` callback arguments to include (defaults to ('body',))
     :param request_model: pydantic request model to convert received body to
@@ -77,7 +192,33 @@ def create_mq_callback(
         include_callback_props = ()
 
     def wrapper(f):
+        def _drop_expired(*f_args) -> bool:
+            channel, method, properties = f_args[:3]
+            if not is_expired(properties):
+                return False
+            LOG.debug(f"Dropping expired request to {f.__name__}")
+            record_expired("handler", f.__name__)
+            if 'channel' in include_callback_props and \
+                    'method' in include_callback_props:
+                # The handler is responsible for acknowledging this message
+                channel.basic_ack(delivery_tag=method.delivery_tag)
+            return True
+
         def _parse_kwargs(*f_args) -> dict:
+            start = time.perf_counter()
+            callback_kwargs = _decode_kwargs(*f_args)
+            DECODE_SECONDS.observe(time.perf_counter() - start,
+                                   (f.__name__,))
+            return callback_kwargs
+
+        def _watch(callback_kwargs: dict):
+            # Within a consumer, this annotates the watch of the consumer
+            body = callback_kwargs.get('body')
+            message_id = getattr(body, 'message_id', None) or \
+                (body.get('message_id') if isinstance(body, dict) else None)
+            return watchdog.watch(f.__name__, f.__name__, message_id)
+
+        def _decode_kwargs(*f_args) -> dict:
             mq_props = ['channel', 'method', 'properties', 'body']
             callback_kwargs = {}
 
@@ -86,7 +227,8 @@ def create_mq_callback(
                     value = f_args[idx]
                     if idx == 3:
                         if value and isinstance(value, bytes):
-                            dict_data = b64_to_dict(value)
+                            with trace_phase('decode'):
+                                dict_data = b64_to_dict(value)
                             callback_kwargs['body'] = dict_data
                         elif value and isinstance(value, dict):
                             callback_kwargs['body'] = value
@@ -94,9 +236,10 @@ def create_mq_callback(
                             raise TypeError(f'Invalid body received, expected: '
                                             f'bytes string; got: {type(value)}')
                         if request_model:
-                            callback_kwargs['body'] = request_model.model_validate(
-                                obj=callback_kwargs['body'],
-                            )
+                            with trace_phase('validate'):
+                                callback_kwargs['body'] = \
+                                    request_model.model_validate(
+                                        obj=callback_kwargs['body'])
                     else:
                         callback_kwargs[mq_props[idx]] = value
             return callback_kwargs
@@ -104,23 +247,32 @@ def create_mq_callback(
         @wraps(f)
         def wrapped_classmethod(self, *f_args):
             try:
+                if _drop_expired(*f_args):
+                    return None
                 parsed_request_kwargs = _parse_kwargs(*f_args)
-                res = f(self, **parsed_request_kwargs)
+                res = None
+                with request_deadline(get_deadline(f_args[2])), \
+                        trace_phase('handler'), \
+                        _watch(parsed_request_kwargs):
+                    res = f(self, **parsed_request_kwargs)
 
                 body = parsed_request_kwargs.get('body') or {}
                 if isinstance(body, BaseModel):
                     body = body.model_dump()
 
-                routing_key = body.get('routing_key')
+                channel, _, properties = f_args[:3]
+                routing_key = body.get('routing_key') or \
+                    getattr(properties, 'reply_to', None)
                 message_id = body.get('message_id')
 
                 if routing_key and res and isinstance(res, dict):
                     res.setdefault("context", {}).setdefault("mq", {}).setdefault("message_id", message_id)
-                    self.send_message(
-                        request_data=res,
-                        vhost=res.pop('vhost', self.vhost),
-                        queue=routing_key,
-                    )
+                    with trace_phase('reply_publish'):
+                        _send_reply(self, channel, properties, res,
+                                    routing_key)
+                elif routing_key and inspect.isgenerator(res):
+                    _send_stream_reply(self, channel, properties, res,
+                                       routing_key, message_id)
             except ValidationError as val_err:
                 LOG.error(f'Validation error when parsing request data of {f.__name__} failed due to '
                           f'error={val_err}')
@@ -134,7 +286,13 @@ def create_mq_callback(
         @wraps(f)
         def wrapped(*f_args):
             try:
-                res = f(**_parse_kwargs(*f_args))
+                if _drop_expired(*f_args):
+                    return None
+                kwargs = _parse_kwargs(*f_args)
+                res = None
+                with request_deadline(get_deadline(f_args[2])), \
+                        trace_phase('handler'), _watch(kwargs):
+                    res = f(**kwargs)
             except ValidationError as val_err:
                 LOG.error(f'Validation error when parsing request data of {f.__name__} failed due to '
                           f'error={val_err}')
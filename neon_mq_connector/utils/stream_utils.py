@@ -0,0 +1,273 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import asyncio
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+from ovos_utils.log import LOG
+
+"""
+Helpers for streaming a payload as a sequence of messages. Each message of a
+stream carries the stream id and a sequence number starting at 0 in its
+headers. The stream is terminated by an end marker message carrying the next
+sequence number and the end flag; the end marker carries no chunk data.
+"""
+
+STREAM_ID_HEADER = "x-neon-stream-id"
+STREAM_SEQ_HEADER = "x-neon-stream-seq"
+STREAM_END_HEADER = "x-neon-stream-end"
+
+# Max number of streams produced concurrently by `run_stream_producer`
+MAX_CONCURRENT_STREAMS = 8
+# Max number of streams waiting for a producer thread; more are rejected
+MAX_QUEUED_STREAMS = 64
+
+_END = object()
+_producer_lock = threading.Lock()
+_producer_pool: Optional[ThreadPoolExecutor] = None
+# Streams submitted and not yet completed
+_pending_streams = 0
+
+
+class StreamProducerBusy(RuntimeError):
+    """
+    Raised when too many streams are waiting to be produced
+    """
+
+
+def run_stream_producer(func: Callable[[], None]):
+    """
+    Run a function producing a stream in a shared, bounded thread pool. If
+    `MAX_CONCURRENT_STREAMS` streams are already being produced, the stream
+    is queued, so the caller (i.e. a consumer IO loop) is never blocked.
+    :param func: function to call with no arguments
+    :raises StreamProducerBusy: `MAX_QUEUED_STREAMS` streams are already
+        waiting to be produced
+    """
+    global _producer_pool, _pending_streams
+    with _producer_lock:
+        if _producer_pool is None:
+            _producer_pool = ThreadPoolExecutor(
+                max_workers=MAX_CONCURRENT_STREAMS,
+                thread_name_prefix="mq_stream")
+        if _pending_streams >= MAX_CONCURRENT_STREAMS + MAX_QUEUED_STREAMS:
+            raise StreamProducerBusy(f"{_pending_streams} streams are "
+                                     f"already being produced")
+        _pending_streams += 1
+
+    def _done():
+        global _pending_streams
+        with _producer_lock:
+            _pending_streams -= 1
+
+    def _run():
+        try:
+            func()
+        except Exception as e:
+            LOG.error(f"Stream producer {func} failed: {e}")
+        finally:
+            _done()
+
+    try:
+        _producer_pool.submit(_run)
+    except Exception:
+        _done()
+        raise
+
+
+def make_stream_headers(stream_id: str, seq: int, end: bool = False) -> dict:
+    """
+    Build message headers for a chunk of a stream
+    :param stream_id: unique id of the stream
+    :param seq: sequence number of this chunk (starting at 0)
+    :param end: True if this is the end marker of the stream
+    :returns: dict of headers to include in published message properties
+    """
+    return {STREAM_ID_HEADER: stream_id,
+            STREAM_SEQ_HEADER: seq,
+            STREAM_END_HEADER: end}
+
+
+def get_stream_info(properties) -> Optional[Tuple[str, int, bool]]:
+    """
+    Get stream information from a received message
+    :param properties: `pika.BasicProperties` of the message
+    :returns: tuple of stream id, sequence number and end flag, or None if
+        the message is not part of a stream
+    """
+    headers = getattr(properties, 'headers', None)
+    if not isinstance(headers, dict) or STREAM_ID_HEADER not in headers:
+        return None
+    stream_id = headers[STREAM_ID_HEADER]
+    if isinstance(stream_id, bytes):
+        stream_id = stream_id.decode()
+    return (stream_id, int(headers.get(STREAM_SEQ_HEADER, 0)),
+            bool(headers.get(STREAM_END_HEADER, False)))
+
+
+class StreamReassembler:
+    """
+    Reassembles chunks of a stream in sequence order. Chunks may be added
+    from any thread (i.e. a consumer callback) and are read by iterating this
+    object, either synchronously or asynchronously.
+    """
+
+    def __init__(self, max_buffered: int = 64, timeout: float = 30):
+        """
+        :param max_buffered: max number of chunks held out of order, i.e.
+            received while an earlier chunk is still missing. The stream
+            fails if this is exceeded. Chunks received in order are not
+            limited here; when read from a consumer that acknowledges each
+            chunk as it is read, they are bounded by the consumer prefetch.
+        :param timeout: max seconds to wait for the next chunk
+        """
+        self.max_buffered = max_buffered
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._pending: Dict[int, Tuple[Any, bool, Optional[Callable]]] = {}
+        self._next_seq = 0
+        # First sequence number not yet received without a gap
+        self._frontier = 0
+        self._finished = False
+        self._error: Optional[Exception] = None
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    @property
+    def _num_out_of_order(self) -> int:
+        # Pending chunks are `_next_seq` to `_frontier - 1` plus any received
+        # after a gap
+        return len(self._pending) - (self._frontier - self._next_seq)
+
+    def add_chunk(self, seq: int, data: Any, end: bool = False,
+                  on_consumed: Optional[Callable[[], None]] = None) -> bool:
+        """
+        Add a received chunk to the stream
+        :param seq: sequence number of the chunk
+        :param data: chunk payload. For the end marker, this is ignored unless
+            it is an Exception, which is raised to the reader
+        :param end: True if this is the end marker of the stream
+        :param on_consumed: optional function called once the chunk is read
+            (or discarded), i.e. to acknowledge the message
+        :returns: True if the chunk was buffered, False if it was discarded
+        """
+        with self._cond:
+            if self._finished or self._error or seq < self._next_seq or \
+                    seq in self._pending:
+                discard = True
+            elif seq > self._frontier and \
+                    self._num_out_of_order >= self.max_buffered:
+                self._error = BufferError(f"More than {self.max_buffered} "
+                                          f"chunks buffered waiting for "
+                                          f"chunk {self._frontier}")
+                self._cond.notify_all()
+                discard = True
+            else:
+                self._pending[seq] = (data, end, on_consumed)
+                while self._frontier in self._pending:
+                    self._frontier += 1
+                self._cond.notify_all()
+                discard = False
+        if discard and on_consumed:
+            on_consumed()
+        return not discard
+
+    def close(self, error: Optional[Exception] = None):
+        """
+        Stop the stream, releasing any readers
+        :param error: optional exception raised to readers
+        """
+        with self._cond:
+            if error and not self._finished:
+                self._error = error
+            self._finished = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._cond.notify_all()
+        for _, _, on_consumed in pending:
+            if on_consumed:
+                on_consumed()
+
+    def next_chunk(self) -> Any:
+        """
+        Get the next chunk of the stream in sequence order, waiting up to
+        `timeout` seconds for it to arrive.
+        :raises StopIteration: the stream has ended
+        :raises TimeoutError: the next chunk did not arrive in time
+        """
+        stop_time = time.monotonic() + self.timeout
+        with self._cond:
+            while self._next_seq not in self._pending:
+                if self._error:
+                    raise self._error
+                if self._finished:
+                    raise StopIteration
+                remaining = stop_time - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Timed out waiting for chunk "
+                                       f"{self._next_seq}")
+                self._cond.wait(remaining)
+            data, end, on_consumed = self._pending.pop(self._next_seq)
+            self._next_seq += 1
+            if end:
+                self._finished = True
+        if on_consumed:
+            on_consumed()
+        if end:
+            if isinstance(data, Exception):
+                raise data
+            raise StopIteration
+        return data
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.next_chunk()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        data = await asyncio.get_running_loop().run_in_executor(
+            None, self._next_chunk_or_end)
+        if data is _END:
+            raise StopAsyncIteration
+        return data
+
+    def _next_chunk_or_end(self) -> Any:
+        # StopIteration cannot be raised into a Future
+        try:
+            return self.next_chunk()
+        except StopIteration:
+            return _END
@@ -0,0 +1,184 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import random
+import threading
+import time
+
+from collections import deque
+from typing import Callable, Dict, List, Optional, Set
+from ovos_utils.log import LOG
+
+
+class ConsumerSupervisor:
+    """
+    Restarts consumers as soon as they report that they stopped unexpectedly.
+    Restarts are delayed by an exponential backoff with jitter based on the
+    number of restarts within `flap_window` seconds; a consumer restarted
+    `flap_threshold` times within that window is considered flapping and is
+    restarted after `max_delay`.
+    """
+
+    def __init__(self, restart_func: Callable[[str], bool],
+                 base_delay: float = 0.1, max_delay: float = 30,
+                 flap_window: float = 60, flap_threshold: int = 5,
+                 history_length: int = 20):
+        """
+        :param restart_func: function called with a consumer name to restart
+            it, returning True if the consumer was restarted
+        :param base_delay: max seconds to wait before the first restart
+        :param max_delay: max seconds to wait before any restart
+        :param flap_window: seconds within which restarts are counted
+        :param flap_threshold: number of restarts within `flap_window` after
+            which a consumer is considered flapping
+        :param history_length: number of restarts to keep history for
+        """
+        self.restart_func = restart_func
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.flap_window = flap_window
+        self.flap_threshold = flap_threshold
+        self.history_length = history_length
+        self._lock = threading.Lock()
+        self._history: Dict[str, deque] = dict()
+        self._pending: Dict[str, threading.Timer] = dict()
+        self._unhealthy: Set[str] = set()
+
+    @property
+    def is_healthy(self) -> bool:
+        """
+        True if no supervised consumer is stopped or waiting to restart
+        """
+        return not self._unhealthy
+
+    @property
+    def unhealthy_consumers(self) -> Set[str]:
+        """
+        Names of consumers that are stopped or waiting to restart
+        """
+        return set(self._unhealthy)
+
+    def get_history(self, name: str) -> List[dict]:
+        """
+        Get the restart history of a consumer
+        :param name: name of the consumer
+        :returns: list of dicts with `time`, `error`, `delay` and `restarted`
+            of recent restarts, oldest first
+        """
+        with self._lock:
+            return [dict(entry) for entry in self._history.get(name, ())]
+
+    def is_flapping(self, name: str) -> bool:
+        """
+        Check if a consumer was restarted too often recently
+        :param name: name of the consumer
+        """
+        with self._lock:
+            return self._count_recent(name) >= self.flap_threshold
+
+    def _count_recent(self, name: str) -> int:
+        cutoff = time.time() - self.flap_window
+        return sum(1 for entry in self._history.get(name, ())
+                   if entry['time'] > cutoff)
+
+    def get_delay(self, name: str) -> float:
+        """
+        Get the delay before the next restart of a consumer
+        :param name: name of the consumer
+        :returns: seconds to wait before restarting
+        """
+        with self._lock:
+            recent = self._count_recent(name)
+        if recent >= self.flap_threshold:
+            return self.max_delay
+        return random.uniform(0, min(self.max_delay,
+                                     self.base_delay * 2 ** recent))
+
+    def notify_stopped(self, name: str, error: Optional[Exception] = None):
+        """
+        Report that a consumer stopped unexpectedly and schedule its restart
+        :param name: name of the consumer
+        :param error: exception that stopped the consumer, if any
+        """
+        delay = self.get_delay(name)
+        with self._lock:
+            self._unhealthy.add(name)
+            if name in self._pending:
+                return
+            entry = {"time": time.time(), "error": repr(error),
+                     "delay": delay, "restarted": None}
+            self._history.setdefault(
+                name, deque(maxlen=self.history_length)).append(entry)
+            if self._count_recent(name) >= self.flap_threshold:
+                LOG.error(f"Consumer {name} is flapping; restarting in "
+                          f"{delay}s")
+            else:
+                LOG.info(f"Consumer {name} stopped ({error}); restarting "
+                         f"in {delay:.3f}s")
+            timer = threading.Timer(delay, self._restart, (name, entry))
+            timer.daemon = True
+            self._pending[name] = timer
+        timer.start()
+
+    def _restart(self, name: str, entry: dict):
+        with self._lock:
+            self._pending.pop(name, None)
+        try:
+            restarted = bool(self.restart_func(name))
+        except Exception as e:
+            LOG.error(f"Failed to restart consumer {name}: {e}")
+            restarted = False
+        with self._lock:
+            entry['restarted'] = restarted
+            if restarted:
+                self._unhealthy.discard(name)
+            else:
+                self._unhealthy.add(name)
+
+    def remove(self, name: str):
+        """
+        Stop supervising a consumer, cancelling any pending restart. History
+        is kept.
+        :param name: name of the consumer
+        """
+        with self._lock:
+            timer = self._pending.pop(name, None)
+            self._unhealthy.discard(name)
+        if timer:
+            timer.cancel()
+
+    def stop(self):
+        """
+        Cancel all pending restarts
+        """
+        with self._lock:
+            timers = list(self._pending.values())
+            self._pending.clear()
+            self._unhealthy.clear()
+        for timer in timers:
+            timer.cancel()
@@ -0,0 +1,211 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import socket
+import time
+import weakref
+
+from threading import Lock
+from typing import Any, Callable, Dict, Optional
+from ovos_utils.log import LOG
+
+from neon_mq_connector.utils.thread_utils import JitteredRepeatingTimer
+
+"""
+Helpers for sending `MQConnector.sync` heartbeats without opening a new
+connection for each of them.
+"""
+
+
+class SharedPublisher:
+    """
+    Keeps one connection open for publishing, shared by every caller with the
+    same key (see `get_shared_publisher`). The connection is re-opened if it
+    was closed or a publish fails on it.
+    """
+
+    def __init__(self, create_connection: Callable[[], Any]):
+        """
+        :param create_connection: function returning a new
+            pika.BlockingConnection
+        """
+        self.create_connection = create_connection
+        self._connection = None
+        # BlockingConnection is not thread-safe
+        self._lock = Lock()
+
+    def _get_connection(self):
+        if self._connection is None or not self._connection.is_open:
+            self._connection = self.create_connection()
+        else:
+            # Service heartbeats and other frames received since last use
+            self._connection.process_data_events(0)
+        return self._connection
+
+    def publish(self, publish_func: Callable[[Any], Any]) -> Any:
+        """
+        Publish with the shared connection, re-connecting once on failure
+        :param publish_func: function publishing with the connection passed
+        :returns: value returned by `publish_func`
+        """
+        with self._lock:
+            try:
+                return publish_func(self._get_connection())
+            except Exception as e:
+                LOG.warning(f"Publish failed, re-connecting: {e}")
+                self._close()
+                return publish_func(self._get_connection())
+
+    def _close(self):
+        connection, self._connection = self._connection, None
+        try:
+            if connection and connection.is_open:
+                connection.close()
+        except Exception as e:
+            LOG.debug(f"Failed to close connection: {e}")
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+_publishers: Dict[tuple, SharedPublisher] = dict()
+_publishers_lock = Lock()
+
+
+def get_shared_publisher(key: tuple, create_connection: Callable[[], Any]
+                         ) -> SharedPublisher:
+    """
+    Get the publisher shared by all callers in this process with `key`
+    :param key: hashable identifying the broker, vhost and credentials
+    :param create_connection: function returning a new connection, used if
+        no publisher exists for `key`
+    :returns: SharedPublisher for `key`
+    """
+    with _publishers_lock:
+        if key not in _publishers:
+            _publishers[key] = SharedPublisher(create_connection)
+        return _publishers[key]
+
+
+class SyncAggregator:
+    """
+    Combines the sync heartbeats of all connectors in a process into one
+    message per period, including a breakdown of the services reporting.
+    """
+
+    def __init__(self, period: float, exchange: str = ''):
+        """
+        :param period: seconds between aggregated messages
+        :param exchange: exchange to publish aggregated messages to
+        """
+        self.period = period
+        self.exchange = exchange
+        self._lock = Lock()
+        self._reports: Dict[str, Dict[str, dict]] = dict()
+        self._connectors = weakref.WeakSet()
+        self._timer: Optional[JitteredRepeatingTimer] = None
+
+    def report(self, connector, request_data: dict):
+        """
+        Add a heartbeat to the next aggregated message
+        :param connector: MQConnector the heartbeat is from
+        :param request_data: heartbeat data, including `service_id`
+        """
+        with self._lock:
+            self._connectors.add(connector)
+            services = self._reports.setdefault(connector.service_name, {})
+            services[request_data.get('service_id') or
+                     connector.service_id] = dict(request_data)
+            if self._timer is None:
+                self._timer = JitteredRepeatingTimer(self.period, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def remove(self, connector):
+        """
+        Stop publishing aggregated messages with `connector`
+        """
+        with self._lock:
+            self._connectors.discard(connector)
+
+    def get_message(self) -> Optional[dict]:
+        """
+        Get the aggregated message for heartbeats reported since the last
+        message, clearing them
+        :returns: dict message, or None if there were no heartbeats
+        """
+        with self._lock:
+            reports, self._reports = self._reports, dict()
+        if not reports:
+            return None
+        return {'host': socket.gethostname(),
+                'pid': os.getpid(),
+                'time': int(time.time()),
+                'services': {name: {'count': len(instances),
+                                    'instances': instances}
+                             for name, instances in reports.items()}}
+
+    def flush(self):
+        """
+        Publish the aggregated message with any connector that reported
+        """
+        message = self.get_message()
+        connectors = list(self._connectors)
+        if not message or not connectors:
+            return
+        try:
+            connectors[0].publish_sync(message, exchange=self.exchange)
+        except Exception as e:
+            LOG.error(f"Failed to publish aggregated sync: {e}")
+
+    def stop(self):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+
+
+_aggregators: Dict[tuple, SyncAggregator] = dict()
+_aggregators_lock = Lock()
+
+
+def get_sync_aggregator(key: tuple, period: float) -> SyncAggregator:
+    """
+    Get the aggregator shared by all connectors in this process with `key`
+    :param key: hashable identifying the broker and vhost
+    :param period: seconds between aggregated messages, if a new aggregator
+        is created
+    :returns: SyncAggregator for `key`
+    """
+    with _aggregators_lock:
+        if key not in _aggregators:
+            _aggregators[key] = SyncAggregator(period)
+        return _aggregators[key]
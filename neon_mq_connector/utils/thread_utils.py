@@ -26,6 +26,8 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import random
+
 from threading import Timer
 
 
@@ -35,3 +37,23 @@ class RepeatingTimer(Timer):
         """thread run function"""
         while not self.finished.wait(self.interval):
             self.function(*self.args, **self.kwargs)
+
+
+class JitteredRepeatingTimer(RepeatingTimer):
+    """
+    RepeatingTimer that waits a random part of the first interval and varies
+    each following interval by up to `jitter` times `interval`, so timers
+    started together do not fire in lockstep
+    """
+    def __init__(self, interval: float, function, args=None, kwargs=None,
+                 jitter: float = 0.1):
+        super().__init__(interval, function, args, kwargs)
+        self.jitter = jitter
+
+    def run(self):
+        """thread run function"""
+        delay = random.uniform(0, self.interval)
+        while not self.finished.wait(delay):
+            self.function(*self.args, **self.kwargs)
+            delay = self.interval * random.uniform(1 - self.jitter,
+                                                   1 + self.jitter)
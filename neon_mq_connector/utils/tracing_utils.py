@@ -0,0 +1,377 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import re
+import time
+
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from ovos_utils.log import LOG
+
+"""
+Tracing hooks for messages published and consumed by this package. Trace
+context is propagated between services with the W3C `traceparent` message
+header. Tracing is disabled until a tracer is set with `set_tracer` or
+`enable_opentelemetry`; while disabled, hooks return without creating spans.
+"""
+
+TRACEPARENT_HEADER = 'traceparent'
+# Wall-clock time a message was published at, in milliseconds since epoch
+PUBLISH_TIME_HEADER = 'x-publish-time'
+
+_TRACEPARENT_RE = re.compile(
+    r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+
+class SpanContext(NamedTuple):
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+    def to_traceparent(self) -> str:
+        """
+        Get this context as a W3C traceparent header value
+        """
+        return f"00-{self.trace_id}-{self.span_id}-" \
+               f"{'01' if self.sampled else '00'}"
+
+    @classmethod
+    def create(cls, trace_id: Optional[str] = None) -> 'SpanContext':
+        """
+        Create a new span context in the trace `trace_id`, or in a new trace
+        """
+        return cls(trace_id or os.urandom(16).hex(), os.urandom(8).hex())
+
+
+def parse_traceparent(value) -> Optional[SpanContext]:
+    """
+    Parse a W3C traceparent header value
+    :param value: header value
+    :returns: SpanContext, or None if `value` is not a valid traceparent
+    """
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    if not isinstance(value, str):
+        return None
+    match = _TRACEPARENT_RE.match(value.strip().lower())
+    if not match:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == 'ff' or trace_id == '0' * 32 or span_id == '0' * 16:
+        return None
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1))
+
+
+class Span:
+    """
+    A timed operation within a trace
+    """
+
+    def __init__(self, tracer: 'Tracer', name: str, context: SpanContext,
+                 parent: Optional[SpanContext] = None,
+                 kind: str = 'internal', attributes: Optional[dict] = None,
+                 start_time: Optional[float] = None):
+        """
+        :param tracer: Tracer the span is reported to when ended
+        :param name: name of the operation
+        :param context: context identifying this span
+        :param parent: context of the parent span, if any
+        :param kind: one of `internal`, `producer` or `consumer`
+        :param attributes: initial attributes of the span
+        :param start_time: wall-clock start time (defaults to now)
+        """
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent = parent
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_time = start_time if start_time is not None else \
+            time.time()
+        self.end_time: Optional[float] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        """
+        Seconds between the start and end of this span, if it ended
+        """
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self, end_time: Optional[float] = None):
+        """
+        End this span and report it to its tracer
+        """
+        if self.end_time is not None:
+            return
+        self.end_time = end_time if end_time is not None else time.time()
+        try:
+            self.tracer.on_end(self)
+        except Exception as e:
+            LOG.error(f"Failed to report span {self.name}: {e}")
+
+
+class Tracer:
+    """
+    Creates spans. Extend this class and override `on_end` to export ended
+    spans, or `start_span` to create them with another tracing library.
+    """
+
+    def start_span(self, name: str, parent: Optional[SpanContext] = None,
+                   kind: str = 'internal', attributes: Optional[dict] = None,
+                   start_time: Optional[float] = None) -> Span:
+        context = SpanContext.create(parent.trace_id if parent else None)
+        if parent:
+            context = context._replace(sampled=parent.sampled)
+        return Span(self, name, context, parent, kind, attributes,
+                    start_time)
+
+    def on_end(self, span: Span):
+        """
+        Called when `span` ends
+        """
+
+
+class RecordingTracer(Tracer):
+    """
+    Keeps the most recent ended spans in memory
+    """
+
+    def __init__(self, max_spans: int = 1000):
+        self.spans = deque(maxlen=max_spans)
+
+    def on_end(self, span: Span):
+        self.spans.append(span)
+
+    def get_spans(self, trace_id: Optional[str] = None) -> List[Span]:
+        """
+        Get recorded spans, optionally only those of trace `trace_id`
+        """
+        return [span for span in list(self.spans)
+                if trace_id is None or span.context.trace_id == trace_id]
+
+
+class OpenTelemetryTracer(Tracer):
+    """
+    Creates spans with the OpenTelemetry API, so they are exported by the
+    configured OpenTelemetry SDK
+    """
+
+    def __init__(self, name: str = 'neon_mq_connector'):
+        """
+        :param name: instrumentation name
+        :raises ImportError: if `opentelemetry-api` is not installed
+        """
+        from opentelemetry import trace
+        self._trace = trace
+        self._tracer = trace.get_tracer(name)
+        self._kinds = {'internal': trace.SpanKind.INTERNAL,
+                       'producer': trace.SpanKind.PRODUCER,
+                       'consumer': trace.SpanKind.CONSUMER}
+
+    def start_span(self, name: str, parent: Optional[SpanContext] = None,
+                   kind: str = 'internal', attributes: Optional[dict] = None,
+                   start_time: Optional[float] = None) -> Span:
+        trace = self._trace
+        otel_context = None
+        if parent:
+            otel_context = trace.set_span_in_context(trace.NonRecordingSpan(
+                trace.SpanContext(
+                    int(parent.trace_id, 16), int(parent.span_id, 16),
+                    is_remote=True, trace_flags=trace.TraceFlags(
+                        int(parent.sampled)))))
+        otel_span = self._tracer.start_span(
+            name, context=otel_context, kind=self._kinds[kind],
+            start_time=int(start_time * 1e9) if start_time else None)
+        span_context = otel_span.get_span_context()
+        span = Span(self, name, SpanContext(
+            f"{span_context.trace_id:032x}", f"{span_context.span_id:016x}",
+            bool(span_context.trace_flags & 1)),
+            parent, kind, attributes, start_time)
+        span.otel_span = otel_span
+        return span
+
+    def on_end(self, span: Span):
+        for key, value in span.attributes.items():
+            span.otel_span.set_attribute(key, value)
+        span.otel_span.end(end_time=int(span.end_time * 1e9))
+
+
+_tracer: Optional[Tracer] = None
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span',
+                                                       default=None)
+
+
+def set_tracer(tracer: Optional[Tracer]):
+    """
+    Set the tracer used for messages in this process
+    :param tracer: Tracer to use, or None to disable tracing
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def enable_opentelemetry(name: str = 'neon_mq_connector') -> bool:
+    """
+    Trace messages with OpenTelemetry if it is installed
+    :param name: instrumentation name
+    :returns: True if OpenTelemetry tracing was enabled
+    """
+    try:
+        set_tracer(OpenTelemetryTracer(name))
+        return True
+    except ImportError:
+        LOG.warning("opentelemetry-api is not installed; tracing disabled")
+        return False
+
+
+def get_current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+class _NoSpan:
+    """
+    Context manager used when tracing is disabled
+    """
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *_):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _ActiveSpan:
+    """
+    Context manager that makes a span current until it exits, then ends it
+    """
+
+    def __init__(self, span: Span):
+        self.span = span
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, _tb):
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.span.set_attribute('error', repr(exc))
+        self.span.end()
+        return False
+
+
+def trace_phase(name: str):
+    """
+    Time a phase of handling the current message as a child span
+    :param name: name of the phase, i.e. `decode` or `handler`
+    :returns: context manager yielding the Span, or None if not tracing
+    """
+    parent = _current_span.get()
+    if _tracer is None or parent is None:
+        return _NO_SPAN
+    return _ActiveSpan(_tracer.start_span(name, parent.context))
+
+
+def start_publish_span(destination: str, headers: Optional[dict] = None
+                       ) -> Tuple[Optional[dict], Optional[Span]]:
+    """
+    Start a span for publishing a message, adding its trace context and the
+    publish time to the message headers
+    :param destination: queue or exchange the message is published to
+    :param headers: headers of the message, if any
+    :returns: headers to publish with and the started Span (None if not
+        tracing). The caller must end the span once the message is published
+    """
+    if _tracer is None:
+        return headers, None
+    parent = _current_span.get()
+    span = _tracer.start_span(f"publish {destination}",
+                              parent.context if parent else None,
+                              'producer', {'destination': destination})
+    headers = {**(headers or {}),
+               TRACEPARENT_HEADER: span.context.to_traceparent(),
+               PUBLISH_TIME_HEADER: int(span.start_time * 1000)}
+    return headers, span
+
+
+def extract_context(properties) -> Tuple[Optional[SpanContext],
+                                         Optional[float]]:
+    """
+    Get the trace context and publish time of a received message
+    :param properties: pika.BasicProperties of the message
+    :returns: SpanContext (None if not traced) and wall-clock publish time
+        (None if unknown)
+    """
+    headers: Dict = getattr(properties, 'headers', None) or {}
+    publish_time = headers.get(PUBLISH_TIME_HEADER)
+    try:
+        publish_time = float(publish_time) / 1000 \
+            if publish_time is not None else None
+    except (TypeError, ValueError):
+        publish_time = None
+    return parse_traceparent(headers.get(TRACEPARENT_HEADER)), publish_time
+
+
+def consume_span(source: str, properties):
+    """
+    Trace handling a received message. The span continues the trace of the
+    publisher and is current while handling the message, so replies and
+    phases are part of it. Time spent queued is recorded as a `queue_wait`
+    child span.
+    :param source: queue the message was received from
+    :param properties: pika.BasicProperties of the message
+    :returns: context manager yielding the Span, or None if not tracing
+    """
+    if _tracer is None:
+        return _NO_SPAN
+    parent, publish_time = extract_context(properties)
+    span = _tracer.start_span(f"consume {source}", parent, 'consumer',
+                              {'source': source})
+    if publish_time is not None:
+        # Clocks of different hosts may differ, so negative waits are zeroed
+        queue_wait = max(0.0, span.start_time - publish_time)
+        span.set_attribute('queue_wait', queue_wait)
+        _tracer.start_span('queue_wait', span.context,
+                           start_time=span.start_time - queue_wait)\
+            .end(span.start_time)
+    return _ActiveSpan(span)
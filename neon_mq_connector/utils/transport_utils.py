@@ -0,0 +1,153 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from typing import Callable, Iterable, Optional, Sequence, Union
+
+import pika
+
+from pika.adapters.select_connection import IOLoop
+
+from neon_mq_connector.utils.cluster_utils import Endpoint, \
+    wait_for_cluster_startup
+
+"""
+Transports create the broker connections used by `MQConnector` and the
+consumer classes. `PikaTransport` connects to RabbitMQ and is used by
+default; another transport, i.e. the in-process broker in
+`memory_transport_utils`, may be set for the whole process with
+`set_transport` or for a single connector with `MQConnector.transport`.
+"""
+
+ConnectionParams = Union[pika.ConnectionParameters,
+                         Sequence[pika.ConnectionParameters]]
+
+
+class Transport:
+    """
+    Creates connections to an MQ broker. Connections must provide the
+    interface of `pika.BlockingConnection` and `pika.SelectConnection`
+    used by this package.
+    """
+    name = ''
+
+    def blocking_connection(self, parameters: ConnectionParams):
+        """
+        Open a connection like `pika.BlockingConnection`
+        :param parameters: connection parameters, or a sequence of them to
+            try in order
+        """
+        raise NotImplementedError()
+
+    def select_connection(self, parameters: pika.ConnectionParameters,
+                          on_open_callback: Optional[Callable] = None,
+                          on_open_error_callback: Optional[Callable] = None,
+                          on_close_callback: Optional[Callable] = None,
+                          custom_ioloop: Optional[IOLoop] = None):
+        """
+        Start opening a connection like `pika.SelectConnection`
+        :param parameters: connection parameters
+        :param on_open_callback: called with the connection once it is open
+        :param on_open_error_callback: called with the connection and an
+            exception if it could not be opened
+        :param on_close_callback: called with the connection and an
+            exception when the connection is closed
+        :param custom_ioloop: IO loop to run the connection on
+        """
+        raise NotImplementedError()
+
+    def wait_for_startup(self, endpoints: Iterable[Endpoint],
+                         timeout: float,
+                         get_params: Optional[Callable] = None
+                         ) -> Optional[Endpoint]:
+        """
+        Wait up to `timeout` seconds for any endpoint to accept connections
+        :param endpoints: endpoints in the order they should be checked
+        :param timeout: max seconds to wait
+        :param get_params: optional function returning the connection
+            parameters to check an endpoint with
+        :returns: first endpoint found to be ready, else None
+        """
+        raise NotImplementedError()
+
+
+class PikaTransport(Transport):
+    """
+    Connects to RabbitMQ with pika
+    """
+    name = 'pika'
+
+    def blocking_connection(self, parameters: ConnectionParams
+                            ) -> pika.BlockingConnection:
+        return pika.BlockingConnection(parameters)
+
+    def select_connection(self, parameters: pika.ConnectionParameters,
+                          on_open_callback: Optional[Callable] = None,
+                          on_open_error_callback: Optional[Callable] = None,
+                          on_close_callback: Optional[Callable] = None,
+                          custom_ioloop: Optional[IOLoop] = None
+                          ) -> pika.SelectConnection:
+        return pika.SelectConnection(
+            parameters=parameters, on_open_callback=on_open_callback,
+            on_open_error_callback=on_open_error_callback,
+            on_close_callback=on_close_callback, custom_ioloop=custom_ioloop)
+
+    def wait_for_startup(self, endpoints: Iterable[Endpoint],
+                         timeout: float,
+                         get_params: Optional[Callable] = None
+                         ) -> Optional[Endpoint]:
+        return wait_for_cluster_startup(endpoints, timeout, get_params)
+
+
+_transport: Transport = PikaTransport()
+
+
+def get_transport() -> Transport:
+    """
+    Get the transport used by connectors and consumers without their own
+    """
+    return _transport
+
+
+def set_transport(transport: Optional[Transport]) -> Transport:
+    """
+    Set the transport used by connectors and consumers without their own
+    :param transport: transport to use, or None to restore `PikaTransport`
+    :returns: previously set transport
+    """
+    global _transport
+    previous = _transport
+    _transport = transport or PikaTransport()
+    return previous
+
+
+def is_blocking_connection(connection) -> bool:
+    """
+    Check if `connection` is a blocking connection of any transport
+    """
+    return isinstance(connection, pika.BlockingConnection) or \
+        getattr(connection, 'is_blocking', False) is True
@@ -0,0 +1,337 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2025 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import ctypes
+import os
+import sys
+import threading
+import time
+import traceback
+
+from contextlib import nullcontext
+from typing import Dict, Optional, Tuple
+from ovos_utils.log import LOG
+
+from neon_mq_connector.utils.metrics_utils import HANDLER_TIMEOUTS, \
+    SLOW_CALLBACKS
+
+"""
+Watchdog over consumer callbacks. While enabled, a monitor thread checks the
+callbacks running in consumer threads; a callback running longer than the
+slow threshold has its thread's stack captured and logged (rate-limited per
+queue) and is counted per queue. An optional hard timeout interrupts the
+callback by raising `HandlerTimeout` in its thread, after which the message
+is nacked if the consumer does not auto-ack. Interrupts are delivered
+between Python bytecodes, so a callback blocked in a single C call (i.e. a
+socket read) is only interrupted when that call returns.
+
+The watchdog is disabled unless enabled with `enable_watchdog`, the
+`slow_callbacks` section of the MQ config, or `NEON_MQ_SLOW_CALLBACK_SECONDS`.
+"""
+
+
+# Max loop iterations to wait for a pending interrupt to be delivered; it is
+# only not delivered if the callback caught it
+_ABSORB_ITERATIONS = 1000
+
+
+class HandlerTimeout(BaseException):
+    """
+    Raised in a callback thread when the callback exceeds its hard timeout.
+    Derived from `BaseException` so handlers catching `Exception` do not
+    swallow it.
+    """
+
+
+class _Call:
+    __slots__ = ('ident', 'queue', 'handler', 'message_id', 'start',
+                 'threshold', 'hard_timeout', 'reported', 'interrupted',
+                 'timed_out')
+
+    def __init__(self, ident: int, queue: str, handler: Optional[str],
+                 message_id: Optional[str], threshold: Optional[float],
+                 hard_timeout: Optional[float]):
+        self.ident = ident
+        self.queue = queue
+        self.handler = handler
+        self.message_id = message_id
+        self.start = time.monotonic()
+        self.threshold = threshold
+        self.hard_timeout = hard_timeout
+        self.reported = False
+        self.interrupted = False
+        self.timed_out = False
+
+
+class _Watch:
+    """
+    Context of a watched callback. Nested watches on the same thread only
+    annotate the outermost one.
+    """
+
+    def __init__(self, watchdog: 'CallbackWatchdog', queue: str,
+                 handler: Optional[str], message_id: Optional[str]):
+        self._watchdog = watchdog
+        self._args = (queue, handler, message_id)
+        self.call: Optional[_Call] = None
+
+    @property
+    def timed_out(self) -> bool:
+        return bool(self.call and self.call.timed_out)
+
+    def __enter__(self) -> '_Watch':
+        self.call = self._watchdog._start(*self._args)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        timed_out = exc_type is HandlerTimeout
+        try:
+            if not self.call:
+                return False
+            if self._watchdog._finish(self.call) and not timed_out:
+                # The interrupt was raised after the callback returned and
+                # is still pending in this thread. It is absorbed here
+                # rather than cancelled, since clearing it with
+                # `PyThreadState_SetAsyncExc` leaves the eval breaker of
+                # CPython < 3.12 set for every thread. It is delivered at
+                # the next check of the eval breaker, i.e. a loop iteration.
+                for _ in range(_ABSORB_ITERATIONS):
+                    pass
+        except HandlerTimeout:
+            # Delivered before the call was finished; a call is only
+            # interrupted once
+            if self.call:
+                self._watchdog._finish(self.call)
+        if self.call:
+            self.call.timed_out = timed_out
+        return timed_out
+
+
+def _raise_in_thread(ident: int, exc_type: type) -> int:
+    return ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(ident), ctypes.py_object(exc_type))
+
+
+class CallbackWatchdog:
+    """
+    Monitors callbacks running in consumer threads for slow calls and hard
+    timeouts
+    """
+
+    def __init__(self):
+        self.threshold: Optional[float] = None
+        self.hard_timeout: Optional[float] = None
+        self.log_interval = 60.0
+        self.requeue = False
+        self._queue_limits: Dict[str, Tuple[Optional[float],
+                                            Optional[float]]] = dict()
+        self._lock = threading.Lock()
+        self._calls: Dict[int, _Call] = dict()
+        self._slow_counts: Dict[str, int] = dict()
+        self._last_logged: Dict[str, float] = dict()
+        self._suppressed: Dict[str, int] = dict()
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold is not None or self.hard_timeout is not None \
+            or bool(self._queue_limits)
+
+    def configure(self, threshold: Optional[float] = None,
+                  hard_timeout: Optional[float] = None,
+                  log_interval: float = 60.0, requeue: bool = False):
+        """
+        Set default limits of callbacks
+        :param threshold: seconds after which a callback is reported as slow
+            (None to not report)
+        :param hard_timeout: seconds after which a callback is interrupted
+            (None to not interrupt)
+        :param log_interval: min seconds between stack logs per queue
+        :param requeue: if True, nacked messages of interrupted callbacks
+            are requeued instead of dropped or dead-lettered
+        """
+        self.threshold = threshold
+        self.hard_timeout = hard_timeout
+        self.log_interval = log_interval
+        self.requeue = requeue
+        self._wakeup.set()
+
+    def set_queue_limits(self, queue: str, threshold: Optional[float] = None,
+                         hard_timeout: Optional[float] = None):
+        """
+        Override the limits of callbacks consuming `queue`
+        :param queue: name of the queue
+        :param threshold: seconds after which a callback is reported as slow
+        :param hard_timeout: seconds after which a callback is interrupted
+        """
+        if threshold is None and hard_timeout is None:
+            self._queue_limits.pop(queue, None)
+        else:
+            self._queue_limits[queue] = (threshold, hard_timeout)
+        self._wakeup.set()
+
+    def get_slow_counts(self) -> Dict[str, int]:
+        """
+        Get the number of slow callbacks reported per queue
+        """
+        with self._lock:
+            return dict(self._slow_counts)
+
+    def reset(self):
+        """
+        Disable the watchdog and clear counts
+        """
+        self.configure()
+        self._queue_limits.clear()
+        with self._lock:
+            self._slow_counts.clear()
+            self._last_logged.clear()
+            self._suppressed.clear()
+
+    def watch(self, queue: str, handler: Optional[str] = None,
+              message_id: Optional[str] = None):
+        """
+        Watch a callback while in the returned context. If the callback is
+        interrupted, `HandlerTimeout` is suppressed and the context's
+        `timed_out` is True.
+        :param queue: name of the queue the message was consumed from
+        :param handler: name of the callback
+        :param message_id: id of the message being handled
+        """
+        if not self.enabled:
+            return nullcontext()
+        return _Watch(self, queue, handler, message_id)
+
+    def _start(self, queue: str, handler: Optional[str],
+               message_id: Optional[str]) -> Optional[_Call]:
+        ident = threading.get_ident()
+        with self._lock:
+            current = self._calls.get(ident)
+            if current:
+                current.handler = current.handler or handler
+                current.message_id = current.message_id or message_id
+                return None
+            threshold, hard_timeout = self._queue_limits.get(
+                queue, (self.threshold, self.hard_timeout))
+            call = self._calls[ident] = _Call(ident, queue, handler,
+                                              message_id, threshold,
+                                              hard_timeout)
+            if not self._thread:
+                self._thread = threading.Thread(target=self._monitor,
+                                                name="neon_callback_watchdog",
+                                                daemon=True)
+                self._thread.start()
+        return call
+
+    def _finish(self, call: _Call) -> bool:
+        """
+        Stop watching a call
+        :param call: call that returned
+        :returns: True if the call was interrupted; the monitor does not
+            interrupt it after this returns
+        """
+        with self._lock:
+            self._calls.pop(call.ident, None)
+            return call.interrupted
+
+    def _get_interval(self) -> float:
+        limits = [self.threshold, self.hard_timeout] + \
+            [limit for limits in self._queue_limits.values()
+             for limit in limits]
+        limits = [limit for limit in limits if limit is not None]
+        return min(1.0, max(0.01, min(limits) / 4)) if limits else 1.0
+
+    def _monitor(self):
+        while True:
+            self._wakeup.wait(self._get_interval())
+            self._wakeup.clear()
+            now = time.monotonic()
+            with self._lock:
+                calls = list(self._calls.values())
+            for call in calls:
+                elapsed = now - call.start
+                if call.threshold is not None and not call.reported and \
+                        elapsed > call.threshold:
+                    call.reported = True
+                    self._report_slow(call, elapsed)
+                if call.hard_timeout is not None and not call.interrupted \
+                        and elapsed > call.hard_timeout:
+                    with self._lock:
+                        if self._calls.get(call.ident) is call:
+                            call.interrupted = True
+                            _raise_in_thread(call.ident, HandlerTimeout)
+                    if call.interrupted:
+                        HANDLER_TIMEOUTS.inc(labels=(call.queue,))
+                        LOG.error(f"Interrupting callback on {call.queue} "
+                                  f"({call.handler}) message_id="
+                                  f"{call.message_id} after {elapsed:.2f}s")
+
+    def _report_slow(self, call: _Call, elapsed: float):
+        frame = sys._current_frames().get(call.ident)
+        stack = ''.join(traceback.format_stack(frame)) if frame else ''
+        SLOW_CALLBACKS.inc(labels=(call.queue,))
+        with self._lock:
+            self._slow_counts[call.queue] = \
+                self._slow_counts.get(call.queue, 0) + 1
+            last = self._last_logged.get(call.queue)
+            if last is not None and time.monotonic() - last < \
+                    self.log_interval:
+                self._suppressed[call.queue] = \
+                    self._suppressed.get(call.queue, 0) + 1
+                return
+            self._last_logged[call.queue] = time.monotonic()
+            suppressed = self._suppressed.pop(call.queue, 0)
+        LOG.warning(f"Slow callback on {call.queue} ({call.handler}) "
+                    f"message_id={call.message_id}: running for "
+                    f"{elapsed:.2f}s"
+                    f"{f' ({suppressed} not logged)' if suppressed else ''}"
+                    f"\n{stack}")
+
+
+watchdog = CallbackWatchdog()
+
+
+def enable_watchdog(threshold: Optional[float] = None,
+                    hard_timeout: Optional[float] = None,
+                    log_interval: float = 60.0, requeue: bool = False):
+    """
+    Enable the callback watchdog; see `CallbackWatchdog.configure`
+    """
+    watchdog.configure(threshold, hard_timeout, log_interval, requeue)
+
+
+def disable_watchdog():
+    """
+    Disable the callback watchdog
+    """
+    watchdog.configure()
+
+
+if os.environ.get('NEON_MQ_SLOW_CALLBACK_SECONDS'):
+    enable_watchdog(float(os.environ['NEON_MQ_SLOW_CALLBACK_SECONDS']))
@@ -74,6 +74,13 @@ setup(
     packages=find_packages(),
     install_requires=get_requirements("requirements.txt"),
     zip_safe=True,
+    entry_points={
+        'console_scripts': [
+            'neon-mq-load=neon_mq_connector.benchmarks.load:main',
+            'neon-mq-soak=neon_mq_connector.benchmarks.soak:main',
+            'neon-mq-recovery=neon_mq_connector.benchmarks.recovery:main'
+        ]
+    },
     classifiers=[
         'Intended Audience :: Developers',
         'Programming Language :: Python :: 3.8',
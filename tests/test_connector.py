@@ -486,4 +486,264 @@ class TestMQConnectorInit(unittest.TestCase):
         async_thread.join(3)
         on_error.assert_not_called()
 
+
+class TestConsumerSupervision(unittest.TestCase):
+    def test_consumer_exit_restarts(self):
+        connector = MQConnector({"users": {"test": {"user": "test_user",
+                                                    "password": "test"}}},
+                                "test")
+        connector.register_consumer("test_consumer", "/test", "test_queue",
+                                    Mock())
+        consumer = connector.consumers["test_consumer"]
+        self.assertEqual(consumer.on_exit, connector._on_consumer_exit)
+        restarted = threading.Event()
+        connector.restart_consumer = Mock(side_effect=lambda _: restarted.set())
+
+        # Consumers that were not started are not restarted
+        connector._consumers_started = True
+        connector._on_consumer_exit(consumer, Exception("test"))
+        self.assertTrue(connector.check_health())
+        connector.restart_consumer.assert_not_called()
+
+        connector.consumer_properties["test_consumer"]["started"] = True
+        connector._on_consumer_exit(consumer, Exception("test"))
+        self.assertFalse(connector.check_health())
+        self.assertTrue(restarted.wait(1))
+        connector.restart_consumer.assert_called_once_with("test_consumer")
+        history = connector.supervisor.get_history("test_consumer")
+        self.assertEqual(len(history), 1)
+        self.assertIn("test", history[0]["error"])
+        # Allow the supervisor to record the restart
+        time.sleep(0.1)
+        self.assertTrue(history[0]["delay"] <= 0.1)
+        self.assertTrue(connector.check_health())
+
+        # Exits of replaced consumers are ignored
+        connector._on_consumer_exit(Mock(name="test_consumer"), None)
+        self.assertTrue(connector.check_health())
+        connector.stop()
+
+
+class TestSyncHeartbeats(unittest.TestCase):
+    def test_sync_reuses_connection(self):
+        from unittest.mock import patch
+        config = {"server": "sync-test", "users": {
+            "test": {"user": "test_user", "password": "test"}}}
+        connectors = [MQConnector(config, "test") for _ in range(2)]
+        with patch("pika.BlockingConnection") as connection_cls, \
+                patch.object(MQConnector, "publish_message") as publish:
+            for _ in range(3):
+                for connector in connectors:
+                    connector.sync()
+        connection_cls.assert_called_once()
+        self.assertEqual(publish.call_count, 6)
+        self.assertIs(publish.call_args[0][0], connection_cls.return_value)
+
+    def test_sync_aggregate(self):
+        config = {"server": "sync-aggregate-test", "users": {
+            "test": {"user": "test_user", "password": "test"}}}
+        connector = MQConnector(config, "test")
+        connector.sync = Mock()
+        connector._on_sync_timer()
+        connector.sync.assert_called_once()
+
+        connector.sync_aggregate = True
+        connector._on_sync_timer()
+        connector.sync.assert_called_once()
+        aggregator = connector._sync_aggregator
+        try:
+            message = aggregator.get_message()
+            self.assertEqual(list(message["services"]["test"]["instances"]),
+                             [connector.service_id])
+        finally:
+            aggregator.stop()
+
+
+class TestMemoryTransportConnector(unittest.TestCase):
+    def test_send_and_consume(self):
+        from neon_mq_connector.utils.memory_transport_utils import \
+            MemoryTransport
+        from neon_mq_connector.utils.network_utils import b64_to_dict
+        transport = MemoryTransport()
+        connector = MQConnector({"server": "memory", "users": {
+            "test": {"user": "test_user", "password": "test"}}}, "test")
+        connector.transport = transport
+        self.assertIs(connector.transport, transport)
+        received = []
+        event = threading.Event()
+
+        def _on_message(channel, method, properties, body):
+            received.append(b64_to_dict(body))
+            if len(received) == 2:
+                event.set()
+
+        connector.register_consumer("memory_consumer", "/test", "memory_q",
+                                    _on_message)
+        connector.run(run_sync=False)
+        try:
+            self.assertIs(connector.consumers["memory_consumer"].transport,
+                          transport)
+            message_id = connector.send_message({"data": 1}, "/test",
+                                                queue="memory_q")
+            with connector.create_mq_connection("/test") as connection:
+                connector.emit_mq_message(connection, {"data": 2},
+                                          queue="memory_q")
+            self.assertTrue(event.wait(5))
+            self.assertEqual(received[0]["message_id"], message_id)
+            self.assertEqual([msg["data"] for msg in received], [1, 2])
+        finally:
+            connector.stop()
+        self.assertEqual(transport.broker.connections, [])
+
+    def test_no_restart_after_stop(self):
+        from neon_mq_connector.utils.memory_transport_utils import \
+            MemoryTransport
+        transport = MemoryTransport()
+        connector = MQConnector({"server": "memory", "users": {
+            "test": {"user": "test_user", "password": "test"}}}, "test")
+        connector.transport = transport
+        connector.register_consumer("memory_consumer", "/test", "memory_q",
+                                    Mock())
+        connector.run(run_sync=False)
+        connector.stop()
+        # A restart scheduled by the supervisor before `stop` is not run
+        self.assertFalse(connector._restart_stopped_consumer(
+            "memory_consumer"))
+        self.assertFalse(connector.consumers["memory_consumer"].is_alive())
+        self.assertEqual(transport.broker.connections, [])
+
+    def test_consumer_stats(self):
+        from neon_mq_connector.utils.accounting_utils import accounting
+        from neon_mq_connector.utils.control_utils import ControlHandler
+        from neon_mq_connector.utils.memory_transport_utils import \
+            MemoryTransport
+        connector = MQConnector({"server": "memory", "consumer_stats": True,
+                                 "users": {"test": {"user": "test_user",
+                                                    "password": "test"}}},
+                                "test")
+        connector.transport = MemoryTransport()
+        handled = threading.Event()
+        connector.register_consumer("idle", "/test", "idle_q", Mock())
+        connector.register_consumer("stats", "/test", "stats_q",
+                                    lambda *_: handled.set())
+        connector.run(run_sync=False)
+        try:
+            self.assertTrue(accounting.enabled)
+            with connector.create_mq_connection("/test") as connection:
+                connector.emit_mq_message(connection, {"data": 1},
+                                          queue="stats_q")
+            self.assertTrue(handled.wait(5))
+            # Stats are recorded after the callback returns
+            for _ in range(100):
+                stats = connector.consumer_stats()
+                if stats["stats"]["messages"]:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(set(stats), {"idle", "stats"})
+            self.assertEqual(stats["idle"]["messages"], 0)
+            self.assertEqual(stats["stats"]["messages"], 1)
+            self.assertGreater(stats["stats"]["bytes"], 0)
+            self.assertGreater(stats["stats"]["io_cpu_seconds"], 0)
+            response = ControlHandler(connector).handle_request(
+                {"command": "consumer_stats"})
+            self.assertEqual(response["output"], connector.consumer_stats())
+        finally:
+            connector.stop()
+            accounting.enabled = False
+            accounting.reset()
+
+
+class TestControlConsumer(unittest.TestCase):
+    def setUp(self):
+        from neon_mq_connector.utils.memory_transport_utils import \
+            MemoryTransport
+        from neon_mq_connector.utils.transport_utils import set_transport
+        set_transport(MemoryTransport())
+
+    def tearDown(self):
+        from neon_mq_connector.utils.transport_utils import set_transport
+        set_transport(None)
+
+    def test_control_commands(self):
+        from neon_mq_connector.utils.client_utils import send_mq_request
+        from neon_mq_connector.utils.control_utils import CONTROL_CONSUMER
+        config = {"server": "memory", "users": {
+            "test": {"user": "test_user", "password": "test"}}}
+        connector = MQConnector(config, "test")
+        connector.run(run_sync=False)
+        self.assertNotIn(CONTROL_CONSUMER, connector.consumers)
+        connector.stop()
+
+        connector = MQConnector(config, "test")
+        connector.vhost = "/test"
+        connector.control_consumer = True
+        handling = threading.Event()
+        release = threading.Event()
+
+        def _busy_handler(*_):
+            handling.set()
+            end = time.monotonic() + 10
+            while not release.is_set() and time.monotonic() < end:
+                sum(range(100))
+
+        connector.register_consumer("busy", "/test", "busy_q", _busy_handler)
+        connector.run(run_sync=False)
+        try:
+            control = connector.consumers[CONTROL_CONSUMER]
+            for _ in range(100):
+                if control.is_consuming:
+                    break
+                time.sleep(0.05)
+            with connector.create_mq_connection("/test") as connection:
+                connector.emit_mq_message(connection, {"data": 1},
+                                          queue="busy_q")
+            self.assertTrue(handling.wait(5))
+
+            stacks = send_mq_request("/test", {"command": "stacks"},
+                                     "test_control", timeout=5)
+            self.assertEqual(stacks["service_id"], connector.service_id)
+            self.assertIn("Thread busy", stacks["output"])
+            self.assertIn("_busy_handler", stacks["output"])
+
+            profile = send_mq_request("/test", {"command": "profile",
+                                                "seconds": 0.2},
+                                      "test_control", timeout=5)
+            self.assertEqual(profile["format"], "collapsed")
+            self.assertGreater(profile["samples"], 0)
+            stack, count = profile["output"].splitlines()[0].rsplit(' ', 1)
+            self.assertTrue(stack.startswith("busy;"))
+            self.assertTrue(stack.endswith(":_busy_handler"))
+            self.assertNotIn(CONTROL_CONSUMER, profile["output"])
+            release.set()
+
+            metrics = send_mq_request("/test", {"command": "metrics"},
+                                      "test_control", timeout=5)
+            self.assertIn("mq_messages_published_total", metrics["output"])
+            error = send_mq_request("/test", {"command": "invalid"},
+                                    "test_control", timeout=5)
+            self.assertEqual(error["error"], "Unknown command: invalid")
+        finally:
+            release.set()
+            connector.stop()
+
+    def test_cprofile(self):
+        from neon_mq_connector.utils.control_utils import ControlHandler
+        connector = MQConnector({"server": "memory", "users": {
+            "test": {"user": "test_user", "password": "test"}}}, "test")
+        connector.vhost = "/test"
+        connector.register_consumer("idle", "/test", "idle_q", Mock())
+        connector.run(run_sync=False)
+        try:
+            for _ in range(100):
+                if connector.consumers["idle"].is_consuming:
+                    break
+                time.sleep(0.05)
+            response = ControlHandler(connector).handle_request(
+                {"command": "profile", "profiler": "cprofile",
+                 "seconds": 0.1, "limit": 5})
+        finally:
+            connector.stop()
+        self.assertEqual(response["format"], "pstats")
+        self.assertIn("function calls", response["output"])
+
 # TODO: test other methods
@@ -216,3 +216,342 @@ class TestSelectConsumer(TestCase):
         test_thread.join(30)
         self.assertFalse(test_thread.is_consuming)
         self.assertFalse(test_thread.is_consumer_alive)
+
+
+@pytest.mark.usefixtures("rmq_instance")
+class TestFaultRecovery(TestCase):
+    def test_recovery(self):
+        from unittest.mock import patch
+        from pika.exceptions import ChannelClosedByBroker
+        from neon_mq_connector.benchmarks import recovery
+        from neon_mq_connector.benchmarks.fault_proxy import FaultProxy
+        from neon_mq_connector.benchmarks.recovery import measure_recovery
+        config = {"server": "localhost", "port": self.rmq_instance.port,
+                  "users": {"test": {"user": "test_user",
+                                     "password": "test_password"}}}
+        with FaultProxy(("localhost", self.rmq_instance.port)) as proxy:
+            for path, fault in (("select", "restart"),
+                                ("blocking", "restart"),
+                                ("select", "stall"),
+                                ("send_message", "restart"),
+                                ("publish_sync", "reset")):
+                with patch.object(recovery, "_delete_probe_queue",
+                                  wraps=recovery._delete_probe_queue) as \
+                        delete:
+                    result = measure_recovery(config, "test", path, fault, 1,
+                                              proxy, "/neon_testing", 60)
+                self.assertIsNotNone(result.recovery_seconds,
+                                     f"{path} did not recover from {fault}")
+                self.assertGreater(result.probes_received, 0)
+                # Probe queues are not left on the broker
+                connector, vhost, queue, _ = delete.call_args[0]
+                with connector.create_mq_connection(vhost) as connection:
+                    with self.assertRaises(ChannelClosedByBroker):
+                        connection.channel().queue_declare(queue,
+                                                           passive=True)
+
+
+class TestConsumerDeadlines(TestCase):
+    def test_expired_message_dropped(self):
+        from pika import BasicProperties
+        from neon_mq_connector.consumers import BlockingConsumerThread, \
+            SelectConsumerThread
+        from neon_mq_connector.utils.deadline_utils import \
+            make_deadline_headers, get_remaining_time, get_expired_counts
+        connection_params = ConnectionParameters()
+        for consumer_cls in (BlockingConsumerThread, SelectConsumerThread):
+            callback = Mock(side_effect=lambda *_: get_remaining_time())
+            consumer = consumer_cls(connection_params, "deadline_q", callback,
+                                    Mock(), auto_ack=False)
+            channel = Mock()
+            method = Mock()
+
+            valid = BasicProperties(headers=make_deadline_headers(10))
+            consumer.on_message(channel, method, valid, b"")
+            callback.assert_called_once_with(channel, method, valid, b"")
+            channel.basic_ack.assert_not_called()
+
+            expired = BasicProperties(headers=make_deadline_headers(-1))
+            consumer.on_message(channel, method, expired, b"")
+            callback.assert_called_once()
+            channel.basic_ack.assert_called_once_with(
+                delivery_tag=method.delivery_tag)
+        self.assertEqual(get_expired_counts()[("queue", "deadline_q")], 2)
+
+
+class _FakeSelectConnection:
+    """
+    Minimal stand-in for `pika.SelectConnection` driving callbacks on the
+    provided IO loop
+    """
+    disconnects = 0
+    max_disconnects = 0
+    failing_hosts = ()
+
+    def __init__(self, parameters, on_open_callback, on_open_error_callback,
+                 on_close_callback, custom_ioloop):
+        from pika.exceptions import AMQPConnectionError
+        self.ioloop = custom_ioloop
+        self._on_close = on_close_callback
+        self.is_open = parameters.host not in self.failing_hosts
+        self.is_closing = False
+        self.is_closed = not self.is_open
+        if self.is_open:
+            self.ioloop.add_callback_threadsafe(
+                lambda: on_open_callback(self))
+        else:
+            self.ioloop.add_callback_threadsafe(
+                lambda: on_open_error_callback(self, AMQPConnectionError()))
+
+    def _reply(self, callback=None, **_):
+        if callback:
+            self.ioloop.add_callback_threadsafe(lambda: callback(None))
+
+    def _consume(self, **_):
+        cls = _FakeSelectConnection
+        if cls.disconnects < cls.max_disconnects:
+            cls.disconnects += 1
+            self.ioloop.add_callback_threadsafe(self._lose_stream)
+
+    def _lose_stream(self):
+        from pika.exceptions import StreamLostError
+        self._set_closed()
+        self._on_close(self, StreamLostError("Forced disconnect"))
+
+    def _set_closed(self):
+        self.is_open = False
+        self.is_closed = True
+
+    def channel(self, on_open_callback):
+        channel = Mock()
+        channel.queue_declare.side_effect = self._reply
+        channel.basic_qos.side_effect = self._reply
+        channel.basic_consume.side_effect = self._consume
+        self.ioloop.add_callback_threadsafe(lambda: on_open_callback(channel))
+
+    def close(self):
+        from pika.exceptions import ConnectionClosedByClient
+        self.is_closing = True
+
+        def _closed():
+            self._set_closed()
+            self._on_close(self, ConnectionClosedByClient(200, "Normal"))
+        self.ioloop.add_callback_threadsafe(_closed)
+
+
+class TestConsumerReconnection(TestCase):
+    def test_forced_disconnects(self):
+        import gc
+        import threading
+        import traceback
+        from unittest.mock import patch
+        from neon_mq_connector.consumers.select_consumer import \
+            SelectConsumerThread, ConsumerState
+
+        _FakeSelectConnection.disconnects = 0
+        _FakeSelectConnection.max_disconnects = 1000
+        error = Mock()
+        consumer = SelectConsumerThread(ConnectionParameters(), "test_q",
+                                        Mock(), error)
+        consumer.reconnect_base_delay = 0.00001
+        stack_depths = []
+        thread_counts = []
+        object_counts = []
+        on_connected = consumer.on_connected
+
+        def _on_connected(connection):
+            stack_depths.append(len(traceback.extract_stack()))
+            if consumer.num_reconnects in (100, 1000):
+                gc.collect()
+                thread_counts.append(threading.active_count())
+                object_counts.append(len(gc.get_objects()))
+            on_connected(connection)
+
+        consumer.on_connected = _on_connected
+        with patch("pika.SelectConnection", _FakeSelectConnection):
+            consumer.start()
+            for _ in range(1200):
+                if consumer.num_reconnects == 1000 and consumer.is_consuming:
+                    break
+                sleep(0.05)
+            consumer.join(5)
+        self.assertEqual(consumer.num_reconnects, 1000)
+        self.assertEqual(len(stack_depths), 1001)
+        self.assertEqual(len(set(stack_depths)), 1)
+        self.assertEqual(thread_counts[0], thread_counts[1])
+        self.assertLess(object_counts[1] - object_counts[0], 1000)
+
+        self.assertFalse(consumer.is_alive())
+        self.assertFalse(consumer.is_consumer_alive)
+        self.assertEqual(consumer.state, ConsumerState.STOPPED)
+        error.assert_not_called()
+
+    def test_endpoint_failover(self):
+        from unittest.mock import patch
+        from neon_mq_connector.consumers.select_consumer import \
+            SelectConsumerThread
+        from neon_mq_connector.utils.cluster_utils import Endpoint, \
+            endpoint_health
+
+        _FakeSelectConnection.disconnects = 0
+        _FakeSelectConnection.max_disconnects = 0
+        _FakeSelectConnection.failing_hosts = ("mq-0",)
+        error = Mock()
+        consumer = SelectConsumerThread(
+            [ConnectionParameters("mq-0"), ConnectionParameters("mq-1")],
+            "test_q", Mock(), error)
+        consumer.max_connection_failed_attempts = 0
+        try:
+            with patch("pika.SelectConnection", _FakeSelectConnection):
+                consumer.start()
+                for _ in range(100):
+                    if consumer.is_consuming:
+                        break
+                    sleep(0.05)
+                self.assertTrue(consumer.is_consuming)
+                self.assertEqual(consumer.current_params.host, "mq-1")
+                self.assertEqual(consumer.connection_failed_attempts, 0)
+                self.assertLess(
+                    endpoint_health.get_score(Endpoint("mq-0", 5672)), 1)
+                consumer.join(5)
+        finally:
+            _FakeSelectConnection.failing_hosts = ()
+            endpoint_health.reset()
+        self.assertFalse(consumer.is_alive())
+        error.assert_not_called()
+
+
+class TestMemoryTransportConsumers(TestCase):
+    def setUp(self):
+        from neon_mq_connector.utils.memory_transport_utils import \
+            MemoryTransport
+        self.transport = MemoryTransport()
+
+    def _wait_for(self, check, timeout=5):
+        for _ in range(int(timeout / 0.01)):
+            if check():
+                return True
+            sleep(0.01)
+        return check()
+
+    def _publish(self, exchange, routing_key, body):
+        with self.transport.blocking_connection() as connection:
+            connection.channel().basic_publish(exchange, routing_key, body)
+
+    def _test_consumer(self, consumer_class):
+        callback = Mock()
+        error = Mock()
+        consumer = consumer_class(ConnectionParameters(), "mem_q", callback,
+                                  error, exchange="mem_ex",
+                                  exchange_type=ExchangeType.fanout,
+                                  transport=self.transport)
+        consumer.start()
+        self.assertTrue(self._wait_for(lambda: consumer.is_consuming))
+        self._publish("mem_ex", "", b"fanout")
+        self._publish("", "mem_q", b"direct")
+        self.assertTrue(self._wait_for(lambda: callback.call_count == 2))
+        self.assertEqual([call[0][3] for call in callback.call_args_list],
+                         [b"fanout", b"direct"])
+        return consumer, error
+
+    def test_blocking_consumer(self):
+        from pika.exceptions import ConnectionClosedByBroker
+        from neon_mq_connector.consumers.blocking_consumer import \
+            BlockingConsumerThread
+        consumer, error = self._test_consumer(BlockingConsumerThread)
+        self.transport.broker.close_connections()
+        self.assertTrue(self._wait_for(lambda: error.called))
+        self.assertIsInstance(error.call_args[0][1], ConnectionClosedByBroker)
+        consumer.join(5)
+        self.assertFalse(consumer.is_alive())
+
+    def test_blocking_consumer_exit(self):
+        from neon_mq_connector.consumers.blocking_consumer import \
+            BlockingConsumerThread
+        on_exit = Mock()
+
+        def _close_channel(channel, *_):
+            channel.close()
+
+        # A channel closed by a callback is a normal shutdown
+        consumer = BlockingConsumerThread(ConnectionParameters(), "exit_q",
+                                          _close_channel, Mock(),
+                                          on_exit=on_exit,
+                                          transport=self.transport)
+        consumer.start()
+        self.assertTrue(self._wait_for(lambda: consumer.is_consuming))
+        self._publish("", "exit_q", b"close")
+        consumer.join(5)
+        self.assertFalse(consumer.is_alive())
+        on_exit.assert_not_called()
+
+        # A consumer cancelled by the broker stopped unexpectedly
+        consumer = BlockingConsumerThread(ConnectionParameters(), "exit_q",
+                                          Mock(), Mock(), on_exit=on_exit,
+                                          transport=self.transport)
+        consumer.start()
+        self.assertTrue(self._wait_for(lambda: consumer.is_consuming))
+        with self.transport.blocking_connection() as connection:
+            connection.channel().queue_delete("exit_q")
+        self.assertTrue(self._wait_for(lambda: on_exit.called))
+        on_exit.assert_called_once_with(consumer, None)
+        consumer.join(5)
+        self.assertFalse(consumer.is_alive())
+
+    def test_select_consumer(self):
+        from neon_mq_connector.consumers.select_consumer import \
+            SelectConsumerThread
+        consumer, error = self._test_consumer(SelectConsumerThread)
+        consumer.reconnect_base_delay = 0.001
+        self.transport.broker.close_connections()
+        self.assertTrue(self._wait_for(lambda: consumer.num_reconnects == 1
+                                       and consumer.is_consuming))
+        consumer.join(5)
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual(self.transport.broker.connections, [])
+        error.assert_not_called()
+
+    def test_select_consumer_loop_lag(self):
+        from unittest.mock import patch
+        from neon_mq_connector.consumers.select_consumer import \
+            SelectConsumerThread
+        from neon_mq_connector.utils.loop_lag_utils import \
+            disable_loop_lag_monitor, enable_loop_lag_monitor, lag_monitor
+
+        def _blocking_callback(*_):
+            sleep(1)
+
+        consumer = SelectConsumerThread(ConnectionParameters(), "idle_q",
+                                        Mock(), transport=self.transport)
+        consumer.start()
+        self.assertTrue(self._wait_for(lambda: consumer.is_consuming))
+        self.assertIsNone(consumer.loop_lag)
+        consumer.join(5)
+
+        # Report stalls after a quarter of a 2s heartbeat
+        enable_loop_lag_monitor(interval=0.05, warn_fraction=0.25)
+        consumer = SelectConsumerThread(ConnectionParameters(heartbeat=2),
+                                        "lag_q", _blocking_callback,
+                                        transport=self.transport)
+        try:
+            with patch("neon_mq_connector.utils.loop_lag_utils.LOG") as log:
+                consumer.start()
+                self.assertTrue(self._wait_for(lambda: consumer.is_consuming))
+                self.assertTrue(self._wait_for(
+                    lambda: consumer.loop_lag["count"] > 2))
+                self.assertLess(consumer.loop_lag["max_lag"], 0.5)
+                self.assertEqual(consumer.loop_lag["threshold"], 0.5)
+                self.assertIn(consumer.name, lag_monitor.get_stats())
+                self._publish("", "lag_q", b"block")
+                self.assertTrue(self._wait_for(
+                    lambda: log.warning.call_count == 2))
+            stall, blocked = [call.args[0]
+                              for call in log.warning.call_args_list]
+            self.assertIn(f"IO loop of {consumer.name} blocked", stall)
+            self.assertIn("_blocking_callback", stall)
+            self.assertIn("was blocked for", blocked)
+            self.assertGreater(consumer.loop_lag["max_lag"], 0.5)
+        finally:
+            disable_loop_lag_monitor()
+            consumer.join(5)
+        self.assertNotIn(consumer.name, lag_monitor.get_stats())
@@ -25,6 +25,7 @@
 # LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import json
 import logging
 import os
 import time
@@ -34,6 +35,8 @@ from unittest.mock import Mock
 import pytest
 import pika
 
+import threading
+
 from threading import Thread
 
 from pika.exceptions import ProbableAuthenticationError
@@ -57,6 +60,7 @@ RANDOM_STR = str(int(time.time()))
 
 INPUT_CHANNEL_A = RANDOM_STR + '_a'
 INPUT_CHANNEL_B = RANDOM_STR + '_b'
+INPUT_CHANNEL_C = RANDOM_STR + '_c'
 OUTPUT_CHANNEL = RANDOM_STR + '_output'
 
 TEST_DICT = {b"section 1": {"key1": "val1",
@@ -123,6 +127,11 @@ class SimpleMQConnector(MQConnector):
                               properties=pika.BasicProperties(expiration='1000'))
         channel.basic_ack(delivery_tag=method.delivery_tag)
 
+    @create_mq_callback
+    def respond_stream(self, body: dict):
+        for i in range(body["data"]):
+            yield {"chunk": i}
+
     @create_mq_callback
     def respond_wrapped(self, body: dict):
         return {
@@ -160,6 +169,11 @@ class TestClientUtils(unittest.TestCase):
                                                   INPUT_CHANNEL_B,
                                                   self.test_connector.respond_wrapped,
                                                   auto_ack=False)
+            self.test_connector.register_consumer("neon_utils_test_stream",
+                                                  vhost,
+                                                  INPUT_CHANNEL_C,
+                                                  self.test_connector.respond_stream,
+                                                  auto_ack=True)
             self.test_connector.run_consumers()
 
     @classmethod
@@ -193,6 +207,21 @@ class TestClientUtils(unittest.TestCase):
         self.assertTrue(response["success"])
         self.assertEqual(response["request_data"], request["data"])
 
+    def test_send_mq_stream_request(self):
+        from neon_mq_connector.utils.client_utils import \
+            send_mq_stream_request
+        with send_mq_stream_request("/neon_testing", {"data": 5},
+                                    INPUT_CHANNEL_C) as stream:
+            chunks = [chunk["chunk"] for chunk in stream]
+        self.assertEqual(chunks, list(range(5)))
+
+        # Non-streaming response is returned as a single chunk
+        request = {"data": time.time()}
+        chunks = list(send_mq_stream_request("/neon_testing", request,
+                                             INPUT_CHANNEL_B))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0]["request_data"], request["data"])
+
     def test_multiple_mq_requests(self):
         from neon_mq_connector.utils.client_utils import send_mq_request
         responses = dict()
@@ -237,6 +266,28 @@ class TestClientUtils(unittest.TestCase):
         with self.assertRaises(ValueError):
             send_mq_request("invalid_endpoint", {}, "test", "test", timeout=5)
 
+    def test_send_mq_request_adaptive(self):
+        from neon_mq_connector.utils.client_utils import send_mq_request
+        from neon_mq_connector.utils.latency_utils import latency_tracker
+        for _ in range(latency_tracker.min_samples):
+            request = {"data": time.time()}
+            response = send_mq_request("/neon_testing", request,
+                                       INPUT_CHANNEL_A, adaptive_timeout=True,
+                                       hedge=True)
+            self.assertEqual(response["request_data"], request["data"])
+        self.assertIsNotNone(latency_tracker.get_quantile(INPUT_CHANNEL_A,
+                                                          0.99))
+
+    def test_send_mq_request_unavailable(self):
+        from neon_mq_connector.utils.client_utils import send_mq_request, \
+            ServiceUnavailableError
+        with self.assertRaises(ServiceUnavailableError):
+            send_mq_request("/neon_testing", {}, "nonexistent_queue",
+                            timeout=5)
+        with self.assertRaises(ServiceUnavailableError):
+            send_mq_request("/neon_testing", {}, "nonexistent_queue",
+                            timeout=5, check_consumers=True)
+
     def test_connector_shutdown(self):
         connector = NeonMQHandler(config=self.test_conf,
                                   service_name="mq_handler",
@@ -384,6 +435,773 @@ class TestMQConnectionUtils(unittest.TestCase):
         self.assertEqual(pika_logger.level, logging.DEBUG)
 
 
+class TestRetryUtils(unittest.TestCase):
+    def test_retry_callback_args(self):
+        failures = []
+        exceeded = Mock(return_value="exceeded")
+
+        class _Retried:
+            @retry(num_retries=3, backoff_factor=0.01, use_self=True,
+                   callback_on_attempt_failure=lambda *args:
+                   failures.append(args),
+                   callback_on_attempt_failure_args=['e', 'self', 1],
+                   callback_on_exceeded=exceeded,
+                   callback_on_exceeded_args=['self'])
+            def fail(self):
+                raise ValueError("failed")
+
+        retried = _Retried()
+        self.assertEqual(retried.fail(), "exceeded")
+        exceeded.assert_called_once_with(retried)
+        self.assertEqual(len(failures), 3)
+        for error, instance, arg in failures:
+            self.assertIsInstance(error, ValueError)
+            self.assertEqual(instance, retried)
+            self.assertEqual(arg, 1)
+
+        # Callback args are resolved per call
+        failures.clear()
+        self.assertEqual(_Retried().fail(), "exceeded")
+        self.assertIsInstance(failures[0][0], ValueError)
+        self.assertNotEqual(failures[0][1], retried)
+
+    def test_retry_budget(self):
+        from neon_mq_connector.utils import connection_utils
+        from neon_mq_connector.utils.connection_utils import RetryBudget
+        budget = RetryBudget(ratio=0.5, max_tokens=1)
+        self.assertTrue(budget.try_acquire())
+        self.assertFalse(budget.try_acquire())
+        budget.record_call()
+        budget.record_call()
+        self.assertTrue(budget.try_acquire())
+
+        calls = []
+
+        @retry(num_retries=5, backoff_factor=0.01)
+        def _fails():
+            calls.append(time.time())
+            raise ValueError("failed")
+
+        real_budget = connection_utils.retry_budget
+        connection_utils.retry_budget = RetryBudget(ratio=0, max_tokens=1)
+        try:
+            with self.assertRaises(RuntimeError):
+                _fails()
+        finally:
+            connection_utils.retry_budget = real_budget
+        # One retry is allowed by the budget
+        self.assertEqual(len(calls), 2)
+
+    def test_circuit_breaker(self):
+        from neon_mq_connector.utils.connection_utils import CircuitBreaker, \
+            CircuitOpenError, get_circuit_breaker
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.is_open)
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow())
+        time.sleep(0.1)
+        # A single trial call is allowed
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow())
+
+        calls = []
+
+        @retry(num_retries=10, backoff_factor=0.001,
+               circuit_breaker_target=lambda target: target)
+        def _connect(target):
+            calls.append(target)
+            raise ConnectionError(target)
+
+        target = "test_circuit_breaker:5672"
+        with self.assertRaises(CircuitOpenError):
+            _connect(target)
+        threshold = get_circuit_breaker(target).failure_threshold
+        self.assertEqual(len(calls), threshold)
+        # Calls fail fast while the circuit is open
+        with self.assertRaises(CircuitOpenError):
+            _connect(target)
+        self.assertEqual(len(calls), threshold)
+
+
+class TestReadinessProbe(unittest.TestCase):
+    def test_wait_ready(self):
+        import socket
+        from unittest.mock import patch
+        from neon_mq_connector.utils.connection_utils import \
+            BrokerReadinessProbe, get_readiness_probe
+
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        port = server.getsockname()[1]
+
+        # Port is closed
+        probe = BrokerReadinessProbe("127.0.0.1", port, initial_backoff=0.01)
+        start = time.monotonic()
+        self.assertFalse(probe.wait_ready(0.5))
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertFalse(probe.is_ready)
+
+        server.listen()
+        try:
+            self.assertTrue(probe.wait_ready(5))
+            self.assertTrue(probe.is_ready)
+        finally:
+            server.close()
+        # Cached readiness is reused
+        self.assertTrue(probe.wait_ready(0))
+
+        # Concurrent callers share a single AMQP handshake
+        probe = BrokerReadinessProbe("127.0.0.1", port)
+        params = pika.ConnectionParameters()
+        with patch("neon_mq_connector.utils.connection_utils."
+                   "check_port_is_open", return_value=True), \
+                patch("neon_mq_connector.utils.connection_utils."
+                      "check_rmq_is_available",
+                      side_effect=lambda _: time.sleep(0.2) or True) as check:
+            results = []
+            threads = [Thread(target=lambda: results.append(
+                probe.wait_ready(5, params))) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results, [True] * 4)
+        check.assert_called_once_with(params)
+
+        self.assertIs(get_readiness_probe("127.0.0.1", port, "/test"),
+                      get_readiness_probe("127.0.0.1", port, "/test"))
+
+
+class TestImportTime(unittest.TestCase):
+    @staticmethod
+    def _import(module: str) -> tuple:
+        """
+        Import `module` in a new interpreter
+        :returns: cumulative seconds to import `module`, set of all imported
+            module names
+        """
+        import subprocess
+        import sys
+        output = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                                 f"import {module}"], capture_output=True,
+                                text=True, check=True).stderr
+        imported = set()
+        import_time = None
+        for line in output.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line.split("|")
+            name = name.strip()
+            imported.add(name)
+            if name == module:
+                import_time = int(cumulative) / 1000000
+        return import_time, imported
+
+    def test_import_neon_mq_connector(self):
+        import_time, imported = self._import("neon_mq_connector")
+        self.assertLess(import_time, 0.05)
+        for heavy_module in ("pika", "ovos_config", "ovos_utils", "pydantic"):
+            self.assertNotIn(heavy_module, imported)
+
+    def test_import_client_utils(self):
+        import_time, imported = \
+            self._import("neon_mq_connector.utils.client_utils")
+        self.assertLess(import_time, 1.0)
+        for heavy_module in ("ovos_config", "pydantic"):
+            self.assertNotIn(heavy_module, imported)
+
+    def test_lazy_imports(self):
+        import neon_mq_connector
+        import neon_mq_connector.consumers
+        import neon_mq_connector.utils
+        from neon_mq_connector.connector import MQConnector as _MQConnector
+        self.assertIs(neon_mq_connector.MQConnector, _MQConnector)
+        self.assertIn("MQConnector", dir(neon_mq_connector))
+        self.assertTrue(callable(neon_mq_connector.utils.retry))
+        self.assertTrue(neon_mq_connector.consumers.SelectConsumerThread)
+        with self.assertRaises(AttributeError):
+            neon_mq_connector.utils.not_a_module
+
+
+class TestConfigSnapshot(unittest.TestCase):
+    def test_snapshot(self):
+        import copy
+        from neon_mq_connector.config import MQConfigSnapshot
+        config = {"server": "mq.example.com",
+                  "users": {"test": {"user": "test_user",
+                                     "password": "test_password"}},
+                  "list": [{"key": "value"}]}
+        snapshot = MQConfigSnapshot(config)
+        self.assertEqual(snapshot.config["users"], config["users"])
+        self.assertEqual(snapshot.config["list"], ({"key": "value"},))
+        with self.assertRaises(TypeError):
+            snapshot.config["server"] = "localhost"
+        with self.assertRaises(TypeError):
+            snapshot.get_service_config("test")["user"] = "other"
+        with self.assertRaises(TypeError):
+            snapshot.config["list"][0]["key"] = "other"
+        mutable = copy.deepcopy(snapshot.config)
+        mutable["users"]["test"]["user"] = "other"
+        self.assertEqual(snapshot.get_service_config("test")["user"],
+                         "test_user")
+        self.assertEqual(snapshot.get_service_config("other"), {})
+
+        params = snapshot.get_connection_params("test", "/vhost")
+        self.assertIs(params, snapshot.get_connection_params("test", "/vhost"))
+        self.assertEqual(params.host, "mq.example.com")
+        self.assertEqual(params.port, 5672)
+        self.assertEqual(params.virtual_host, "/vhost")
+        self.assertEqual(params.credentials.username, "test_user")
+        self.assertEqual(snapshot.get_connection_fields("test"),
+                         ("mq.example.com", 5672, "test_user",
+                          "test_password"))
+
+    def test_connector_config(self):
+        from unittest.mock import patch
+        from neon_mq_connector.config import MQConfigSnapshot
+        from neon_mq_connector.utils.client_utils import \
+            _get_mq_config_snapshot
+        config = {"server": "mq.example.com",
+                  "users": {"test": {"user": "test_user",
+                                     "password": "test_password"}}}
+        connector = MQConnector(config, "test")
+        snapshot = connector.config_snapshot
+        params = connector.get_connection_params("/test")
+        self.assertIs(connector.config_snapshot, snapshot)
+        self.assertIs(connector.get_connection_params("/test"), params)
+        # Changes made in place are reflected
+        connector.config["server"] = "mq2.example.com"
+        connector.service_config["password"] = "new_password"
+        self.assertEqual(connector.get_connection_params("/test").host,
+                         "mq2.example.com")
+        self.assertEqual(connector.mq_credentials.password, "new_password")
+
+        # The default config is a mutable copy of the global snapshot
+        config["server"] = "mq.example.com"
+        global_snapshot = MQConfigSnapshot(config)
+        with patch("neon_mq_connector.connector.get_mq_config_snapshot",
+                   return_value=global_snapshot), \
+                patch("neon_mq_connector.utils.client_utils."
+                      "get_mq_config_snapshot", return_value=global_snapshot):
+            connector = MQConnector(None, "test")
+            self.assertIs(connector.config_snapshot, global_snapshot)
+            connector.config["server"] = "localhost"
+            self.assertEqual(connector.config_snapshot.config["server"],
+                             "localhost")
+            self.assertEqual(global_snapshot.config["server"],
+                             "mq.example.com")
+
+            # Requests reuse one snapshot with default mq_handler credentials
+            handler_snapshot = _get_mq_config_snapshot()
+            self.assertIs(_get_mq_config_snapshot(), handler_snapshot)
+            self.assertEqual(handler_snapshot.config["server"],
+                             "mq.example.com")
+            self.assertTrue(handler_snapshot.get_service_config("mq_handler"))
+            self.assertFalse(global_snapshot.get_service_config("mq_handler"))
+
+    def test_reload(self):
+        import json
+        from tempfile import TemporaryDirectory
+        from unittest.mock import patch
+        import neon_mq_connector.config as mq_config
+        from neon_mq_connector.config import reload_mq_config, \
+            get_mq_config_snapshot
+
+        def _write(path: str, config: dict, mtime: int):
+            with open(path, "w") as f:
+                json.dump(config, f)
+            os.utime(path, ns=(mtime, mtime))
+
+        def _load():
+            with open(config_file) as f:
+                return json.load(f)
+
+        config = {"server": "localhost",
+                  "users": {"test": {"user": "test_user",
+                                     "password": "test_password"}},
+                  "properties": {"key": "value"}}
+        original_snapshot = mq_config._snapshot
+        with TemporaryDirectory() as temp_dir, \
+                patch("neon_mq_connector.config._get_config_sources",
+                      return_value=[os.path.join(temp_dir, "mq.json")]), \
+                patch("neon_mq_connector.config.load_neon_mq_config",
+                      side_effect=_load):
+            config_file = os.path.join(temp_dir, "mq.json")
+            _write(config_file, config, 1000000000)
+            try:
+                snapshot = reload_mq_config(force=True)
+                self.assertIs(get_mq_config_snapshot(), snapshot)
+                # Unchanged files are not reloaded
+                self.assertIs(reload_mq_config(), snapshot)
+
+                connector = MQConnector(None, "test")
+                connector.restart_consumer = Mock()
+                connector.consumer_properties["consumer"] = {
+                    "started": True, "properties": {
+                        "connection_params":
+                            connector.get_connection_params("/test")}}
+                params = connector.get_connection_params("/test")
+                self.assertIs(params, connector.get_connection_params("/test"))
+                listener = Mock()
+                mq_config.add_config_listener(listener)
+
+                # Changes to unrelated fields do not rebuild connections
+                config["properties"]["key"] = "new_value"
+                _write(config_file, config, 2000000000)
+                new_snapshot = reload_mq_config()
+                self.assertIsNot(new_snapshot, snapshot)
+                listener.assert_called_once_with(snapshot, new_snapshot)
+                self.assertEqual(connector.config["properties"]["key"],
+                                 "new_value")
+                connector.restart_consumer.assert_not_called()
+
+                config["users"]["test"]["password"] = "new_password"
+                _write(config_file, config, 3000000000)
+                reload_mq_config()
+                connector.restart_consumer.assert_called_once_with("consumer")
+                new_params = connector.consumer_properties["consumer"][
+                    "properties"]["connection_params"]
+                self.assertEqual(new_params.credentials.password,
+                                 "new_password")
+                self.assertEqual(new_params.virtual_host, "/test")
+            finally:
+                mq_config._snapshot = original_snapshot
+
+
+class TestSupervisorUtils(unittest.TestCase):
+    def test_consumer_supervisor(self):
+        from neon_mq_connector.utils.supervisor_utils import \
+            ConsumerSupervisor
+        restarted = threading.Event()
+        restart_result = [True]
+
+        def _restart(name):
+            restarted.set()
+            return restart_result[0]
+
+        supervisor = ConsumerSupervisor(_restart, base_delay=0.01,
+                                        max_delay=60, flap_threshold=3)
+        self.assertTrue(supervisor.is_healthy)
+        for i in range(3):
+            self.assertFalse(supervisor.is_flapping("test"))
+            restarted.clear()
+            supervisor.notify_stopped("test", ValueError(i))
+            self.assertTrue(restarted.wait(1))
+            time.sleep(0.05)
+            self.assertTrue(supervisor.is_healthy)
+        history = supervisor.get_history("test")
+        self.assertEqual(len(history), 3)
+        self.assertEqual([entry["restarted"] for entry in history],
+                         [True] * 3)
+        self.assertIn("ValueError(2)", history[2]["error"])
+        for entry, max_delay in zip(history, (0.01, 0.02, 0.04)):
+            self.assertLessEqual(entry["delay"], max_delay)
+
+        # Flapping consumers are restarted after max_delay
+        self.assertTrue(supervisor.is_flapping("test"))
+        self.assertEqual(supervisor.get_delay("test"), 60)
+        restarted.clear()
+        supervisor.notify_stopped("test")
+        self.assertFalse(supervisor.is_healthy)
+        self.assertEqual(supervisor.unhealthy_consumers, {"test"})
+        supervisor.remove("test")
+        self.assertTrue(supervisor.is_healthy)
+        self.assertFalse(restarted.wait(0.1))
+
+        # Failed restarts leave the consumer unhealthy
+        restart_result[0] = False
+        supervisor.notify_stopped("other")
+        self.assertTrue(restarted.wait(1))
+        time.sleep(0.05)
+        self.assertFalse(supervisor.is_healthy)
+        self.assertFalse(supervisor.get_history("other")[0]["restarted"])
+        supervisor.stop()
+        self.assertTrue(supervisor.is_healthy)
+
+
+class TestClusterUtils(unittest.TestCase):
+    def test_parse_endpoints(self):
+        from neon_mq_connector.utils.cluster_utils import Endpoint, \
+            parse_endpoints
+        self.assertEqual(parse_endpoints({"server": "mq", "port": 5673}),
+                         (Endpoint("mq", 5673),))
+        self.assertEqual(parse_endpoints({"servers": [
+            "mq-0", "mq-1:5673", {"host": "mq-2", "port": 5674}, "mq-0"]}),
+            (Endpoint("mq-0", 5672), Endpoint("mq-1", 5673),
+             Endpoint("mq-2", 5674)))
+
+    def test_endpoint_selector(self):
+        from neon_mq_connector.utils.cluster_utils import Endpoint, \
+            EndpointHealth, EndpointSelector
+        endpoints = [Endpoint(f"mq-{i}", 5672) for i in range(3)]
+        health = EndpointHealth()
+        selector = EndpointSelector(endpoints, "round_robin",
+                                    {"leader_q": "mq-2:5672"}, health)
+        self.assertEqual(selector.order(), endpoints)
+        self.assertEqual(selector.order(), endpoints[1:] + endpoints[:1])
+        with self.assertRaises(ValueError):
+            EndpointSelector(endpoints, "invalid")
+
+        # Queues are consistently assigned to a node
+        order = selector.order("some_q", "queue_leader")
+        self.assertEqual(order, selector.order("some_q", "queue_leader"))
+        self.assertEqual(sorted(order), endpoints)
+        self.assertEqual(selector.order("leader_q", "queue_leader")[0],
+                         endpoints[2])
+
+        connections = [Mock(is_open=True) for _ in range(3)]
+        selector.track_connection(endpoints[0], connections[0])
+        selector.track_connection(endpoints[0], connections[1])
+        selector.track_connection(endpoints[1], connections[2])
+        self.assertEqual(selector.get_connection_count(endpoints[0]), 2)
+        self.assertEqual(selector.order(strategy="least_connections"),
+                         [endpoints[2], endpoints[1], endpoints[0]])
+        connections[0].is_open = False
+        self.assertEqual(selector.get_connection_count(endpoints[0]), 1)
+
+        # Unhealthy endpoints are tried last
+        health.record_failure(endpoints[2])
+        self.assertLess(health.get_score(endpoints[2]), 1)
+        self.assertEqual(selector.order("leader_q", "queue_leader")[-1],
+                         endpoints[2])
+        health.record_success(endpoints[2])
+        self.assertEqual(health.get_score(endpoints[2]), 1)
+
+    def test_endpoint_selector_connect(self):
+        from neon_mq_connector.utils.cluster_utils import Endpoint, \
+            EndpointHealth, EndpointSelector
+        endpoints = [Endpoint(f"mq-{i}", 5672) for i in range(2)]
+        health = EndpointHealth()
+        selector = EndpointSelector(endpoints, "round_robin", health=health)
+        connection = Mock(is_open=True)
+
+        def _connect(endpoint):
+            if endpoint == endpoints[0]:
+                raise pika.exceptions.AMQPConnectionError(endpoint)
+            return connection
+
+        self.assertIs(selector.connect(_connect), connection)
+        self.assertLess(health.get_score(endpoints[0]), 1)
+        self.assertEqual(selector.get_connection_count(endpoints[1]), 1)
+        # The failed endpoint is tried last by the next connection
+        self.assertEqual(selector.order(), [endpoints[1], endpoints[0]])
+        with self.assertRaises(pika.exceptions.AMQPConnectionError):
+            selector.connect(Mock(side_effect=
+                                  pika.exceptions.AMQPConnectionError))
+
+    def test_cluster_connection_params(self):
+        from neon_mq_connector.utils.cluster_utils import Endpoint
+        connector = MQConnector({"servers": ["mq-0", "mq-1:5673"],
+                                 "endpoint_strategy": "round_robin",
+                                 "users": {"test": {"user": "test_user",
+                                                    "password": "pass"}}},
+                                "test")
+        self.assertEqual(connector.config_snapshot.get_endpoints(),
+                         (Endpoint("mq-0", 5672), Endpoint("mq-1", 5673)))
+        params = connector.get_cluster_connection_params("/test")
+        self.assertEqual(len(params), 2)
+        self.assertEqual({(p.host, p.port) for p in params},
+                         {("mq-0", 5672), ("mq-1", 5673)})
+        self.assertTrue(all(p.virtual_host == "/test" and
+                            p.credentials.username == "test_user"
+                            for p in params))
+        # Parameters are cached per endpoint
+        self.assertEqual({id(p) for p in params},
+                         {id(p) for p in connector.get_cluster_connection_params(
+                             "/test")})
+
+
+class TestSyncUtils(unittest.TestCase):
+    def test_shared_publisher(self):
+        from neon_mq_connector.utils.sync_utils import SharedPublisher, \
+            get_shared_publisher
+        connections = []
+
+        def _create_connection():
+            connections.append(Mock(is_open=True))
+            return connections[-1]
+
+        publisher = SharedPublisher(_create_connection)
+        publish = Mock(return_value="message_id")
+        self.assertEqual(publisher.publish(publish), "message_id")
+        self.assertEqual(publisher.publish(publish), "message_id")
+        self.assertEqual(len(connections), 1)
+        connections[0].process_data_events.assert_called_once_with(0)
+        publish.assert_called_with(connections[0])
+
+        # Closed connections are replaced
+        connections[0].is_open = False
+        publisher.publish(publish)
+        self.assertEqual(len(connections), 2)
+
+        # Failed publishes are retried once with a new connection
+        publish.side_effect = [pika.exceptions.StreamLostError(), "retried"]
+        self.assertEqual(publisher.publish(publish), "retried")
+        self.assertEqual(len(connections), 3)
+        connections[1].close.assert_called_once()
+        publish.assert_called_with(connections[2])
+
+        self.assertIs(get_shared_publisher(("test",), _create_connection),
+                      get_shared_publisher(("test",), Mock()))
+
+    def test_jittered_repeating_timer(self):
+        from neon_mq_connector.utils.thread_utils import \
+            JitteredRepeatingTimer
+        called = threading.Semaphore(0)
+        timer = JitteredRepeatingTimer(0.02, called.release, jitter=0.5)
+        timer.start()
+        for _ in range(3):
+            self.assertTrue(called.acquire(timeout=1))
+        timer.cancel()
+
+    def test_sync_aggregator(self):
+        from neon_mq_connector.utils.sync_utils import SyncAggregator
+        aggregator = SyncAggregator(60)
+        connectors = [Mock(service_name="service_a", service_id="a1"),
+                      Mock(service_name="service_a", service_id="a2"),
+                      Mock(service_name="service_b", service_id="b1")]
+        for _ in range(2):
+            for connector in connectors:
+                aggregator.report(connector,
+                                  {"service_id": connector.service_id,
+                                   "time": 1})
+        try:
+            message = aggregator.get_message()
+            self.assertEqual(message["pid"], os.getpid())
+            self.assertEqual(message["services"]["service_a"]["count"], 2)
+            self.assertEqual(set(message["services"]["service_a"]
+                                 ["instances"]), {"a1", "a2"})
+            self.assertEqual(message["services"]["service_b"]["count"], 1)
+            self.assertIsNone(aggregator.get_message())
+
+            aggregator.flush()
+            for connector in connectors:
+                connector.publish_sync.assert_not_called()
+            aggregator.report(connectors[2], {"service_id": "b1"})
+            for connector in connectors[:2]:
+                aggregator.remove(connector)
+            aggregator.flush()
+            connectors[2].publish_sync.assert_called_once()
+            self.assertEqual(set(connectors[2].publish_sync.call_args[0][0]
+                                 ["services"]), {"service_b"})
+        finally:
+            aggregator.stop()
+
+
+class TestMetricsUtils(unittest.TestCase):
+    def test_registry(self):
+        from neon_mq_connector.utils.metrics_utils import MetricsRegistry
+        registry = MetricsRegistry()
+        counter = registry.counter("test_total", "Test counter", ("queue",))
+        gauge = registry.gauge("test_gauge", "Test gauge")
+        histogram = registry.histogram("test_seconds", "Test histogram",
+                                       buckets=(0.1, 1))
+        self.assertIs(counter, registry.counter("test_total", "", ("queue",)))
+        with self.assertRaises(ValueError):
+            registry.gauge("test_total", "Test counter")
+
+        # Updates are ignored while disabled
+        counter.inc(labels=("q",))
+        histogram.observe(0.5)
+        self.assertEqual(counter.get(("q",)), 0)
+        self.assertEqual(histogram.get(), 0)
+
+        registry.enabled = True
+        counter.inc(labels=("q",))
+        counter.inc(2, labels=('a"b',))
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        self.assertEqual(counter.get(("q",)), 1)
+        self.assertEqual(gauge.get(), 1)
+        self.assertEqual(histogram.get(), 3)
+        self.assertAlmostEqual(histogram.get_sum(), 5.55)
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE test_total counter", lines)
+        self.assertIn('test_total{queue="q"} 1', lines)
+        self.assertIn('test_total{queue="a\\"b"} 2', lines)
+        self.assertIn("test_gauge 1", lines)
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn("test_seconds_count 3", lines)
+
+        registry.reset()
+        self.assertEqual(counter.get(("q",)), 0)
+        self.assertEqual(histogram.get(), 0)
+
+    def test_consumer_metrics(self):
+        from neon_mq_connector.utils.consumer_utils import handle_message
+        from neon_mq_connector.utils.metrics_utils import metrics, \
+            HANDLER_ERRORS, HANDLER_SECONDS, MESSAGES_CONSUMED, \
+            MESSAGES_IN_FLIGHT
+        consumer = Mock(queue="metrics_q")
+        in_flight = []
+        consumer.callback_func.side_effect = \
+            lambda *_: in_flight.append(MESSAGES_IN_FLIGHT.get(("metrics_q",)))
+        properties = pika.BasicProperties()
+        metrics.enabled = True
+        try:
+            handle_message(consumer, Mock(), Mock(), properties, b"")
+            consumer.callback_func.side_effect = ValueError("test")
+            with self.assertRaises(ValueError):
+                handle_message(consumer, Mock(), Mock(), properties, b"")
+            self.assertEqual(in_flight, [1])
+            self.assertEqual(MESSAGES_CONSUMED.get(("metrics_q",)), 2)
+            self.assertEqual(MESSAGES_IN_FLIGHT.get(("metrics_q",)), 0)
+            self.assertEqual(HANDLER_SECONDS.get(("metrics_q",)), 2)
+            self.assertEqual(HANDLER_ERRORS.get(("metrics_q",)), 1)
+        finally:
+            metrics.enabled = False
+            metrics.reset()
+
+    def test_disabled_overhead(self):
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from neon_mq_connector.utils import consumer_utils
+        from neon_mq_connector.utils.consumer_utils import handle_message
+        from neon_mq_connector.utils.metrics_utils import metrics, Counter, \
+            Gauge, Histogram
+        self.assertFalse(metrics.enabled)
+        consumer = SimpleNamespace(queue="overhead_q", auto_ack=True,
+                                   callback_func=Mock())
+        properties = pika.BasicProperties()
+
+        # While disabled, messages are handled without touching metrics,
+        # accounting, tracing or the watchdog
+        instrumentation = Mock(side_effect=AssertionError("instrumented"))
+        with patch.object(Counter, "inc", instrumentation), \
+                patch.object(Gauge, "set", instrumentation), \
+                patch.object(Histogram, "observe", instrumentation), \
+                patch.object(consumer_utils.accounting, "record",
+                             instrumentation), \
+                patch.object(consumer_utils.watchdog, "watch",
+                             instrumentation), \
+                patch.object(consumer_utils, "consume_span",
+                             instrumentation):
+            handle_message(consumer, Mock(), Mock(), properties, b"")
+        consumer.callback_func.assert_called_once()
+        instrumentation.assert_not_called()
+
+    def test_metrics_server(self):
+        from urllib.request import urlopen
+        from neon_mq_connector.utils.metrics_utils import metrics, \
+            start_metrics_server, stop_metrics_server, CONNECTION_OPENS
+        try:
+            server = start_metrics_server(0, "127.0.0.1")
+            self.assertIs(server, start_metrics_server(0, "127.0.0.1"))
+            self.assertTrue(metrics.enabled)
+            CONNECTION_OPENS.inc(labels=("test",))
+            port = server.server_address[1]
+            with urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+                self.assertTrue(response.headers["Content-Type"]
+                                .startswith("text/plain"))
+                body = response.read().decode()
+            self.assertIn('mq_connection_opens_total{kind="test"} 1', body)
+        finally:
+            stop_metrics_server()
+            metrics.enabled = False
+            metrics.reset()
+
+
+class TestTracingUtils(unittest.TestCase):
+    def tearDown(self):
+        from neon_mq_connector.utils.tracing_utils import set_tracer
+        set_tracer(None)
+
+    def test_traceparent(self):
+        from neon_mq_connector.utils.tracing_utils import SpanContext, \
+            parse_traceparent
+        context = SpanContext.create()
+        self.assertEqual(len(context.trace_id), 32)
+        self.assertEqual(len(context.span_id), 16)
+        self.assertEqual(parse_traceparent(context.to_traceparent()),
+                         context)
+        value = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00"
+        self.assertEqual(parse_traceparent(value.encode()),
+                         SpanContext("4bf92f3577b34da6a3ce929d0e0e4736",
+                                     "00f067aa0ba902b7", False))
+        for invalid in (None, 1, "", "00-abc-def-01",
+                        f"00-{'0' * 32}-00f067aa0ba902b7-01",
+                        f"ff-{'a' * 32}-00f067aa0ba902b7-01"):
+            self.assertIsNone(parse_traceparent(invalid))
+
+    def test_disabled(self):
+        from neon_mq_connector.utils.tracing_utils import consume_span, \
+            get_tracer, start_publish_span, trace_phase
+        self.assertIsNone(get_tracer())
+        headers = {"key": "value"}
+        self.assertEqual(start_publish_span("q", headers), (headers, None))
+        with consume_span("q", pika.BasicProperties()) as span:
+            self.assertIsNone(span)
+            with trace_phase("handler") as phase:
+                self.assertIsNone(phase)
+
+    def test_trace_propagation(self):
+        from neon_mq_connector.utils.consumer_utils import handle_message
+        from neon_mq_connector.utils.tracing_utils import RecordingTracer, \
+            PUBLISH_TIME_HEADER, TRACEPARENT_HEADER, parse_traceparent, \
+            set_tracer
+        tracer = RecordingTracer()
+        set_tracer(tracer)
+
+        connection = Mock(spec=pika.BlockingConnection)
+        channel = connection.channel.return_value
+        MQConnector.emit_mq_message(connection, {"data": 1}, queue="q",
+                                    headers={"key": "value"})
+        properties = channel.basic_publish.call_args.kwargs["properties"]
+        self.assertEqual(properties.headers["key"], "value")
+        self.assertIsInstance(properties.headers[PUBLISH_TIME_HEADER], int)
+        publish_span, = tracer.get_spans()
+        self.assertEqual(publish_span.kind, "producer")
+        self.assertEqual(parse_traceparent(
+            properties.headers[TRACEPARENT_HEADER]), publish_span.context)
+
+        @create_mq_callback(include_callback_props=("body",),
+                            request_model=MockRequestModel)
+        def _handler(body):
+            return body
+
+        consumer = Mock(queue="q", callback_func=_handler)
+        handle_message(consumer, Mock(), Mock(), properties,
+                       channel.basic_publish.call_args.kwargs["body"])
+        trace_id = publish_span.context.trace_id
+        spans = {span.name: span for span in tracer.get_spans(trace_id)}
+        self.assertEqual(set(spans), {"publish q", "consume q", "queue_wait",
+                                      "decode", "validate", "handler"})
+        consume = spans["consume q"]
+        self.assertEqual(consume.parent, publish_span.context)
+        self.assertGreaterEqual(consume.attributes["queue_wait"], 0)
+        for phase in ("queue_wait", "decode", "validate", "handler"):
+            self.assertEqual(spans[phase].parent, consume.context)
+            self.assertGreaterEqual(spans[phase].duration, 0)
+
+    def test_enable_opentelemetry(self):
+        from neon_mq_connector.utils.tracing_utils import \
+            enable_opentelemetry, get_tracer, OpenTelemetryTracer
+        try:
+            import opentelemetry  # noqa: F401
+        except ImportError:
+            self.assertFalse(enable_opentelemetry())
+            self.assertIsNone(get_tracer())
+        else:
+            self.assertTrue(enable_opentelemetry())
+            self.assertIsInstance(get_tracer(), OpenTelemetryTracer)
+
+
 class TestConsumerUtils(unittest.TestCase):
     def test_default_error_handler(self):
         from neon_mq_connector.utils.consumer_utils import default_error_handler
@@ -483,6 +1301,454 @@ class TestRabbitUtils(unittest.TestCase):
         test_handlers.callback_with_pydantic_model(*valid_model_request.values())
         test_handlers.callback.assert_called_with(body=mock_model)
 
+    def test_create_mq_callback_reply(self):
+        class ReplyHandler:
+            emit_mq_reply = MQConnector.emit_mq_reply
+            vhost = "/test"
+
+            def __init__(self):
+                self.send_message = Mock()
+
+            @create_mq_callback(include_callback_props=('body',))
+            def handle(self, body):
+                return {"response": True, "message_id": body["message_id"]}
+
+        handler = ReplyHandler()
+        channel = Mock()
+        channel.is_open = True
+        channel.connection.add_callback_threadsafe = \
+            Mock(side_effect=lambda func: func())
+
+        # Reply to `reply_to` is published on the consuming channel
+        request = self.create_mock_request({"message_id": "test_id",
+                                            "routing_key": "reply_queue"})
+        request['channel'] = channel
+        request['properties'] = pika.BasicProperties(reply_to="reply_queue",
+                                                     correlation_id="corr_id")
+        handler.handle(*request.values())
+        handler.send_message.assert_not_called()
+        channel.basic_publish.assert_called_once()
+        kwargs = channel.basic_publish.call_args.kwargs
+        self.assertEqual(kwargs['routing_key'], "reply_queue")
+        self.assertEqual(kwargs['properties'].correlation_id, "corr_id")
+        self.assertEqual(b64_to_dict(kwargs['body'])['message_id'], "test_id")
+
+        # `reply_to` property is honored without a `routing_key`
+        channel.basic_publish.reset_mock()
+        request = self.create_mock_request({"message_id": "test_id"})
+        request['channel'] = channel
+        request['properties'] = pika.BasicProperties(reply_to="reply_to_queue")
+        handler.handle(*request.values())
+        kwargs = channel.basic_publish.call_args.kwargs
+        self.assertEqual(kwargs['routing_key'], "reply_to_queue")
+        self.assertEqual(kwargs['properties'].correlation_id, "test_id")
+        handler.send_message.assert_not_called()
+
+        # Reply to a `routing_key` other than `reply_to` declares the queue
+        # via `send_message`
+        channel.basic_publish.reset_mock()
+        request = self.create_mock_request({"message_id": "test_id",
+                                            "routing_key": "reply_queue"})
+        request['channel'] = channel
+        request['properties'] = pika.BasicProperties()
+        handler.handle(*request.values())
+        channel.basic_publish.assert_not_called()
+        handler.send_message.assert_called_once()
+        self.assertEqual(handler.send_message.call_args.kwargs['queue'],
+                         "reply_queue")
+
+        # Failed publish scheduled on the IO loop falls back to `send_message`
+        handler.send_message.reset_mock()
+        channel.basic_publish = Mock(side_effect=RuntimeError("closed"))
+        request = self.create_mock_request({"message_id": "test_id"})
+        request['channel'] = channel
+        request['properties'] = pika.BasicProperties(reply_to="reply_to_queue")
+        handler.handle(*request.values())
+        channel.basic_publish.assert_called_once()
+        handler.send_message.assert_called_once()
+        self.assertEqual(handler.send_message.call_args.kwargs['queue'],
+                         "reply_to_queue")
+
+        # Closed channel falls back to a new connection
+        handler.send_message.reset_mock()
+        channel.basic_publish.reset_mock()
+        channel.is_open = False
+        handler.handle(*request.values())
+        channel.basic_publish.assert_not_called()
+        handler.send_message.assert_called_once()
+
+    def test_create_mq_callback_deadline(self):
+        from neon_mq_connector.utils.deadline_utils import \
+            get_remaining_time, make_deadline_headers, get_expired_counts
+        callback = Mock(side_effect=lambda body: get_remaining_time())
+
+        @create_mq_callback(include_callback_props=('channel', 'method',
+                                                    'body'))
+        def deadline_handler(channel, method, body):
+            return callback(body)
+
+        # Request within its deadline is handled with remaining budget
+        request = self.create_mock_request({"test": True})
+        request['properties'] = pika.BasicProperties(
+            headers=make_deadline_headers(10))
+        remaining = deadline_handler(*request.values())
+        callback.assert_called_once()
+        self.assertTrue(0 < remaining <= 10)
+
+        # Expired request is acknowledged and dropped before handling
+        callback.reset_mock()
+        request['properties'] = pika.BasicProperties(
+            headers=make_deadline_headers(-1))
+        self.assertIsNone(deadline_handler(*request.values()))
+        callback.assert_not_called()
+        request['channel'].basic_ack.assert_called_once()
+        self.assertEqual(get_expired_counts()[('handler', 'deadline_handler')], 1)
+
+        # Requests without a deadline have no budget
+        request['properties'] = pika.BasicProperties()
+        self.assertIsNone(deadline_handler(*request.values()))
+        callback.assert_called_once()
+
+    def test_create_mq_callback_stream_reply(self):
+        from neon_mq_connector.utils.stream_utils import get_stream_info
+
+        class StreamHandler:
+            emit_mq_reply = MQConnector.emit_mq_reply
+            create_unique_id = staticmethod(MQConnector.create_unique_id)
+
+            @create_mq_callback(include_callback_props=('body',))
+            def handle(self, body):
+                for i in range(3):
+                    yield {"chunk": i}
+
+        published = []
+        done = threading.Event()
+
+        def _publish(**kwargs):
+            published.append(kwargs)
+            if get_stream_info(kwargs['properties'])[2]:
+                done.set()
+
+        channel = Mock()
+        channel.is_open = True
+        channel.basic_publish = Mock(side_effect=_publish)
+        channel.connection.add_callback_threadsafe = \
+            Mock(side_effect=lambda func: func())
+        request = self.create_mock_request({"message_id": "test_id",
+                                            "routing_key": "reply_queue"})
+        request['channel'] = channel
+        request['properties'] = pika.BasicProperties(reply_to="reply_queue")
+        StreamHandler().handle(*request.values())
+        self.assertTrue(done.wait(5))
+
+        self.assertEqual(len(published), 4)
+        stream_ids = set()
+        for seq, kwargs in enumerate(published):
+            self.assertEqual(kwargs['routing_key'], "reply_queue")
+            stream_id, chunk_seq, end = get_stream_info(kwargs['properties'])
+            stream_ids.add(stream_id)
+            self.assertEqual(chunk_seq, seq)
+            self.assertEqual(end, seq == 3)
+            body = b64_to_dict(kwargs['body'])
+            self.assertEqual(body['context']['mq']['message_id'], "test_id")
+            if not end:
+                self.assertEqual(body['chunk'], seq)
+        self.assertEqual(len(stream_ids), 1)
+
+
+class TestStreamUtils(unittest.TestCase):
+    def test_stream_reassembler(self):
+        from neon_mq_connector.utils.stream_utils import StreamReassembler
+
+        # Out of order chunks are read in order
+        consumed = Mock()
+        stream = StreamReassembler()
+        self.assertTrue(stream.add_chunk(1, "b", on_consumed=consumed))
+        self.assertTrue(stream.add_chunk(0, "a", on_consumed=consumed))
+        self.assertTrue(stream.add_chunk(3, None, end=True))
+        self.assertTrue(stream.add_chunk(2, "c", on_consumed=consumed))
+        # Duplicates are discarded and released immediately
+        self.assertFalse(stream.add_chunk(2, "c", on_consumed=consumed))
+        self.assertEqual(consumed.call_count, 1)
+        self.assertEqual(list(stream), ["a", "b", "c"])
+        self.assertEqual(consumed.call_count, 4)
+        self.assertTrue(stream.finished)
+
+        # Chunks read while being produced
+        stream = StreamReassembler(timeout=5)
+
+        def _produce():
+            for i in range(5):
+                stream.add_chunk(i, i)
+                time.sleep(0.01)
+            stream.add_chunk(5, None, end=True)
+
+        Thread(target=_produce).start()
+        self.assertEqual(list(stream), list(range(5)))
+
+        # In order chunks are not limited by `max_buffered`
+        stream = StreamReassembler(max_buffered=2)
+        for i in range(10):
+            self.assertTrue(stream.add_chunk(i, i))
+        stream.add_chunk(10, None, end=True)
+        self.assertEqual(list(stream), list(range(10)))
+
+        # Buffer overflow fails the stream
+        stream = StreamReassembler(max_buffered=2)
+        stream.add_chunk(1, "b")
+        stream.add_chunk(2, "c")
+        self.assertFalse(stream.add_chunk(3, "d"))
+        with self.assertRaises(BufferError):
+            next(stream)
+
+        # Missing chunk times out
+        stream = StreamReassembler(timeout=0.1)
+        stream.add_chunk(1, "b")
+        with self.assertRaises(TimeoutError):
+            next(stream)
+
+        # Producer error is raised at the end of the stream
+        stream = StreamReassembler()
+        stream.add_chunk(0, "a")
+        stream.add_chunk(1, RuntimeError("failed"), end=True)
+        self.assertEqual(next(stream), "a")
+        with self.assertRaises(RuntimeError):
+            next(stream)
+
+    def test_stream_reassembler_async(self):
+        import asyncio
+        from neon_mq_connector.utils.stream_utils import StreamReassembler
+        stream = StreamReassembler()
+        for i in range(3):
+            stream.add_chunk(i, i)
+        stream.add_chunk(3, None, end=True)
+
+        async def _read():
+            return [chunk async for chunk in stream]
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(_read()), [0, 1, 2])
+        finally:
+            loop.close()
+
+    def test_emit_mq_stream(self):
+        from neon_mq_connector.utils.stream_utils import StreamReassembler, \
+            get_stream_info
+        chunks = [{"data": i} for i in range(3)]
+
+        def _reassemble(published: list) -> list:
+            stream = StreamReassembler()
+            for kwargs in published:
+                props = kwargs['properties']
+                self.assertEqual(kwargs['routing_key'], "stream_queue")
+                self.assertEqual(props.correlation_id, "request_id")
+                body = b64_to_dict(kwargs['body'])
+                self.assertEqual(body['message_id'], "request_id")
+                self.assertEqual(body['context']['mq']['message_id'],
+                                 "request_id")
+                # Chunks are held until a slow reader gets them
+                self.assertIsNone(props.expiration)
+                _, seq, end = get_stream_info(props)
+                stream.add_chunk(seq, body, end)
+            return [chunk['data'] for chunk in stream]
+
+        # Blocking connection publishes on a single channel
+        connection = Mock(spec=pika.BlockingConnection)
+        channel = connection.channel.return_value
+        MQConnector.emit_mq_stream(connection, iter(chunks), "stream_queue",
+                                   message_id="request_id")
+        connection.channel.assert_called_once()
+        channel.close.assert_called_once()
+        self.assertEqual(_reassemble([c.kwargs for c in
+                                      channel.basic_publish.call_args_list]),
+                         [0, 1, 2])
+
+        # Select connection produces chunks off the IO loop
+        connection = Mock()
+        channel = Mock()
+        closed = threading.Event()
+        channel.close = Mock(side_effect=lambda: closed.set())
+        connection.channel = Mock(
+            side_effect=lambda on_open_callback: on_open_callback(channel))
+        connection.ioloop.add_callback_threadsafe = \
+            Mock(side_effect=lambda func: func())
+        MQConnector.emit_mq_stream(connection, iter(chunks), "stream_queue",
+                                   message_id="request_id")
+        self.assertTrue(closed.wait(5))
+        self.assertEqual(_reassemble([c.kwargs for c in
+                                      channel.basic_publish.call_args_list]),
+                         [0, 1, 2])
+
+    def test_run_stream_producer(self):
+        from unittest.mock import patch
+        from neon_mq_connector.utils import stream_utils
+        release = threading.Event()
+        produced = []
+
+        def _produce():
+            release.wait(5)
+            produced.append(True)
+
+        with patch.object(stream_utils, "MAX_QUEUED_STREAMS", 1):
+            try:
+                # Streams beyond the pool size are queued without blocking
+                start = time.monotonic()
+                for _ in range(stream_utils.MAX_CONCURRENT_STREAMS + 1):
+                    stream_utils.run_stream_producer(_produce)
+                self.assertLess(time.monotonic() - start, 1)
+                with self.assertRaises(stream_utils.StreamProducerBusy):
+                    stream_utils.run_stream_producer(_produce)
+            finally:
+                release.set()
+            for _ in range(100):
+                if len(produced) == stream_utils.MAX_CONCURRENT_STREAMS + 1:
+                    break
+                time.sleep(0.05)
+            self.assertEqual(len(produced),
+                             stream_utils.MAX_CONCURRENT_STREAMS + 1)
+            stream_utils.run_stream_producer(produced.clear)
+
+
+class TestQueueConsumerCache(unittest.TestCase):
+    def test_get_consumer_count(self):
+        from pika.exceptions import ChannelClosedByBroker
+        from neon_mq_connector.utils.client_utils import QueueConsumerCache
+        cache = QueueConsumerCache(ttl=60)
+        connection = Mock()
+        channel = connection.channel.return_value
+        channel.queue_declare.return_value.method.consumer_count = 2
+
+        self.assertEqual(cache.get_consumer_count(connection, "/vh", "q"), 2)
+        channel.queue_declare.assert_called_once_with(queue="q", passive=True)
+        channel.close.assert_called_once()
+
+        # Cached counts do not query the broker
+        self.assertEqual(cache.get_consumer_count(connection, "/vh", "q"), 2)
+        channel.queue_declare.assert_called_once()
+
+        # Invalidated counts are queried again
+        cache.invalidate("/vh", "q")
+        channel.queue_declare.return_value.method.consumer_count = 0
+        self.assertEqual(cache.get_consumer_count(connection, "/vh", "q"), 0)
+        self.assertEqual(channel.queue_declare.call_count, 2)
+
+        # Nonexistent queues are reported as None
+        channel.queue_declare.side_effect = \
+            ChannelClosedByBroker(404, "NOT_FOUND")
+        self.assertIsNone(cache.get_consumer_count(connection, "/vh", "q2"))
+
+    def test_emit_mq_message_mandatory(self):
+        connection = Mock(spec=pika.BlockingConnection)
+        channel = connection.channel.return_value
+        MQConnector.emit_mq_message(connection, {"data": 1}, queue="q",
+                                    mandatory=True)
+        channel.confirm_delivery.assert_called_once()
+        channel.queue_declare.assert_not_called()
+        self.assertTrue(channel.basic_publish.call_args.kwargs['mandatory'])
+        channel.close.assert_called_once()
+
+
+class TestLatencyUtils(unittest.TestCase):
+    def test_p2_quantile(self):
+        import random
+        from neon_mq_connector.utils.latency_utils import P2Quantile
+        rand = random.Random(1234)
+        values = [rand.expovariate(1.0) for _ in range(10000)]
+        for quantile in (0.5, 0.95, 0.99):
+            estimator = P2Quantile(quantile)
+            for value in values:
+                estimator.add(value)
+            exact = sorted(values)[int(quantile * len(values))]
+            self.assertAlmostEqual(estimator.value, exact, delta=exact * 0.05)
+
+        estimator = P2Quantile(0.5)
+        self.assertIsNone(estimator.value)
+        for value in (3, 1, 2):
+            estimator.add(value)
+        self.assertEqual(estimator.value, 2)
+        with self.assertRaises(ValueError):
+            P2Quantile(1)
+
+    def test_adaptive_timeout(self):
+        from neon_mq_connector.utils.latency_utils import latency_tracker, \
+            get_adaptive_timeout, get_hedge_delay
+        queue = "test_adaptive_timeout"
+        self.assertEqual(get_adaptive_timeout(queue, 30), 30)
+        self.assertIsNone(get_hedge_delay(queue))
+        for _ in range(latency_tracker.min_samples):
+            latency_tracker.record(queue, 0.5)
+        self.assertAlmostEqual(get_adaptive_timeout(queue, 30, 0.99, 4), 2)
+        self.assertAlmostEqual(get_hedge_delay(queue, 0.95), 0.5)
+        # Timeout is bounded by the max and min timeouts
+        self.assertEqual(get_adaptive_timeout(queue, 1, 0.99, 4), 1)
+        self.assertEqual(get_adaptive_timeout(queue, 30, 0.99, 1, 1), 1)
+        # Other percentiles are tracked from when they are first used
+        self.assertEqual(get_adaptive_timeout(queue, 30, 0.999), 30)
+        self.assertIsNone(get_hedge_delay(queue, 0.97))
+        for _ in range(latency_tracker.min_samples):
+            latency_tracker.record(queue, 0.5)
+        self.assertAlmostEqual(get_adaptive_timeout(queue, 30, 0.999, 4), 2)
+        self.assertAlmostEqual(get_hedge_delay(queue, 0.97), 0.5)
+        with self.assertRaises(ValueError):
+            get_adaptive_timeout(queue, 30, 1.5)
+        latency_tracker.reset(queue)
+        self.assertEqual(get_adaptive_timeout(queue, 30), 30)
+
+    def test_timing_config(self):
+        from neon_mq_connector.utils.latency_utils import \
+            DEFAULT_TIMING_CONFIG, get_timing_config
+        self.assertEqual(get_timing_config({}), DEFAULT_TIMING_CONFIG)
+        timing = get_timing_config({"request_timing": {
+            "timeout_percentile": 0.999, "hedge_percentile": 95,
+            "hedge_budget": 0.1}})
+        self.assertEqual(timing["timeout_percentile"], 0.999)
+        self.assertEqual(timing["hedge_percentile"],
+                         DEFAULT_TIMING_CONFIG["hedge_percentile"])
+        self.assertEqual(timing["hedge_budget"], 0.1)
+
+    def test_hedge_budget(self):
+        from neon_mq_connector.utils.latency_utils import HedgeBudget
+        budget = HedgeBudget(ratio=0.25, max_tokens=2)
+        self.assertFalse(budget.try_acquire())
+        for _ in range(4):
+            budget.record_request()
+        self.assertTrue(budget.try_acquire())
+        self.assertFalse(budget.try_acquire())
+        # Unused budget is capped
+        for _ in range(100):
+            budget.record_request()
+        self.assertTrue(budget.try_acquire())
+        self.assertTrue(budget.try_acquire())
+        self.assertFalse(budget.try_acquire())
+
+
+class TestDeadlineUtils(unittest.TestCase):
+    def test_deadline_headers(self):
+        from neon_mq_connector.utils.deadline_utils import \
+            make_deadline_headers, get_deadline, is_expired, DEADLINE_HEADER
+        headers = make_deadline_headers(5)
+        props = pika.BasicProperties(headers=headers)
+        self.assertEqual(get_deadline(props), headers[DEADLINE_HEADER])
+        self.assertFalse(is_expired(props))
+        self.assertTrue(is_expired(pika.BasicProperties(
+            headers=make_deadline_headers(-0.1))))
+        self.assertIsNone(get_deadline(pika.BasicProperties()))
+        self.assertFalse(is_expired(pika.BasicProperties(
+            headers={DEADLINE_HEADER: "invalid"})))
+
+    def test_request_deadline(self):
+        from neon_mq_connector.utils.deadline_utils import \
+            request_deadline, get_remaining_time
+        self.assertIsNone(get_remaining_time())
+        with request_deadline(time.time() + 5):
+            self.assertTrue(4 < get_remaining_time() <= 5)
+            with request_deadline(None):
+                self.assertIsNone(get_remaining_time())
+            self.assertIsNotNone(get_remaining_time())
+        self.assertIsNone(get_remaining_time())
+
+
 class TestThreadUtils(unittest.TestCase):
     counter = 0
 
@@ -502,3 +1768,830 @@ class TestThreadUtils(unittest.TestCase):
         time.sleep(interval_timeout)
         timer_thread.cancel()
         self.assertEqual(self.counter, 3)
+
+
+class TestAccountingUtils(unittest.TestCase):
+    def tearDown(self):
+        from neon_mq_connector.utils.accounting_utils import accounting
+        accounting.enabled = False
+        accounting.reset()
+
+    def test_consumer_stats(self):
+        from types import SimpleNamespace
+        from neon_mq_connector.utils.accounting_utils import \
+            enable_consumer_stats, get_consumer_stats
+        from neon_mq_connector.utils.consumer_utils import handle_message
+
+        def _busy(*_):
+            end = time.thread_time() + 0.05
+            while time.thread_time() < end:
+                pass
+
+        consumer = SimpleNamespace(name="busy", queue="busy_q",
+                                   auto_ack=True, callback_func=_busy)
+        handle_message(consumer, Mock(), Mock(), pika.BasicProperties(),
+                       b"body")
+        self.assertEqual(get_consumer_stats(), {})
+
+        enable_consumer_stats()
+        handle_message(consumer, Mock(), Mock(), pika.BasicProperties(),
+                       b"body")
+        first = get_consumer_stats()["busy"]
+        # CPU spent between callbacks is accounted to pika
+        end = time.thread_time() + 0.05
+        while time.thread_time() < end:
+            pass
+        consumer.callback_func = Mock(side_effect=ValueError("test"))
+        with self.assertRaises(ValueError):
+            handle_message(consumer, Mock(), Mock(), pika.BasicProperties(),
+                           b"12345")
+        stats = get_consumer_stats(["busy", "unknown"])
+        self.assertEqual(stats["unknown"]["messages"], 0)
+        stats = stats["busy"]
+        self.assertEqual(stats["messages"], 2)
+        self.assertEqual(stats["errors"], 1)
+        self.assertEqual(stats["bytes"], 9)
+        self.assertGreaterEqual(stats["handler_cpu_seconds"], 0.05)
+        self.assertGreaterEqual(stats["handler_wall_seconds"], 0.05)
+        self.assertGreaterEqual(stats["io_cpu_seconds"] -
+                                first["io_cpu_seconds"], 0.05)
+        self.assertAlmostEqual(stats["cpu_seconds"],
+                               stats["handler_cpu_seconds"] +
+                               stats["io_cpu_seconds"])
+
+    def test_consumer_stats_owners(self):
+        from types import SimpleNamespace
+        from neon_mq_connector.utils.accounting_utils import \
+            enable_consumer_stats, get_consumer_stats
+        from neon_mq_connector.utils.consumer_utils import handle_message
+
+        def _consume(owner, count):
+            consumer = SimpleNamespace(name="shared", queue="shared_q",
+                                       auto_ack=True, callback_func=Mock(),
+                                       stats_owner=owner)
+            for _ in range(count):
+                handle_message(consumer, Mock(), Mock(),
+                               pika.BasicProperties(), b"body")
+
+        enable_consumer_stats()
+        threads = [threading.Thread(target=_consume, args=("one", 3)),
+                   threading.Thread(target=_consume, args=("two", 5))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(get_consumer_stats(owner="one")["shared"]["messages"],
+                         3)
+        self.assertEqual(get_consumer_stats(owner="two")["shared"]["bytes"],
+                         20)
+        self.assertEqual(get_consumer_stats(), {})
+
+    def test_consumer_metrics(self):
+        from types import SimpleNamespace
+        from neon_mq_connector.utils.consumer_utils import handle_message
+        from neon_mq_connector.utils.metrics_utils import metrics, \
+            CONSUMER_BYTES, CONSUMER_CPU_SECONDS, CONSUMER_HANDLER_SECONDS, \
+            CONSUMER_MESSAGES
+        consumer = SimpleNamespace(name="metered", queue="metered_q",
+                                   auto_ack=True, callback_func=Mock())
+        metrics.enabled = True
+        try:
+            handle_message(consumer, Mock(), Mock(), pika.BasicProperties(),
+                           b"body")
+            self.assertEqual(CONSUMER_MESSAGES.get(("metered",)), 1)
+            self.assertEqual(CONSUMER_BYTES.get(("metered",)), 4)
+            self.assertGreater(CONSUMER_HANDLER_SECONDS.get(("metered",)), 0)
+            self.assertGreater(CONSUMER_CPU_SECONDS.get(("metered", "io")), 0)
+            self.assertIn('mq_consumer_cpu_seconds_total{consumer="metered",'
+                          'activity="handler"}', metrics.render())
+        finally:
+            metrics.enabled = False
+            metrics.reset()
+
+
+class TestWatchdogUtils(unittest.TestCase):
+    def tearDown(self):
+        from neon_mq_connector.utils.watchdog_utils import watchdog
+        watchdog.reset()
+
+    def test_disabled(self):
+        from contextlib import nullcontext
+        from neon_mq_connector.utils.watchdog_utils import watchdog
+        self.assertFalse(watchdog.enabled)
+        self.assertIsInstance(watchdog.watch("q"), nullcontext)
+
+    def test_slow_callback(self):
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from neon_mq_connector.utils.consumer_utils import handle_message
+        from neon_mq_connector.utils.watchdog_utils import enable_watchdog, \
+            watchdog
+
+        def slow_handler(*_):
+            time.sleep(0.3)
+
+        enable_watchdog(threshold=0.1, log_interval=60)
+        consumer = SimpleNamespace(queue="slow_q", auto_ack=False,
+                                   callback_func=slow_handler)
+        channel = Mock()
+        with patch("neon_mq_connector.utils.watchdog_utils.LOG") as log:
+            for _ in range(2):
+                handle_message(consumer, channel, Mock(),
+                               pika.BasicProperties(correlation_id="id"), b"")
+        self.assertEqual(watchdog.get_slow_counts(), {"slow_q": 2})
+        # Second report is rate-limited
+        log.warning.assert_called_once()
+        message = log.warning.call_args.args[0]
+        self.assertIn("slow_handler", message)
+        self.assertIn("message_id=id", message)
+        self.assertIn("time.sleep(0.3)", message)
+        channel.basic_nack.assert_not_called()
+
+    def test_hard_timeout(self):
+        from types import SimpleNamespace
+        from neon_mq_connector.utils.consumer_utils import handle_message
+        from neon_mq_connector.utils.watchdog_utils import enable_watchdog, \
+            watchdog
+
+        def stuck_handler(*_):
+            while True:
+                pass
+
+        enable_watchdog(hard_timeout=0.2)
+        consumer = SimpleNamespace(queue="stuck_q", auto_ack=False,
+                                   callback_func=stuck_handler)
+        channel = Mock()
+        method = Mock()
+        handle_message(consumer, channel, method, pika.BasicProperties(), b"")
+        channel.basic_nack.assert_called_once_with(
+            delivery_tag=method.delivery_tag, requeue=False)
+
+        # Decorated handlers called outside a consumer return None
+        @create_mq_callback()
+        def _handler(body):
+            while True:
+                pass
+
+        # Per-queue limits override the defaults
+        enable_watchdog()
+        watchdog.set_queue_limits("_handler", hard_timeout=0.2)
+        self.assertIsNone(_handler(Mock(), Mock(), pika.BasicProperties(),
+                                   dict_to_b64({"data": 1})))
+
+    def test_late_interrupt(self):
+        from unittest.mock import patch
+        from neon_mq_connector.utils.watchdog_utils import HandlerTimeout, \
+            _raise_in_thread, enable_watchdog, watchdog
+
+        finish = watchdog._finish
+
+        def _interrupt_on_finish(call):
+            # Interrupt as the monitor would just before the call is popped
+            if not call.interrupted:
+                call.interrupted = True
+                _raise_in_thread(call.ident, HandlerTimeout)
+            return finish(call)
+
+        enable_watchdog(hard_timeout=60)
+        watch = watchdog.watch("late_q")
+        with patch.object(watchdog, "_finish",
+                          side_effect=_interrupt_on_finish):
+            with watch:
+                pass
+        # The callback returned, so its message is not nacked
+        self.assertFalse(watch.timed_out)
+
+        # An interrupt caught by the callback is not waited for
+        watch = watchdog.watch("late_q")
+        with watch:
+            watch.call.interrupted = True
+        self.assertFalse(watch.timed_out)
+        self.assertEqual(watchdog._calls, {})
+
+
+class TestBenchmarkHarness(unittest.TestCase):
+    def test_scenario_matrix(self):
+        from neon_mq_connector.benchmarks.harness import scenario_matrix
+        scenarios = scenario_matrix(payload_sizes=(64, 4096),
+                                    auto_ack=(True, False), messages=10)
+        self.assertEqual(len(scenarios), 8)
+        self.assertEqual({s.consumer for s in scenarios[:2]},
+                         {'blocking', 'select'})
+        self.assertEqual(len({s.name for s in scenarios}), 8)
+        self.assertTrue(all(s.messages == 10 for s in scenarios))
+        with self.assertRaises(ValueError):
+            scenario_matrix(consumer_classes=('invalid',))
+
+    def test_latency_stats(self):
+        from neon_mq_connector.benchmarks.harness import LatencyStats, \
+            percentile
+        self.assertEqual(percentile([], 50), 0)
+        samples = [i / 1000 for i in range(1, 1001)]
+        self.assertEqual(percentile(samples, 50), 0.5)
+        self.assertEqual(percentile(samples, 99), 0.99)
+        self.assertEqual(percentile(samples, 100), 1.0)
+        stats = LatencyStats.from_samples(reversed(samples))
+        self.assertEqual(stats.count, 1000)
+        self.assertEqual(stats.p999, 0.999)
+        self.assertEqual(stats.max, 1.0)
+        self.assertAlmostEqual(stats.mean, 0.5005)
+
+    def test_render_markdown(self):
+        from neon_mq_connector.benchmarks.harness import BenchmarkResult, \
+            LatencyStats, Scenario, render_markdown
+        latency = LatencyStats.from_samples([0.001, 0.002, 0.003])
+        results = [BenchmarkResult(Scenario(consumer), 10, received, 0.5, 1,
+                                   latency).to_dict()
+                   for consumer, received in (('blocking', 10),
+                                              ('select', 9))]
+        self.assertEqual(results[0]['publish_rate'], 20)
+        self.assertEqual(results[1]['lost'], 1)
+        markdown = render_markdown({"environment": {"python": "3"},
+                                    "results": results})
+        self.assertIn(f"| {results[0]['name']} | 20 | 10 | 2.00 | 3.00 | "
+                      f"3.00 | 0 |", markdown)
+        self.assertIn("## Consumer Classes", markdown)
+        self.assertIn("| blocking msg/s | blocking p99 ms | select msg/s |",
+                      markdown)
+        self.assertIn("| 10 | 3.00 | 9 | 3.00 |", markdown)
+
+
+class TestMemoryTransport(unittest.TestCase):
+    def setUp(self):
+        from neon_mq_connector.utils.memory_transport_utils import \
+            MemoryTransport
+        self.transport = MemoryTransport()
+        self.connection = self.transport.blocking_connection()
+        self.channel = self.connection.channel()
+
+    def tearDown(self):
+        if self.connection.is_open:
+            self.connection.close()
+
+    def _consume(self, queue, auto_ack=True):
+        received = []
+        self.channel.basic_consume(
+            queue, lambda ch, method, props, body: received.append(
+                (method, body)), auto_ack=auto_ack)
+        self.connection.process_data_events(0)
+        return received
+
+    def test_topic_matches(self):
+        from neon_mq_connector.utils.memory_transport_utils import \
+            topic_matches
+        self.assertTrue(topic_matches("a.b", "a.b"))
+        self.assertTrue(topic_matches("a.*", "a.b"))
+        self.assertFalse(topic_matches("a.*", "a.b.c"))
+        self.assertTrue(topic_matches("a.#", "a"))
+        self.assertTrue(topic_matches("#.c", "a.b.c"))
+        self.assertTrue(topic_matches("a.#.c", "a.c"))
+        self.assertFalse(topic_matches("a.#.d", "a.b.c"))
+
+    def test_exchange_routing(self):
+        self.channel.exchange_declare("fan", "fanout")
+        self.channel.exchange_declare("top", "topic")
+        for queue in ("q1", "q2"):
+            self.channel.queue_declare(queue)
+            self.channel.queue_bind(queue, "fan")
+        self.channel.queue_bind("q1", "top", "log.*")
+        self.channel.basic_publish("fan", "", b"fan")
+        self.channel.basic_publish("top", "log.info", b"topic")
+        self.channel.basic_publish("top", "metric.info", b"dropped")
+        self.channel.basic_publish("", "q2", b"direct")
+        self.assertEqual(self.transport.broker.get_message_count("q1"), 2)
+        self.assertEqual([body for _, body in self._consume("q2")],
+                         [b"fan", b"direct"])
+
+        self.channel.queue_unbind("q1", "top", "log.*")
+        self.channel.basic_publish("top", "log.info", b"unbound")
+        self.assertEqual(self.transport.broker.get_message_count("q1"), 2)
+
+    def test_prefetch_and_requeue(self):
+        self.channel.queue_declare("q")
+        self.channel.basic_qos(prefetch_count=2)
+        for idx in range(5):
+            self.channel.basic_publish("", "q", str(idx).encode())
+        received = self._consume("q", auto_ack=False)
+        self.assertEqual(len(received), 2)
+        self.channel.basic_ack(received[0][0].delivery_tag)
+        self.connection.process_data_events(0)
+        self.assertEqual(len(received), 3)
+        self.channel.basic_nack(received[2][0].delivery_tag, multiple=True)
+        self.connection.process_data_events(0)
+        redelivered = [(body, method.redelivered)
+                       for method, body in received[3:]]
+        self.assertEqual(redelivered, [(b"1", True), (b"2", True)])
+
+    def test_message_ttl(self):
+        from pika import BasicProperties
+        self.channel.queue_declare("q", arguments={"x-message-ttl": 0})
+        self.channel.queue_declare("q2")
+        self.channel.basic_publish("", "q", b"expired")
+        self.channel.basic_publish("", "q2", b"expired",
+                                   BasicProperties(expiration="0"))
+        self.channel.basic_publish("", "q2", b"kept")
+        time.sleep(0.01)
+        self.assertEqual(self.transport.broker.get_message_count("q"), 0)
+        self.assertEqual(self.channel.basic_get("q2", True)[2], b"kept")
+
+    def test_unroutable(self):
+        from pika.exceptions import UnroutableError
+        returned = Mock()
+        self.channel.add_on_return_callback(returned)
+        self.channel.basic_publish("", "missing", b"", mandatory=True)
+        self.connection.process_data_events(0)
+        self.assertEqual(returned.call_args[0][1].reply_code, 312)
+        self.channel.confirm_delivery()
+        self.channel.basic_publish("", "missing", b"")
+        with self.assertRaises(UnroutableError):
+            self.channel.basic_publish("", "missing", b"", mandatory=True)
+
+    def test_channel_errors(self):
+        from pika.exceptions import ChannelClosedByBroker
+        with self.assertRaises(ChannelClosedByBroker) as ctx:
+            self.channel.queue_declare("missing", passive=True)
+        self.assertEqual(ctx.exception.reply_code, 404)
+        self.assertTrue(self.channel.is_closed)
+
+        self.connection.channel().queue_declare("private", exclusive=True)
+        other = self.transport.blocking_connection()
+        with self.assertRaises(ChannelClosedByBroker) as ctx:
+            other.channel().queue_declare("private")
+        self.assertEqual(ctx.exception.reply_code, 405)
+        self.connection.close()
+        other.channel().queue_declare("private")
+        other.close()
+
+    def test_close_connections(self):
+        from pika.exceptions import ConnectionClosedByBroker
+        self.channel.queue_declare("q")
+        self.channel.basic_consume("q", Mock())
+        self.transport.broker.close_connections()
+        self.assertTrue(self.connection.is_closed)
+        self.assertEqual(self.transport.broker.connections, [])
+        with self.assertRaises(ConnectionClosedByBroker):
+            self.channel.start_consuming()
+
+    def test_memory_broker_run(self):
+        from neon_mq_connector.benchmarks.harness import BenchmarkRunner, \
+            Scenario
+        from neon_mq_connector.utils.memory_transport_utils import \
+            MemoryTransport
+        config = {"server": "localhost", "users": {
+            "bench": {"user": "bench", "password": "bench"}}}
+        runner = BenchmarkRunner(config, "bench", transport=MemoryTransport())
+        report = runner.run([Scenario('blocking', messages=20),
+                             Scenario('select', messages=20, auto_ack=False)],
+                            requests=5)
+        self.assertEqual(report["environment"]["transport"], "memory")
+        self.assertEqual([r["received"] for r in report["results"]], [20, 20])
+        self.assertEqual(report["requests"]["latency"]["count"], 5)
+
+
+class TestMemoryTransportRequests(unittest.TestCase):
+    def setUp(self):
+        from neon_mq_connector.utils.memory_transport_utils import \
+            MemoryTransport
+        from neon_mq_connector.utils.transport_utils import set_transport
+        set_transport(MemoryTransport())
+        self.connector = MQConnector({"server": "memory", "users": {
+            "test": {"user": "test_user", "password": "test"}}}, "test")
+        self.connector.vhost = "/test"
+
+    def tearDown(self):
+        from neon_mq_connector.utils.transport_utils import set_transport
+        self.connector.stop()
+        set_transport(None)
+
+    def test_reply_before_response_consumer(self):
+        from unittest.mock import patch
+        from neon_mq_connector.benchmarks.harness import register_responder
+        from neon_mq_connector.utils.client_utils import send_mq_request
+        register_responder(self.connector, "/test", "fast_q")
+        self.connector.run(run_sync=False)
+        for _ in range(100):
+            if self.connector.consumers["benchmark_responder"].is_consuming:
+                break
+            time.sleep(0.05)
+        run_consumers = NeonMQHandler.run_consumers
+
+        def _delayed_run_consumers(handler, *args, **kwargs):
+            # The reply is sent before the response consumer starts
+            timer = threading.Timer(0.5, run_consumers,
+                                    (handler,) + args, kwargs)
+            timer.start()
+            self.addCleanup(timer.join)
+
+        with patch.object(NeonMQHandler, "run_consumers",
+                          _delayed_run_consumers):
+            response = send_mq_request("/test", {"data": 1}, "fast_q",
+                                       timeout=5)
+        self.assertIn("message_id", response)
+
+    def test_response_consumer_not_restarted(self):
+        from unittest.mock import patch
+        from neon_mq_connector.benchmarks.harness import register_responder
+        from neon_mq_connector.utils.client_utils import send_mq_request
+        from neon_mq_connector.utils.supervisor_utils import \
+            ConsumerSupervisor
+        register_responder(self.connector, "/test", "fast_q")
+        self.connector.run(run_sync=False)
+        with patch.object(ConsumerSupervisor, "notify_stopped") as stopped, \
+                patch("neon_mq_connector.connector.LOG") as log:
+            for i in range(5):
+                self.assertIn("message_id", send_mq_request(
+                    "/test", {"data": i}, "fast_q", timeout=5))
+        # Response consumers close their channel once a response is handled
+        stopped.assert_not_called()
+        for call in log.error.call_args_list:
+            self.assertNotIn("Failed to join", call.args[0])
+
+
+class TestLoadGenerator(unittest.TestCase):
+    def test_histogram(self):
+        from neon_mq_connector.benchmarks.histogram import LatencyHistogram
+        histogram = LatencyHistogram()
+        other = LatencyHistogram()
+        for idx in range(1, 10001):
+            (histogram if idx % 2 else other).record(idx / 1000)
+        histogram.merge(other)
+        self.assertEqual(histogram.total_count, 10000)
+        self.assertAlmostEqual(histogram.mean, 5.0005)
+        self.assertEqual(histogram.min, 0.001)
+        self.assertEqual(histogram.max, 10)
+        for pct in (50, 99, 99.9):
+            self.assertAlmostEqual(histogram.value_at_percentile(pct),
+                                   pct / 10, delta=pct / 10 / 1000)
+        self.assertEqual(histogram.value_at_percentile(100), 10)
+        self.assertLess(len(histogram.buckets()), 10000)
+
+        loaded = LatencyHistogram.from_dict(histogram.to_dict())
+        self.assertEqual(loaded.percentiles(), histogram.percentiles())
+        hgrm = histogram.to_hgrm().splitlines()
+        self.assertTrue(hgrm[0].split() ==
+                        ["Value", "Percentile", "TotalCount",
+                         "1/(1-Percentile)"])
+        self.assertEqual(hgrm[-len(histogram.buckets()) - 3].split(),
+                         ["1.000", "0.000100000000", "1", "1.00"])
+        with self.assertRaises(ValueError):
+            histogram.merge(LatencyHistogram(2))
+
+    def test_arrival_offsets(self):
+        from neon_mq_connector.benchmarks.load import arrival_offsets
+        self.assertEqual(list(arrival_offsets('constant', 10, count=4)),
+                         [0, 0.1, 0.2, 0.3])
+        self.assertEqual(len(list(arrival_offsets('constant', 10,
+                                                  duration=1))), 10)
+        self.assertEqual(list(arrival_offsets('bursty', 10, count=6,
+                                              burst_size=3)),
+                         [0, 0, 0, 0.3, 0.3, 0.3])
+        poisson = list(arrival_offsets('poisson', 1000, count=10000, seed=1))
+        self.assertEqual(poisson, sorted(poisson))
+        self.assertAlmostEqual(poisson[-1], 10, delta=0.5)
+        self.assertEqual(poisson, list(arrival_offsets('poisson', 1000,
+                                                       count=10000, seed=1)))
+        with self.assertRaises(ValueError):
+            next(arrival_offsets('constant', 10))
+
+    def test_payload_template(self):
+        from neon_mq_connector.benchmarks.load import PayloadTemplate
+        template = PayloadTemplate({"seq": "${seq}", "id": "req-${seq}",
+                                    "nested": [{"data": "${data}"}],
+                                    "other": "$unknown", "count": 1}, 4)
+        data = template.render(7)
+        self.assertEqual(data, {"seq": 7, "id": "req-7",
+                                "nested": [{"data": "xxxx"}],
+                                "other": "$unknown", "count": 1})
+        self.assertIsNot(template.render(7)["nested"], data["nested"])
+        self.assertEqual(PayloadTemplate(payload_size=2).render(0),
+                         {"data": "xx"})
+
+    def test_coordinated_omission(self):
+        from neon_mq_connector.benchmarks.load import LoadGenerator, \
+            LoadProfile, PayloadTemplate
+
+        def _send(data):
+            # The first message stalls the only worker for 10 intervals
+            time.sleep(0.1 if data["data"] == "stall" else 0)
+            return True
+
+        template = PayloadTemplate()
+        template.render = lambda seq: {"data": "stall" if seq == 0 else ""}
+        profile = LoadProfile('constant', 100, count=20, concurrency=1)
+        result = LoadGenerator(_send, profile, template).run()
+        self.assertEqual(result.sent, 20)
+        self.assertEqual(result.failed, 0)
+        self.assertGreaterEqual(result.max_backlog, 9)
+        # Messages queued behind the stall include their wait in latency
+        self.assertGreater(result.latency.value_at_percentile(90), 0.05)
+        self.assertLess(result.service_time.value_at_percentile(90), 0.01)
+
+    def test_run_load_memory(self):
+        import json
+        from neon_mq_connector.benchmarks.load import main
+        from neon_mq_connector.benchmarks.histogram import LatencyHistogram
+        from tempfile import TemporaryDirectory
+        with TemporaryDirectory() as tmp:
+            report_path = os.path.join(tmp, "load.json")
+            main(["--broker", "memory", "--queue", "load_test", "--echo",
+                  "--rate", "100", "--count", "10", "--concurrency", "2",
+                  "--json", report_path])
+            with open(report_path) as f:
+                report = json.load(f)
+        result = report["result"]
+        self.assertEqual(report["environment"]["transport"], "memory")
+        self.assertEqual(result["sent"], 10)
+        self.assertEqual(result["failed"], 0)
+        self.assertEqual(LatencyHistogram.from_dict(
+            result["latency"]).total_count, 10)
+
+
+class TestSoakHarness(unittest.TestCase):
+    def test_check_trends(self):
+        from neon_mq_connector.benchmarks.soak import SoakSample, \
+            check_trends, fit_slope
+        self.assertAlmostEqual(fit_slope([0, 1, 2, 3], [1, 3, 5, 7]), 2)
+        self.assertEqual(fit_slope([1, 1], [1, 2]), 0)
+        samples = [SoakSample(i * 10, i, 100_000_000 + 1_000 * (i % 2),
+                              5_000_000 + 200_000 * i, 10, 4 + i)
+                   for i in range(10)]
+        self.assertEqual(check_trends(samples[:2]), [])
+        trends = {trend.metric: trend for trend in check_trends(samples)}
+        self.assertFalse(trends["rss_bytes"].failed)
+        self.assertFalse(trends["open_fds"].failed)
+        self.assertEqual(trends["open_fds"].growth, 0)
+        self.assertAlmostEqual(trends["threads"].growth, 9)
+        self.assertTrue(trends["threads"].failed)
+        # Traced memory grew 36% over the run
+        self.assertAlmostEqual(trends["traced_bytes"].start, 5_000_000)
+        self.assertTrue(trends["traced_bytes"].failed)
+        trends = {trend.metric: trend for trend in check_trends(
+            samples, {"threads": 10, "traced_bytes": 0.5}, warmup=2)}
+        self.assertAlmostEqual(trends["threads"].growth, 7)
+        self.assertFalse(trends["threads"].failed)
+        self.assertFalse(trends["traced_bytes"].failed)
+
+    def test_memory_broker_soak(self):
+        from neon_mq_connector.benchmarks.soak import main, \
+            render_summary, run_soak, take_sample
+        from neon_mq_connector.utils.memory_transport_utils import \
+            MemoryTransport
+        sample = take_sample(0, 0)
+        self.assertGreater(sample.rss_bytes, 0)
+        self.assertGreater(sample.open_fds, 0)
+        self.assertGreaterEqual(sample.threads, 1)
+
+        samples = []
+        report = run_soak({"server": "localhost", "users": {
+            "mq_handler": {"user": "test", "password": "test"}}},
+            "mq_handler", 4, sample_interval=0.1, warmup=0, burst_size=2,
+            timeout=10, transport=MemoryTransport(),
+            on_sample=samples.append)
+        self.assertGreater(report["cycles"], 0)
+        self.assertEqual(report["request_errors"], 0)
+        self.assertEqual(len(report["samples"]), len(samples))
+        self.assertEqual(samples[-1].cycles, report["cycles"])
+        self.assertEqual({trend["metric"] for trend in report["trends"]},
+                         {"rss_bytes", "traced_bytes", "open_fds",
+                          "threads"})
+        self.assertIn("cycles in 4s", render_summary(report))
+        # Consumers and connections of stopped connectors are not left over
+        self.assertFalse([thread for thread in threading.enumerate()
+                          if thread.name.startswith("soak_")])
+
+        with self.assertRaises(ValueError):
+            main(["--broker", "memory", "--tolerance", "invalid=1"])
+
+
+class TestBenchmarkRegression(unittest.TestCase):
+    @staticmethod
+    def _results(samples, higher_is_better=False, tolerance=0.1):
+        from statistics import median
+        return {"benchmarks": {"test": {
+            "unit": "us", "higher_is_better": higher_is_better,
+            "tolerance": tolerance, "median": median(samples),
+            "samples": samples}}}
+
+    def test_mann_whitney(self):
+        from neon_mq_connector.benchmarks.regression import \
+            mann_whitney_greater
+        self.assertAlmostEqual(mann_whitney_greater([1, 2, 3, 4, 5],
+                                                    [6, 7, 8, 9, 10]),
+                               1 / 252)
+        self.assertAlmostEqual(mann_whitney_greater([1, 3, 5, 7, 9],
+                                                    [2, 4, 6, 8, 10]),
+                               87 / 252)
+        self.assertEqual(mann_whitney_greater([6, 7, 8], [1, 2, 3]), 1)
+        # Ties use the normal approximation
+        self.assertLess(mann_whitney_greater([1, 1, 2, 2, 3] * 4,
+                                             [2, 3, 3, 4, 4] * 4), 0.001)
+        self.assertEqual(mann_whitney_greater([], [1]), 1)
+
+    def test_compare_results(self):
+        from neon_mq_connector.benchmarks.regression import \
+            compare_results, render_comparison
+        baseline = self._results([10, 10.2, 9.9, 10.1, 10.3])
+        slower = self._results([12, 12.2, 11.9, 12.1, 12.3])
+        noisy = self._results([9, 14, 10, 8, 13])
+        faster = self._results([8, 8.2, 7.9, 8.1, 8.3])
+
+        regression, = compare_results(baseline, slower)
+        self.assertEqual(regression.status, 'regression')
+        self.assertAlmostEqual(regression.change, 0.2, places=2)
+        self.assertTrue(regression.failed)
+        self.assertEqual(compare_results(baseline, slower,
+                                         tolerances={"test": 0.5})[0].status,
+                         'pass')
+        self.assertEqual(compare_results(baseline, noisy)[0].status, 'pass')
+        self.assertEqual(compare_results(baseline, faster)[0].status,
+                         'improvement')
+        # Lower throughput is worse
+        self.assertEqual(compare_results(
+            self._results([10, 10.2, 9.9, 10.1, 10.3], True),
+            self._results([8, 8.2, 7.9, 8.1, 8.3], True))[0].status,
+            'regression')
+        self.assertEqual(compare_results(baseline, {"benchmarks": {}}
+                                         )[0].status, 'missing')
+
+        table = render_comparison(compare_results(baseline, slower))
+        self.assertIn("| test | us | 10.10 | 12.10 | +19.8% | 10% | 0.004 | "
+                      "FAIL (regression) |", table)
+        self.assertTrue(table.endswith("1 regression(s)"))
+
+    def test_regression_cli(self):
+        from tempfile import TemporaryDirectory
+        from neon_mq_connector.benchmarks.__main__ import main
+        from neon_mq_connector.benchmarks.regression import load_baseline
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "baseline.json")
+            args = ["--baseline", path, "--trials", "4",
+                    "--benchmark", "codec_encode", "handle_message"]
+            with self.assertRaises(FileNotFoundError):
+                main(args)
+            self.assertEqual(main(args + ["--update-baseline"]), 0)
+            baseline = load_baseline(path)
+            self.assertEqual(len(baseline["benchmarks"]["codec_encode"]
+                                 ["samples"]), 4)
+            # Scale the baseline so the current run is a clear regression
+            for result in baseline["benchmarks"].values():
+                result["samples"] = [value / 10 for value in
+                                     result["samples"]]
+                result["median"] /= 10
+            with open(path, 'w') as f:
+                json.dump(baseline, f)
+            self.assertEqual(main(args), 1)
+            self.assertEqual(main(args + ["--tolerance", "codec_encode=100",
+                                          "handle_message=100"]), 0)
+
+
+class TestFaultProxy(unittest.TestCase):
+    def setUp(self):
+        import socket
+        self.server = socket.create_server(("127.0.0.1", 0))
+        Thread(target=self._serve, daemon=True).start()
+
+    def tearDown(self):
+        self.server.close()
+
+    def _serve(self):
+        def _echo(connection):
+            with connection:
+                while data := connection.recv(65536):
+                    connection.sendall(data)
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            Thread(target=_echo, args=(connection,), daemon=True).start()
+
+    def _connect(self, proxy):
+        import socket
+        connection = socket.create_connection(proxy.address)
+        connection.settimeout(2)
+        self.addCleanup(connection.close)
+        return connection
+
+    def test_faults(self):
+        import socket
+        from neon_mq_connector.benchmarks.fault_proxy import FaultProxy
+        threads = threading.active_count()
+        with FaultProxy(self.server.getsockname()) as proxy:
+            connection = self._connect(proxy)
+            connection.sendall(b"test")
+            self.assertEqual(connection.recv(10), b"test")
+            self.assertEqual(proxy.connections, 1)
+
+            # Latency is added in each direction
+            proxy.set_latency(0.1)
+            start = time.monotonic()
+            connection.sendall(b"latency")
+            self.assertEqual(connection.recv(10), b"latency")
+            self.assertGreaterEqual(time.monotonic() - start, 0.2)
+            proxy.heal()
+
+            # Stalled data is delivered after healing
+            connection.settimeout(0.3)
+            proxy.stall()
+            connection.sendall(b"stall")
+            with self.assertRaises(socket.timeout):
+                connection.recv(10)
+            proxy.heal()
+            self.assertEqual(connection.recv(10), b"stall")
+
+            # Blackholed connections stay half-open; new ones recover
+            proxy.blackhole()
+            connection.sendall(b"blackhole")
+            with self.assertRaises(socket.timeout):
+                connection.recv(10)
+            proxy.heal()
+            connection.sendall(b"healed")
+            with self.assertRaises(socket.timeout):
+                connection.recv(10)
+            new_connection = self._connect(proxy)
+            new_connection.sendall(b"new")
+            self.assertEqual(new_connection.recv(10), b"new")
+
+            proxy.reset_connections()
+            with self.assertRaises(ConnectionResetError):
+                new_connection.recv(10)
+            self.assertEqual(proxy.connections, 0)
+
+            proxy.refuse()
+            with self.assertRaises(ConnectionResetError):
+                self._connect(proxy).recv(10)
+            proxy.heal()
+            connection = self._connect(proxy)
+            connection.sendall(b"restarted")
+            self.assertEqual(connection.recv(10), b"restarted")
+        self.assertEqual(proxy.connections, 0)
+        for _ in range(20):
+            if threading.active_count() <= threads:
+                break
+            time.sleep(0.1)
+        self.assertLessEqual(threading.active_count(), threads)
+
+    def test_schedule(self):
+        from neon_mq_connector.benchmarks.fault_proxy import FaultProxy
+        with FaultProxy(self.server.getsockname()) as proxy:
+            self._connect(proxy)
+            connection = self._connect(proxy)
+            connection.sendall(b"test")
+            self.assertEqual(connection.recv(10), b"test")
+            resets = []
+            proxy.schedule(0.1, lambda: resets.append(proxy.connections))
+            proxy.schedule(0.2, proxy.reset_connections, interval=0.1)
+            time.sleep(0.5)
+            self.assertEqual(resets, [2])
+            self.assertEqual(proxy.connections, 0)
+            with self.assertRaises(ConnectionResetError):
+                connection.recv(10)
+
+    def test_recovery_probes(self):
+        from neon_mq_connector.benchmarks.recovery import FAULTS, _Prober, \
+            get_proxied_config, inject_fault, measure_recovery, \
+            render_summary
+        proxy = Mock(address=("127.0.0.1", 1234))
+        config = {"servers": ["mq-0", "mq-1"], "port": 5672,
+                  "users": {"test": {}}}
+        self.assertEqual(get_proxied_config(config, proxy),
+                         {"server": "127.0.0.1", "port": 1234,
+                          "users": {"test": {}}})
+        for fault in FAULTS:
+            inject_fault(proxy, fault, 0)
+        proxy.reset_connections.assert_called_once()
+        proxy.restart.assert_called_once_with(0)
+        proxy.set_latency.assert_called_once_with(1.0)
+        self.assertEqual(proxy.heal.call_count, 3)
+        with self.assertRaises(ValueError):
+            measure_recovery(config, "test", "select", "invalid")
+
+        # Probes are delivered only while `delivering` is set
+        delivering = threading.Event()
+        delivering.set()
+        prober = _Prober(lambda data: delivering.is_set() and
+                         prober.on_message(None, None, None,
+                                           dict_to_b64(data)), 0.01)
+        prober.start()
+        try:
+            self.assertIsNotNone(prober.wait_received_after(
+                time.monotonic(), 1))
+            delivering.clear()
+            time.sleep(0.1)
+            healed = time.monotonic()
+            self.assertIsNone(prober.first_received_after(healed))
+            delivering.set()
+            received = prober.wait_received_after(healed, 1)
+            self.assertLess(received - healed, 0.5)
+        finally:
+            prober.stop()
+        self.assertGreater(len(prober.published), len(prober.received))
+
+        report = {"results": [
+            {"path": "select", "fault": "reset", "fault_seconds": 0,
+             "recovery_seconds": 0.25, "publish_errors": 0},
+            {"path": "send_message", "fault": "stall", "fault_seconds": 5,
+             "recovery_seconds": None, "publish_errors": 2}]}
+        self.assertEqual(render_summary(report).splitlines()[2:],
+                         ["| reset | select | 0 | 0.250 | 0 |",
+                          "| stall | send_message | 5 | timed out | 2 |"])